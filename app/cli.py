@@ -0,0 +1,263 @@
+"""
+Module: cli
+Phase: 6
+Milestone: 6
+Step: 8
+Purpose:
+    One command-line entry point for the fleet operations:
+        python -m app.cli discover 10.10.0.0/24
+        python -m app.cli push 10.10.0.20 10.10.0.30 --rules ./iptables.rules
+        python -m app.cli validate 10.10.0.20
+        python -m app.cli apply 10.10.0.20 --rollback-timeout 60 --preflight
+        python -m app.cli preflight 10.10.0.20 10.10.0.30 --pin 10.10.0.20=SHA256:...
+        python -m app.cli snapshot 10.10.0.20 --out snapshots/
+        python -m app.cli logs -n 20 --action apply
+    Start-up stays cheap for shell loops: only argparse is imported at load
+    time, each command imports its implementation when it runs, and paramiko
+    is loaded lazily on the first SSH connection (see app.utils.lazy_import),
+    so --help and `logs` never pay for it. tests/test_cli.py holds the
+    import-time budget.
+"""
+
+import argparse
+import os
+import sys
+
+
+DEFAULT_USER = "root"
+DEFAULT_KEY = os.environ.get("IPTABLES_GUI_SSH_KEY", os.path.expanduser("~/.ssh/id_rsa"))
+DEFAULT_REMOTE_RULES = "/tmp/iptables.rules"
+HOST_WORKERS = 16
+
+
+# ---------- Output ----------
+def _emit(args, host: str, result: dict, file=None):
+    if args.json:
+        import json
+        print(json.dumps({"host": host, **result}, default=str), file=file, flush=True)
+    else:
+        mark = "✅" if result.get("status") == "success" else "❌"
+        print(f"{mark} {host}: {result.get('message', result.get('status'))}", file=file, flush=True)
+
+
+def _preflight(args, emit_ready: bool = False, file=None) -> dict:
+    """Warm the shared sessions for args.hosts; failed hosts (and ready ones if asked) are printed."""
+    from app.core.ssh_session_manager import shared_manager
+
+    try:
+        pins = dict(p.split("=", 1) for p in args.pin)
+    except ValueError:
+        raise SystemExit("--pin takes HOST=SHA256:...")
+    report = shared_manager().preflight(args.hosts, args.user, args.key, fingerprints=pins,
+                                        deadline_s=args.deadline, workers=args.workers)
+    for host, r in report["hosts"].items():
+        if emit_ready or r["status"] != "success":
+            _emit(args, host, r, file)
+    if report["stragglers"]:
+        print(f"🐢 Stragglers: {', '.join(report['stragglers'])}", file=sys.stderr)
+    return report
+
+
+def _fan_out(args, fn) -> int:
+    """Run fn(host) over args.hosts in parallel, printing results as they finish; exit code 1 on any failure."""
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from contextlib import nullcontext, redirect_stdout
+
+    out = sys.stdout
+    failed = 0
+    # Step functions print progress; with --json it goes to stderr so stdout stays machine-readable.
+    # sys.stdout is swapped once before any worker starts and restored after all of them finished;
+    # results are written to the caller's stdout (`out`) by this thread only.
+    with redirect_stdout(sys.stderr) if args.json else nullcontext():
+        if getattr(args, "preflight", False):
+            # Connect to every host up front; only hosts that are ready take part
+            report = _preflight(args, file=out)
+            failed, args.hosts = len(report["failed"]), report["ready"]
+            if not args.hosts:
+                return 1
+        with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(args.hosts)))) as pool:
+            futures = {pool.submit(fn, h): h for h in args.hosts}
+            for f in as_completed(futures):
+                host = futures[f]
+                try:
+                    result = f.result()
+                except Exception as e:
+                    result = {"status": "failure", "message": f"Error on {host}: {e}"}
+                failed += result.get("status") != "success"
+                _emit(args, host, result, out)
+    return 1 if failed else 0
+
+
+# ---------- Commands ----------
+def cmd_discover(args) -> int:
+    from app.core.host_discovery import discover_hosts
+
+    found = discover_hosts(args.subnet, args.user, args.key, ssh_check=not args.ping_only,
+                           fetch_hostname=not args.ping_only, max_workers=args.workers)
+    for r in found:
+        _emit(args, r["ip"], {"status": "success", "message": r.get("hostname") or "reachable", **r})
+    return 0 if found else 1
+
+
+def cmd_push(args) -> int:
+    from app.core.iptables_push import push_iptables_ruleset
+
+    return _fan_out(args, lambda h: push_iptables_ruleset(h, args.user, args.key, args.rules, args.remote))
+
+
+def cmd_validate(args) -> int:
+    from app.core.iptables_validate import validate_iptables_rules
+
+    return _fan_out(args, lambda h: validate_iptables_rules(h, args.user, args.key, args.remote))
+
+
+def cmd_apply(args) -> int:
+    from app.core.iptables_apply import apply_iptables_rules
+
+    return _fan_out(args, lambda h: apply_iptables_rules(h, args.user, args.key, args.remote,
+                                                         rollback_timeout_s=args.rollback_timeout))
+
+
+def cmd_snapshot(args) -> int:
+    from app.core.ruleset_collector import collect_ruleset
+    from app.utils.parser import serialize_ruleset
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    def snapshot(host):
+        r = collect_ruleset(host, args.user, args.key, table=args.table, compress=not args.no_compress)
+        if r["status"] != "success":
+            return r
+        text = serialize_ruleset(r.pop("ruleset"))
+        if args.out:
+            from app.utils.file_manager import atomic_write
+            path = os.path.join(args.out, f"{host}.rules")
+            atomic_write(path, text)
+            r["message"] = f"{r['message']} → {path}"
+        else:
+            r["ruleset"] = text
+        return r
+
+    if args.out or args.json:
+        return _fan_out(args, snapshot)
+    # No --out: print the rulesets themselves, one host after another
+    code = 0
+    for host in args.hosts:
+        r = snapshot(host)
+        if r["status"] != "success":
+            _emit(args, host, r)
+            code = 1
+            continue
+        print(f"# {host}\n{r['ruleset']}", end="", flush=True)
+    return code
+
+
+def cmd_preflight(args) -> int:
+    report = _preflight(args, emit_ready=True)
+    return 0 if report["status"] == "success" else 1
+
+
+def cmd_logs(args) -> int:
+    import json
+    from app.core.iptables_logger import LOG_FILE
+    from app.utils.file_manager import MappedFile
+
+    if not os.path.exists(LOG_FILE):
+        print(f"⚠️ No KB log at {LOG_FILE}", file=sys.stderr)
+        return 1
+    # Filters need more than `n` lines to find `n` matches; read backwards in growing steps
+    want = args.n
+    scan = want if not (args.host or args.action) else want * 8
+    with MappedFile(LOG_FILE) as mf:
+        while True:
+            lines = mf.tail(scan)
+            entries = []
+            for line in lines:
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    continue
+                if (args.host and e.get("host") != args.host) or (args.action and e.get("action") != args.action):
+                    continue
+                entries.append(e)
+            if len(entries) >= want or len(lines) < scan:
+                break
+            scan *= 4
+    for e in entries[-want:]:
+        if args.json:
+            print(json.dumps(e))
+        else:
+            mark = "✅" if e.get("status") == "success" else "❌"
+            print(f"{e.get('timestamp', '?')[:19]} {mark} {e.get('action', '?'):<9} {e.get('host', '?'):<15} "
+                  f"{e.get('message', '')}")
+    return 0
+
+
+# ---------- Parser ----------
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m app.cli", description="iptables fleet operations")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--user", default=DEFAULT_USER, help="SSH user (default: %(default)s)")
+    common.add_argument("--key", default=DEFAULT_KEY, help="SSH private key (default: $IPTABLES_GUI_SSH_KEY or ~/.ssh/id_rsa)")
+    common.add_argument("--workers", type=int, default=HOST_WORKERS, help="hosts handled in parallel")
+    common.add_argument("--json", action="store_true", help="one JSON object per line on stdout")
+    fleet = argparse.ArgumentParser(add_help=False, parents=[common])
+    fleet.add_argument("hosts", nargs="+", help="target hosts")
+    remote = argparse.ArgumentParser(add_help=False)
+    remote.add_argument("--remote", default=DEFAULT_REMOTE_RULES, help="ruleset path on the hosts")
+    warm = argparse.ArgumentParser(add_help=False)
+    warm.add_argument("--pin", action="append", default=[], metavar="HOST=SHA256:...",
+                      help="expected host key fingerprint (repeatable)")
+    warm.add_argument("--deadline", type=float, metavar="SECONDS", help="stop waiting for slow hosts after SECONDS")
+    staged = argparse.ArgumentParser(add_help=False, parents=[warm])
+    staged.add_argument("--preflight", action="store_true",
+                        help="warm and check all sessions first; only ready hosts proceed")
+
+    sub = ap.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    p = sub.add_parser("discover", parents=[common], help="find reachable SSH hosts in a subnet")
+    p.add_argument("subnet", help="e.g. 10.10.0.0/24")
+    p.add_argument("--ping-only", action="store_true", help="skip the SSH login check")
+    p.set_defaults(fn=cmd_discover)
+
+    p = sub.add_parser("push", parents=[fleet, remote, staged], help="upload a ruleset file")
+    p.add_argument("--rules", default="./iptables.rules", help="local ruleset (default: %(default)s)")
+    p.set_defaults(fn=cmd_push)
+
+    p = sub.add_parser("validate", parents=[fleet, remote, staged], help="iptables-restore --test the pushed ruleset")
+    p.set_defaults(fn=cmd_validate)
+
+    p = sub.add_parser("apply", parents=[fleet, remote, staged], help="apply the pushed ruleset")
+    p.add_argument("--rollback-timeout", type=int, metavar="SECONDS",
+                   help="arm an on-host rollback unless confirmed within SECONDS")
+    p.set_defaults(fn=cmd_apply)
+
+    p = sub.add_parser("snapshot", parents=[fleet], help="fetch the live rulesets")
+    p.add_argument("--table", help="only this table")
+    p.add_argument("--out", metavar="DIR", help="write <host>.rules files instead of printing")
+    p.add_argument("--no-compress", action="store_true", help="plain transfer (no gzip on the host)")
+    p.set_defaults(fn=cmd_snapshot)
+
+    p = sub.add_parser("preflight", parents=[fleet, warm], help="connect to hosts and check iptables access")
+    p.set_defaults(fn=cmd_preflight)
+
+    p = sub.add_parser("logs", help="show recent KB log entries")
+    p.add_argument("-n", type=int, default=20, help="entries to show (default: %(default)s)")
+    p.add_argument("--host", help="only this host")
+    p.add_argument("--action", help="only push, validate, apply, ...")
+    p.add_argument("--json", action="store_true", help="raw JSON lines")
+    p.set_defaults(fn=cmd_logs)
+    return ap
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.fn(args)
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Module: circuit_breaker
+Phase: 6
+Milestone: 4
+Step: 1
+Purpose:
+    Per-host failure isolation for SSHSessionManager.
+      - CircuitBreaker: closed → open after consecutive transport failures,
+        half-open after a cooldown lets a single probe through, which closes
+        it again on success or re-opens it with a longer cooldown
+      - LatencyTracker: recent connect latencies → adaptive connect timeout
+        (a multiple of p95, clamped), so slow-but-alive hosts keep working
+        and dead hosts stop costing the full default timeout
+"""
+
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+# ---------- Tunables ----------
+BREAKER_FAILURES        = 3        # consecutive transport failures before opening
+BREAKER_COOLDOWN_S      = 15.0     # first open period
+BREAKER_MAX_COOLDOWN_S  = 300.0    # cap for repeated failed probes
+BREAKER_BACKOFF         = 2.0      # cooldown multiplier per failed probe
+LATENCY_WINDOW          = 64       # recent samples kept per host
+LATENCY_MIN_SAMPLES     = 5        # below this, use the caller's timeout
+TIMEOUT_P95_MULTIPLIER  = 4.0
+TIMEOUT_FLOOR_S         = 1.0
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """Three-state breaker. `allow()` before a call, then `success()` or `failure()`."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S,
+                 clock=time.monotonic):
+        self._threshold = failures
+        self._base_cooldown = cooldown_s
+        self._cooldown = cooldown_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """True if a call may proceed; in half-open state only one probe at a time."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self._clock() - self.opened_at >= self._cooldown:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._cooldown = self._base_cooldown
+            self._probe_in_flight = False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN:
+                # Failed probe: stay away longer
+                self._cooldown = min(self._cooldown * BREAKER_BACKOFF, BREAKER_MAX_COOLDOWN_S)
+                self._open()
+            elif self.state == CLOSED and self.consecutive_failures >= self._threshold:
+                self._open()
+
+    def release(self):
+        """End a half-open probe that was neither a success nor a transport failure."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = self._clock()
+        self.trips += 1
+        self._probe_in_flight = False
+
+    def retry_in(self) -> float:
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self._cooldown - (self._clock() - self.opened_at))
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+            "retry_in_s": round(self.retry_in(), 1),
+        }
+
+
+class LatencyTracker:
+    """Sliding window of latencies (seconds) with a percentile-based timeout."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)     # deque.append is atomic
+
+    def timed_out(self):
+        """
+        A dial ran out the adaptive timeout: the history no longer describes
+        the host (it got slower), so forget it and give the next dials the
+        caller's full timeout until there are enough new samples.
+        """
+        self._samples.clear()
+
+    def percentile(self, q: float) -> Optional[float]:
+        samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def timeout(self, ceiling: float) -> float:
+        """Adaptive timeout, never above `ceiling` (the caller's configured timeout)."""
+        if len(self._samples) < LATENCY_MIN_SAMPLES:
+            return ceiling
+        p95 = self.percentile(0.95)
+        return max(TIMEOUT_FLOOR_S, min(ceiling, p95 * TIMEOUT_P95_MULTIPLIER))
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    now = [0.0]
+    cb = CircuitBreaker(failures=3, cooldown_s=10, clock=lambda: now[0])
+    for _ in range(3):
+        assert cb.allow()
+        cb.failure()
+    print("after 3 failures:", cb.snapshot())
+    assert not cb.allow()
+    now[0] = 10.0
+    print("probe allowed:", cb.allow(), "second caller:", cb.allow())
+    cb.failure()
+    print("failed probe:", cb.snapshot())
+    now[0] = 30.0
+    cb.allow()
+    cb.success()
+    print("recovered:", cb.snapshot())
+
+    lt = LatencyTracker()
+    for ms in (20, 25, 22, 30, 21, 24, 400):
+        lt.add(ms / 1000)
+    print(f"✅ adaptive connect timeout: {lt.timeout(5.0):.2f}s (p95 {lt.percentile(0.95):.3f}s)")
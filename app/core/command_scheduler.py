@@ -0,0 +1,366 @@
+"""
+Module: command_scheduler
+Phase: 6
+Milestone: 6
+Step: 7
+Purpose:
+    Admission control in front of SSHSessionManager, so bulk rollouts and
+    background polling cannot starve interactive GUI reads.
+      - Priority classes: interactive > rollout > background; waiting
+        commands are admitted highest class first, FIFO per host, round-robin
+        across hosts
+      - Global and per-host concurrency limits, with slots held back for the
+        higher classes (a full rollout still leaves room for the UI)
+      - Token-bucket rate limits per class (interactive is not rate limited)
+      - Backpressure: bounded queues and waits, failing fast with
+        error_type "Overloaded"/"QueueTimeout"; queue depth, in-flight,
+        wait time, throttling and rejections are exported as metrics
+    scheduler.lane(ROLLOUT) is a drop-in `mgr` for push/validate/apply/...:
+    its exec() is scheduled, everything else goes to the session manager.
+"""
+
+from __future__ import annotations
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+from app.core import metrics
+from app.core.ssh_session_manager import DEFAULT_TIMEOUT_S, SSHSessionManager, shared_manager
+
+
+INTERACTIVE, ROLLOUT, BACKGROUND = "interactive", "rollout", "background"
+PRIORITIES = (INTERACTIVE, ROLLOUT, BACKGROUND)        # highest first
+
+# ---------- Tunables ----------
+MAX_INFLIGHT   = 64        # commands running at once, all hosts
+MAX_PER_HOST   = 4         # commands running at once on one host
+# Slots a class leaves free for the classes above it (global, per host)
+HEADROOM       = {INTERACTIVE: (0, 0), ROLLOUT: (8, 1), BACKGROUND: (16, 2)}
+# Token buckets: (commands per second, burst); None = not rate limited
+RATES          = {INTERACTIVE: None, ROLLOUT: (100.0, 200), BACKGROUND: (20.0, 40)}
+MAX_QUEUED     = {INTERACTIVE: 1000, ROLLOUT: 10000, BACKGROUND: 500}
+MAX_WAIT_S     = {INTERACTIVE: 30.0, ROLLOUT: 600.0, BACKGROUND: 120.0}
+
+_SCHEDULERS: "weakref.WeakSet[CommandScheduler]" = weakref.WeakSet()
+
+SCHED_WAIT_SECONDS = metrics.histogram("scheduler_wait_seconds", "Time commands waited for admission",
+                                       ("priority",))
+SCHED_THROTTLED_TOTAL = metrics.counter("scheduler_throttled_total", "Commands delayed by the rate limit",
+                                        ("priority",))
+SCHED_REJECTED_TOTAL = metrics.counter("scheduler_rejected_total", "Commands refused by backpressure",
+                                       ("priority", "reason"))
+
+
+def _sum_stats(field: str) -> Dict[Tuple[str, ...], float]:
+    out = {(p,): 0 for p in PRIORITIES}
+    for s in list(_SCHEDULERS):
+        for p, n in s.stats()[field].items():
+            out[(p,)] += n
+    return out
+
+
+metrics.gauge("scheduler_queue_depth", "Commands waiting for admission", ("priority",),
+              fn=lambda: _sum_stats("queued"))
+metrics.gauge("scheduler_inflight", "Admitted commands still running", ("priority",),
+              fn=lambda: _sum_stats("inflight"))
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`; starts full."""
+
+    __slots__ = ("rate", "burst", "tokens", "_last", "_clock")
+
+    def __init__(self, rate: float, burst: float, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._clock = clock
+        self._last = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Seconds until the next token is available."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Backpressure(RuntimeError):
+    """Admission refused; `result` is the failure dict handed back to the caller."""
+
+    def __init__(self, result: Dict[str, object]):
+        super().__init__(result["message"])
+        self.result = result
+
+
+class _Request:
+    __slots__ = ("host", "priority", "granted", "throttled")
+
+    def __init__(self, host: str, priority: str):
+        self.host = host
+        self.priority = priority
+        self.granted = False
+        self.throttled = False
+
+
+class CommandScheduler:
+    """
+    Priority-aware admission in front of a session manager:
+        sched = CommandScheduler(shared_manager())
+        sched.exec(host, user, key, "iptables -S", priority=INTERACTIVE)
+        apply_iptables_rules(host, ..., mgr=sched.lane(ROLLOUT))
+    Callers block in their own thread until admitted; the command then runs
+    on that thread.
+    """
+
+    def __init__(
+        self,
+        mgr: Optional[SSHSessionManager] = None,
+        max_inflight: int = MAX_INFLIGHT,
+        max_per_host: int = MAX_PER_HOST,
+        rates: Optional[Dict[str, Optional[Tuple[float, float]]]] = None,
+        clock=time.monotonic,
+    ):
+        self.mgr = mgr or shared_manager()
+        self.max_inflight = max_inflight
+        self.max_per_host = max_per_host
+        rates = RATES if rates is None else {**RATES, **rates}
+        self._buckets = {p: TokenBucket(r[0], r[1], clock) for p, r in rates.items() if r}
+        self._cond = threading.Condition()
+        # priority → host → FIFO of waiting requests (host order rotates for fairness)
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Request]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._queued = {p: 0 for p in PRIORITIES}
+        self._inflight = {p: 0 for p in PRIORITIES}
+        self._host_inflight: Dict[str, int] = {}
+        self._next_token: Optional[float] = None
+        self._clock = clock
+        _SCHEDULERS.add(self)
+
+    # ---------- Admission ----------
+    def _pump(self) -> bool:
+        """Grant every waiting request that fits now (caller holds the lock)."""
+        granted = False
+        next_token = None
+        total = sum(self._inflight.values())
+        for p in PRIORITIES:
+            queues = self._queues[p]
+            if not queues:
+                continue
+            global_room, host_room = HEADROOM[p]
+            global_limit = max(1, self.max_inflight - global_room)
+            host_limit = max(1, self.max_per_host - host_room)
+            if total >= global_limit:
+                break               # lower classes keep even more headroom
+            bucket = self._buckets.get(p)
+            for host in list(queues):
+                q = queues[host]
+                if self._host_inflight.get(host, 0) < host_limit:
+                    if bucket is not None and not bucket.take():
+                        wait = bucket.wait_time()
+                        next_token = wait if next_token is None else min(next_token, wait)
+                        q[0].throttled = True
+                        break       # this class is out of tokens
+                    req = q.popleft()
+                    req.granted = granted = True
+                    self._queued[p] -= 1
+                    self._inflight[p] += 1
+                    self._host_inflight[host] = self._host_inflight.get(host, 0) + 1
+                    total += 1
+                    # one per host per pass, then to the back: round-robin across hosts
+                    if q:
+                        queues.move_to_end(host)
+                    else:
+                        del queues[host]
+                    if total >= global_limit:
+                        break
+        self._next_token = next_token
+        return granted
+
+    def _admit(self, host: str, priority: str, max_wait_s: Optional[float]) -> Optional[Dict[str, object]]:
+        """Block until admitted; returns a failure dict instead if refused."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority!r} (use one of {', '.join(PRIORITIES)})")
+        max_wait_s = MAX_WAIT_S[priority] if max_wait_s is None else max_wait_s
+        started = self._clock()
+        req = _Request(host, priority)
+        with self._cond:
+            if self._queued[priority] >= MAX_QUEUED[priority]:
+                SCHED_REJECTED_TOTAL.inc(priority, "overloaded")
+                return _refused("Overloaded", f"{priority} queue is full ({MAX_QUEUED[priority]} waiting); "
+                                              f"try again later")
+            self._queues[priority].setdefault(host, deque()).append(req)
+            self._queued[priority] += 1
+            while True:
+                while self._pump():
+                    self._cond.notify_all()
+                if req.granted:
+                    break
+                left = started + max_wait_s - self._clock()
+                if left <= 0:
+                    q = self._queues[priority].get(host)
+                    q.remove(req)
+                    if not q:
+                        del self._queues[priority][host]
+                    self._queued[priority] -= 1
+                    SCHED_REJECTED_TOTAL.inc(priority, "timeout")
+                    return _refused("QueueTimeout", f"{host}: not admitted within {max_wait_s:.0f}s "
+                                                    f"({priority}); the fleet is busy")
+                self._cond.wait(left if self._next_token is None else min(left, self._next_token + 0.001))
+        SCHED_WAIT_SECONDS.observe(self._clock() - started, priority)
+        if req.throttled:
+            SCHED_THROTTLED_TOTAL.inc(priority)
+        return None
+
+    def _release(self, host: str, priority: str):
+        with self._cond:
+            self._inflight[priority] -= 1
+            n = self._host_inflight[host] - 1
+            if n:
+                self._host_inflight[host] = n
+            else:
+                del self._host_inflight[host]
+            self._pump()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, host: str, priority: str = ROLLOUT, max_wait_s: Optional[float] = None) -> Iterator[None]:
+        """Hold one admission for multi-step work (e.g. an SFTP transfer); raises Backpressure if refused."""
+        refused = self._admit(host, priority, max_wait_s)
+        if refused is not None:
+            raise Backpressure(refused)
+        try:
+            yield
+        finally:
+            self._release(host, priority)
+
+    # ---------- Execution ----------
+    def exec(
+        self,
+        host: str,
+        user: str,
+        key_path: str,
+        command: str,
+        port: int = 22,
+        timeout: int = DEFAULT_TIMEOUT_S,
+        sink=None,
+        fresh: bool = False,
+        priority: str = ROLLOUT,
+        max_wait_s: Optional[float] = None,
+    ) -> dict:
+        """SSHSessionManager.exec() once admitted; a refusal comes back as a failure result."""
+        refused = self._admit(host, priority, max_wait_s)
+        if refused is not None:
+            return refused
+        try:
+            return self.mgr.exec(host, user, key_path, command, port=port, timeout=timeout, sink=sink, fresh=fresh)
+        finally:
+            self._release(host, priority)
+
+    def lane(self, priority: str) -> "Lane":
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority!r}")
+        return Lane(self, priority)
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            return {
+                "queued": dict(self._queued),
+                "inflight": dict(self._inflight),
+                "hosts_busy": len(self._host_inflight),
+                "tokens": {p: round(b.tokens, 1) for p, b in self._buckets.items()},
+            }
+
+
+class Lane:
+    """A CommandScheduler bound to one priority, usable wherever an SSHSessionManager is expected."""
+
+    __slots__ = ("scheduler", "priority")
+
+    def __init__(self, scheduler: CommandScheduler, priority: str):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def exec(self, host: str, user: str, key_path: str, command: str, port: int = 22,
+             timeout: int = DEFAULT_TIMEOUT_S, sink=None, fresh: bool = False) -> dict:
+        return self.scheduler.exec(host, user, key_path, command, port=port, timeout=timeout, sink=sink,
+                                   fresh=fresh, priority=self.priority)
+
+    def slot(self, host: str, max_wait_s: Optional[float] = None):
+        return self.scheduler.slot(host, self.priority, max_wait_s)
+
+    def __getattr__(self, name: str):
+        # get_session, close_host, circuit(), ...: straight to the session manager
+        return getattr(self.scheduler.mgr, name)
+
+
+def _refused(error_type: str, message: str) -> Dict[str, object]:
+    return {
+        "status": "failure",
+        "exit_code": None,
+        "stdout": "",
+        "stderr": message,
+        "message": message,
+        "error_type": error_type,
+        "retries": 0,
+    }
+
+
+@contextmanager
+def admitted(mgr, host: str) -> Iterator[None]:
+    """Hold a scheduler slot when `mgr` is a Lane; a no-op for a plain session manager."""
+    if isinstance(mgr, Lane):
+        with mgr.slot(host):
+            yield
+    else:
+        yield
+
+
+# ---------- Shared schedulers ----------
+_SHARED: Dict[str, CommandScheduler] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_scheduler(name: str = "default") -> CommandScheduler:
+    """Process-wide scheduler in front of shared_manager(name)."""
+    with _SHARED_LOCK:
+        sched = _SHARED.get(name)
+        if sched is None:
+            sched = _SHARED[name] = CommandScheduler(shared_manager(name))
+        return sched
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    class SlowManager:
+        def exec(self, host, user, key_path, command, **kw):
+            time.sleep(0.05)
+            return {"status": "success", "stdout": command}
+
+    sched = CommandScheduler(SlowManager(), max_inflight=24, max_per_host=2)
+    rollout = sched.lane(ROLLOUT)
+    hosts = [f"10.10.0.{i}" for i in range(20)]
+    with ThreadPoolExecutor(64) as pool:
+        bulk = [pool.submit(rollout.exec, h, "root", "-", "iptables-restore") for h in hosts * 3]
+        time.sleep(0.1)
+        t0 = time.perf_counter()
+        sched.exec("10.10.0.1", "root", "-", "iptables -S", priority=INTERACTIVE)
+        print(f"⚡ interactive read during rollout: {(time.perf_counter() - t0) * 1000:.0f} ms")
+        print("📊", sched.stats())
+        for f in bulk:
+            f.result()
+    print("✅ rollout done:", sched.stats())
@@ -0,0 +1,394 @@
+"""
+Module: counter_store
+Phase: 6
+Milestone: 6
+Step: 9
+Purpose:
+    Time series of per-rule packet/byte counters, so hit counters survive
+    past the `iptables -L -v` call that read them.
+      - Columnar on-disk segments per host under db/counters/<host>/: the
+        rule ids of the segment (rules.npy) and append-only int64 columns
+        ts.i64 [T], packets.i64 / bytes.i64 [T x R], read straight into NumPy
+      - Rules are identified by (host, table, chain, spec) in rules.jsonl;
+        a new segment starts when a host's rule set changes
+      - Vectorized queries over any window: per-rule rates, top-N and
+        anomalies (rules that suddenly spike or go dead); counter resets
+        (reboot, iptables -Z) are detected as decreasing counters
+    Sampling reuses collect_ruleset(counters=True), many hosts in parallel.
+"""
+
+from __future__ import annotations
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.core.ruleset_store import _host_ref_name, _timestamp
+from app.utils.parser import Ruleset
+
+
+# ---------- Tunables ----------
+COUNTER_DIR     = Path(__file__).resolve().parents[2] / "db" / "counters"
+SEGMENT_ROWS    = 2016        # samples per segment (a week at 5-minute sampling)
+SAMPLE_WORKERS  = 32          # hosts sampled in parallel
+SPIKE_FACTOR    = 5.0         # recent rate > factor x baseline rate → spike
+MIN_RATE        = 0.01        # packets/s below which rates are too small to flag
+
+RuleKey = Tuple[str, str, str, str]          # (host, table, chain, spec)
+When = Union[float, str, datetime.datetime]
+
+
+class _Segment:
+    """One host's samples for a fixed rule set: rules.npy + appendable int64 columns."""
+
+    __slots__ = ("path", "rules", "rows", "first_ts", "last_ts")
+
+    def __init__(self, path: Path, rules: Optional[np.ndarray] = None):
+        self.path = path
+        if rules is None:
+            self.rules = np.load(path / "rules.npy")
+        else:
+            path.mkdir(parents=True)
+            np.save(path / "rules.npy", rules)
+            self.rules = rules
+        self.rows = self._repair()
+        ts = np.fromfile(path / "ts.i64", np.int64) if self.rows else np.empty(0, np.int64)
+        self.first_ts = int(ts[0]) if self.rows else None
+        self.last_ts = int(ts[-1]) if self.rows else None
+
+    def _repair(self) -> int:
+        """Rows fully written; a torn append (crash) is cut back to the last whole row."""
+        width = len(self.rules) * 8
+        sizes = [(self.path / f).stat().st_size if (self.path / f).exists() else 0
+                 for f in ("ts.i64", "packets.i64", "bytes.i64")]
+        rows = min(sizes[0] // 8, sizes[1] // width if width else sizes[0] // 8,
+                   sizes[2] // width if width else sizes[0] // 8)
+        for f, size, want in zip(("ts.i64", "packets.i64", "bytes.i64"), sizes, (8, width, width)):
+            if size != rows * want:
+                os.truncate(self.path / f, rows * want)
+        return rows
+
+    def append(self, ts: np.ndarray, packets: np.ndarray, bytes_: np.ndarray):
+        # Counters first, ts last: a row only counts once its timestamp is on disk
+        for name, arr in (("packets.i64", packets), ("bytes.i64", bytes_), ("ts.i64", ts)):
+            with open(self.path / name, "ab") as f:
+                f.write(np.ascontiguousarray(arr, np.int64).tobytes())
+        self.rows += len(ts)
+        if self.first_ts is None:
+            self.first_ts = int(ts[0])
+        self.last_ts = int(ts[-1])
+
+    def read(self, lo: float = -np.inf, hi: float = np.inf) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Rows with lo <= ts <= hi; only those rows of the counter columns are read."""
+        r = self.rules.size
+        ts = np.fromfile(self.path / "ts.i64", np.int64, count=self.rows)
+        i0, i1 = int(np.searchsorted(ts, lo, "left")), int(np.searchsorted(ts, hi, "right"))
+        n = max(0, i1 - i0)
+        packets = np.fromfile(self.path / "packets.i64", np.int64, count=n * r, offset=i0 * r * 8)
+        bytes_ = np.fromfile(self.path / "bytes.i64", np.int64, count=n * r, offset=i0 * r * 8)
+        return ts[i0:i0 + n], packets.reshape(n, r), bytes_.reshape(n, r)
+
+
+def _increase(values: np.ndarray, carry: np.ndarray) -> np.ndarray:
+    """
+    Per-row counter increases of a [T x R] block. Row 0 is compared with
+    `carry` (the previous sample, -1 if none: no increase); a decrease
+    means the counter was reset, so the new value is the increase.
+    """
+    d = np.diff(values, axis=0, prepend=carry[None, :])
+    d[0, carry < 0] = 0
+    reset = d < 0
+    d[reset] = values[reset]
+    return d
+
+
+def rule_keys(host: str, ruleset: Ruleset) -> Tuple[List[RuleKey], List[int], List[int]]:
+    """(keys, packets, bytes) of every rule carrying counters; repeated specs get a "#n" suffix."""
+    keys, packets, bytes_ = [], [], []
+    for table in ruleset.tables.values():
+        for chain in table.chains.values():
+            seen: Dict[str, int] = {}
+            for r in chain.rules:
+                if r.packets is None:
+                    continue
+                spec = r.to_line(counters=False)
+                n = seen[spec] = seen.get(spec, 0) + 1
+                keys.append((host, table.name, chain.name, spec if n == 1 else f"{spec} #{n}"))
+                packets.append(r.packets)
+                bytes_.append(r.bytes)
+    return keys, packets, bytes_
+
+
+class CounterStore:
+    """
+    Counter history for many hosts.
+        store = CounterStore()
+        store.record("10.10.0.20", ruleset)                 # a Ruleset parsed with counters
+        store.top(10, by="bytes", start="2025-01-01")
+        store.anomalies(recent_s=3600)
+    """
+
+    def __init__(self, root: Union[str, Path] = COUNTER_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._keys: List[RuleKey] = []
+        self._ids: Dict[RuleKey, int] = {}
+        self._segments: Dict[str, List[_Segment]] = {}
+        index = self.root / "rules.jsonl"
+        if index.exists():
+            with open(index) as f:
+                for line in f:
+                    try:
+                        key = tuple(json.loads(line))
+                    except ValueError:
+                        break               # torn last line
+                    self._ids[key] = len(self._keys)
+                    self._keys.append(key)
+
+    # ---------- Rules ----------
+    def _rule_ids(self, keys: Sequence[RuleKey]) -> np.ndarray:
+        new = [k for k in dict.fromkeys(keys) if k not in self._ids]
+        if new:
+            with open(self.root / "rules.jsonl", "a") as f:
+                for k in new:
+                    f.write(json.dumps(list(k)) + "\n")
+            for k in new:
+                self._ids[k] = len(self._keys)
+                self._keys.append(k)
+        return np.fromiter((self._ids[k] for k in keys), np.int32, len(keys))
+
+    def rule(self, rule_id: int) -> Dict[str, str]:
+        host, table, chain, spec = self._keys[rule_id]
+        return {"host": host, "table": table, "chain": chain, "rule": spec}
+
+    # ---------- Segments ----------
+    def _host_dir(self, host: str) -> Path:
+        return self.root / Path(_host_ref_name(host)).stem
+
+    def _host_segments(self, host: str) -> List[_Segment]:
+        segs = self._segments.get(host)
+        if segs is None:
+            d = self._host_dir(host)
+            names = sorted(os.listdir(d), key=lambda n: tuple(map(int, n.split("-")))) if d.exists() else []
+            segs = self._segments[host] = [_Segment(d / n) for n in names]
+        return segs
+
+    def _host_names(self) -> List[str]:
+        return sorted({k[0] for k in self._keys})
+
+    def hosts(self) -> List[str]:
+        with self._lock:
+            return self._host_names()
+
+    # ---------- Recording ----------
+    def record_batch(self, host: str, keys: Sequence[RuleKey], ts: Sequence[float],
+                     packets: np.ndarray, bytes_: np.ndarray):
+        """Append T samples of R rules at once: ts [T], packets/bytes [T x R] (backfills, imports)."""
+        ts = np.asarray(ts, np.float64).astype(np.int64)
+        packets = np.asarray(packets, np.int64).reshape(len(ts), len(keys))
+        bytes_ = np.asarray(bytes_, np.int64).reshape(len(ts), len(keys))
+        with self._lock:
+            ids = self._rule_ids(keys)
+            segs = self._host_segments(host)
+            seg = segs[-1] if segs else None
+            if (seg is None or seg.rows >= SEGMENT_ROWS or not np.array_equal(seg.rules, ids)
+                    or (seg.last_ts is not None and ts[0] < seg.last_ts)):
+                d = self._host_dir(host)
+                seq = int(segs[-1].path.name.split("-")[1]) + 1 if segs else 0
+                seg = _Segment(d / f"{int(ts[0])}-{seq}", ids)
+                segs.append(seg)
+            room = SEGMENT_ROWS - seg.rows
+            seg.append(ts[:room], packets[:room], bytes_[:room])
+        if len(ts) > room:
+            self.record_batch(host, keys, ts[room:], packets[room:], bytes_[room:])
+
+    def record(self, host: str, ruleset: Ruleset, when: Optional[When] = None) -> int:
+        """One sample of every counted rule in `ruleset`; returns the number of rules recorded."""
+        keys, packets, bytes_ = rule_keys(host, ruleset)
+        if keys:
+            ts = time.time() if when is None else _timestamp(when)
+            self.record_batch(host, keys, [ts], np.array([packets]), np.array([bytes_]))
+        return len(keys)
+
+    # ---------- Queries ----------
+    def _window(self, start: Optional[When], end: Optional[When], hosts: Optional[Iterable[str]]):
+        """
+        Counter increases per rule id within [start, end]: (packets, bytes,
+        first ts, last ts); never-sampled rules have NaN timestamps.
+        """
+        lo = -np.inf if start is None else _timestamp(start)
+        hi = np.inf if end is None else _timestamp(end)
+        with self._lock:
+            n = len(self._keys)
+            hosts = self._host_names() if hosts is None else list(hosts)
+            segs = [s for h in hosts for s in self._host_segments(h)
+                    if s.rows and s.last_ts >= lo and s.first_ts <= hi]
+        inc_p = np.zeros(n, np.int64)
+        inc_b = np.zeros(n, np.int64)
+        first = np.full(n, np.nan)
+        last = np.full(n, np.nan)
+        carry_p = np.full(n, -1, np.int64)
+        carry_b = np.full(n, -1, np.int64)
+        for seg in segs:                  # per host in time order: carries link adjacent segments
+            ts, packets, bytes_ = seg.read(lo, hi)
+            if not ts.size:
+                continue
+            r = seg.rules
+            inc_p[r] += _increase(packets, carry_p[r]).sum(axis=0)
+            inc_b[r] += _increase(bytes_, carry_b[r]).sum(axis=0)
+            first[r] = np.fmin(first[r], np.where(carry_p[r] < 0, ts[0], last[r]))
+            last[r] = ts[-1]
+            carry_p[r] = packets[-1]
+            carry_b[r] = bytes_[-1]
+        return inc_p, inc_b, first, last
+
+    def rates(self, start: Optional[When] = None, end: Optional[When] = None,
+              hosts: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Vectorized per-rule totals and average rates over the window:
+        {rule_id, packets, bytes, packets_per_s, bytes_per_s} arrays for every
+        rule sampled at least twice in it.
+        """
+        inc_p, inc_b, first, last = self._window(start, end, hosts)
+        span = last - first
+        ids = np.flatnonzero(span > 0)
+        return {
+            "rule_id": ids,
+            "packets": inc_p[ids],
+            "bytes": inc_b[ids],
+            "packets_per_s": inc_p[ids] / span[ids],
+            "bytes_per_s": inc_b[ids] / span[ids],
+        }
+
+    def top(self, n: int = 10, by: str = "packets", start: Optional[When] = None, end: Optional[When] = None,
+            hosts: Optional[Iterable[str]] = None) -> List[Dict[str, object]]:
+        """The `n` rules with the largest counter increase (by "packets" or "bytes") in the window."""
+        if by not in ("packets", "bytes"):
+            raise ValueError("'by' must be 'packets' or 'bytes'")
+        r = self.rates(start, end, hosts)
+        values = r[by]
+        k = min(n, len(values))
+        if k == 0:
+            return []
+        idx = np.argpartition(-values, k - 1)[:k]
+        idx = idx[np.argsort(-values[idx], kind="stable")]
+        return [{**self.rule(int(r["rule_id"][i])), "packets": int(r["packets"][i]), "bytes": int(r["bytes"][i]),
+                 "packets_per_s": round(float(r["packets_per_s"][i]), 3),
+                 "bytes_per_s": round(float(r["bytes_per_s"][i]), 3)} for i in idx]
+
+    def anomalies(
+        self,
+        recent_s: float = 3600,
+        baseline_s: float = 7 * 86400,
+        now: Optional[When] = None,
+        spike_factor: float = SPIKE_FACTOR,
+        min_rate: float = MIN_RATE,
+        hosts: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, object]]:
+        """
+        Rules whose packet rate over the last `recent_s` seconds departs from
+        the preceding `baseline_s`: "spike" (> spike_factor x baseline and at
+        least min_rate) or "dead" (baseline >= min_rate, no hits since).
+        """
+        now = time.time() if now is None else _timestamp(now)
+        split = now - recent_s
+        base_p, _, base_first, base_last = self._window(split - baseline_s, split, hosts)
+        rec_p, _, rec_first, rec_last = self._window(split, now, hosts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            base_rate = np.where(base_last - base_first > 0, base_p / (base_last - base_first), np.nan)
+            rec_rate = np.where(rec_last - rec_first > 0, rec_p / (rec_last - rec_first), np.nan)
+        seen = ~np.isnan(base_rate) & ~np.isnan(rec_rate)
+        spike = seen & (rec_rate >= min_rate) & (rec_rate > spike_factor * base_rate)
+        dead = seen & (base_rate >= min_rate) & (rec_p == 0)
+        out = []
+        for kind, mask in (("spike", spike), ("dead", dead)):
+            for i in np.flatnonzero(mask):
+                out.append({**self.rule(int(i)), "kind": kind, "baseline_pps": round(float(base_rate[i]), 3),
+                            "recent_pps": round(float(rec_rate[i]), 3)})
+        out.sort(key=lambda a: (a["kind"], -abs(a["recent_pps"] - a["baseline_pps"])))
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            hosts = self._host_names()
+            segs = [s for h in hosts for s in self._host_segments(h)]
+            return {"hosts": len(hosts), "rules": len(self._keys), "segments": len(segs),
+                    "samples": sum(s.rows for s in segs),
+                    "bytes": sum(f.stat().st_size for s in segs for f in s.path.iterdir())}
+
+
+_DEFAULT: Optional[CounterStore] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_counter_store() -> CounterStore:
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None or _DEFAULT.root != Path(COUNTER_DIR):
+            _DEFAULT = CounterStore(COUNTER_DIR)
+        return _DEFAULT
+
+
+# ---------- Sampling ----------
+def sample_host(host: str, user: str, key_path: str, store: Optional[CounterStore] = None,
+                mgr=None) -> Dict[str, object]:
+    """Collect the live counters of one host (iptables-save -c) and record them."""
+    from app.core.ruleset_collector import collect_ruleset
+
+    r = collect_ruleset(host, user, key_path, counters=True, mgr=mgr)
+    if r["status"] != "success":
+        return {"status": "failure", "message": f"Counter sample failed on {host}: {r['message']}"}
+    n = (store or default_counter_store()).record(host, r["ruleset"])
+    return {"status": "success", "message": f"Recorded {n} rule counters from {host}", "rules": n}
+
+
+def sample_hosts(hosts: Iterable[str], user: str, key_path: str, store: Optional[CounterStore] = None,
+                 mgr=None, workers: int = SAMPLE_WORKERS) -> Dict[str, object]:
+    hosts = list(hosts)
+    store = store or default_counter_store()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(hosts)))) as pool:
+        results = dict(zip(hosts, pool.map(lambda h: sample_host(h, user, key_path, store, mgr), hosts)))
+    failed = [h for h, r in results.items() if r["status"] != "success"]
+    return {
+        "status": "success" if not failed else "partial",
+        "message": f"Sampled {len(hosts) - len(failed)}/{len(hosts)} hosts",
+        "hosts": results,
+        "failed": failed,
+    }
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    HOSTS, RULES, DAYS, STEP_S = 20, 200, 28, 600
+    rng = np.random.default_rng(7)
+    store = CounterStore(tempfile.mkdtemp(prefix="counters-"))
+    now = 1_700_000_000
+    ts = now - DAYS * 86400 + np.arange(DAYS * 86400 // STEP_S) * STEP_S
+    t0 = time.perf_counter()
+    for h in range(HOSTS):
+        host = f"10.10.{h // 250}.{h % 250}"
+        keys = [(host, "filter", "INPUT", f"-A INPUT -p tcp --dport {1000 + i} -j ACCEPT") for i in range(RULES)]
+        pps = rng.gamma(0.5, 20, RULES)
+        packets = np.cumsum(rng.poisson(pps * STEP_S, (len(ts), RULES)), axis=0)
+        store.record_batch(host, keys, ts, packets, packets * 400)
+    print(f"💾 {HOSTS * RULES} rules x {len(ts)} samples written in {time.perf_counter() - t0:.1f}s: {store.stats()}")
+
+    t0 = time.perf_counter()
+    top = store.top(5, by="bytes")
+    print(f"🏆 top 5 over {DAYS} days in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    for r in top:
+        print(f"   {r['host']} {r['rule']}: {r['bytes_per_s']:.0f} B/s")
+    t0 = time.perf_counter()
+    found = store.anomalies(recent_s=3600, baseline_s=7 * 86400, now=now)
+    print(f"🚨 {len(found)} anomalies in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    shutil.rmtree(store.root)
@@ -0,0 +1,268 @@
+"""
+Module: drift_report
+Phase: 6
+Milestone: 6
+Step: 3
+Purpose:
+    Which hosts diverge from their intended policy, without downloading every
+    ruleset.
+      - The host hashes each chain of its own iptables-save output (counters
+        stripped) and sends back one sha256 per chain
+      - The same digests are computed locally over the intended ruleset,
+        canonicalized the way iptables-save prints rules
+      - Only chains whose digests differ are fetched (`iptables -S CHAIN`) and
+        diffed; hosts are checked in parallel
+      - Intended state comes from the compiled host-group policies or from the
+        last version recorded in the ruleset store
+"""
+
+from __future__ import annotations
+import hashlib
+import shlex
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+from app.core import metrics
+from app.core.iptables_backend import normalize_spec
+from app.core.metrics import record_stage
+from app.core.ssh_session_manager import SSHSessionManager, shared_manager
+from app.core.tracing import traced
+from app.utils.parser import (Chain, ParseError, Rule, Ruleset, _split, diff_rulesets,
+                              parse_iptables_save)
+
+
+# ---------- Tunables ----------
+DRIFT_WORKERS = 32          # hosts checked in parallel by drift_report()
+
+DRIFT_CHAINS_TOTAL = metrics.counter("drift_chains_total", "Chains compared by drift checks", ("result",))
+
+ChainKey = Tuple[str, str]          # (table, chain)
+Intended = Callable[[str], Union[Ruleset, str]]
+
+
+def digest_command(tables: Optional[Iterable[str]] = None) -> str:
+    """
+    Remote shell command printing the chain index ("chain <n> <table> <name>")
+    and then "<sha256>  <n>" per chain. Each chain is hashed as its declaration
+    without counters followed by its rules, one per line, as iptables-save
+    prints them.
+    """
+    saves = [f"iptables-save -t {shlex.quote(t)}" for t in tables] if tables else ["iptables-save"]
+    awk = (
+        "/^\\*/ { t = substr($0, 2); next } "
+        "/^:/ { sub(/ \\[[0-9]+:[0-9]+\\]$/, \"\"); c = substr($1, 2); n++; f[t \" \" c] = n; "
+        "print \"chain \" n \" \" t \" \" c; print > (d \"/\" n); close(d \"/\" n); next } "
+        "/^-A / { p = d \"/\" f[t \" \" $2]; if (p != o) { if (o != \"\") close(o); o = p } print >> p }"
+    )
+    return (
+        "D=$(mktemp -d) || exit 1; trap 'rm -rf \"$D\"' EXIT; "
+        f"{{ {'; '.join(saves)}; }} | awk -v d=\"$D\" '{awk}' && cd \"$D\" && "
+        "set -- * && { [ ! -e \"$1\" ] || sha256sum -- \"$@\"; }"
+    )
+
+
+def parse_digests(output: str) -> Dict[ChainKey, str]:
+    names: Dict[str, ChainKey] = {}
+    digests: Dict[ChainKey, str] = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 4 and parts[0] == "chain":
+            names[parts[1]] = (parts[2], parts[3])
+        elif len(parts) == 2 and parts[1] in names:
+            digests[names[parts[1]]] = parts[0]
+    return digests
+
+
+def canonical(ruleset: Ruleset) -> Ruleset:
+    """Copy of `ruleset` with every rule rewritten the way iptables-save prints it."""
+    out = Ruleset()
+    for table in ruleset.tables.values():
+        t = out.table(table.name)
+        for chain in table.chains.values():
+            t.chains[chain.name] = c = Chain(chain.name, chain.policy)
+            c.rules = [Rule(chain.name, normalize_spec(r.args)) for r in chain.rules]
+    return out
+
+
+def local_digests(ruleset: Ruleset) -> Dict[ChainKey, str]:
+    """Per-chain digests matching digest_command() for a canonical ruleset."""
+    out = {}
+    for table in ruleset.tables.values():
+        for chain in table.chains.values():
+            body = [chain.header(counters=False)] + [r.to_line(counters=False) for r in chain.rules]
+            out[(table.name, chain.name)] = hashlib.sha256(("\n".join(body) + "\n").encode()).hexdigest()
+    return out
+
+
+def fetch_command(chains: Iterable[ChainKey]) -> str:
+    """`iptables -S` for just these chains, each section headed by "*<table> <chain>"."""
+    return "; ".join(f"echo {shlex.quote(f'*{t} {c}')}; iptables -t {shlex.quote(t)} -S {shlex.quote(c)} 2>/dev/null"
+                     for t, c in chains)
+
+
+def parse_fetched(output: str) -> Ruleset:
+    """Ruleset holding only the chains printed by fetch_command()."""
+    ruleset = Ruleset()
+    chain = None
+    for line in output.splitlines():
+        if line.startswith("*"):
+            table, name = line[1:].split(" ", 1)
+            chain = ruleset.table(table).chains.setdefault(name, Chain(name))
+            continue
+        args = _split(line)
+        if chain is None or len(args) < 2 or args[1] != chain.name:
+            continue
+        if args[0] == "-P" and len(args) > 2:
+            chain.policy = args[2]
+        elif args[0] == "-A":
+            chain.rules.append(Rule(chain.name, args[2:]))
+    return ruleset
+
+
+# ---------- Intended state ----------
+def intended_from_policies(compiler=None) -> Intended:
+    """Intended ruleset = the host's compiled group policy (db/policies.json by default)."""
+    if compiler is None:
+        from app.core.policy_templates import load_policies
+        compiler = load_policies()
+    return compiler.compile_host
+
+
+def intended_from_store(store=None) -> Intended:
+    """Intended ruleset = the last version recorded for the host (what was applied)."""
+    from app.core.ruleset_store import default_store
+    store = store or default_store()
+
+    def head(host: str) -> Ruleset:
+        v = store.head(host)
+        if v is None:
+            raise KeyError(f"no recorded version of {host}")
+        return store.read_ruleset(v["tree"])
+
+    return head
+
+
+# ---------- Checks ----------
+@traced("drift")
+def check_drift(
+    host: str,
+    user: str,
+    key_path: str,
+    intended: Union[Ruleset, str],
+    mgr: Optional[SSHSessionManager] = None,
+    port: int = 22,
+) -> Dict[str, object]:
+    """
+    Compare one host with its intended ruleset. Only tables present in the
+    intended ruleset are checked. Returns dict(status, message, in_sync,
+    chains, matching, drifted, missing, extra): `drifted` maps "table/chain" to
+    its policy change and the rules "missing" (intended, not on the host) and
+    "unexpected" (on the host only); `missing`/`extra` list whole chains.
+    """
+    started = time.perf_counter()
+    mgr = mgr or shared_manager()
+    if isinstance(intended, str):
+        intended = parse_iptables_save(intended)
+    intended = canonical(intended)
+    want = local_digests(intended)
+
+    r = mgr.exec(host, user, key_path, digest_command(intended.tables), port=port)
+    have = parse_digests(r.get("stdout", "")) if r["status"] == "success" else {}
+    if r["status"] != "success" or (not have and r.get("stderr")):
+        final = {"status": "failure",
+                 "message": f"Drift check failed on {host}: {r.get('stderr') or r.get('message')}"}
+        record_stage(host, "drift", started, final)
+        return final
+
+    differing = [k for k in want if k in have and have[k] != want[k]]
+    missing = [k for k in want if k not in have]
+    extra = [k for k in have if k not in want]
+    drifted: Dict[str, Dict[str, object]] = {}
+    if differing:
+        fetched = mgr.exec(host, user, key_path, fetch_command(differing), port=port)
+        if fetched["status"] != "success":
+            final = {"status": "failure",
+                     "message": f"Fetching drifted chains failed on {host}: "
+                                f"{fetched.get('stderr') or fetched.get('message')}"}
+            record_stage(host, "drift", started, final)
+            return final
+        actual = parse_fetched(fetched["stdout"])
+        wanted = Ruleset()
+        for t, c in differing:
+            wanted.table(t).chains[c] = intended.tables[t].chains[c]
+        for table, chains in diff_rulesets(wanted, actual).items():
+            for chain, d in chains.items():
+                drifted[f"{table}/{chain}"] = {"policy": d["policy"], "missing": d["removed"],
+                                               "unexpected": d["added"], "reordered": d["reordered"]}
+
+    DRIFT_CHAINS_TOTAL.inc("match", amount=len(want) - len(differing) - len(missing))
+    DRIFT_CHAINS_TOTAL.inc("drift", amount=len(differing))
+    DRIFT_CHAINS_TOTAL.inc("missing", amount=len(missing))
+    DRIFT_CHAINS_TOTAL.inc("extra", amount=len(extra))
+    in_sync = not (drifted or missing or extra)
+    final = {
+        "status": "success",
+        "message": f"{host} matches its intended policy" if in_sync else
+                   f"{host} drifted: {len(drifted)} changed, {len(missing)} missing, {len(extra)} extra chains",
+        "in_sync": in_sync,
+        "chains": len(want),
+        "matching": len(want) - len(differing) - len(missing),
+        "drifted": drifted,
+        "missing": [f"{t}/{c}" for t, c in missing],
+        "extra": [f"{t}/{c}" for t, c in extra],
+    }
+    record_stage(host, "drift", started, final)
+    return final
+
+
+def check_host(host: str, user: str, key_path: str, intended: Intended,
+               mgr: Optional[SSHSessionManager] = None, port: int = 22) -> Dict[str, object]:
+    """check_drift() with the intended ruleset looked up for `host`."""
+    try:
+        want = intended(host)
+    except (KeyError, ParseError, ValueError) as e:
+        return {"status": "failure", "message": f"No intended ruleset for {host}: {e}"}
+    return check_drift(host, user, key_path, want, mgr=mgr, port=port)
+
+
+def drift_report(
+    hosts: Iterable[str],
+    user: str,
+    key_path: str,
+    intended: Optional[Intended] = None,
+    mgr: Optional[SSHSessionManager] = None,
+    workers: int = DRIFT_WORKERS,
+    port: int = 22,
+) -> Dict[str, object]:
+    """
+    Check every host in parallel. `intended` defaults to the compiled policies.
+    Returns dict(status, message, hosts={host: summary}, drifted=[...], failed=[...]).
+    """
+    hosts = list(hosts)
+    intended = intended or intended_from_policies()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(hosts)))) as pool:
+        results = dict(zip(hosts, pool.map(lambda h: check_host(h, user, key_path, intended, mgr, port), hosts)))
+    drifted = [h for h, r in results.items() if r["status"] == "success" and not r["in_sync"]]
+    failed = [h for h, r in results.items() if r["status"] != "success"]
+    return {
+        "status": "success" if not failed else "partial",
+        "message": f"{len(hosts) - len(drifted) - len(failed)} in sync, {len(drifted)} drifted, "
+                   f"{len(failed)} unchecked",
+        "hosts": results,
+        "drifted": drifted,
+        "failed": failed,
+    }
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    HOSTS = ["10.10.0.20", "10.10.0.30", "10.10.0.40"]
+    USER = "root"
+    KEY = "/home/glitch/.ssh/id_rsa"
+
+    print(digest_command(["filter"]))
+    report = drift_report(HOSTS, USER, KEY, intended=intended_from_store())
+    print(report["message"])
+    for h in report["drifted"]:
+        print(f"⚠️ {h}: {report['hosts'][h]['drifted']}")
@@ -13,10 +13,11 @@ Purpose:
 import ipaddress
 import subprocess
 import socket
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 
-from app.core.ssh_session_manager import SSHSessionManager
+from app.core.ssh_session_manager import SSHSessionManager, shared_manager
 
 
 def ping_host(ip: str, timeout: int = 1) -> bool:
@@ -48,14 +49,20 @@ def discover_hosts(
     ssh_check: bool = True,
     fetch_hostname: bool = True,
     max_workers: int = 20,
+    mgr: Optional[SSHSessionManager] = None,
+    on_probe: Optional[Callable[[Dict[str, str]], None]] = None,
+    stop_event: Optional[threading.Event] = None,
 ) -> List[Dict[str, str]]:
     """
     Discover reachable SSH hosts within a subnet.
 
+    Optional hooks for background callers: a `mgr` (default: shared_manager()),
+    `on_probe(result)` after each IP, and `stop_event` to skip remaining IPs.
+
     Returns list of dicts:
         {"ip": str, "ping": bool, "ssh": bool, "hostname": str or None}
     """
-    mgr = SSHSessionManager(idle_ttl_s=120)
+    mgr = mgr or shared_manager()
     results = []
 
     ips = [str(ip) for ip in ipaddress.IPv4Network(subnet)]
@@ -63,6 +70,8 @@ def discover_hosts(
 
     def probe(ip):
         data = {"ip": ip, "ping": False, "ssh": False, "hostname": None}
+        if stop_event is not None and stop_event.is_set():
+            return data
         if ping_host(ip):
             data["ping"] = True
             if ssh_check and check_ssh_port(ip):
@@ -80,8 +89,9 @@ def discover_hosts(
         futures = [pool.submit(probe, ip) for ip in ips]
         for f in as_completed(futures):
             results.append(f.result())
+            if on_probe is not None:
+                on_probe(results[-1])
 
-    mgr.stop()
     reachable = [r for r in results if r["ping"] or r["ssh"]]
     print(f"✅ Discovery complete. Found {len(reachable)} reachable hosts.")
     return reachable
@@ -6,58 +6,212 @@ Step: 3 (with KB logging)
 Purpose:
     Apply uploaded iptables ruleset on remote host using iptables-restore,
     perform validation first, and log the outcome.
+    The resulting ruleset is recorded as a new version in the ruleset store.
+
+    Applies are atomic with a dead-man timer (like iptables-apply): one round
+    trip snapshots the current rules, arms an on-host rollback timer and
+    restores the new ruleset; the timer is only cancelled by a confirmation
+    sent over a *fresh* SSH connection, so a policy that locks out SSH rolls
+    itself back.
 """
 
 from __future__ import annotations
-from typing import Dict
+import shlex
+import time
+import uuid
+from typing import Dict, Optional
+from app.core.metrics import record_stage
+from app.core.tracing import span, traced
 from app.core.iptables_validate import validate_iptables_rules
-from app.core.ssh_session_manager import SSHSessionManager
+from app.core.ssh_session_manager import SSHSessionManager, shared_manager
 from app.core.iptables_logger import log_kb_entry
+from app.core.ruleset_collector import collect_ruleset
+from app.core.ruleset_store import RulesetStore, default_store
+from app.utils.parser import ParseError
+
+
+# ---------- Tunables ----------
+ROLLBACK_TIMEOUT_S = 30                 # on-host timer; 0/None applies without a safety net
+REMOTE_STATE_DIR   = "/tmp"             # where the snapshot and timer state live on the host
+
+EXIT_SNAPSHOT_FAILED = 10
+EXIT_RESTORE_FAILED  = 11
+EXIT_EXPIRED         = 12
+EXIT_ALREADY_ARMED   = 13               # a retried arm step: the first attempt got at least this far
 
 
+def arm_command(state: str, remote_rules_path: str, timeout_s: int) -> str:
+    """
+    Snapshot → arm timer → restore, in one shell command. Prints the snapshot.
+    Whoever renames `<state>.pending` first (timer or confirmation) wins.
+    Runs at most once per state: a second run (an SSH retry after the channel
+    dropped) would snapshot the *new* rules over the backup and start a second
+    timer, so it exits EXIT_ALREADY_ARMED without touching anything.
+    """
+    b = shlex.quote(state)
+    timer = (f"sleep {int(timeout_s)}; mv \"$0.pending\" \"$0.fired\" 2>/dev/null "
+             f"&& iptables-restore < \"$0.bak\"")
+    return (
+        f"umask 077; B={b}; "
+        f"(set -C; : > \"$B.armed\") 2>/dev/null || exit {EXIT_ALREADY_ARMED}; "
+        f"iptables-save > \"$B.bak\" || exit {EXIT_SNAPSHOT_FAILED}; "
+        f": > \"$B.pending\"; "
+        f"nohup sh -c {shlex.quote(timer)} \"$B\" >/dev/null 2>&1 </dev/null & "
+        f"echo $! > \"$B.pid\"; "
+        f"if ! iptables-restore < {shlex.quote(remote_rules_path)}; then "
+        f"mv \"$B.pending\" \"$B.failed\" 2>/dev/null; kill $(cat \"$B.pid\") 2>/dev/null; "
+        f"iptables-restore < \"$B.bak\"; exit {EXIT_RESTORE_FAILED}; fi; "
+        f"cat \"$B.bak\""
+    )
+
+
+def confirm_command(state: str) -> str:
+    """
+    Cancel the timer if it has not fired yet; exits EXIT_EXPIRED otherwise.
+    `<state>.confirmed` is kept as a marker, so a retried confirmation (the
+    first one ran but its reply was lost) reports "already confirmed"
+    instead of a rollback that never happened.
+    """
+    b = shlex.quote(state)
+    return (
+        f"B={b}; if mv \"$B.pending\" \"$B.confirmed\" 2>/dev/null; then "
+        f"kill $(cat \"$B.pid\") 2>/dev/null; rm -f \"$B.pid\" \"$B.bak\" \"$B.armed\"; "
+        f"echo confirmed; "
+        f"elif [ -e \"$B.confirmed\" ]; then echo already confirmed; "
+        f"else exit {EXIT_EXPIRED}; fi"
+    )
+
+
+@traced("apply")
 def apply_iptables_rules(
     host: str,
     user: str,
     key_path: str,
-    remote_rules_path: str = "/tmp/iptables.rules"
+    remote_rules_path: str = "/tmp/iptables.rules",
+    mgr: Optional[SSHSessionManager] = None,
+    source: str = "apply",
+    store: Optional[RulesetStore] = None,
+    rollback_timeout_s: Optional[int] = None,
+    confirm_mgr: Optional[SSHSessionManager] = None,
 ) -> Dict[str, str]:
     """
     Apply uploaded iptables ruleset to remote host and log the result.
+    Runs on the process-wide shared_manager() unless a `mgr` is passed.
+    The dead-man confirmation goes through `confirm_mgr` (default: `mgr`):
+    it has to land before the timer fires, so callers on a rate-limited
+    lane should pass one that is not.
+    On success the host's live ruleset is recorded in `store` (default:
+    default_store()) and the version ID returned as "version"; the rules it
+    replaced are recorded too ("previous_version").
+    rollback_timeout_s defaults to ROLLBACK_TIMEOUT_S; 0 disables the timer.
     """
     print(f"🚀 Starting iptables rule application on {host} ...")
+    started = time.perf_counter()
+    mgr = mgr or shared_manager()
+    store = store or default_store()
+    timeout_s = ROLLBACK_TIMEOUT_S if rollback_timeout_s is None else rollback_timeout_s
 
     # Step 1: Validate before applying
-    validation = validate_iptables_rules(host, user, key_path, remote_rules_path)
+    validation = validate_iptables_rules(host, user, key_path, remote_rules_path, mgr=mgr)
     if validation["status"] != "success":
         result = {
             "status": "failure",
             "message": f"Syntax validation failed: {validation['message']}",
         }
+        record_stage(host, "apply", started, result)
         log_kb_entry("apply", host, result)
         return result
 
-    # Step 2: Apply rules
-    mgr = SSHSessionManager()
+    # Step 2: Apply rules (snapshot + dead-man timer unless disabled)
     print(f"🧱 Applying iptables rules on {host} ...")
-    command = f"iptables-restore < {remote_rules_path}"
-    result = mgr.exec(host, user, key_path, command)
-    mgr.stop()
+    if timeout_s:
+        final = _apply_with_rollback(host, user, key_path, remote_rules_path, mgr, confirm_mgr or mgr,
+                                     timeout_s, store)
+    else:
+        with span("restore"):
+            result = mgr.exec(host, user, key_path, f"iptables-restore < {shlex.quote(remote_rules_path)}")
+        if result["status"] == "success":
+            final = {"status": "success", "message": f"iptables rules applied successfully on {host}"}
+        else:
+            final = {
+                "status": "failure",
+                "message": f"Failed to apply ruleset: {result.get('stderr') or result.get('message')}",
+            }
 
-    if result["status"] == "success":
+    if final["status"] == "success":
+        version = _record_version(host, user, key_path, mgr, source, store)
+        if version:
+            final["version"] = version
+
+    record_stage(host, "apply", started, final)
+    log_kb_entry("apply", host, final)
+    return final
+
+
+def _apply_with_rollback(host: str, user: str, key_path: str, remote_rules_path: str,
+                         mgr: SSHSessionManager, confirm_mgr: SSHSessionManager, timeout_s: int,
+                         store: RulesetStore) -> Dict[str, str]:
+    state = f"{REMOTE_STATE_DIR}/iptables-apply-{uuid.uuid4().hex[:12]}"
+
+    with span("restore", rollback_timeout_s=timeout_s):
+        armed = mgr.exec(host, user, key_path, arm_command(state, remote_rules_path, timeout_s))
+    if armed["status"] != "success":
+        detail = armed.get("stderr") or armed.get("message")
+        if armed.get("exit_code") == EXIT_RESTORE_FAILED:
+            return {"status": "failure", "message": f"Failed to apply ruleset (previous rules restored): {detail}"}
+        if armed.get("exit_code") == EXIT_ALREADY_ARMED:
+            # The connection dropped mid-apply and the retry found the first attempt's state:
+            # the new rules may be live, but then the timer is armed; never confirm blind.
+            return {"status": "failure", "message": f"Connection lost while applying on {host}; state unknown, "
+                                                    f"any new rules roll back within {timeout_s}s"}
+        if armed.get("exit_code") == EXIT_SNAPSHOT_FAILED:
+            return {"status": "failure", "message": f"Could not snapshot current rules, nothing applied: {detail}"}
+        return {"status": "failure", "message": f"Failed to apply ruleset: {detail}"}
+
+    previous = None
+    try:
+        previous = store.record(host, armed["stdout"], source="pre-apply")["id"]
+    except (ParseError, OSError) as e:
+        print(f"⚠️ Pre-apply snapshot not recorded: {e}")
+
+    # A new connection, not the one already open: established flows survive most lockouts
+    with span("confirm"):
+        confirmed = confirm_mgr.exec(host, user, key_path, confirm_command(state), fresh=True)
+    if confirmed["status"] == "success":
+        final = {"status": "success", "message": f"iptables rules applied and confirmed on {host}"}
+    elif confirmed.get("exit_code") == EXIT_EXPIRED:
+        final = {"status": "failure", "message": f"Confirmation came too late; {host} rolled back to the previous rules"}
+    elif confirmed.get("exit_code") is not None:
         final = {
-            "status": "success",
-            "message": f"iptables rules applied successfully on {host}",
+            "status": "failure",
+            "message": f"Confirmation failed on {host} ({confirmed.get('stderr')}); it rolls back within {timeout_s}s",
         }
     else:
         final = {
             "status": "failure",
-            "message": f"Failed to apply ruleset: {result.get('stderr') or result.get('message')}",
+            "message": f"No fresh SSH connection after apply ({confirmed.get('message')}); "
+                       f"{host} rolls back within {timeout_s}s",
         }
-
-    log_kb_entry("apply", host, final)
+    if previous:
+        final["previous_version"] = previous
     return final
 
 
+def _record_version(host: str, user: str, key_path: str, mgr: SSHSessionManager,
+                    source: str, store: RulesetStore) -> Optional[str]:
+    """Snapshot what the host is running now; history is best-effort and never fails an apply."""
+    with span("record"):
+        collected = collect_ruleset(host, user, key_path, counters=False, mgr=mgr)
+        if collected["status"] != "success":
+            print(f"⚠️ Not recorded in ruleset history: {collected['message']}")
+            return None
+        try:
+            return store.record(host, collected["ruleset"], source=source)["id"]
+        except OSError as e:
+            print(f"⚠️ Ruleset store write failed: {e}")
+            return None
+
+
 # ---------- Self-test ----------
 if __name__ == "__main__":
     HOST = "10.10.0.20"
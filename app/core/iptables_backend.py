@@ -0,0 +1,458 @@
+"""
+Module: iptables_backend
+Phase: 6
+Milestone: 1
+Step: 4
+Purpose:
+    Pluggable execution backends for iptables_controller.
+      - SubprocessBackend: runs the real iptables / iptables-save / iptables-restore
+      - InMemoryBackend: pure-Python model of the same commands (no root, no kernel)
+    Both return subprocess.CompletedProcess objects, so callers do not care
+    which one is active. The in-memory backend is also what powers the
+    controller's "plan" mode.
+"""
+
+from __future__ import annotations
+import copy
+import ipaddress
+import subprocess
+from typing import List, Optional
+
+from app.core.validator import CHAIN_RESTRICTED_TARGETS, TABLE_TARGETS
+
+from app.utils.parser import (
+    BUILTIN_CHAINS, Chain, ParseError, Rule, Ruleset, Table,
+    parse_iptables_save,
+)
+
+
+class IptablesBackend:
+    """Interface: execute an iptables-family argv and return a CompletedProcess."""
+
+    name = "abstract"
+
+    def run(self, cmd: List[str], input: Optional[str] = None) -> subprocess.CompletedProcess:
+        raise NotImplementedError
+
+
+class SubprocessBackend(IptablesBackend):
+    """Default backend: the real binaries via subprocess (needs root)."""
+
+    name = "subprocess"
+
+    def run(self, cmd: List[str], input: Optional[str] = None) -> subprocess.CompletedProcess:
+        return subprocess.run(cmd, input=input, capture_output=True, text=True)
+
+
+# ---------- In-memory model ----------
+_LONG_OPTS = {
+    "--protocol": "-p", "--source": "-s", "--destination": "-d",
+    "--in-interface": "-i", "--out-interface": "-o", "--jump": "-j", "--goto": "-g",
+    "--match": "-m", "--source-port": "--sport", "--destination-port": "--dport",
+}
+_IMPLICIT_MATCH_OPTS = {"--sport", "--dport", "--tcp-flags", "--syn", "--icmp-type"}
+
+E_BAD_RULE = "iptables: Bad rule (does a matching rule exist in that chain?)."
+E_NO_CHAIN = "iptables: No chain/target/match by that name."
+E_EXISTS = "iptables: Chain already exists."
+E_NOT_EMPTY = "iptables: Directory not empty."
+E_INDEX = "iptables: Index of insertion too big."
+
+
+def normalize_spec(args: List[str]) -> List[str]:
+    """
+    Rewrite a rule spec the way iptables-save prints it: short option names,
+    /32 on bare addresses and the implicit `-m tcp|udp|icmp` before protocol options.
+    """
+    out: List[str] = []
+    proto = None
+    matched = set()
+    i = 0
+    while i < len(args):
+        tok = _LONG_OPTS.get(args[i], args[i])
+        if tok in ("-j", "-g"):
+            out.extend([tok] + args[i + 1:])
+            break
+        if tok in ("-s", "-d") and i + 1 < len(args):
+            out += [tok, _cidr(args[i + 1])]
+            i += 2
+            continue
+        if tok == "-p" and i + 1 < len(args):
+            proto = args[i + 1].lower()
+            out += [tok, proto]
+            i += 2
+            continue
+        if tok == "-m" and i + 1 < len(args):
+            matched.add(args[i + 1])
+        if tok in _IMPLICIT_MATCH_OPTS and proto and proto not in matched and "multiport" not in matched:
+            out += ["-m", proto]
+            matched.add(proto)
+        out.append(tok)
+        i += 1
+    return out
+
+
+def _cidr(value: str) -> str:
+    if "," in value:
+        return ",".join(_cidr(v) for v in value.split(","))
+    try:
+        return str(ipaddress.ip_network(value, strict=False))
+    except ValueError:
+        return value  # hostnames are left for the real binary to resolve
+
+
+def _ok(cmd, out: str = "") -> subprocess.CompletedProcess:
+    return subprocess.CompletedProcess(cmd, 0, out, "")
+
+
+def _fail(cmd, err: str, code: int = 1) -> subprocess.CompletedProcess:
+    return subprocess.CompletedProcess(cmd, code, "", err)
+
+
+class InMemoryBackend(IptablesBackend):
+    """
+    Pure-Python iptables state. Supports:
+      iptables [-t T] -A/-I/-D/-C/-R/-F/-X/-N/-P/-Z/-L/-S
+      iptables-save [-t T] [-c]
+      iptables-restore [--test] [--noflush]   (payload via `input`)
+    Errors mimic iptables messages and exit codes.
+    """
+
+    name = "memory"
+
+    def __init__(self, initial: Optional[str] = None):
+        self.state = Ruleset()
+        for tname, chains in BUILTIN_CHAINS.items():
+            table = self.state.table(tname)
+            for c in chains:
+                table.chains[c] = Chain(c, "ACCEPT")
+        if initial:
+            res = self.run(["iptables-restore"], input=initial)
+            if res.returncode != 0:
+                raise ValueError(res.stderr)
+
+    @classmethod
+    def from_backend(cls, backend: IptablesBackend) -> "InMemoryBackend":
+        """Snapshot another backend's current rules into a new in-memory model."""
+        res = backend.run(["iptables-save"])
+        if res.returncode != 0:
+            raise RuntimeError(res.stderr.strip())
+        return cls(res.stdout)
+
+    def clone(self) -> "InMemoryBackend":
+        twin = InMemoryBackend.__new__(InMemoryBackend)
+        twin.state = copy.deepcopy(self.state)
+        return twin
+
+    # ---------- Dispatch ----------
+    def run(self, cmd: List[str], input: Optional[str] = None) -> subprocess.CompletedProcess:
+        prog = cmd[0].rsplit("/", 1)[-1] if cmd else ""
+        if prog == "iptables":
+            return self._iptables(cmd)
+        if prog == "iptables-save":
+            return self._save(cmd)
+        if prog == "iptables-restore":
+            return self._restore(cmd, input or "")
+        return _fail(cmd, f"{prog}: command not supported by the in-memory backend", 127)
+
+    def _iptables(self, cmd: List[str]) -> subprocess.CompletedProcess:
+        args = cmd[1:]
+        tname = "filter"
+        if len(args) >= 2 and args[0] in ("-t", "--table"):
+            tname, args = args[1], args[2:]
+        table = self.state.tables.get(tname)
+        if table is None:
+            return _fail(cmd, f"iptables v1.8.7 (memory): can't initialize iptables table `{tname}': Table does not exist", 3)
+        if not args:
+            return _fail(cmd, "iptables v1.8.7 (memory): no command specified", 2)
+
+        op, rest = args[0], args[1:]
+        handler = self._OPS.get(op)
+        if handler is None:
+            # -L/-S may carry -v/-n/--line-numbers before or after the chain name
+            flags = [a for a in args if a.startswith("-")]
+            if "-L" in flags or "--list" in flags:
+                return self._list(cmd, table, [a for a in args if not a.startswith("-")], "-v" in flags, "--line-numbers" in flags)
+            if "-S" in flags or "--list-rules" in flags:
+                return self._list_rules(cmd, table, [a for a in args if not a.startswith("-")])
+            return _fail(cmd, f"iptables v1.8.7 (memory): unknown option \"{op}\"", 2)
+        return handler(self, cmd, table, rest)
+
+    # ---------- Rule operations ----------
+    def _chain(self, table: Table, name: str) -> Optional[Chain]:
+        return table.chains.get(name)
+
+    def _target_ok(self, table: Table, chain: str, spec: List[str]) -> bool:
+        """A declared chain of this table, or a target the kernel accepts in this table and built-in chain."""
+        t = Rule("", spec).target
+        if t is None or (t in table.chains and not table.chains[t].builtin):
+            return True
+        if t not in TABLE_TARGETS.get(table.name, ()):
+            return False
+        allowed = CHAIN_RESTRICTED_TARGETS.get(t)
+        return allowed is None or chain not in BUILTIN_CHAINS.get(table.name, ()) or chain in allowed
+
+    def _append(self, cmd, table, rest):
+        chain = self._chain(table, rest[0]) if rest else None
+        if chain is None:
+            return _fail(cmd, E_NO_CHAIN)
+        spec = normalize_spec(rest[1:])
+        if not self._target_ok(table, chain.name, spec):
+            return _fail(cmd, E_NO_CHAIN)
+        chain.rules.append(Rule(chain.name, spec, 0, 0))
+        return _ok(cmd)
+
+    def _insert(self, cmd, table, rest):
+        chain = self._chain(table, rest[0]) if rest else None
+        if chain is None:
+            return _fail(cmd, E_NO_CHAIN)
+        pos, spec = 1, rest[1:]
+        if spec and spec[0].isdigit():
+            pos, spec = int(spec[0]), spec[1:]
+        if pos < 1 or pos > len(chain.rules) + 1:
+            return _fail(cmd, E_INDEX)
+        spec = normalize_spec(spec)
+        if not self._target_ok(table, chain.name, spec):
+            return _fail(cmd, E_NO_CHAIN)
+        chain.rules.insert(pos - 1, Rule(chain.name, spec, 0, 0))
+        return _ok(cmd)
+
+    def _replace(self, cmd, table, rest):
+        chain = self._chain(table, rest[0]) if rest else None
+        if chain is None:
+            return _fail(cmd, E_NO_CHAIN)
+        if len(rest) < 2 or not rest[1].isdigit() or not 1 <= int(rest[1]) <= len(chain.rules):
+            return _fail(cmd, E_INDEX)
+        spec = normalize_spec(rest[2:])
+        if not self._target_ok(table, chain.name, spec):
+            return _fail(cmd, E_NO_CHAIN)
+        chain.rules[int(rest[1]) - 1] = Rule(chain.name, spec, 0, 0)
+        return _ok(cmd)
+
+    def _find(self, chain: Chain, spec: List[str]) -> int:
+        wanted = normalize_spec(spec)
+        for i, r in enumerate(chain.rules):
+            if r.args == wanted:
+                return i
+        return -1
+
+    def _delete(self, cmd, table, rest):
+        chain = self._chain(table, rest[0]) if rest else None
+        if chain is None:
+            return _fail(cmd, E_NO_CHAIN)
+        if len(rest) == 2 and rest[1].isdigit():
+            idx = int(rest[1]) - 1
+            if not 0 <= idx < len(chain.rules):
+                return _fail(cmd, "iptables: Index of deletion too big.")
+        else:
+            idx = self._find(chain, rest[1:])
+            if idx < 0:
+                return _fail(cmd, E_BAD_RULE)
+        del chain.rules[idx]
+        return _ok(cmd)
+
+    def _check(self, cmd, table, rest):
+        chain = self._chain(table, rest[0]) if rest else None
+        if chain is None:
+            return _fail(cmd, E_NO_CHAIN)
+        return _ok(cmd) if self._find(chain, rest[1:]) >= 0 else _fail(cmd, E_BAD_RULE)
+
+    def _flush(self, cmd, table, rest):
+        names = rest[:1] or list(table.chains)
+        for n in names:
+            chain = self._chain(table, n)
+            if chain is None:
+                return _fail(cmd, E_NO_CHAIN)
+            chain.rules.clear()
+        return _ok(cmd)
+
+    def _new_chain(self, cmd, table, rest):
+        if not rest:
+            return _fail(cmd, "iptables v1.8.7 (memory): -N requires a chain name", 2)
+        if rest[0] in table.chains:
+            return _fail(cmd, E_EXISTS)
+        table.chains[rest[0]] = Chain(rest[0])
+        return _ok(cmd)
+
+    def _delete_chain(self, cmd, table, rest):
+        names = rest[:1] or [c.name for c in table.chains.values() if not c.builtin]
+        for n in names:
+            chain = self._chain(table, n)
+            if chain is None or chain.builtin:
+                return _fail(cmd, E_NO_CHAIN)
+            if chain.rules or any(r.target == n for r in table.rules()):
+                return _fail(cmd, E_NOT_EMPTY)
+            del table.chains[n]
+        return _ok(cmd)
+
+    def _policy(self, cmd, table, rest):
+        if len(rest) != 2:
+            return _fail(cmd, "iptables v1.8.7 (memory): -P requires a chain and a policy", 2)
+        chain = self._chain(table, rest[0])
+        if chain is None or not chain.builtin:
+            return _fail(cmd, "iptables: Bad built-in chain name.")
+        if rest[1] not in ("ACCEPT", "DROP"):
+            return _fail(cmd, "iptables: Bad policy name.")
+        chain.policy = rest[1]
+        return _ok(cmd)
+
+    def _zero(self, cmd, table, rest):
+        for c in table.chains.values():
+            if rest and c.name != rest[0]:
+                continue
+            c.packets = c.bytes = 0
+            for r in c.rules:
+                r.packets = r.bytes = 0
+        return _ok(cmd)
+
+    _OPS = {
+        "-A": _append, "--append": _append,
+        "-I": _insert, "--insert": _insert,
+        "-R": _replace, "--replace": _replace,
+        "-D": _delete, "--delete": _delete,
+        "-C": _check, "--check": _check,
+        "-F": _flush, "--flush": _flush,
+        "-N": _new_chain, "--new-chain": _new_chain,
+        "-X": _delete_chain, "--delete-chain": _delete_chain,
+        "-P": _policy, "--policy": _policy,
+        "-Z": _zero, "--zero": _zero,
+    }
+
+    # ---------- Listing ----------
+    def _list(self, cmd, table: Table, names: List[str], verbose: bool, line_numbers: bool):
+        chains = [table.chains.get(n) for n in names] if names else list(table.chains.values())
+        if any(c is None for c in chains):
+            return _fail(cmd, E_NO_CHAIN)
+        blocks = []
+        for c in chains:
+            if c.builtin:
+                head = f"Chain {c.name} (policy {c.policy}"
+                head += f" {c.packets} packets, {c.bytes} bytes)" if verbose else ")"
+            else:
+                refs = sum(1 for r in table.rules() if r.target == c.name)
+                head = f"Chain {c.name} ({refs} references)"
+            cols = "target     prot opt source               destination"
+            if verbose:
+                cols = " pkts bytes target     prot opt in     out     source               destination"
+            if line_numbers:
+                cols = "num  " + cols
+            lines = [head, cols]
+            for n, r in enumerate(c.rules, 1):
+                prot = ("!" if "protocol" in r.negated else "") + (r.protocol or "all")
+                src = ("!" if "source" in r.negated else "") + (r.source or "0.0.0.0/0")
+                dst = ("!" if "destination" in r.negated else "") + (r.destination or "0.0.0.0/0")
+                extra = " ".join(a for a in _extra_tokens(r.args))
+                row = f"{(r.target or ''):<10} {prot:<4} --  "
+                if verbose:
+                    row = f"{r.packets or 0:>5} {r.bytes or 0:>5} " + row + f"{(r.in_iface or '*'):<6} {(r.out_iface or '*'):<7} "
+                row += f"{src:<20} {dst:<20} {extra}".rstrip()
+                lines.append((f"{n:<4} " if line_numbers else "") + row)
+            blocks.append("\n".join(lines))
+        return _ok(cmd, "\n\n".join(blocks))
+
+    def _list_rules(self, cmd, table: Table, names: List[str]):
+        chains = [table.chains.get(n) for n in names] if names else list(table.chains.values())
+        if any(c is None for c in chains):
+            return _fail(cmd, E_NO_CHAIN)
+        out = []
+        for c in chains:
+            out.append(f"-P {c.name} {c.policy}" if c.builtin else f"-N {c.name}")
+        for c in chains:
+            out.extend(r.to_line(counters=False) for r in c.rules)
+        return _ok(cmd, "\n".join(out))
+
+    # ---------- save / restore ----------
+    def _save(self, cmd):
+        args = cmd[1:]
+        counters = "-c" in args or "--counters" in args
+        tables = list(self.state.tables.values())
+        for flag in ("-t", "--table"):
+            if flag in args:
+                name = args[args.index(flag) + 1]
+                if name not in self.state.tables:
+                    return _fail(cmd, f"iptables-save: table '{name}' does not exist")
+                tables = [self.state.tables[name]]
+        out = []
+        for t in tables:
+            # Like the real tool: chain counters always, rule counters only with -c
+            out.append("# Generated by iptables-save (memory backend)")
+            out.append(f"*{t.name}")
+            out.extend(c.header() for c in t.chains.values())
+            out.extend(r.to_line(counters) for c in t.chains.values() for r in c.rules)
+            out.append("COMMIT")
+            out.append("# Completed by iptables-save (memory backend)")
+        return _ok(cmd, "\n".join(out) + "\n")
+
+    def _restore(self, cmd, payload: str):
+        args = cmd[1:]
+        test_only = "-t" in args or "--test" in args
+        noflush = "-n" in args or "--noflush" in args
+        try:
+            incoming = parse_iptables_save(payload)
+        except ParseError as e:
+            return _fail(cmd, f"iptables-restore: {e}")
+
+        staged = copy.deepcopy(self.state)
+        for tname, table in incoming.tables.items():
+            if tname not in BUILTIN_CHAINS:
+                return _fail(cmd, f"iptables-restore: unable to initialize table '{tname}'")
+            current = staged.table(tname)
+            if not noflush:
+                builtin = {n: Chain(n, "ACCEPT") for n in BUILTIN_CHAINS[tname]}
+                current.chains = builtin
+            for cname, chain in table.chains.items():
+                existing = current.chains.get(cname)
+                if existing is None or not noflush:
+                    current.chains[cname] = Chain(cname, chain.policy, chain.packets, chain.bytes)
+                elif chain.builtin:
+                    existing.policy = chain.policy
+                else:
+                    existing.rules.clear()  # --noflush still flushes redeclared user chains
+            for chain in table.chains.values():
+                for pos, r in enumerate(chain.rules, 1):
+                    spec = normalize_spec(r.args)
+                    if not self._target_ok(current, chain.name, spec):
+                        return _fail(cmd, f"iptables-restore: {tname}/{chain.name} rule {pos}: {E_NO_CHAIN}")
+                    current.chains[chain.name].rules.append(Rule(chain.name, spec, r.packets or 0, r.bytes or 0))
+        if not test_only:
+            self.state = staged
+        return _ok(cmd)
+
+
+def _extra_tokens(args: List[str]) -> List[str]:
+    """Tokens of a rule that `iptables -L` prints after the address columns."""
+    skip = {"-p", "-s", "-d", "-i", "-o", "-j", "-g"}
+    out, i = [], 0
+    while i < len(args):
+        tok = args[i]
+        if tok in ("-j", "-g"):
+            out.extend(args[i + 2:])
+            break
+        if tok in skip:
+            i += 2
+            continue
+        if tok == "!" and i + 1 < len(args) and args[i + 1] in skip:
+            i += 1
+            continue
+        if tok == "-m":
+            i += 2
+            continue
+        out.append(tok)
+        i += 1
+    return out
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    mem = InMemoryBackend()
+    for argv in (
+        ["iptables", "-N", "SSH"],
+        ["iptables", "-A", "INPUT", "-p", "tcp", "--dport", "22", "-j", "SSH"],
+        ["iptables", "-A", "SSH", "-s", "10.10.0.30", "-j", "ACCEPT"],
+        ["iptables", "-P", "INPUT", "DROP"],
+        ["iptables", "-D", "INPUT", "-p", "icmp", "-j", "ACCEPT"],
+    ):
+        r = mem.run(argv)
+        print(" ".join(argv), "→", r.returncode, r.stderr)
+    print(mem.run(["iptables", "-L", "-v", "-n"]).stdout)
+    print(mem.run(["iptables-save", "-t", "filter"]).stdout)
@@ -7,16 +7,45 @@ rules from within the iptables GUI project.
 Author: Sanil Tison
 Phase: 2 (Core Command Layer)
 Goal: Provide functions to list, add, delete, save, and restore iptables rules.
+
+Commands go through a pluggable backend (see iptables_backend): the real
+binaries by default, or an in-memory model for tests, simulations and
+"plan" (dry-run) mode.
 """
 
-import subprocess
 import json
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.core.iptables_backend import IptablesBackend, InMemoryBackend, SubprocessBackend
+from app.core.ruleset_store import default_store
+from app.utils.file_manager import atomic_write
+from app.utils.parser import (ParseError, Ruleset, diff_rulesets, parse_config_json, parse_iptables_save,
+                              serialize_table)
+from app.utils.snapshot import SnapshotError, read_snapshot, write_snapshot
 
 
 # === GLOBAL CONFIG PATH ===
 CONFIG_PATH = Path(__file__).resolve().parents[2] / "db" / "config.json"
 
+# === ACTIVE BACKEND ===
+_backend: IptablesBackend = SubprocessBackend()
+
+
+def set_backend(backend: IptablesBackend) -> IptablesBackend:
+    """
+    Route all controller commands through `backend`; returns the previous one.
+    Example:
+        set_backend(InMemoryBackend())
+    """
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
+
+def get_backend() -> IptablesBackend:
+    return _backend
+
 
 def test_environment():
     """
@@ -27,17 +56,17 @@ def test_environment():
 
 
 # === MAIN EXECUTION ENTRY POINT ===
-def run_cmd(cmd: list[str]) -> str:
+def run_cmd(cmd: list[str], input: Optional[str] = None) -> str:
     """
-    Executes a system command and returns its output as a string.
+    Executes a command through the active backend and returns its output as a string.
     Handles errors gracefully for use in backend functions.
     """
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        return f"[ERROR] {e.stderr.strip()}"
-    
+    result = _backend.run(cmd, input=input)
+    if result.returncode != 0:
+        return f"[ERROR] {result.stderr.strip()}"
+    return result.stdout.strip()
+
+
 def list_rules(table: str = "filter") -> str:
     """
     List all rules from a specific table (filter, nat, or mangle).
@@ -48,31 +77,39 @@ def list_rules(table: str = "filter") -> str:
     return run_cmd(cmd)
 
 
-def add_rule(chain: str, rule_params: list[str], table: str = "filter") -> str:
+def add_rule(chain: str, rule_params: list[str], table: str = "filter", plan: bool = False) -> str:
     """
     Add a new rule to a chain in a given table.
+    With plan=True, nothing is applied; the resulting table is returned instead.
     Example:
         add_rule("INPUT", ["-p", "icmp", "-j", "ACCEPT"])
     """
     cmd = ["iptables", "-t", table, "-A", chain] + rule_params
+    if plan:
+        return _format_plan(plan_rules([cmd]), table)
     output = run_cmd(cmd)
     return f"✅ Rule added to {table}/{chain}: {' '.join(rule_params)}\n{output}"
 
 
-def delete_rule(chain: str, rule_params: list[str], table: str = "filter") -> str:
+def delete_rule(chain: str, rule_params: list[str], table: str = "filter", plan: bool = False) -> str:
     """
     Delete a specific rule from a chain.
+    With plan=True, nothing is applied; the resulting table is returned instead.
     Example:
         delete_rule("INPUT", ["-p", "icmp", "-j", "ACCEPT"])
     """
     cmd = ["iptables", "-t", table, "-D", chain] + rule_params
+    if plan:
+        return _format_plan(plan_rules([cmd]), table)
     output = run_cmd(cmd)
     return f"🗑️ Rule removed from {table}/{chain}: {' '.join(rule_params)}\n{output}"
 
 def save_rules_to_json() -> None:
     """
     Export all iptables rules (filter, nat, mangle) to a JSON file.
-    The output of 'iptables-save' for each table is stored under db/config.json.
+    The output of 'iptables-save' for each table is stored under db/config.json,
+    alongside a binary snapshot (db/config.snap) that loads much faster, and
+    recorded as a "localhost" version in the ruleset store (db/store).
     """
     tables = ["filter", "nat", "mangle"]
     data = {}
@@ -82,31 +119,118 @@ def save_rules_to_json() -> None:
         result = run_cmd(["iptables-save", "-t", table])
         data[table] = result
 
-    CONFIG_PATH.write_text(json.dumps(data, indent=2))
+    # A crash mid-save must not leave a truncated config behind
+    atomic_write(CONFIG_PATH, json.dumps(data, indent=2))
     print(f"✅ All tables saved to {CONFIG_PATH}")
 
+    try:
+        ruleset = parse_config_json(data)
+    except ParseError as e:
+        print(f"⚠️ Saved rules could not be parsed, no snapshot or history entry: {e}")
+        return
+    try:
+        write_snapshot(_snapshot_path(), ruleset)
+    except (SnapshotError, OSError) as e:
+        print(f"⚠️ Snapshot not written: {e}")
+
+    # Keep every saved state in the versioned store, not just the latest
+    try:
+        version = default_store().record("localhost", ruleset, source="save")
+        print(f"📦 Recorded as version {version['id'][:12]}")
+    except OSError as e:
+        print(f"⚠️ Not recorded in ruleset history: {e}")
+
+
+def _snapshot_path() -> Path:
+    return CONFIG_PATH.with_suffix(".snap")
+
+
+def load_saved_ruleset() -> Optional[Ruleset]:
+    """
+    The last saved ruleset: from db/config.snap when it is at least as recent
+    as db/config.json, otherwise parsed from the JSON. None if nothing was saved.
+    """
+    return _load_saved()[0]
+
+
+def _load_saved() -> Tuple[Optional[Ruleset], Optional[Path]]:
+    """load_saved_ruleset() plus the file it was actually read from."""
+    snap = _snapshot_path()
+    try:
+        if snap.exists() and (not CONFIG_PATH.exists() or snap.stat().st_mtime_ns >= CONFIG_PATH.stat().st_mtime_ns):
+            return read_snapshot(snap), snap
+    except (SnapshotError, OSError) as e:
+        print(f"⚠️ Ignoring unreadable snapshot {snap}: {e}")
+    if not CONFIG_PATH.exists():
+        return None, None
+    return parse_config_json(json.loads(CONFIG_PATH.read_text())), CONFIG_PATH
+
 
 def load_rules_from_json() -> None:
     """
-    Restore iptables rules from db/config.json using 'iptables-restore'.
+    Restore iptables rules from db/config.json (or its snapshot, see
+    load_saved_ruleset) using 'iptables-restore'.
     Each table's ruleset is loaded back into the kernel.
     """
-    if not CONFIG_PATH.exists():
+    try:
+        ruleset, source = _load_saved()
+    except (ParseError, ValueError) as e:
+        print(f"❌ Saved configuration {CONFIG_PATH} is unreadable: {e}")
+        return
+    if ruleset is None:
         print("⚠️ No saved configuration found!")
         return
+    print(f"📂 Loading rules from {source} ...")
 
-    print(f"📂 Loading rules from {CONFIG_PATH} ...")
-    data = json.loads(CONFIG_PATH.read_text())
-
-    for table, ruleset in data.items():
-        print(f"🔄 Restoring table: {table} ...")
-        process = subprocess.run(["iptables-restore"], input=ruleset, text=True)
+    for table in ruleset.tables.values():
+        print(f"🔄 Restoring table: {table.name} ...")
+        process = _backend.run(["iptables-restore"], input=serialize_table(table))
         if process.returncode == 0:
-            print(f"✅ Successfully restored {table} table")
+            print(f"✅ Successfully restored {table.name} table")
         else:
-            print(f"❌ Failed to restore {table} table")
+            print(f"❌ Failed to restore {table.name} table")
+
+    print(f"🎯 Firewall configuration restored from {source.name}")
+
+
+def plan_rules(commands: List[list[str]]) -> dict:
+    """
+    Dry run: replay iptables commands against an in-memory copy of the current
+    rules (taken from the active backend) and report the outcome. Nothing is applied.
+
+    Returns:
+        dict: {"status", "message", "errors": [str], "diff": {table: {chain: ...}},
+               "ruleset": iptables-save text of the planned state}
+    """
+    before = InMemoryBackend.from_backend(_backend)
+    after = before.clone()
+    errors = []
+    for cmd in commands:
+        res = after.run(cmd)
+        if res.returncode != 0:
+            errors.append(f"{' '.join(cmd)}: {res.stderr.strip()}")
+
+    before_text = before.run(["iptables-save"]).stdout
+    after_text = after.run(["iptables-save"]).stdout
+    diff = diff_rulesets(parse_iptables_save(before_text), parse_iptables_save(after_text))
+    return {
+        "status": "failure" if errors else "success",
+        "message": f"{len(commands)} command(s) planned, {len(errors)} error(s)",
+        "errors": errors,
+        "diff": diff,
+        "ruleset": after_text,
+    }
+
 
-    print("🎯 Firewall configuration restored from JSON")
+def _format_plan(plan: dict, table: str) -> str:
+    section = parse_iptables_save(plan["ruleset"]).tables.get(table)
+    lines = [f"📝 Plan ({plan['message']}) — {table} table would be:"]
+    if section:
+        for c in section.chains.values():
+            lines.append(c.header(counters=False))
+            lines.extend("  " + r.to_line(counters=False) for r in c.rules)
+    lines.extend(f"❌ {e}" for e in plan["errors"])
+    return "\n".join(lines)
 
 
 
@@ -11,6 +11,8 @@ Purpose:
 import os, json, datetime
 from typing import Dict
 
+from app.core import tracing
+
 LOG_DIR = "logs/kb"
 LOG_FILE = os.path.join(LOG_DIR, "iptables_kb.jsonl")
 
@@ -32,6 +34,11 @@ def log_kb_entry(action: str, host: str, result: Dict[str, str]):
         "status": result.get("status"),
         "message": result.get("message"),
     }
+    # Link the entry to the rollout trace (logs/traces) when one is active
+    span = tracing.current_span()
+    if span is not None:
+        entry["trace_id"] = span.trace.trace_id
+        entry["duration_ms"] = round(span.duration_ms, 1)
     with open(LOG_FILE, "a") as f:
         f.write(json.dumps(entry) + "\n")
     print(f"🧾 Logged {action} result for {host}: {entry['status']}")
@@ -10,33 +10,41 @@ Purpose:
 
 from __future__ import annotations
 import os
-from typing import Dict
+import time
+from typing import Dict, Optional
+from app.core.metrics import record_stage
+from app.core.tracing import traced
 from app.core.ssh_file_transfer import SSHFileTransfer
-from app.core.ssh_session_manager import SSHSessionManager
+from app.core.ssh_session_manager import SSHSessionManager, shared_manager
 from app.core.iptables_logger import log_kb_entry
 
 
+@traced("push")
 def push_iptables_ruleset(
     host: str,
     user: str,
     key_path: str,
     local_rules_path: str,
-    remote_rules_path: str = "/tmp/iptables.rules"
+    remote_rules_path: str = "/tmp/iptables.rules",
+    mgr: Optional[SSHSessionManager] = None,
 ) -> Dict[str, str]:
     """
     Upload iptables ruleset to remote host and log the result.
+    Runs on the process-wide shared_manager() unless a `mgr` is passed.
     """
-    mgr = SSHSessionManager()
-    xfer = SSHFileTransfer(mgr)
-
+    started = time.perf_counter()
     if not os.path.exists(local_rules_path):
         result = {
             "status": "failure",
             "message": f"Local ruleset not found: {local_rules_path}",
         }
+        record_stage(host, "push", started, result)
         log_kb_entry("push", host, result)
         return result
 
+    mgr = mgr or shared_manager()
+    xfer = SSHFileTransfer(mgr)
+
     print(f"📤 Uploading iptables ruleset to {host} ...")
     result = xfer.upload(
         host=host,
@@ -46,8 +54,8 @@ def push_iptables_ruleset(
         remote_path=remote_rules_path,
     )
 
+    record_stage(host, "push", started, result)
     log_kb_entry("push", host, result)
-    mgr.stop()
     return result
 
 
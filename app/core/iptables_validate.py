@@ -9,26 +9,33 @@ Purpose:
 """
 
 from __future__ import annotations
-from typing import Dict
-from app.core.ssh_session_manager import SSHSessionManager
+import shlex
+import time
+from typing import Dict, Optional
+from app.core.metrics import record_stage
+from app.core.tracing import traced
+from app.core.ssh_session_manager import SSHSessionManager, shared_manager
 from app.core.iptables_logger import log_kb_entry
 
 
+@traced("validate")
 def validate_iptables_rules(
     host: str,
     user: str,
     key_path: str,
-    remote_rules_path: str = "/tmp/iptables.rules"
+    remote_rules_path: str = "/tmp/iptables.rules",
+    mgr: Optional[SSHSessionManager] = None,
 ) -> Dict[str, str]:
     """
     Run iptables syntax validation remotely and log the result.
+    Runs on the process-wide shared_manager() unless a `mgr` is passed.
     """
-    mgr = SSHSessionManager()
+    started = time.perf_counter()
+    mgr = mgr or shared_manager()
     print(f"🧠 Validating iptables syntax on {host} ...")
 
-    command = f"iptables-restore --test {remote_rules_path}"
+    command = f"iptables-restore --test {shlex.quote(remote_rules_path)}"
     result = mgr.exec(host, user, key_path, command)
-    mgr.stop()
 
     if result["status"] == "success":
         final = {
@@ -41,6 +48,7 @@ def validate_iptables_rules(
             "message": f"Syntax error in ruleset: {result.get('stderr') or result.get('message')}",
         }
 
+    record_stage(host, "validate", started, final)
     log_kb_entry("validate", host, final)
     return final
 
@@ -0,0 +1,257 @@
+"""
+Module: job_queue
+Phase: 6
+Milestone: 2
+Step: 1
+Purpose:
+    Background job subsystem for long-running fleet operations.
+      - Worker pool executes jobs off the request thread
+      - Job IDs, per-host progress, cancellation and result retention
+      - Ordered event log per job, consumable as a stream (SSE in main_process)
+"""
+
+from __future__ import annotations
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.core import metrics, tracing
+
+
+# ---------- Tunables ----------
+JOB_WORKERS          = 4          # jobs running at the same time
+HOST_WORKERS         = 32         # hosts processed in parallel inside one job
+RETENTION_S          = 3600       # keep finished jobs for an hour
+MAX_FINISHED_JOBS    = 200        # ...but never more than this many
+MAX_EVENTS_PER_JOB   = 5000       # older events are dropped from the replay buffer
+
+JOB_SECONDS = metrics.histogram("job_duration_seconds", "Background job run time", ("kind", "status"),
+                                metrics.DURATION_BUCKETS)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class Job:
+    """State of one background job. All mutation goes through the job's condition."""
+
+    def __init__(self, kind: str, params: Dict[str, object], total: int = 0):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.results: Dict[str, object] = {}
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.trace_id: Optional[str] = None
+        self._events: List[Dict[str, object]] = []
+        self._seq = 0
+        self._cancel = threading.Event()
+        self._cond = threading.Condition()
+
+    # ---------- Progress ----------
+    def emit(self, event_type: str, **data):
+        with self._cond:
+            self._seq += 1
+            self._events.append({"seq": self._seq, "type": event_type, "time": time.time(), **data})
+            if len(self._events) > MAX_EVENTS_PER_JOB:
+                del self._events[: len(self._events) - MAX_EVENTS_PER_JOB]
+            self._cond.notify_all()
+
+    def set_total(self, total: int):
+        with self._cond:
+            self.total = total
+        self.emit("progress", done=self.done, total=total)
+
+    def record(self, host: str, result: Dict[str, object]):
+        """Store one host's result and advance progress."""
+        ok = result.get("status") == "success"
+        with self._cond:
+            self.results[host] = result
+            self.done += 1
+            if not ok:
+                self.failed += 1
+        self.emit("host", host=host, status=result.get("status"), message=result.get("message"),
+                  done=self.done, total=self.total)
+
+    # ---------- Cancellation ----------
+    def cancel(self) -> bool:
+        if self.status in FINISHED:
+            return False
+        self._cancel.set()
+        self.emit("cancelling")
+        return True
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def cancel_event(self) -> threading.Event:
+        return self._cancel
+
+    # ---------- Streaming ----------
+    def events_after(self, seq: int, timeout: float) -> List[Dict[str, object]]:
+        """Events with seq > `seq`, waiting up to `timeout` if there are none yet."""
+        with self._cond:
+            if self._seq <= seq and self.status not in FINISHED:
+                self._cond.wait(timeout)
+            return [e for e in self._events if e["seq"] > seq]
+
+    def to_dict(self, include_results: bool = True) -> Dict[str, object]:
+        d = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "progress": {"done": self.done, "failed": self.failed, "total": self.total},
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "trace_id": self.trace_id,
+        }
+        if include_results:
+            d["results"] = dict(self.results)
+        return d
+
+
+class JobManager:
+    """
+    Runs jobs on a worker pool and retains them for later inspection.
+        jm = JobManager()
+        job = jm.submit("apply", work_fn, {"hosts": [...]})
+    `work_fn(job)` returns the final result (stored under results["_summary"])
+    and should check `job.cancelled` between units of work.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, retention_s: int = RETENTION_S):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._retention_s = retention_s
+
+    def submit(self, kind: str, fn: Callable[[Job], object], params: Dict[str, object], total: int = 0) -> Job:
+        job = Job(kind, params, total)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        job.emit("queued", kind=kind)
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], object]):
+        if job.cancelled:
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        job.emit("started")
+        with tracing.span(f"job.{job.kind}", root=True, job_id=job.id) as sp:
+            job.trace_id = sp.trace.trace_id
+            try:
+                summary = fn(job)
+                if summary is not None:
+                    job.results["_summary"] = summary
+                status = CANCELLED if job.cancelled else (FAILED if job.failed else SUCCEEDED)
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                sp.fail(job.error)
+                status = FAILED
+        self._finish(job, status)
+
+    def _finish(self, job: Job, status: str):
+        # Status and the final event change together, so streams never end early
+        with job._cond:
+            job.status = status
+            job.finished = time.time()
+            job.emit("finished", status=status, done=job.done, failed=job.failed, total=job.total, error=job.error)
+        JOB_SECONDS.observe(job.finished - (job.started or job.created), job.kind, status)
+
+    def _purge(self):
+        now = time.time()
+        finished = sorted((j for j in self._jobs.values() if j.status in FINISHED), key=lambda j: j.finished or 0)
+        expired = [j for j in finished if now - (j.finished or now) > self._retention_s]
+        overflow = finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]
+        for j in expired + overflow:
+            self._jobs.pop(j.id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            self._purge()
+            return sorted(self._jobs.values(), key=lambda j: j.created, reverse=True)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        return bool(job and job.cancel())
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for j in jobs:
+            j.cancel()
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def run_per_host(job: Job, hosts: Iterable[str], fn: Callable[[str], Dict[str, object]],
+                 max_workers: int = HOST_WORKERS) -> Dict[str, int]:
+    """
+    Fan `fn(host)` out over hosts inside a job, recording each result as it
+    completes. Hosts not yet started when the job is cancelled are skipped.
+    """
+    hosts = list(hosts)
+    job.set_total(len(hosts))
+
+    def guarded(host: str) -> Dict[str, object]:
+        if job.cancelled:
+            return {"status": "cancelled", "message": f"Skipped {host}: job cancelled"}
+        with tracing.span("host", host=host) as sp:
+            try:
+                result = fn(host)
+            except Exception as e:
+                result = {"status": "failure", "message": f"Error on {host}: {e}"}
+            tracing.mark_result(sp, result)
+            return result
+
+    # wrap(): host spans run in pool threads but belong to the job's trace
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(hosts)))) as pool:
+        futures = {pool.submit(tracing.wrap(guarded), h): h for h in hosts}
+        for f in as_completed(futures):
+            job.record(futures[f], f.result())
+    return {"hosts": len(hosts), "failed": job.failed}
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import random
+
+    jm = JobManager()
+
+    def fake_rollout(job: Job):
+        def one(host):
+            time.sleep(random.uniform(0.01, 0.05))
+            return {"status": "success", "message": f"applied on {host}"}
+        return run_per_host(job, [f"10.10.0.{i}" for i in range(1, 51)], one)
+
+    job = jm.submit("apply", fake_rollout, {"hosts": "10.10.0.1-50"})
+    seq = 0
+    while True:
+        events = job.events_after(seq, timeout=1)
+        if events:
+            seq = events[-1]["seq"]
+            print(f"… {job.done}/{job.total} hosts")
+        if job.status in FINISHED and not events:
+            break
+    print(job.to_dict(include_results=False))
+    jm.shutdown()
@@ -0,0 +1,282 @@
+"""
+Module: metrics
+Phase: 6
+Milestone: 3
+Step: 1
+Purpose:
+    Prometheus-style instrumentation for SSH sessions and rollout pipelines.
+      - Counter, Gauge and Histogram families with labels
+      - Hot-path updates touch only a per-thread shard: no lock, no contention
+        between the many worker threads of a fleet fan-out
+      - Shards are merged at scrape time; shards of finished threads are
+        folded into a retired total so thread churn does not grow memory
+      - render() produces the text exposition format served at /metrics
+"""
+
+from __future__ import annotations
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# ---------- Tunables ----------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+Labels = Tuple[str, ...]
+
+
+class _Sharded:
+    """
+    Base for metrics whose updates go to thread-local rows:
+        shard = {label_values: [v0, v1, ...]}
+    Only the owning thread writes a shard; the collector reads copies.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str], width: int):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._width = width
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, Dict[Labels, List[float]]]] = []
+        self._retired: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()     # shard registration and collection only
+
+    def _row(self, labels: Labels) -> List[float]:
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        row = shard.get(labels)
+        if row is None:
+            if len(labels) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+            row = shard[labels] = [0.0] * self._width
+        return row
+
+    def _collect(self) -> Dict[Labels, List[float]]:
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    _merge(self._retired, shard)
+            self._shards = alive
+            total = {k: list(v) for k, v in self._retired.items()}
+            for _, shard in alive:
+                _merge(total, shard)
+        return total
+
+    def _label_str(self, labels: Labels, extra: str = "") -> str:
+        parts = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, labels)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+def _merge(into: Dict[Labels, List[float]], shard: Dict[Labels, List[float]]):
+    for labels, row in dict(shard).items():   # dict() copy is atomic under the GIL
+        acc = into.get(labels)
+        if acc is None:
+            into[labels] = list(row)
+        else:
+            for i, v in enumerate(row):
+                acc[i] += v
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Counter(_Sharded):
+    """Monotonic counter: ssh_retries.inc("10.10.0.20")."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_, labelnames, 1)
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._row(labels)[0] += amount
+
+    def value(self, *labels: str) -> float:
+        return self._collect().get(labels, [0.0])[0]
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{self._label_str(k)} {_fmt(v[0])}" for k, v in sorted(self._collect().items())]
+
+
+class Histogram(_Sharded):
+    """
+    Cumulative-bucket histogram: exec_seconds.observe(0.042, "10.10.0.20").
+    A row holds one count per bucket (+Inf last), then sum.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_, labelnames, len(self.buckets) + 2)
+
+    def observe(self, value: float, *labels: str):
+        row = self._row(labels)
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def snapshot(self, *labels: str) -> Dict[str, float]:
+        row = self._collect().get(labels)
+        if row is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": sum(row[:-1]), "sum": row[-1]}
+
+    def render(self) -> List[str]:
+        out = []
+        for labels, row in sorted(self._collect().items()):
+            cum = 0.0
+            for bound, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                cum += n
+                le = "+Inf" if bound == float("inf") else _fmt(bound)
+                label_str = self._label_str(labels, 'le="%s"' % le)
+                out.append(f"{self.name}_bucket{label_str} {_fmt(cum)}")
+            out.append(f"{self.name}_sum{self._label_str(labels)} {_fmt(row[-1])}")
+            out.append(f"{self.name}_count{self._label_str(labels)} {_fmt(cum)}")
+        return out
+
+
+class Gauge:
+    """
+    Point-in-time value computed at scrape time:
+        SESSIONS_OPEN = Gauge("ssh_sessions_open", "...", fn=lambda: {(): 3})
+    `fn` returns {label_values: value}, so the hot path never updates it.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = (),
+                 fn: Optional[Callable[[], Dict[Labels, float]]] = None):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        if self.fn is None:
+            return []
+        out = []
+        for labels, v in sorted(self.fn().items()):
+            parts = [f'{n}="{_escape(x)}"' for n, x in zip(self.labelnames, labels)]
+            out.append(f"{self.name}{'{' + ','.join(parts) + '}' if parts else ''} {_fmt(v)}")
+        return out
+
+
+class Registry:
+    """Named collection of metric families."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in list(self._metrics.values()):
+            try:
+                body = m.render()
+            except Exception as e:
+                lines.append(f"# {m.name} collection failed: {e}")
+                continue
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help_, labelnames))
+
+
+def histogram(name: str, help_: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_, labelnames, buckets))
+
+
+def gauge(name: str, help_: str, labelnames: Sequence[str] = (),
+          fn: Optional[Callable[[], Dict[Labels, float]]] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help_, labelnames, fn))
+
+
+def render() -> str:
+    """Text exposition of every registered metric (content type text/plain; version=0.0.4)."""
+    return REGISTRY.render()
+
+
+# ---------- Shared pipeline metrics ----------
+STAGE_SECONDS = histogram(
+    "iptables_stage_duration_seconds", "Duration of push/validate/apply per host",
+    ("host", "stage"), DURATION_BUCKETS)
+STAGE_TOTAL = counter(
+    "iptables_stage_total", "Pipeline stage runs by outcome", ("stage", "status"))
+
+
+def record_stage(host: str, stage: str, started: float, result: Dict[str, str]):
+    """Record one pipeline stage; `started` is a time.perf_counter() value."""
+    STAGE_SECONDS.observe(time.perf_counter() - started, host, stage)
+    STAGE_TOTAL.inc(stage, str(result.get("status")))
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    h = histogram("demo_exec_seconds", "demo", ("host",))
+    c = counter("demo_exec_total", "demo", ("host", "outcome"))
+
+    def work(i):
+        for _ in range(10_000):
+            h.observe(0.003 * (i % 7), f"10.10.0.{i % 4}")
+            c.inc(f"10.10.0.{i % 4}", "success")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(16) as pool:
+        list(pool.map(work, range(32)))
+    dt = time.perf_counter() - t0
+    print(f"✅ {32 * 20_000} updates from 16 threads in {dt:.2f}s ({dt / 640_000 * 1e9:.0f} ns/update)")
+    print("\n".join(render().splitlines()[:8]))
+    print("count:", h.snapshot("10.10.0.0")["count"])
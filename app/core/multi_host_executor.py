@@ -10,7 +10,7 @@ Purpose:
 
 import concurrent.futures
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 from app.core.remote_command_executor import execute_remote_command, validate_command
 
 
@@ -20,7 +20,8 @@ def execute_on_multiple_hosts(
     key_path: str,
     command: str,
     port: int = 22,
-    max_workers: int = 3
+    max_workers: int = 3,
+    priority: Optional[str] = None,
 ) -> Dict[str, Dict[str, str]]:
     """
     Execute a command concurrently across multiple SSH hosts.
@@ -32,6 +33,9 @@ def execute_on_multiple_hosts(
         command (str): Command to run remotely.
         port (int): SSH port (default 22).
         max_workers (int): Max parallel threads.
+        priority (str): Scheduler class ("interactive", "rollout", "background").
+            When set, commands run on pooled sessions through the shared
+            command scheduler instead of one connection per call.
 
     Returns:
         dict: Structured results per host.
@@ -46,9 +50,16 @@ def execute_on_multiple_hosts(
 
     print(f"🔧 Executing '{command}' on {len(hosts)} hosts...")
 
+    if priority is None:
+        run = execute_remote_command
+    else:
+        from app.core.command_scheduler import shared_scheduler
+        lane = shared_scheduler().lane(priority)
+        run = lambda host, user, key_path, command, port: lane.exec(host, user, key_path, command, port=port)
+
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         future_to_host = {
-            executor.submit(execute_remote_command, host, user, key_path, command, port): host
+            executor.submit(run, host, user, key_path, command, port): host
             for host in hosts
         }
 
@@ -0,0 +1,405 @@
+"""
+Module: objective_engine
+Phase: 6
+Milestone: 6
+Step: 1
+Purpose:
+    Server side of the objective wizard (planning.txt: "what to do with the
+    packet" × "where in the packet path").
+      - Lookup tables built once at import: (objective, hook) → valid
+        table/chain/target combinations, best choice first, plus the
+        per-objective and per-hook views the GUI dropdowns need
+      - Every answer is pre-serialized with its ETag, so a keystroke costs a
+        dict lookup and clients can cache it
+      - build_rule(): objective + position + matches → validated
+        iptables-restore fragment (apply with `iptables-restore --noflush`)
+"""
+
+from __future__ import annotations
+import hashlib
+import ipaddress
+import json
+import re
+import shlex
+from typing import Dict, List, Optional, Tuple
+
+from app.core.iptables_backend import normalize_spec
+from app.core.validator import CHAIN_RESTRICTED_TARGETS, TABLE_TARGETS
+from app.utils.parser import Rule
+
+
+# ---------- Netfilter facts ----------
+HOOKS = ("PREROUTING", "INPUT", "FORWARD", "OUTPUT", "POSTROUTING")
+
+# Which hooks each table registers on
+TABLE_HOOKS = {
+    "raw":    ("PREROUTING", "OUTPUT"),
+    "mangle": HOOKS,
+    "nat":    ("PREROUTING", "INPUT", "OUTPUT", "POSTROUTING"),
+    "filter": ("INPUT", "FORWARD", "OUTPUT"),
+}
+
+# Planning-doc wording → hook
+POSITIONS = {
+    "PREROUTING":  'Before "mine or yours" decision',
+    "INPUT":       "Before packet is sent to the process",
+    "FORWARD":     "After routing/forwarding decision",
+    "OUTPUT":      "After the process responds",
+    "POSTROUTING": "Before packet is sent out the interface",
+}
+POSITION_ALIASES = {
+    "before_decision": "PREROUTING", "before_routing": "PREROUTING", "to_process": "INPUT",
+    "forwarding": "FORWARD", "from_process": "OUTPUT", "before_send": "POSTROUTING",
+}
+
+# Target → (options that must be given, options that may be given)
+TARGET_OPTIONS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "ACCEPT":     ((), ()),
+    "DROP":       ((), ()),
+    "REJECT":     ((), ("reject-with",)),
+    "SNAT":       (("to-source",), ()),
+    "MASQUERADE": ((), ("to-ports",)),
+    "DNAT":       (("to-destination",), ()),
+    "REDIRECT":   ((), ("to-ports",)),
+    "MARK":       (("set-mark",), ()),
+    "CONNMARK":   (("set-mark",), ()),
+    "DSCP":       (("set-dscp",), ()),
+    "TTL":        (("ttl-set",), ()),
+    "TCPMSS":     ((), ("clamp-mss-to-pmtu", "set-mss")),
+    "LOG":        ((), ("log-prefix", "log-level")),
+    "NFLOG":      ((), ("nflog-group", "nflog-prefix")),
+}
+
+# Target → (required, optional, tables it is valid in, hooks); where it may
+# go comes from the validator's tables so the two cannot disagree
+TARGETS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]] = {
+    target: (required, optional,
+             tuple(t for t in TABLE_HOOKS if target in TABLE_TARGETS[t]),
+             tuple(h for h in HOOKS if h in CHAIN_RESTRICTED_TARGETS.get(target, HOOKS)))
+    for target, (required, optional) in TARGET_OPTIONS.items()
+}
+
+# Objective → (targets in GUI order, table preference)
+OBJECTIVES = {
+    "filter":       (("ACCEPT", "DROP", "REJECT"), ("filter", "raw", "mangle")),
+    "snat":         (("SNAT",), ("nat",)),
+    "masquerade":   (("MASQUERADE",), ("nat",)),
+    "dnat":         (("DNAT",), ("nat",)),
+    "port_forward": (("DNAT", "REDIRECT"), ("nat",)),
+    "mangle":       (("MARK", "CONNMARK", "DSCP", "TTL", "TCPMSS"), ("mangle",)),
+    "log":          (("LOG", "NFLOG"), ("filter", "mangle", "raw")),
+}
+# GUI objective names (index.html) → engine objectives
+OBJECTIVE_ALIASES = {"translate": ("snat", "dnat", "masquerade", "port_forward")}
+
+NOTES = {
+    ("filter", "raw"): "raw table: dropped before connection tracking (cheapest, but no conntrack state)",
+    ("filter", "mangle"): "mangle table: works, but filtering belongs in the filter table",
+    ("port_forward", "REDIRECT"): "redirects to a port on this host",
+    ("TCPMSS", None): "needs -p tcp --tcp-flags SYN,RST SYN",
+}
+
+
+# ---------- Lookup tables (built once) ----------
+def _combos(objective: str, hook: str) -> List[Dict[str, object]]:
+    targets, tables = OBJECTIVES[objective]
+    out = []
+    for table in tables:
+        if hook not in TABLE_HOOKS[table]:
+            continue
+        for target in targets:
+            required, optional, target_tables, target_hooks = TARGETS[target]
+            if table in target_tables and hook in target_hooks:
+                note = NOTES.get((objective, table)) or NOTES.get((objective, target)) or NOTES.get((target, None))
+                out.append({"table": table, "chain": hook, "target": target,
+                            "required": list(required), "optional": list(optional), "note": note})
+    return out
+
+
+COMBOS: Dict[Tuple[str, str], List[Dict[str, object]]] = {
+    (o, h): _combos(o, h) for o in OBJECTIVES for h in HOOKS
+}
+HOOKS_FOR: Dict[str, List[str]] = {o: [h for h in HOOKS if COMBOS[(o, h)]] for o in OBJECTIVES}
+OBJECTIVES_AT: Dict[str, List[str]] = {h: [o for o in OBJECTIVES if COMBOS[(o, h)]] for h in HOOKS}
+
+
+class Answer:
+    """A pre-serialized lookup response."""
+
+    __slots__ = ("data", "body", "etag")
+
+    def __init__(self, data: Dict[str, object]):
+        self.data = data
+        self.body = json.dumps(data, sort_keys=True).encode()
+        self.etag = hashlib.sha1(self.body).hexdigest()[:16]
+
+
+def _answer(objective: Optional[str], hook: Optional[str]) -> Answer:
+    if objective and hook:
+        combos = COMBOS[(objective, hook)]
+        return Answer({"status": "success" if combos else "invalid", "objective": objective,
+                       "position": hook, "label": POSITIONS[hook], "combinations": combos})
+    if objective:
+        return Answer({"status": "success", "objective": objective,
+                       "positions": [{"hook": h, "label": POSITIONS[h], "combinations": COMBOS[(objective, h)]}
+                                     for h in HOOKS_FOR[objective]]})
+    if hook:
+        return Answer({"status": "success", "position": hook, "label": POSITIONS[hook],
+                       "objectives": OBJECTIVES_AT[hook]})
+    return Answer({"status": "success", "objectives": list(OBJECTIVES), "positions": POSITIONS,
+                   "hooks_for": HOOKS_FOR, "objectives_at": OBJECTIVES_AT,
+                   "combinations": {f"{o}:{h}": c for (o, h), c in COMBOS.items() if c}})
+
+
+ANSWERS: Dict[Tuple[Optional[str], Optional[str]], Answer] = {
+    (o, h): _answer(o, h) for o in (None, *OBJECTIVES) for h in (None, *HOOKS)
+}
+
+
+def resolve_objective(objective: Optional[str], target: Optional[str] = None) -> Optional[str]:
+    """Engine objective for an engine or GUI name ("translate" + "DNAT" → "dnat")."""
+    if not objective:
+        return None
+    objective = objective.lower()
+    if objective in OBJECTIVES:
+        return objective
+    for candidate in OBJECTIVE_ALIASES.get(objective, ()):
+        if target is None or target.upper() in OBJECTIVES[candidate][0]:
+            return candidate
+    return None
+
+
+def resolve_position(position: Optional[str]) -> Optional[str]:
+    if not position:
+        return None
+    if position.upper() in HOOKS:
+        return position.upper()
+    return POSITION_ALIASES.get(position.lower())
+
+
+def lookup(objective: Optional[str] = None, position: Optional[str] = None,
+           target: Optional[str] = None) -> Optional[Answer]:
+    """Precomputed answer, or None for an unknown objective/position."""
+    o = resolve_objective(objective, target)
+    h = resolve_position(position)
+    if (objective and o is None) or (position and h is None):
+        return None
+    return ANSWERS[(o, h)]
+
+
+# ---------- Rule builder ----------
+_PORT_PROTOCOLS = {"tcp", "udp", "sctp", "udplite"}
+CT_STATES = ("NEW", "ESTABLISHED", "RELATED", "INVALID", "UNTRACKED", "SNAT", "DNAT")
+_IFACE = re.compile(r"!?[A-Za-z0-9_.:@-]{1,15}\+?")        # IFNAMSIZ - 1, optional '+' wildcard
+_WORD = re.compile(r"!?[A-Za-z0-9_.:/,+-]+")                # protocols, marks, levels, ...
+_CONTROL = re.compile(r"[\x00-\x1f\x7f]")
+_FREE_TEXT = {"comment", "log-prefix", "nflog-prefix"}      # may contain spaces, never control characters
+_NAT_TO = {"to-source", "to-destination"}
+
+
+def _check_text(key: str, value: str) -> Optional[str]:
+    if _CONTROL.search(value):
+        return f"{key} must not contain control characters"
+    if key not in _FREE_TEXT and not _WORD.fullmatch(value):
+        return f"invalid {key} {value!r}"
+    return None
+
+
+def _check_iface(value: str) -> Optional[str]:
+    return None if _IFACE.fullmatch(value) else f"invalid interface {value!r}"
+
+
+def _check_state(value: str) -> Optional[str]:
+    bad = [s for s in value.upper().split(",") if s not in CT_STATES]
+    return f"invalid state {', '.join(bad)}; valid: {', '.join(CT_STATES)}" if bad else None
+
+
+def _check_port_range(value: str) -> bool:
+    parts = value.split("-")
+    return len(parts) <= 2 and all(p.isdigit() and 0 < int(p) < 65536 for p in parts)
+
+
+def _check_nat_to(key: str, value: str) -> Optional[str]:
+    """addr[-addr][:port[-port]], IPv6 addresses in brackets when a port follows."""
+    addr, port = value, None
+    if value.startswith("["):
+        addr, _, rest = value[1:].partition("]")
+        if rest:
+            if not rest.startswith(":"):
+                return f"invalid {key} {value!r}"
+            port = rest[1:]
+    elif value.count(":") == 1:
+        addr, port = value.split(":")
+    try:
+        for a in addr.split("-", 1):
+            ipaddress.ip_address(a)
+    except ValueError:
+        return f"invalid {key} {value!r}"
+    if port is not None and not _check_port_range(port):
+        return f"invalid {key} port {port!r}"
+    return None
+
+
+def _check_addr(value: str) -> Optional[str]:
+    try:
+        ipaddress.ip_network(value.lstrip("!").strip(), strict=False)
+        return None
+    except ValueError:
+        return f"invalid address {value!r}"
+
+
+def _check_port(value: str) -> Optional[str]:
+    parts = str(value).split(":")
+    if len(parts) > 2 or not all(p.isdigit() and 0 < int(p) < 65536 for p in parts if p):
+        return f"invalid port {value!r}"
+    return None
+
+
+def build_rule(
+    objective: str,
+    position: str,
+    target: Optional[str] = None,
+    match: Optional[Dict[str, object]] = None,
+    params: Optional[Dict[str, object]] = None,
+) -> Dict[str, object]:
+    """
+    Validated rule for an objective at a position.
+        match:  source, destination, protocol, sport, dport, in_iface, out_iface, state, comment
+        params: target options without dashes, e.g. {"to-destination": "10.10.0.40:80"}
+    Returns dict(status, message, table, chain, target, spec, command, fragment) or
+    dict(status="failure", errors=[...]).
+    """
+    match = match or {}
+    params = {str(k).lstrip("-"): v for k, v in (params or {}).items() if v not in (None, "")}
+    errors: List[str] = []
+
+    o = resolve_objective(objective, target)
+    h = resolve_position(position)
+    if o is None:
+        errors.append(f"unknown objective {objective!r}")
+    if h is None:
+        errors.append(f"unknown position {position!r}")
+    if errors:
+        return {"status": "failure", "message": "; ".join(errors), "errors": errors}
+
+    combos = COMBOS[(o, h)]
+    if target:
+        combos = [c for c in combos if c["target"] == target.upper()]
+    if not combos:
+        msg = f"{target.upper() + ' for ' if target else ''}{o} is not possible at {h}; valid: {HOOKS_FOR[o]}"
+        return {"status": "failure", "message": msg, "errors": [msg]}
+    combo = combos[0]
+
+    proto = str(match.get("protocol") or "").lower() or None
+    if proto:
+        err = _check_text("protocol", proto)
+        if err:
+            errors.append(err)
+    args: List[str] = []
+    for key, opt in (("source", "-s"), ("destination", "-d")):
+        if match.get(key):
+            err = _check_addr(str(match[key]))
+            if err:
+                errors.append(err)
+            args += [opt, str(match[key])]
+    if match.get("in_iface"):
+        if h in ("OUTPUT", "POSTROUTING"):
+            errors.append(f"input interface cannot be matched in {h}")
+        err = _check_iface(str(match["in_iface"]))
+        if err:
+            errors.append(err)
+        args += ["-i", str(match["in_iface"])]
+    if match.get("out_iface"):
+        if h in ("PREROUTING", "INPUT"):
+            errors.append(f"output interface cannot be matched in {h}")
+        err = _check_iface(str(match["out_iface"]))
+        if err:
+            errors.append(err)
+        args += ["-o", str(match["out_iface"])]
+    if proto:
+        args += ["-p", proto]
+    for key, opt in (("sport", "--sport"), ("dport", "--dport")):
+        if match.get(key) not in (None, ""):
+            if proto not in _PORT_PROTOCOLS:
+                errors.append(f"{key} needs protocol tcp, udp or sctp")
+            err = _check_port(str(match[key]))
+            if err:
+                errors.append(err)
+            args += [opt, str(match[key])]
+    if match.get("state"):
+        err = _check_state(str(match["state"]))
+        if err:
+            errors.append(err)
+        args += ["-m", "conntrack", "--ctstate", str(match["state"]).upper()]
+    if match.get("comment"):
+        err = _check_text("comment", str(match["comment"]))
+        if err:
+            errors.append(err)
+        args += ["-m", "comment", "--comment", str(match["comment"])[:256]]
+
+    for opt in combo["required"]:
+        if opt not in params:
+            errors.append(f"{combo['target']} needs --{opt}")
+    unknown = set(params) - set(combo["required"]) - set(combo["optional"])
+    if unknown:
+        errors.append(f"{combo['target']} does not take {', '.join('--' + u for u in sorted(unknown))}")
+    for opt, value in params.items():
+        if value is True:
+            continue
+        if opt in _NAT_TO:
+            err = _check_nat_to(opt, str(value))
+        elif opt == "to-ports":
+            err = None if _check_port_range(str(value)) else f"invalid to-ports {value!r}"
+        else:
+            err = _check_text(opt, str(value))
+        if err:
+            errors.append(err)
+    if combo["target"] == "TCPMSS" and proto != "tcp":
+        errors.append("TCPMSS needs protocol tcp")
+    if combo["target"] == "DNAT" and o == "port_forward" and not proto:
+        errors.append("port forwarding needs a protocol")
+    if errors:
+        return {"status": "failure", "message": "; ".join(errors), "errors": errors}
+
+    if combo["target"] == "TCPMSS":
+        args += ["--tcp-flags", "SYN,RST", "SYN"]
+    args += ["-j", combo["target"]]
+    for opt in combo["required"] + combo["optional"]:
+        if opt in params:
+            value = params[opt]
+            args += [f"--{opt}"] if value is True else [f"--{opt}", str(value)]
+
+    rule = Rule(h, normalize_spec(args))
+    spec = rule.spec()
+    return {
+        "status": "success",
+        "message": f"{o} at {h}: {combo['table']}/{h} -j {combo['target']}",
+        "table": combo["table"],
+        "chain": h,
+        "target": combo["target"],
+        "note": combo["note"],
+        "spec": spec,
+        "command": shlex.join(["iptables", "-t", combo["table"], "-A", h, *rule.args]),
+        # Policy "-" declares the built-in chain without touching its policy under --noflush
+        "fragment": f"*{combo['table']}\n:{h} - [0:0]\n{rule.to_line(counters=False)}\nCOMMIT\n",
+    }
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import time
+
+    n = 10_000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        lookup("dnat", "PREROUTING")
+    print(f"🔎 lookup: {(time.perf_counter() - t0) / n * 1e6:.2f} µs")
+    print("dnat hooks:", HOOKS_FOR["dnat"], "| objectives at FORWARD:", OBJECTIVES_AT["FORWARD"])
+
+    t0 = time.perf_counter()
+    r = build_rule("port_forward", "before_decision", match={"protocol": "tcp", "dport": 8080, "in_iface": "eth0"},
+                   params={"to-destination": "10.10.0.40:80"})
+    print(f"🧱 build_rule: {(time.perf_counter() - t0) * 1000:.2f} ms")
+    print(r["fragment"])
+    print(build_rule("snat", "INPUT")["message"])
+    print(build_rule("filter", "POSTROUTING")["message"])
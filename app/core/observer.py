@@ -0,0 +1,418 @@
+"""
+Module: observer
+Phase: 6
+Milestone: 6
+Step: 2
+Purpose:
+    Push-based change detection, so that watching a quiet fleet costs ~nothing.
+      - One long-lived SSH channel per host runs a tiny shell watcher that
+        prints a line only when the ruleset digest changes (plus a rare
+        heartbeat). xtables-monitor is the trigger where it exists (nft
+        backend); elsewhere iptables-save is hashed on the host every few
+        seconds. No ruleset crosses the wire until something changes.
+      - On a change the new ruleset is collected and recorded in the ruleset
+        store (source "observer")
+      - FileWatcher watches local files (db/, iptables.rules) with inotify via
+        ctypes, falling back to mtime polling
+      - Events go to an ordered, replayable log (SSE in main_process)
+"""
+
+from __future__ import annotations
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core import metrics
+from app.core.ssh_session_manager import SSHSessionManager, shared_manager
+
+
+# ---------- Tunables ----------
+WATCH_INTERVAL_S    = 5          # host-side check interval (hash in poll mode, event file in monitor mode)
+HEARTBEAT_EVERY     = 12         # ...and an "alive" line every N checks, so dead channels are noticed
+WATCH_IDLE_TTL_S    = 86400      # watcher sessions are busy by design; don't let the sweeper reap them
+OBSERVER_MANAGER    = "observer" # shared_manager() name for watcher sessions
+RECONNECT_DELAY_S   = 2
+RECONNECT_MAX_S     = 60
+MAX_EVENTS          = 5000       # older events are dropped from the replay buffer
+LOCAL_POLL_S        = 1.0        # FileWatcher poll interval without inotify
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+LOCAL_PATHS  = (PROJECT_ROOT / "db", PROJECT_ROOT / "iptables.rules")
+
+OBSERVER_EVENTS = metrics.counter("observer_events_total", "Observer events by type", ("type",))
+
+_OBSERVERS: "set[Observer]" = set()
+metrics.gauge("observer_hosts_watched", "Hosts with an active rule watcher",
+              fn=lambda: {(): sum(len(o.hosts()) for o in list(_OBSERVERS))})
+
+
+def watch_command(interval_s: int = WATCH_INTERVAL_S, heartbeat_every: int = HEARTBEAT_EVERY) -> str:
+    """
+    Remote POSIX-sh watcher. Prints "rules <cksum>-<bytes> <mode>" whenever the
+    normalized iptables-save output changes (counters and comments stripped),
+    and "alive" every `heartbeat_every` checks. Exits on SIGPIPE once the
+    channel is gone.
+    """
+    i, k = int(interval_s), max(1, int(heartbeat_every))
+    return (
+        "h() { iptables-save 2>/dev/null | sed -e '/^#/d' -e 's/ \\[[0-9]*:[0-9]*\\]$//' | cksum | tr ' ' '-'; }; "
+        "P=; e() { c=$(h); [ \"$c\" = \"$P\" ] || { P=$c; echo \"rules $c $1\"; }; }; "
+        "n=0; beat() { n=$((n+1)); [ $((n % " + str(k) + ")) -ne 0 ] || echo alive; }; "
+        "if command -v xtables-monitor >/dev/null 2>&1 && iptables -V 2>/dev/null | grep -q nf_tables; then "
+        "F=$(mktemp) || exit 1; xtables-monitor -e >>\"$F\" 2>/dev/null & M=$!; "
+        "trap 'kill $M 2>/dev/null; rm -f \"$F\"; exit' HUP PIPE TERM; "
+        "e monitor; while sleep " + str(i) + "; do "
+        "if [ -s \"$F\" ]; then : >\"$F\"; e monitor; fi; beat; done; "
+        "else e poll; while sleep " + str(i) + "; do e poll; beat; done; fi"
+    )
+
+
+class WatchStopped(Exception):
+    """Raised into a watcher's channel loop when its host is unwatched."""
+
+
+class _Watch:
+    """State of one watched host."""
+
+    __slots__ = ("host", "user", "key_path", "port", "digest", "mode", "connected", "last_seen",
+                 "changes", "error", "stopped", "wake", "thread")
+
+    def __init__(self, host: str, user: str, key_path: str, port: int):
+        self.host, self.user, self.key_path, self.port = host, user, key_path, port
+        self.digest: Optional[str] = None
+        self.mode: Optional[str] = None
+        self.connected = False
+        self.last_seen: Optional[float] = None
+        self.changes = 0
+        self.error: Optional[str] = None
+        self.stopped = False
+        self.wake = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"host": self.host, "port": self.port, "digest": self.digest, "mode": self.mode,
+                "connected": self.connected, "last_seen": self.last_seen, "changes": self.changes,
+                "error": self.error}
+
+
+class _WatchSink:
+    """exec(sink=...) target: splits the watcher's output into lines."""
+
+    def __init__(self, observer: "Observer", watch: _Watch):
+        self._observer = observer
+        self._watch = watch
+        self._buf = b""
+        self.lines = 0
+
+    def reset(self):
+        # Called before exec() retries: an unwatched host must not be redialled
+        if self._watch.stopped:
+            raise WatchStopped(self._watch.host)
+        self._buf = b""
+
+    def write(self, chunk: bytes):
+        if self._watch.stopped:
+            raise WatchStopped(self._watch.host)
+        *lines, self._buf = (self._buf + chunk).split(b"\n")
+        for line in lines:
+            self.lines += 1
+            self._observer._line(self._watch, line.decode(errors="replace").strip())
+
+
+class Observer:
+    """
+    Fleet rule watcher + local file watcher sharing one event log.
+        obs = Observer()
+        obs.watch("10.10.0.20", "root", key)
+        obs.watch_local()                      # db/ and iptables.rules
+        obs.events_after(0, timeout=15)        → [{"seq", "type", "time", ...}]
+    Event types: baseline, changed, recorded, disconnected, error, file.
+    With record=True a "changed" host is collected and recorded in `store`
+    (default: default_store()); `on_change(host, event)` is called either way.
+    """
+
+    def __init__(
+        self,
+        mgr: Optional[SSHSessionManager] = None,
+        interval_s: int = WATCH_INTERVAL_S,
+        record: bool = True,
+        store=None,
+        collect_mgr: Optional[SSHSessionManager] = None,
+        on_change: Optional[Callable[[str, Dict[str, object]], None]] = None,
+    ):
+        self.mgr = mgr or shared_manager(OBSERVER_MANAGER, idle_ttl_s=WATCH_IDLE_TTL_S)
+        self.interval_s = interval_s
+        self.record = record
+        self._store = store
+        self._collect_mgr = collect_mgr
+        self._on_change = on_change
+        self._watches: Dict[Tuple[str, int], _Watch] = {}
+        self._files: List[FileWatcher] = []
+        self._events: List[Dict[str, object]] = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        _OBSERVERS.add(self)
+
+    # ---------- Events ----------
+    def emit(self, event_type: str, **data):
+        OBSERVER_EVENTS.inc(event_type)
+        with self._cond:
+            self._seq += 1
+            self._events.append({"seq": self._seq, "type": event_type, "time": time.time(), **data})
+            if len(self._events) > MAX_EVENTS:
+                del self._events[: len(self._events) - MAX_EVENTS]
+            self._cond.notify_all()
+
+    def events_after(self, seq: int, timeout: float) -> List[Dict[str, object]]:
+        """Events with seq > `seq`, waiting up to `timeout` if there are none yet."""
+        with self._cond:
+            if self._seq <= seq:
+                self._cond.wait(timeout)
+            return [e for e in self._events if e["seq"] > seq]
+
+    # ---------- Hosts ----------
+    def watch(self, host: str, user: str, key_path: str, port: int = 22) -> bool:
+        """Start watching `host`; False if it is already watched."""
+        k = (host, port)
+        with self._cond:
+            if k in self._watches:
+                return False
+            w = self._watches[k] = _Watch(host, user, key_path, port)
+        w.thread = threading.Thread(target=self._run, args=(w,), name=f"observer-{host}", daemon=True)
+        w.thread.start()
+        return True
+
+    def unwatch(self, host: str, port: int = 22) -> bool:
+        with self._cond:
+            w = self._watches.pop((host, port), None)
+        if w is None:
+            return False
+        w.stopped = True
+        w.wake.set()
+        # Closing the session ends the channel read; the watcher dies on its next write (SIGPIPE)
+        self.mgr.close_host(host, w.user, port)
+        return True
+
+    def hosts(self) -> List[Dict[str, object]]:
+        with self._cond:
+            return [w.to_dict() for w in self._watches.values()]
+
+    def _run(self, w: _Watch):
+        delay = RECONNECT_DELAY_S
+        command = watch_command(self.interval_s)
+        while not w.stopped:
+            sink = _WatchSink(self, w)
+            try:
+                r = self.mgr.exec(w.host, w.user, w.key_path, command, port=w.port, sink=sink)
+            except WatchStopped:
+                break
+            w.connected = False
+            if w.stopped:
+                break
+            if sink.lines:
+                delay = RECONNECT_DELAY_S         # it was up: start the backoff over
+            w.error = r.get("stderr") or r.get("message")
+            self.emit("disconnected", host=w.host, message=w.error, retry_in_s=delay)
+            w.wake.wait(delay)
+            delay = min(delay * 2, RECONNECT_MAX_S)
+
+    def _line(self, w: _Watch, line: str):
+        w.connected = True
+        w.last_seen = time.time()
+        if not line.startswith("rules "):
+            return                                 # heartbeat
+        _, digest, mode = (line.split() + [None])[:3]
+        w.mode = mode
+        if w.digest == digest:
+            return                                 # reconnected, nothing changed meanwhile
+        previous, w.digest = w.digest, digest
+        if previous is None:
+            self.emit("baseline", host=w.host, digest=digest, mode=mode)
+            return
+        w.changes += 1
+        event = {"host": w.host, "digest": digest, "previous": previous, "mode": mode}
+        self.emit("changed", **event)
+        try:
+            if self.record:
+                event.update(self._record(w))
+            if self._on_change:
+                self._on_change(w.host, event)
+        except Exception as e:
+            # Never let a handler kill the channel loop
+            self.emit("error", host=w.host, message=f"{type(e).__name__}: {e}")
+
+    def _record(self, w: _Watch) -> Dict[str, object]:
+        from app.core.ruleset_collector import collect_ruleset
+        from app.core.ruleset_store import default_store
+
+        collected = collect_ruleset(w.host, w.user, w.key_path, counters=False, mgr=self._collect_mgr,
+                                    port=w.port)
+        if collected["status"] != "success":
+            self.emit("error", host=w.host, message=collected["message"])
+            return {}
+        v = (self._store or default_store()).record(w.host, collected["ruleset"], source="observer")
+        self.emit("recorded", host=w.host, version=v["id"], changed=v["changed"], rules=v["rules"])
+        return {"version": v["id"]}
+
+    # ---------- Local files ----------
+    def watch_local(self, paths: Iterable[os.PathLike] = LOCAL_PATHS, backend: str = "auto") -> "FileWatcher":
+        fw = FileWatcher(paths, lambda path, kind: self.emit("file", path=path, change=kind), backend=backend)
+        fw.start()
+        self._files.append(fw)
+        return fw
+
+    def stop(self):
+        for w in self.hosts():
+            self.unwatch(w["host"], w["port"])
+        for fw in self._files:
+            fw.stop()
+        self._files.clear()
+        _OBSERVERS.discard(self)
+
+
+# ---------- Local file watching ----------
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x002, 0x008, 0x040, 0x080
+IN_CREATE, IN_DELETE, IN_DELETE_SELF, IN_IGNORED = 0x100, 0x200, 0x400, 0x8000
+IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+
+def _libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch      # noqa: B018 - probe the symbols
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class FileWatcher:
+    """
+    Calls `callback(path, change)` ("modified" or "deleted") when a watched
+    file, or a file directly inside a watched directory, changes.
+    Directories are watched non-recursively; files are watched through their
+    directory so atomic replace-by-rename is seen too. Temp files (".tmp-*",
+    as written by atomic writers) are ignored.
+    backend: "inotify", "poll" or "auto" (inotify where the kernel/libc has it).
+    """
+
+    def __init__(self, paths: Iterable[os.PathLike], callback: Callable[[str, str], None],
+                 backend: str = "auto", poll_s: float = LOCAL_POLL_S):
+        self.paths = [Path(p).resolve() for p in paths]
+        self.callback = callback
+        self.poll_s = poll_s
+        self._libc = _libc() if backend in ("auto", "inotify") else None
+        if backend == "inotify" and self._libc is None:
+            raise OSError("inotify is not available")
+        self.backend = "inotify" if self._libc is not None else "poll"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _targets(self) -> Dict[Path, Optional[set]]:
+        """{directory: None (whole directory) or the set of file names wanted in it}"""
+        dirs: Dict[Path, Optional[set]] = {}
+        for p in self.paths:
+            if p.is_dir():
+                dirs[p] = None
+            elif p.parent.is_dir() and dirs.get(p.parent, set()) is not None:
+                dirs.setdefault(p.parent, set()).add(p.name)
+        return dirs
+
+    def _wanted(self, names: Optional[set], name: str) -> bool:
+        return not name.startswith(".tmp-") and (names is None or name in names)
+
+    def start(self) -> "FileWatcher":
+        target = self._setup_inotify() if self.backend == "inotify" else self._run_poll
+        self._thread = threading.Thread(target=target, name="file-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    # inotify: the kernel queues events, the thread sleeps in select() until there are some
+    def _setup_inotify(self) -> Callable[[], None]:
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            self.backend = "poll"
+            return self._run_poll
+        wds: Dict[int, Tuple[Path, Optional[set]]] = {}
+        for d, names in self._targets().items():
+            wd = self._libc.inotify_add_watch(fd, os.fsencode(str(d)), _WATCH_MASK)
+            if wd >= 0:
+                wds[wd] = (d, names)
+        return lambda: self._run_inotify(fd, wds)
+
+    def _run_inotify(self, fd: int, wds: Dict[int, Tuple[Path, Optional[set]]]):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                while offset < len(data):
+                    wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+                    name = data[offset + _EVENT.size: offset + _EVENT.size + length].rstrip(b"\0").decode()
+                    offset += _EVENT.size + length
+                    if wd not in wds or not name or mask & IN_IGNORED:
+                        continue
+                    d, names = wds[wd]
+                    if self._wanted(names, name):
+                        kind = "deleted" if mask & (IN_DELETE | IN_MOVED_FROM) else "modified"
+                        self.callback(str(d / name), kind)
+        finally:
+            os.close(fd)
+
+    # Polling fallback: stat every poll_s and diff (mtime, size)
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        seen = {}
+        for d, names in self._targets().items():
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+            for entry in entries:
+                if self._wanted(names, entry.name) and entry.is_file(follow_symlinks=False):
+                    st = entry.stat()
+                    seen[entry.path] = (st.st_mtime_ns, st.st_size)
+        return seen
+
+    def _run_poll(self):
+        before = self._scan()
+        while not self._stop.wait(self.poll_s):
+            now = self._scan()
+            for path, sig in now.items():
+                if before.get(path) != sig:
+                    self.callback(path, "modified")
+            for path in before.keys() - now.keys():
+                self.callback(path, "deleted")
+            before = now
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import tempfile
+
+    print(watch_command())
+    d = tempfile.mkdtemp(prefix="observer-")
+    seen = []
+    fw = FileWatcher([d], lambda p, k: seen.append((os.path.basename(p), k))).start()
+    print(f"👀 local backend: {fw.backend}")
+    Path(d, "rules.json").write_text("{}")
+    os.unlink(Path(d, "rules.json"))
+    time.sleep(0.3 if fw.backend == "inotify" else 2.5)
+    fw.stop()
+    print(f"📨 events: {seen}")
@@ -0,0 +1,267 @@
+"""
+Module: openssh_session_manager
+Phase: 6
+Milestone: 4
+Step: 2
+Purpose:
+    SSHSessionManager backend that drives the system OpenSSH client.
+      - One ControlMaster per (host, user, port), kept alive by ControlPersist
+      - exec() runs `ssh -S <socket>` over the master: no handshake, C crypto
+      - open_sftp() returns an scp-over-master shim, so SSHFileTransfer works
+      - Retries, circuit breakers, metrics, tracing and idle expiry are the
+        base manager's; only dialing, command execution and liveness differ
+"""
+
+from __future__ import annotations
+import hashlib
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from app.core.ssh_session_manager import IDLE_TTL_S, SSH_COMPRESS, STREAM_CHUNK, SSHSessionManager, _err, paramiko
+
+
+# ---------- Tunables ----------
+SERVER_ALIVE_INTERVAL_S = 15
+SERVER_ALIVE_COUNT      = 3
+EXEC_TIMEOUT_S          = 300        # hard stop for a single remote command
+
+
+class _ScpAttrs:
+    """Stand-in for paramiko's SFTPAttributes (only st_size is used)."""
+
+    __slots__ = ("st_size",)
+
+    def __init__(self, st_size: int):
+        self.st_size = st_size
+
+
+class _ScpChannel:
+    """Minimal put/get/close surface of paramiko.SFTPClient, using scp over the master."""
+
+    def __init__(self, session: "OpenSSHSession"):
+        self._s = session
+
+    def _scp(self, src: str, dst: str):
+        s = self._s
+        cmd = [s.scp_bin, "-q", "-o", f"ControlPath={s.control_path}", "-o", "ControlMaster=no",
+               "-o", "BatchMode=yes", "-P", str(s.port), src, dst]
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=EXEC_TIMEOUT_S)
+        if proc.returncode != 0:
+            raise IOError(proc.stderr.strip() or f"scp exited {proc.returncode}")
+
+    def put(self, local_path: str, remote_path: str) -> _ScpAttrs:
+        self._scp(local_path, f"{self._s.user}@{self._s.host}:{remote_path}")
+        return _ScpAttrs(os.path.getsize(local_path))
+
+    def get(self, remote_path: str, local_path: str):
+        self._scp(f"{self._s.user}@{self._s.host}:{remote_path}", local_path)
+
+    def close(self):
+        pass
+
+
+class OpenSSHSession:
+    """Handle on one ControlMaster socket; stands in for paramiko.SSHClient."""
+
+    def __init__(self, ssh_bin: str, scp_bin: str, control_path: str, host: str, user: str, port: int):
+        self.ssh_bin = ssh_bin
+        self.scp_bin = scp_bin
+        self.control_path = control_path
+        self.host = host
+        self.user = user
+        self.port = port
+
+    def _base(self) -> List[str]:
+        return [self.ssh_bin, "-S", self.control_path, "-o", "ControlMaster=no", "-o", "BatchMode=yes",
+                "-p", str(self.port), "-l", self.user, self.host]
+
+    def run(self, command: str, input: Optional[str] = None, timeout: Optional[float] = None) -> dict:
+        # No input: hand ssh an empty stdin so the remote side sees EOF at once
+        stdin = {"input": input} if input is not None else {"stdin": subprocess.DEVNULL}
+        try:
+            proc = subprocess.run(self._base() + ["--", command], capture_output=True, text=True,
+                                  timeout=EXEC_TIMEOUT_S if timeout is None else timeout, **stdin)
+        except subprocess.TimeoutExpired as e:
+            return _err("SSHChannelError", "Command timed out over ControlMaster", e)
+        return self._result(command, proc.returncode, proc.stdout.strip(), proc.stderr.strip())
+
+    def stream(self, command: str, sink, timeout: Optional[float] = None) -> dict:
+        """Like run(), but stdout is written to `sink` chunk by chunk."""
+        timeout = EXEC_TIMEOUT_S if timeout is None else timeout
+        with tempfile.TemporaryFile() as err:
+            proc = subprocess.Popen(self._base() + ["--", command], stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE, stderr=err)
+            # The deadline covers the reads too: a command that hangs with stdout
+            # open would otherwise never reach wait(); killing ssh ends the read
+            expired = threading.Event()
+            timer = threading.Timer(timeout, lambda: (expired.set(), proc.kill()))
+            timer.daemon = True
+            timer.start()
+            n = 0
+            try:
+                with proc.stdout:
+                    for chunk in iter(lambda: proc.stdout.read1(STREAM_CHUNK), b""):
+                        sink.write(chunk)
+                        n += len(chunk)
+                rc = proc.wait()
+            finally:
+                timer.cancel()
+            if expired.is_set():
+                return _err("SSHChannelError", "Command timed out over ControlMaster",
+                            subprocess.TimeoutExpired(command, timeout))
+            err.seek(0)
+            stderr = err.read().decode(errors="replace").strip()
+        result = self._result(command, rc, "", stderr)
+        if result.get("error_type") is None:
+            result["stdout_bytes"] = n
+        return result
+
+    def _result(self, command: str, rc: int, stdout: str, stderr: str) -> dict:
+        # 255 is also what ssh returns for its own failures: tell them apart by the master
+        if rc == 255 and not self.check():
+            return _err("SSHChannelError", "ControlMaster connection lost", OSError(stderr))
+        return {
+            "status": "success" if rc == 0 else "failure",
+            "exit_code": rc,
+            "stdout": stdout,
+            "stderr": stderr,
+            "message": f"Executed '{command}' (exit {rc})",
+        }
+
+    def check(self) -> bool:
+        return subprocess.run([self.ssh_bin, "-S", self.control_path, "-O", "check", self.host],
+                              capture_output=True).returncode == 0
+
+    def is_active(self) -> bool:
+        # The master removes its socket when it exits; a stale one is caught by run()
+        return os.path.exists(self.control_path)
+
+    def open_sftp(self) -> _ScpChannel:
+        return _ScpChannel(self)
+
+    def close(self):
+        if os.path.exists(self.control_path):
+            subprocess.run([self.ssh_bin, "-S", self.control_path, "-O", "exit", self.host], capture_output=True)
+
+
+class OpenSSHSessionManager(SSHSessionManager):
+    """
+    Drop-in SSHSessionManager using OpenSSH ControlMaster multiplexing.
+        mgr = OpenSSHSessionManager()
+        mgr.exec("10.10.0.20", "root", key, "iptables-save")
+    Host keys are accepted on first use (like the paramiko AutoAddPolicy) into a
+    per-manager known_hosts file unless `known_hosts` is given.
+    """
+
+    def __init__(self, idle_ttl_s: int = IDLE_TTL_S, ssh_bin: str = "ssh", scp_bin: str = "scp",
+                 control_dir: Optional[str] = None, known_hosts: Optional[str] = None,
+                 extra_opts: Optional[Dict[str, str]] = None, compress: bool = SSH_COMPRESS):
+        ssh = shutil.which(ssh_bin)
+        if ssh is None:
+            raise RuntimeError(f"OpenSSH client '{ssh_bin}' not found in PATH")
+        super().__init__(idle_ttl_s, compress)
+        self._ssh = ssh
+        self._scp = shutil.which(scp_bin) or scp_bin
+        # Unix socket paths are limited to ~104 bytes: keep the directory short
+        self._owns_dir = control_dir is None
+        self._dir = control_dir or tempfile.mkdtemp(prefix="ipt-ssh-", dir="/tmp" if os.path.isdir("/tmp") else None)
+        self._known_hosts = known_hosts or os.path.join(self._dir, "known_hosts")
+        self._extra_opts = extra_opts or {}
+
+    def _control_path(self, host: str, user: str, port: int) -> str:
+        name = hashlib.sha1(f"{user}@{host}:{port}".encode()).hexdigest()[:16]
+        return os.path.join(self._dir, name)
+
+    def _dial(self, host: str, user: str, key_path: str, port: int, timeout: int) -> OpenSSHSession:
+        ctl = self._control_path(host, user, port)
+        opts = {
+            "ControlMaster": "yes",
+            "ControlPersist": str(int(self._idle_ttl_s)),   # orphaned masters still expire
+            "BatchMode": "yes",
+            "LogLevel": "ERROR",
+            "ConnectTimeout": str(max(1, math.ceil(timeout))),
+            "StrictHostKeyChecking": "accept-new",
+            "UserKnownHostsFile": self._known_hosts,
+            "IdentitiesOnly": "yes",
+            "ServerAliveInterval": str(SERVER_ALIVE_INTERVAL_S),
+            "ServerAliveCountMax": str(SERVER_ALIVE_COUNT),
+            "Compression": "yes" if self._compress else "no",
+            **self._extra_opts,
+        }
+        cmd = [self._ssh, "-N", "-f", "-S", ctl, "-i", key_path, "-p", str(port), "-l", user]
+        for k, v in opts.items():
+            cmd += ["-o", f"{k}={v}"]
+        cmd.append(host)
+
+        # The backgrounded master inherits stdio: a pipe would never reach EOF
+        with tempfile.TemporaryFile(mode="w+") as err:
+            try:
+                proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=err,
+                                      timeout=timeout + 5)
+            except subprocess.TimeoutExpired as e:
+                raise paramiko.SSHException(f"ssh master to {host}:{port} timed out") from e
+            err.seek(0)
+            stderr = err.read().strip()
+        if proc.returncode != 0:
+            if "Permission denied" in stderr:
+                raise paramiko.AuthenticationException(stderr)
+            raise paramiko.SSHException(stderr or f"ssh exited {proc.returncode}")
+        return OpenSSHSession(self._ssh, self._scp, ctl, host, user, port)
+
+    def _exec_with_client(self, client, command: str, sink=None) -> dict:
+        if isinstance(client, OpenSSHSession):
+            return client.run(command) if sink is None else client.stream(command, sink)
+        return super()._exec_with_client(client, command, sink)
+
+    def compression(self, host: str, user: str, port: int = 22) -> Optional[Dict[str, str]]:
+        # OpenSSH does not report the negotiated algorithm; report what was requested
+        with self._lock:
+            ms = self._cache.get((host, user, port))
+        if ms is None or not self._is_alive(ms.client):
+            return None
+        algo = "zlib@openssh.com" if self._compress else "none"
+        return {"in": algo, "out": algo}
+
+    def host_key_fingerprint(self, host: str, user: str, port: int = 22) -> Optional[str]:
+        # The master accepted the key into our known_hosts; ask ssh-keygen for its fingerprint
+        with self._lock:
+            ms = self._cache.get((host, user, port))
+        if ms is None or not isinstance(ms.client, OpenSSHSession):
+            return super().host_key_fingerprint(host, user, port)
+        name = host if port == 22 else f"[{host}]:{port}"
+        try:
+            out = subprocess.run(["ssh-keygen", "-l", "-F", name, "-f", self._known_hosts],
+                                 capture_output=True, text=True, timeout=5).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        return next((tok for tok in out.split() if tok.startswith("SHA256:")), None)
+
+    def _is_alive(self, client) -> bool:
+        if isinstance(client, OpenSSHSession):
+            return client.is_active()
+        return super()._is_alive(client)
+
+    def stop(self):
+        super().stop()
+        if self._owns_dir:
+            shutil.rmtree(self._dir, ignore_errors=True)
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    HOST = "10.10.0.20"
+    USER = "root"
+    KEY = "/home/glitch/.ssh/id_rsa"
+
+    mgr = OpenSSHSessionManager()
+    try:
+        for _ in range(3):
+            r = mgr.exec(HOST, USER, KEY, "hostname")
+            print(HOST, "→", r["status"], r.get("stdout") or r.get("message"), f"({r.get('latency_ms')} ms)")
+    finally:
+        mgr.stop()
@@ -0,0 +1,454 @@
+"""
+Module: packet_simulator
+Phase: 6
+Milestone: 1
+Step: 2
+Purpose:
+    Offline packet classification against a parsed ruleset (no root, no containers).
+      - Compiles each chain into vectorized blocks of simple first-match rules
+        plus individual steps for jumps, RETURN, goto and non-terminating targets
+      - Classifies NumPy batches of 5-tuples (optionally with interfaces)
+      - Reports the verdict and the matching rule id per packet
+    Stateful matches (state/conntrack) are resolved as for a NEW packet. Rules using
+    options the simulator cannot evaluate never match and are listed in `unsupported`.
+"""
+
+from __future__ import annotations
+import ipaddress
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.parser import Rule, Ruleset, Table, parse_iptables_save
+
+
+# ---------- Tunables ----------
+MAX_CHAIN_DEPTH   = 64              # guard against jump loops
+BLOCK_CELLS       = 4_000_000       # packets x rules evaluated per matrix chunk
+
+PROTOCOLS = {"tcp": 6, "udp": 17, "icmp": 1, "icmpv6": 58, "sctp": 132, "gre": 47, "esp": 50, "ah": 51}
+
+VERDICTS = ["ACCEPT", "DROP", "REJECT", "DNAT", "SNAT", "MASQUERADE", "REDIRECT", "QUEUE", "NFQUEUE"]
+_VERDICT_CODE = {v: i for i, v in enumerate(VERDICTS)}
+
+# Options the simulator understands; any other match option makes a rule unsupported
+_KNOWN_OPTS = {
+    "-p", "--protocol", "-s", "--source", "-d", "--destination", "-i", "--in-interface",
+    "-o", "--out-interface", "--sport", "--source-port", "--dport", "--destination-port",
+    "--sports", "--dports", "-m", "--match", "--comment", "--state", "--ctstate",
+}
+_STATE_OPTS = ("--state", "--ctstate")
+_KIND_TERMINAL, _KIND_CONTINUE, _KIND_JUMP, _KIND_GOTO, _KIND_RETURN = range(5)
+
+
+def ip_to_int(ip: str) -> int:
+    return int(ipaddress.IPv4Address(ip))
+
+
+def _proto_num(p: str) -> int:
+    p = p.lower()
+    if p in PROTOCOLS:
+        return PROTOCOLS[p]
+    return int(p)
+
+
+def _net(value: str) -> Tuple[int, int]:
+    n = ipaddress.IPv4Network(value, strict=False)
+    return int(n.network_address), int(n.netmask)
+
+
+def _port_ranges(value: str) -> List[Tuple[int, int]]:
+    ranges = []
+    for part in value.split(","):
+        if ":" in part:
+            lo, hi = part.split(":", 1)
+            ranges.append((int(lo or 0), int(hi or 65535)))
+        else:
+            ranges.append((int(part), int(part)))
+    return ranges
+
+
+# ---------- Packet batches ----------
+def make_packets(
+    src: Sequence,
+    dst: Sequence,
+    proto: Sequence,
+    sport: Optional[Sequence] = None,
+    dport: Optional[Sequence] = None,
+    in_iface: Optional[Sequence[str]] = None,
+    out_iface: Optional[Sequence[str]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Build a packet batch. Addresses may be dotted strings or integers,
+    protocols names or numbers. Interfaces are optional string columns.
+    """
+    def addr(col):
+        return np.fromiter((ip_to_int(a) if isinstance(a, str) else int(a) for a in col), dtype=np.uint32)
+
+    n = len(src)
+    batch = {
+        "src": addr(src),
+        "dst": addr(dst),
+        "proto": np.fromiter((_proto_num(p) if isinstance(p, str) else int(p) for p in proto), dtype=np.int16),
+        "sport": np.asarray(sport if sport is not None else np.zeros(n), dtype=np.int32),
+        "dport": np.asarray(dport if dport is not None else np.zeros(n), dtype=np.int32),
+    }
+    for key, col in (("in_iface", in_iface), ("out_iface", out_iface)):
+        if col is not None:
+            names, ids = np.unique(np.asarray(col, dtype=object).astype(str), return_inverse=True)
+            batch[key] = ids.astype(np.int32)
+            batch[key + "_names"] = list(names)
+    return batch
+
+
+def random_packets(n: int, seed: int = 0, subnet: str = "10.0.0.0/8") -> Dict[str, np.ndarray]:
+    """Synthetic batch: random addresses in `subnet`, mostly TCP/UDP to low ports."""
+    rng = np.random.default_rng(seed)
+    base, mask = _net(subnet)
+    host_bits = (~mask) & 0xFFFFFFFF
+    src = (base | (rng.integers(0, host_bits + 1, n, dtype=np.uint64) & host_bits)).astype(np.uint32)
+    dst = (base | (rng.integers(0, host_bits + 1, n, dtype=np.uint64) & host_bits)).astype(np.uint32)
+    proto = rng.choice(np.array([6, 17, 1], dtype=np.int16), n, p=[0.7, 0.25, 0.05])
+    sport = rng.integers(1024, 65536, n, dtype=np.int32)
+    dport = np.where(rng.random(n) < 0.8, rng.integers(1, 1024, n), rng.integers(1024, 65536, n)).astype(np.int32)
+    is_icmp = proto == 1
+    sport[is_icmp] = 0
+    dport[is_icmp] = 0
+    return {"src": src, "dst": dst, "proto": proto, "sport": sport, "dport": dport}
+
+
+# ---------- Compilation ----------
+class _CRule:
+    """A rule lowered to numeric match fields."""
+
+    __slots__ = ("id", "rule", "kind", "code", "jump", "src", "dst", "proto", "sports", "dports",
+                 "in_iface", "out_iface", "never", "simple", "unsupported")
+
+    def __init__(self, rid: int, rule: Rule, table: Table):
+        self.id = rid
+        self.rule = rule
+        self.never = False
+        self.src = self.dst = None              # (net, mask, negated)
+        self.proto = None                       # (num, negated)
+        self.sports = self.dports = None        # ([(lo, hi), ...], negated)
+        self.in_iface = self.out_iface = None   # (name, negated)
+        self.code = -1
+        self.jump: Optional[str] = None
+
+        neg = rule.negated
+        if rule.source:
+            self.src = (*_net(rule.source), "source" in neg)
+        if rule.destination:
+            self.dst = (*_net(rule.destination), "destination" in neg)
+        if rule.protocol and rule.protocol.lower() != "all":
+            self.proto = (_proto_num(rule.protocol), "protocol" in neg)
+        if rule.sport:
+            self.sports = (_port_ranges(rule.sport), "sport" in neg)
+        if rule.dport:
+            self.dports = (_port_ranges(rule.dport), "dport" in neg)
+        if rule.in_iface:
+            self.in_iface = (rule.in_iface, "in_iface" in neg)
+        if rule.out_iface:
+            self.out_iface = (rule.out_iface, "out_iface" in neg)
+
+        self.unsupported = _unknown_options(rule.args)
+        if self.unsupported or not _state_allows_new(rule.args):
+            self.never = True
+
+        target = rule.target
+        if target is None:
+            self.kind = _KIND_CONTINUE
+        elif target == "RETURN":
+            self.kind = _KIND_RETURN
+        elif target in _VERDICT_CODE:
+            self.kind = _KIND_TERMINAL
+            self.code = _VERDICT_CODE[target]
+        elif target in table.chains:
+            self.kind = _KIND_GOTO if ("-g" in rule.args or "--goto" in rule.args) else _KIND_JUMP
+            self.jump = target
+        else:
+            # LOG, MARK, CONNMARK, TOS, ... do not end traversal
+            self.kind = _KIND_CONTINUE
+
+        self.simple = (
+            self.kind == _KIND_TERMINAL
+            and self.in_iface is None and self.out_iface is None
+            and (self.sports is None or len(self.sports[0]) == 1)
+            and (self.dports is None or len(self.dports[0]) == 1)
+        )
+
+    def match(self, pk: Dict[str, np.ndarray], idx: np.ndarray) -> np.ndarray:
+        m = np.ones(idx.size, dtype=bool)
+        if self.src:
+            net, mask, neg = self.src
+            m &= ((pk["src"][idx] & np.uint32(mask)) == np.uint32(net)) ^ neg
+        if self.dst:
+            net, mask, neg = self.dst
+            m &= ((pk["dst"][idx] & np.uint32(mask)) == np.uint32(net)) ^ neg
+        if self.proto:
+            num, neg = self.proto
+            m &= (pk["proto"][idx] == num) ^ neg
+        for field, spec in (("sport", self.sports), ("dport", self.dports)):
+            if spec:
+                ranges, neg = spec
+                col = pk[field][idx]
+                hit = np.zeros(idx.size, dtype=bool)
+                for lo, hi in ranges:
+                    hit |= (col >= lo) & (col <= hi)
+                m &= hit ^ neg
+        for field, spec in (("in_iface", self.in_iface), ("out_iface", self.out_iface)):
+            if spec:
+                name, neg = spec
+                if field not in pk:
+                    m &= neg
+                    continue
+                names = pk[field + "_names"]
+                if name.endswith("+"):
+                    vocab = np.array([n.startswith(name[:-1]) for n in names] or [False])
+                else:
+                    vocab = np.array([n == name for n in names] or [False])
+                m &= vocab[pk[field][idx]] ^ neg
+        return m
+
+
+def _unknown_options(args: List[str]) -> List[str]:
+    unknown = []
+    for tok in args:
+        if tok in ("-j", "--jump", "-g", "--goto"):
+            break
+        if tok.startswith("-") and tok not in _KNOWN_OPTS:
+            unknown.append(tok)
+    return unknown
+
+
+def _state_allows_new(args: List[str]) -> bool:
+    for i, tok in enumerate(args):
+        if tok in _STATE_OPTS and i + 1 < len(args):
+            negated = i > 0 and args[i - 1] == "!"
+            has_new = "NEW" in args[i + 1].split(",")
+            return has_new != negated
+    return True
+
+
+class _Block:
+    """A run of simple terminal rules evaluated together as a packets x rules matrix."""
+
+    def __init__(self, rules: List[_CRule]):
+        self.rules = rules
+        r = len(rules)
+        self.ids = np.array([c.id for c in rules], dtype=np.int32)
+        self.codes = np.array([c.code for c in rules], dtype=np.int8)
+        self.snet, self.smask, self.sneg = self._net_cols(c.src for c in rules)
+        self.dnet, self.dmask, self.dneg = self._net_cols(c.dst for c in rules)
+        self.proto = np.array([c.proto[0] if c.proto else -1 for c in rules], dtype=np.int16)
+        self.pneg = np.array([bool(c.proto and c.proto[1]) for c in rules])
+        self.splo, self.sphi, self.spneg = self._port_cols(c.sports for c in rules)
+        self.dplo, self.dphi, self.dpneg = self._port_cols(c.dports for c in rules)
+        self.chunk = max(1, BLOCK_CELLS // max(r, 1))
+
+    @staticmethod
+    def _net_cols(specs: Iterable):
+        specs = list(specs)
+        net = np.array([s[0] if s else 0 for s in specs], dtype=np.uint32)
+        mask = np.array([s[1] if s else 0 for s in specs], dtype=np.uint32)
+        neg = np.array([bool(s and s[2]) for s in specs])
+        return net, mask, neg
+
+    @staticmethod
+    def _port_cols(specs: Iterable):
+        specs = list(specs)
+        lo = np.array([s[0][0][0] if s else 0 for s in specs], dtype=np.int32)
+        hi = np.array([s[0][0][1] if s else 65535 for s in specs], dtype=np.int32)
+        neg = np.array([bool(s and s[1]) for s in specs])
+        return lo, hi, neg
+
+    def first_match(self, pk: Dict[str, np.ndarray], idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (matched mask over idx, column of the first matching rule)."""
+        hit = np.zeros(idx.size, dtype=bool)
+        col = np.zeros(idx.size, dtype=np.int64)
+        for start in range(0, idx.size, self.chunk):
+            sl = idx[start:start + self.chunk]
+            src = pk["src"][sl][:, None]
+            dst = pk["dst"][sl][:, None]
+            proto = pk["proto"][sl][:, None]
+            sport = pk["sport"][sl][:, None]
+            dport = pk["dport"][sl][:, None]
+            m = ((src & self.smask) == self.snet) ^ self.sneg
+            m &= ((dst & self.dmask) == self.dnet) ^ self.dneg
+            m &= (self.proto < 0) | ((proto == self.proto) ^ self.pneg)
+            m &= ((sport >= self.splo) & (sport <= self.sphi)) ^ self.spneg
+            m &= ((dport >= self.dplo) & (dport <= self.dphi)) ^ self.dpneg
+            hit[start:start + sl.size] = m.any(axis=1)
+            col[start:start + sl.size] = m.argmax(axis=1)
+        return hit, col
+
+
+class SimulationResult:
+    """Per-packet verdict codes and matching rule ids (-1 means the chain policy decided)."""
+
+    def __init__(self, sim: "PacketSimulator", verdict: np.ndarray, rule: np.ndarray):
+        self.sim = sim
+        self.verdict = verdict
+        self.rule = rule
+
+    def verdict_names(self) -> List[str]:
+        return [VERDICTS[v] for v in self.verdict]
+
+    def summary(self) -> Dict[str, int]:
+        codes, counts = np.unique(self.verdict, return_counts=True)
+        return {VERDICTS[c]: int(n) for c, n in zip(codes, counts)}
+
+    def explain(self, i: int) -> Dict[str, object]:
+        rid = int(self.rule[i])
+        return {
+            "verdict": VERDICTS[int(self.verdict[i])],
+            "rule_id": rid,
+            "rule": self.sim.describe(rid),
+        }
+
+
+class PacketSimulator:
+    """
+    Compiled, read-only view of one table, ready to classify packet batches.
+        sim = PacketSimulator(parse_iptables_save(text))
+        res = sim.classify(make_packets(["10.0.0.5"], ["10.0.0.1"], ["tcp"], [40000], [22]))
+    """
+
+    def __init__(self, ruleset: Ruleset, table: str = "filter", strict: bool = False):
+        if table not in ruleset.tables:
+            raise ValueError(f"table {table!r} not present in ruleset")
+        self.table = ruleset.tables[table]
+        self.rules: List[_CRule] = []
+        self.unsupported: Dict[int, List[str]] = {}   # rule id → options never evaluated
+        self._program: Dict[str, List[object]] = {}
+
+        for chain in self.table.chains.values():
+            steps: List[object] = []
+            run: List[_CRule] = []
+            for rule in chain.rules:
+                cr = _CRule(len(self.rules), rule, self.table)
+                self.rules.append(cr)
+                if cr.unsupported:
+                    if strict:
+                        raise ValueError(f"unsupported option(s) {cr.unsupported} in {rule}")
+                    self.unsupported[cr.id] = cr.unsupported
+                if cr.never:
+                    continue
+                if cr.simple:
+                    run.append(cr)
+                    continue
+                if run:
+                    steps.append(_Block(run))
+                    run = []
+                steps.append(cr)
+            if run:
+                steps.append(_Block(run))
+            self._program[chain.name] = steps
+
+    @classmethod
+    def from_text(cls, text: str, table: str = "filter") -> "PacketSimulator":
+        return cls(parse_iptables_save(text), table)
+
+    def describe(self, rule_id: int) -> str:
+        if rule_id < 0:
+            return "policy"
+        r = self.rules[rule_id].rule
+        return f"{r.chain}: {r.spec()}"
+
+    def classify(self, packets: Dict[str, np.ndarray], chain: str = "INPUT") -> SimulationResult:
+        """Run a packet batch through a built-in chain and return per-packet verdicts."""
+        c = self.table.chains.get(chain)
+        if c is None or not c.builtin:
+            raise ValueError(f"{chain!r} is not a built-in chain of table {self.table.name!r}")
+        n = packets["src"].shape[0]
+        verdict = np.full(n, -1, dtype=np.int8)
+        rule = np.full(n, -1, dtype=np.int32)
+
+        fell_through = self._run(chain, packets, np.arange(n), verdict, rule, 0)
+        verdict[fell_through] = _VERDICT_CODE.get(c.policy, _VERDICT_CODE["ACCEPT"])
+        return SimulationResult(self, verdict, rule)
+
+    def _run(self, chain: str, pk, idx: np.ndarray, verdict, rule, depth: int) -> np.ndarray:
+        """Traverse `chain` with packets `idx`; return the indices that leave it undecided."""
+        if depth > MAX_CHAIN_DEPTH:
+            raise RecursionError(f"chain depth exceeded at {chain!r}")
+        returned: List[np.ndarray] = []
+        active = idx
+        for step in self._program[chain]:
+            if active.size == 0:
+                break
+            if isinstance(step, _Block):
+                hit, col = step.first_match(pk, active)
+                if hit.any():
+                    decided = active[hit]
+                    verdict[decided] = step.codes[col[hit]]
+                    rule[decided] = step.ids[col[hit]]
+                    active = active[~hit]
+                continue
+
+            m = step.match(pk, active)
+            if not m.any():
+                continue
+            matched = active[m]
+            kind = step.kind
+            if kind == _KIND_TERMINAL:
+                verdict[matched] = step.code
+                rule[matched] = step.id
+                active = active[~m]
+            elif kind == _KIND_RETURN:
+                returned.append(matched)
+                active = active[~m]
+            elif kind == _KIND_JUMP:
+                back = self._run(step.jump, pk, matched, verdict, rule, depth + 1)
+                active = np.sort(np.concatenate([active[~m], back]))
+            elif kind == _KIND_GOTO:
+                returned.append(self._run(step.jump, pk, matched, verdict, rule, depth + 1))
+                active = active[~m]
+            # _KIND_CONTINUE: packets keep traversing unchanged
+
+        returned.append(active)
+        return np.concatenate(returned) if len(returned) > 1 else active
+
+
+def simulate(ruleset_text: str, flows: Iterable[Tuple], chain: str = "INPUT", table: str = "filter") -> List[Dict[str, object]]:
+    """
+    Convenience wrapper: classify (src, dst, proto, sport, dport) tuples and
+    return one explanation dict per flow.
+    """
+    flows = list(flows)
+    sim = PacketSimulator.from_text(ruleset_text, table)
+    cols = list(zip(*flows)) if flows else [[], [], [], [], []]
+    res = sim.classify(make_packets(*cols), chain)
+    return [res.explain(i) for i in range(len(flows))]
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import time
+
+    RULES = (
+        "*filter\n"
+        ":INPUT DROP [0:0]\n"
+        ":FORWARD DROP [0:0]\n"
+        ":OUTPUT ACCEPT [0:0]\n"
+        ":SSH - [0:0]\n"
+        "-A INPUT -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT\n"
+        "-A INPUT -p tcp -m tcp --dport 22 -j SSH\n"
+        "-A INPUT -p tcp -m multiport --dports 80,443 -j ACCEPT\n"
+        "-A INPUT -p icmp -j ACCEPT\n"
+        "-A SSH -s 10.10.0.0/24 -j ACCEPT\n"
+        "-A SSH -j REJECT --reject-with icmp-port-unreachable\n"
+        "COMMIT\n"
+    )
+    for r in simulate(RULES, [("10.10.0.30", "10.10.0.20", "tcp", 40000, 22),
+                              ("192.168.1.5", "10.10.0.20", "tcp", 40000, 22),
+                              ("192.168.1.5", "10.10.0.20", "udp", 5353, 53)]):
+        print(r)
+
+    sim = PacketSimulator.from_text(RULES)
+    batch = random_packets(1_000_000)
+    t0 = time.perf_counter()
+    res = sim.classify(batch)
+    dt = time.perf_counter() - t0
+    print(f"Classified {batch['src'].size:,} packets in {dt:.3f}s "
+          f"({batch['src'].size / dt / 1e6:.1f} M pkt/s): {res.summary()}")
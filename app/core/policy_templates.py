@@ -0,0 +1,387 @@
+"""
+Module: policy_templates
+Phase: 6
+Milestone: 5
+Step: 2
+Purpose:
+    Host-group policy templates compiled to per-host iptables-restore payloads.
+      - A template is iptables-save text with `${var}` placeholders; a list
+        value expands a rule line once per item
+      - Host groups bind a template to group variables plus per-host overrides
+        (`${host}` is always the host itself)
+      - Compiled chains are cached by the values of the variables they use,
+        so hosts with equal values share one rendering, and changing a
+        variable recompiles only the hosts whose chains depend on it
+"""
+
+from __future__ import annotations
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from string import Template
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from app.utils.parser import ParseError, parse_iptables_save
+
+
+# ---------- Tunables ----------
+POLICY_PATH       = Path(__file__).resolve().parents[2] / "db" / "policies.json"
+CHAIN_CACHE_SIZE  = 50_000       # compiled chains kept (LRU)
+
+VarValue = Union[str, int, List[Union[str, int]]]
+
+# A newline in a value would start a new rule line in the payload
+_CONTROL = re.compile(r"[\x00-\x1f\x7f]")
+
+
+class PolicyError(ValueError):
+    """Raised when a template cannot be parsed or a host cannot be compiled."""
+
+
+class _ChainTemplate:
+    """One chain of a template: declaration line + rule lines, with the variables they use."""
+
+    __slots__ = ("table", "name", "header", "lines", "variables")
+
+    def __init__(self, table: str, name: str, header: str):
+        self.table = table
+        self.name = name
+        self.header = header
+        self.lines: List[Tuple[Template, Tuple[str, ...]]] = []
+        self.variables: Tuple[str, ...] = ()
+
+    def add(self, line: str):
+        t = Template(line)
+        if not t.is_valid():
+            raise PolicyError(f"invalid placeholder in {line!r}")
+        self.lines.append((t, tuple(t.get_identifiers())))
+
+    def finish(self):
+        ids = set(Template(self.header).get_identifiers())
+        for _, line_ids in self.lines:
+            ids.update(line_ids)
+        self.variables = tuple(sorted(ids))
+
+    def render(self, values: Dict[str, VarValue]) -> str:
+        out = [Template(self.header).substitute(values)]
+        for t, ids in self.lines:
+            lists = [i for i in ids if isinstance(values[i], list)]
+            if not lists:
+                out.append(t.substitute(values))
+                continue
+            # One line per combination of list values
+            for combo in itertools.product(*(values[i] for i in lists)):
+                out.append(t.substitute(values, **dict(zip(lists, combo))))
+        return "\n".join(out)
+
+
+class PolicyTemplate:
+    """Parsed template: tables → ordered chain templates."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.tables: Dict[str, List[_ChainTemplate]] = {}
+        self._parse(text)
+
+    def _parse(self, text: str):
+        chains: Optional[Dict[str, _ChainTemplate]] = None
+        table = None
+        for lineno, raw in enumerate(text.splitlines(), 1):
+            line = raw.strip()
+            if not line or line[0] == "#":
+                continue
+            if line[0] == "*":
+                table = line[1:]
+                chains = OrderedDict()
+            elif line == "COMMIT":
+                if chains is None:
+                    raise PolicyError(f"{self.name}:{lineno}: COMMIT outside of a table")
+                self.tables[table] = list(chains.values())
+                chains = None
+            elif chains is None:
+                raise PolicyError(f"{self.name}:{lineno}: content outside of a *table block")
+            elif line[0] == ":":
+                name = line[1:].split()[0]
+                chains[name] = _ChainTemplate(table, name, line)
+            else:
+                parts = line.split(None, 2)
+                if len(parts) < 2 or parts[0] not in ("-A", "--append") or parts[1] not in chains:
+                    raise PolicyError(f"{self.name}:{lineno}: expected '-A <declared chain> ...': {line!r}")
+                chains[parts[1]].add(line)
+        if chains is not None:
+            raise PolicyError(f"{self.name}: table {table!r} is missing COMMIT")
+        for table_chains in self.tables.values():
+            for c in table_chains:
+                c.finish()
+
+    @property
+    def variables(self) -> set:
+        return {v for chains in self.tables.values() for c in chains for v in c.variables}
+
+
+class HostGroup:
+    """A template bound to group variables and per-host overrides."""
+
+    __slots__ = ("name", "template", "vars", "hosts")
+
+    def __init__(self, name: str, template: str, vars: Optional[Dict[str, VarValue]] = None,
+                 hosts: Optional[Dict[str, Dict[str, VarValue]]] = None):
+        self.name = name
+        self.template = template
+        self.vars = dict(vars or {})
+        self.hosts = {h: dict(v or {}) for h, v in (hosts or {}).items()}
+
+    def values(self, host: str) -> Dict[str, VarValue]:
+        return {**self.vars, **self.hosts[host], "host": host}
+
+
+def _freeze(v: VarValue):
+    return tuple(v) if isinstance(v, list) else v
+
+
+def _check_value(name: str, value: VarValue):
+    for item in (value if isinstance(value, list) else [value]):
+        if _CONTROL.search(str(item)):
+            raise PolicyError(f"variable {name!r}: control characters are not allowed in {item!r}")
+
+
+class PolicyCompiler:
+    """
+    Templates + host groups → per-host iptables-restore payloads.
+        pc = PolicyCompiler()
+        pc.add_template("edge", text)
+        pc.add_group(HostGroup("dmz", "edge", {"lan_if": "eth1"}, {"10.10.0.20": {}}))
+        pc.compile_all()                    → {host: payload}
+        pc.set_var("dmz", "lan_if", "eth2") → hosts whose payload changes
+    """
+
+    def __init__(self):
+        self.templates: Dict[str, PolicyTemplate] = {}
+        self.groups: Dict[str, HostGroup] = {}
+        self._host_group: Dict[str, str] = {}
+        self._chains: "OrderedDict[tuple, str]" = OrderedDict()    # chain key → rendered text
+        self._payloads: Dict[str, Tuple[tuple, str]] = {}          # host → (chain keys, payload)
+        self._lock = threading.RLock()
+        self.stats = {"chain_hits": 0, "chain_misses": 0, "host_hits": 0, "host_compiles": 0}
+
+    # ---------- Definition ----------
+    def add_template(self, name: str, text: str) -> PolicyTemplate:
+        t = PolicyTemplate(name, text)
+        with self._lock:
+            self.templates[name] = t
+            # Cached chains of a replaced template are keyed by its identity; drop them
+            self._chains = OrderedDict((k, v) for k, v in self._chains.items() if k[0] != name)
+            for host, group in self._host_group.items():
+                if self.groups[group].template == name:
+                    self._payloads.pop(host, None)
+        return t
+
+    def add_group(self, group: HostGroup):
+        with self._lock:
+            if group.template not in self.templates:
+                raise PolicyError(f"group {group.name!r}: unknown template {group.template!r}")
+            for host in group.hosts:
+                owner = self._host_group.get(host)
+                if owner is not None and owner != group.name:
+                    raise PolicyError(f"host {host} is already in group {owner!r}")
+            old = self.groups.get(group.name)
+            for host in (old.hosts if old else ()):
+                self._host_group.pop(host, None)
+                self._payloads.pop(host, None)
+            self.groups[group.name] = group
+            for host in group.hosts:
+                self._host_group[host] = group.name
+
+    def hosts(self) -> List[str]:
+        return list(self._host_group)
+
+    def set_var(self, group: str, name: str, value: Optional[VarValue], host: Optional[str] = None) -> List[str]:
+        """
+        Set (or with value=None remove) a group variable, or a host override when
+        `host` is given. Returns the hosts whose compiled payload is now stale.
+        """
+        with self._lock:
+            g = self.groups[group]
+            if value is not None:
+                _check_value(name, value)
+            targets = [host] if host is not None else list(g.hosts)
+            before = {h: self._chain_keys(h, g) for h in targets}
+            scope = g.hosts[host] if host is not None else g.vars
+            if value is None:
+                scope.pop(name, None)
+            else:
+                scope[name] = value
+            stale = []
+            for h in targets:
+                try:
+                    changed = self._chain_keys(h, g) != before[h]
+                except PolicyError:
+                    changed = True
+                if changed:
+                    self._payloads.pop(h, None)
+                    stale.append(h)
+            return stale
+
+    # ---------- Compilation ----------
+    def _chain_keys(self, host: str, group: Optional[HostGroup] = None) -> tuple:
+        group = group or self.groups[self._host_group[host]]
+        tpl = self.templates[group.template]
+        values = group.values(host)
+        keys = []
+        for table, chains in tpl.tables.items():
+            for c in chains:
+                try:
+                    frozen = tuple(_freeze(values[v]) for v in c.variables)
+                except KeyError as e:
+                    raise PolicyError(f"{host}: variable {e.args[0]!r} of {table}/{c.name} is not set") from None
+                for v in c.variables:
+                    _check_value(v, values[v])
+                keys.append((tpl.name, table, c.name, frozen))
+        return tuple(keys)
+
+    def _chain(self, key: tuple, chain: _ChainTemplate) -> str:
+        text = self._chains.get(key)
+        if text is not None:
+            self.stats["chain_hits"] += 1
+            self._chains.move_to_end(key)
+            return text
+        self.stats["chain_misses"] += 1
+        values = {v: (list(x) if isinstance(x, tuple) else x) for v, x in zip(chain.variables, key[3])}
+        text = chain.render(values)
+        # Check each distinct rendering once, not every host's payload
+        try:
+            parse_iptables_save(f"*{chain.table}\n{text}\nCOMMIT\n")
+        except ParseError as e:
+            raise PolicyError(f"{key[0]} {chain.table}/{chain.name} with {values}: {e}") from None
+        self._chains[key] = text
+        if len(self._chains) > CHAIN_CACHE_SIZE:
+            self._chains.popitem(last=False)
+        return text
+
+    def compile_host(self, host: str) -> str:
+        """iptables-restore payload for one host."""
+        with self._lock:
+            if host not in self._host_group:
+                raise PolicyError(f"host {host} is not in any group")
+            group = self.groups[self._host_group[host]]
+            keys = self._chain_keys(host, group)
+            cached = self._payloads.get(host)
+            if cached is not None and cached[0] == keys:
+                self.stats["host_hits"] += 1
+                return cached[1]
+
+            tpl = self.templates[group.template]
+            out, i = [], 0
+            for table, chains in tpl.tables.items():
+                texts = [self._chain(keys[i + j], c) for j, c in enumerate(chains)]
+                i += len(chains)
+                bodies = [t.split("\n", 1) for t in texts]
+                out.append(f"*{table}")
+                out.extend(b[0] for b in bodies)                  # declarations before rules
+                out.extend(b[1] for b in bodies if len(b) > 1)
+                out.append("COMMIT")
+            payload = "\n".join(out) + "\n"
+            self._payloads[host] = (keys, payload)
+            self.stats["host_compiles"] += 1
+            return payload
+
+    def compile_all(self, hosts: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        return {h: self.compile_host(h) for h in (self.hosts() if hosts is None else hosts)}
+
+    def stale_hosts(self) -> List[str]:
+        """Hosts without an up-to-date compiled payload."""
+        with self._lock:
+            return [h for h in self._host_group if h not in self._payloads]
+
+
+# ---------- Persistence ----------
+def load_policies(path: Union[str, Path] = POLICY_PATH) -> PolicyCompiler:
+    """
+    Build a compiler from a JSON document:
+        {"templates": {name: text | [lines]},
+         "groups": {name: {"template": .., "vars": {..}, "hosts": {host: {vars}}}}}
+    """
+    with open(path) as f:
+        doc = json.load(f)
+    pc = PolicyCompiler()
+    for name, text in doc.get("templates", {}).items():
+        pc.add_template(name, "\n".join(text) if isinstance(text, list) else text)
+    for name, g in doc.get("groups", {}).items():
+        hosts = g.get("hosts", {})
+        if isinstance(hosts, list):
+            hosts = {h: {} for h in hosts}
+        pc.add_group(HostGroup(name, g["template"], g.get("vars"), hosts))
+    return pc
+
+
+def push_host_policy(
+    compiler: PolicyCompiler,
+    host: str,
+    user: str,
+    key_path: str,
+    remote_rules_path: str = "/tmp/iptables.rules",
+    mgr=None,
+) -> Dict[str, str]:
+    """Compile `host`'s payload and upload it with push_iptables_ruleset()."""
+    from app.core.iptables_push import push_iptables_ruleset
+
+    try:
+        payload = compiler.compile_host(host)
+    except PolicyError as e:
+        return {"status": "failure", "message": f"Policy compilation failed: {e}"}
+    fd, local = tempfile.mkstemp(prefix="policy-", suffix=".rules")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(payload)
+        return push_iptables_ruleset(host, user, key_path, local, remote_rules_path, mgr=mgr)
+    finally:
+        os.unlink(local)
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import time
+
+    EDGE = """
+*filter
+:INPUT DROP [0:0]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [0:0]
+:MGMT - [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT
+-A INPUT -i ${lan_if} -s ${lan_net} -j ACCEPT
+-A INPUT -p tcp --dport 22 -j MGMT
+-A MGMT -s ${admin_net} -j ACCEPT
+-A MGMT -j DROP
+-A FORWARD -i ${lan_if} -o ${wan_if} -j ACCEPT
+COMMIT
+*nat
+:PREROUTING ACCEPT [0:0]
+:POSTROUTING ACCEPT [0:0]
+-A PREROUTING -d ${host}/32 -p tcp --dport 443 -j DNAT --to-destination ${web_backend}
+-A POSTROUTING -o ${wan_if} -j MASQUERADE
+COMMIT
+"""
+    pc = PolicyCompiler()
+    pc.add_template("edge", EDGE)
+    for site in range(10):
+        hosts = {f"10.{site}.0.{i}": {"web_backend": f"192.168.{site}.{i % 4 + 10}:443"} for i in range(100)}
+        pc.add_group(HostGroup(f"site{site}", "edge", {
+            "lan_if": "eth1", "wan_if": "eth0", "lan_net": f"192.168.{site}.0/24",
+            "admin_net": ["10.255.0.0/24", "10.255.1.0/24"]}, hosts))
+
+    t0 = time.perf_counter()
+    payloads = pc.compile_all()
+    print(f"⚙️  {len(payloads)} hosts compiled in {(time.perf_counter() - t0) * 1000:.0f} ms {pc.stats}")
+    stale = pc.set_var("site3", "lan_net", "192.168.33.0/24")
+    t0 = time.perf_counter()
+    pc.compile_all()
+    print(f"🔁 lan_net change: {len(stale)} hosts recompiled in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    print(payloads["10.0.0.1"])
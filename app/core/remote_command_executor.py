@@ -8,13 +8,18 @@ Purpose:
     Ensures only safe and approved commands can run on target systems.
 """
 
-import paramiko
 import socket
 import json
 import os
+import re
+import shlex
 from datetime import datetime
 from typing import Dict
 
+from app.utils.lazy_import import lazy_import
+
+paramiko = lazy_import("paramiko")
+
 LOG_FILE = os.path.join(os.path.dirname(__file__), "../../logs/ssh_command_log.json")
 
 # ✅ Allowed command whitelist (expandable later)
@@ -28,6 +33,13 @@ ALLOWED_COMMANDS = [
     "hostname",
     "uptime"
 ]
+# Options that only change how the listing above is printed
+READ_ONLY_OPTIONS = {
+    "iptables": {"-n", "-v", "-x", "--line-numbers"},
+    "iptables-save": {"-c"},
+}
+# Anything the remote shell would interpret: separators, redirects, substitution, globs, quoting
+_SHELL_META = re.compile(r"[;&|<>`$(){}\[\]*?!~#'\"\\\x00-\x1f\x7f]")
 
 def _write_log(entry: Dict[str, str]) -> None:
     """
@@ -58,10 +70,19 @@ def _write_log(entry: Dict[str, str]) -> None:
 
 def validate_command(command: str) -> bool:
     """
-    Check if a command is allowed for remote execution.
+    Check if a command is allowed for remote execution: its words must be one
+    of ALLOWED_COMMANDS, optionally followed by READ_ONLY_OPTIONS for that
+    program. Shell metacharacters are never allowed, so the remote shell
+    runs exactly that one program.
     """
+    if _SHELL_META.search(command):
+        return False
+    argv = command.split()
+    if not argv:
+        return False
     for allowed in ALLOWED_COMMANDS:
-        if command.strip().startswith(allowed):
+        words = shlex.split(allowed)
+        if argv[:len(words)] == words and set(argv[len(words):]) <= READ_ONLY_OPTIONS.get(words[0], set()):
             return True
     return False
 
@@ -4,11 +4,14 @@ remote_controller.py
 Handles agentless SSH connectivity for remote firewall management.
 """
 
-import paramiko
 from pathlib import Path
 import json
 import os
 
+from app.utils.lazy_import import lazy_import
+
+paramiko = lazy_import("paramiko")
+
 def test_ssh_connection(host: str, username: str, key_path: str, port: int = 22):
     """Test SSH connectivity to a remote firewall using a private key."""
     try:
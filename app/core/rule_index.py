@@ -0,0 +1,271 @@
+"""
+Module: rule_index
+Phase: 6
+Milestone: 2
+Step: 3
+Purpose:
+    Paged, filterable access to very large chains for the GUI.
+      - Stable rule IDs: derived from table, chain, rule spec and duplicate
+        ordinal, so inserting or deleting other rules never renumbers a row
+      - Server-side filters: address (CIDR overlap), port (incl. ranges and
+        multiport lists), target, comment, free text
+      - offset/limit pages, so the front end only fetches the visible window
+      - Index and filter results are cached per ruleset digest; paging through
+        a 100k-rule chain costs a slice, not a re-parse
+"""
+
+from __future__ import annotations
+import hashlib
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.utils.parser import Rule, parse_iptables_save
+
+
+# ---------- Tunables ----------
+SNAPSHOT_TTL_S      = 2.0        # reuse one iptables-save for this long across page requests
+INDEX_CACHE_SIZE    = 8          # (table, counters) indexes kept in memory
+FILTER_CACHE_SIZE   = 64         # filtered position lists kept per index
+DEFAULT_LIMIT       = 100
+MAX_LIMIT           = 1000
+
+FILTER_KEYS = ("address", "port", "target", "comment", "q")
+
+
+class RuleRow:
+    """One indexed rule: stable ID, 1-based position in its chain, parsed rule."""
+
+    __slots__ = ("id", "position", "rule", "_nets", "_ports")
+
+    def __init__(self, rule_id: str, position: int, rule: Rule):
+        self.id = rule_id
+        self.position = position
+        self.rule = rule
+        self._nets = None
+        self._ports = None
+
+    # Parsed lazily: most requests never filter by address or port
+    def nets(self) -> List[ipaddress.IPv4Network]:
+        if self._nets is None:
+            nets = []
+            for value in (self.rule.source, self.rule.destination):
+                if value:
+                    for part in value.split(","):
+                        try:
+                            nets.append(ipaddress.ip_network(part, strict=False))
+                        except ValueError:
+                            pass
+            self._nets = nets
+        return self._nets
+
+    def ports(self) -> List[Tuple[int, int]]:
+        if self._ports is None:
+            self._ports = [r for v in (self.rule.sport, self.rule.dport) if v for r in _port_ranges(v)]
+        return self._ports
+
+    def to_dict(self) -> Dict[str, object]:
+        r = self.rule
+        return {
+            "id": self.id,
+            "position": self.position,
+            "spec": r.spec(),
+            "target": r.target,
+            "protocol": r.protocol,
+            "source": r.source,
+            "destination": r.destination,
+            "sport": r.sport,
+            "dport": r.dport,
+            "in_iface": r.in_iface,
+            "out_iface": r.out_iface,
+            "comment": r.comment,
+            "packets": r.packets,
+            "bytes": r.bytes,
+        }
+
+
+def _port_ranges(value: str) -> List[Tuple[int, int]]:
+    out = []
+    for part in value.split(","):
+        lo, sep, hi = part.partition(":")
+        try:
+            # "1024:" runs to the top of the port space, ":1024" from the bottom
+            out.append((int(lo or 0), (int(hi) if hi else 65535) if sep else int(lo)))
+        except ValueError:
+            pass
+    return out
+
+
+def rule_id(table: str, chain: str, args: List[str], ordinal: int = 0) -> str:
+    """Stable ID of the `ordinal`-th rule with these arguments in table/chain."""
+    key = "\0".join([table, chain, *args, str(ordinal)])
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class RuleIndex:
+    """All chains of one table, indexed for paging and filtering."""
+
+    def __init__(self, table: str, text: str):
+        self.table = table
+        self.digest = hashlib.sha256(text.encode()).hexdigest()[:32]
+        self.chains: Dict[str, List[RuleRow]] = {}
+        self.policies: Dict[str, str] = {}
+        self._by_id: Dict[str, Tuple[str, int]] = {}
+        self._filters: "OrderedDict[tuple, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        t = parse_iptables_save(text).tables.get(table)
+        for name, chain in (t.chains.items() if t else ()):
+            seen: Dict[str, int] = {}
+            rows = []
+            for pos, rule in enumerate(chain.rules, 1):
+                spec = "\0".join(rule.args)
+                n = seen.get(spec, 0)
+                seen[spec] = n + 1
+                row = RuleRow(rule_id(table, name, rule.args, n), pos, rule)
+                rows.append(row)
+                self._by_id[row.id] = (name, pos - 1)
+            self.chains[name] = rows
+            self.policies[name] = chain.policy
+
+    def locate(self, rid: str) -> Optional[RuleRow]:
+        hit = self._by_id.get(rid)
+        return self.chains[hit[0]][hit[1]] if hit else None
+
+    def summary(self) -> List[Dict[str, object]]:
+        return [{"chain": c, "policy": self.policies[c], "rules": len(rows)} for c, rows in self.chains.items()]
+
+    def filtered(self, chain: str, filters: Dict[str, str]) -> Sequence[int]:
+        """Indexes (0-based) of rows in `chain` matching all filters; cached."""
+        if not any(filters.get(k) for k in FILTER_KEYS):
+            return range(len(self.chains.get(chain, ())))
+        key = (chain,) + tuple(filters.get(k) or None for k in FILTER_KEYS)
+        with self._lock:
+            hit = self._filters.get(key)
+            if hit is not None:
+                self._filters.move_to_end(key)
+                return hit
+        preds = _predicates(filters)
+        rows = self.chains.get(chain, [])
+        result = [i for i, row in enumerate(rows) if all(p(row) for p in preds)]
+        with self._lock:
+            self._filters[key] = result
+            while len(self._filters) > FILTER_CACHE_SIZE:
+                self._filters.popitem(last=False)
+        return result
+
+
+def _predicates(filters: Dict[str, str]) -> List[Callable[[RuleRow], bool]]:
+    preds: List[Callable[[RuleRow], bool]] = []
+    address = filters.get("address")
+    if address:
+        net = ipaddress.ip_network(address, strict=False)
+        preds.append(lambda row: any(n.version == net.version and n.overlaps(net) for n in row.nets()))
+    port = filters.get("port")
+    if port:
+        ranges = _port_ranges(port)
+        if not ranges:
+            raise ValueError(f"invalid port filter {port!r}")
+        preds.append(lambda row: any(a <= hi and lo <= b for a, b in row.ports() for lo, hi in ranges))
+    target = filters.get("target")
+    if target:
+        t = target.upper()
+        preds.append(lambda row: (row.rule.target or "").upper() == t)
+    comment = filters.get("comment")
+    if comment:
+        c = comment.lower()
+        preds.append(lambda row: c in (row.rule.comment or "").lower())
+    q = filters.get("q")
+    if q:
+        ql = q.lower()
+        preds.append(lambda row: ql in row.rule.spec().lower())
+    return preds
+
+
+def page(index: RuleIndex, chain: str, offset: int = 0, limit: int = DEFAULT_LIMIT,
+         **filters: str) -> Dict[str, object]:
+    """
+    One page of a chain:
+        {"status", "message", "table", "chain", "digest", "total", "offset", "limit", "rules": [...]}
+    `total` counts rows after filtering, so a virtualized list can size its scrollbar.
+    """
+    if chain not in index.chains:
+        return {"status": "failure", "message": f"No chain '{chain}' in table '{index.table}'"}
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    offset = max(0, int(offset))
+    try:
+        matched = index.filtered(chain, filters)
+    except ValueError as e:
+        return {"status": "failure", "message": f"Invalid filter: {e}"}
+    rows = index.chains[chain]
+    return {
+        "status": "success",
+        "message": f"{len(matched)} rule(s) in {index.table}/{chain}",
+        "table": index.table,
+        "chain": chain,
+        "digest": index.digest,
+        "total": len(matched),
+        "offset": offset,
+        "limit": limit,
+        "rules": [rows[i].to_dict() for i in matched[offset:offset + limit]],
+    }
+
+
+class RuleIndexCache:
+    """
+    Builds RuleIndex objects from `fetch(table, counters) -> iptables-save text`
+    and keeps the latest few. A snapshot younger than SNAPSHOT_TTL_S is reused
+    without fetching; an unchanged fetch (same digest) reuses the old index.
+    """
+
+    def __init__(self, fetch: Callable[[str, bool], str], ttl_s: float = SNAPSHOT_TTL_S,
+                 max_indexes: int = INDEX_CACHE_SIZE):
+        self._fetch = fetch
+        self._ttl_s = ttl_s
+        self._max = max_indexes
+        self._entries: "OrderedDict[Tuple[str, bool], Tuple[float, RuleIndex]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, table: str, counters: bool = False) -> RuleIndex:
+        key = (table, counters)
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit and time.monotonic() - hit[0] < self._ttl_s:
+                return hit[1]
+        text = self._fetch(table, counters)
+        digest = hashlib.sha256(text.encode()).hexdigest()[:32]
+        index = hit[1] if hit and hit[1].digest == digest else RuleIndex(table, text)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), index)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max:
+                self._entries.popitem(last=False)
+        return index
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    lines = ["*filter", ":INPUT DROP [0:0]", ":FORWARD ACCEPT [0:0]", ":OUTPUT ACCEPT [0:0]"]
+    for i in range(100_000):
+        lines.append(f"-A INPUT -s 10.{i // 65536}.{(i // 256) % 256}.{i % 256}/32 -p tcp -m tcp --dport {1024 + i % 5000} -j ACCEPT")
+    lines.append("COMMIT")
+    text = "\n".join(lines) + "\n"
+
+    t0 = time.perf_counter()
+    idx = RuleIndex("filter", text)
+    t1 = time.perf_counter()
+    first = page(idx, "INPUT", offset=50_000, limit=50)
+    t2 = time.perf_counter()
+    hits = page(idx, "INPUT", port="2000", limit=5)
+    t3 = time.perf_counter()
+    page(idx, "INPUT", port="2000", offset=5, limit=5)
+    t4 = time.perf_counter()
+    print(f"✅ indexed {len(idx.chains['INPUT'])} rules in {t1 - t0:.2f}s")
+    print(f"✅ page @50000: {(t2 - t1) * 1e3:.2f} ms, first id {first['rules'][0]['id']}")
+    print(f"✅ port filter: {hits['total']} hits in {(t3 - t2) * 1e3:.1f} ms, next page {(t4 - t3) * 1e3:.2f} ms")
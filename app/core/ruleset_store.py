@@ -0,0 +1,321 @@
+"""
+Module: ruleset_store
+Phase: 6
+Milestone: 5
+Step: 1
+Purpose:
+    Versioned, content-addressed history of the rulesets applied to each host.
+      - Git-like objects under db/store/objects: chains are blobs, tables and
+        rulesets are trees of hashes, so a chain shared by hundreds of hosts
+        is stored once
+      - Every recorded ruleset becomes a version (host, time, tree, parent)
+      - Per-host ref logs answer "what was on host X at time T" by bisection
+      - checkout()/rollback_host() restore any version by ID
+"""
+
+from __future__ import annotations
+import bisect
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.utils.file_manager import atomic_write
+from app.utils.parser import Ruleset, parse_iptables_save, serialize_ruleset
+
+
+# ---------- Tunables ----------
+STORE_DIR          = Path(__file__).resolve().parents[2] / "db" / "store"
+OBJECT_CACHE_SIZE  = 4096        # decoded objects kept in memory
+ZLIB_LEVEL         = 6
+OBJECT_FSYNC       = True        # objects are immutable: flush each one once and never again
+
+KINDS = ("chain", "table", "tree", "version")
+
+
+def _timestamp(when: Union[float, str, datetime.datetime]) -> float:
+    """Epoch seconds from a number, an ISO-8601 string or a datetime (naive = UTC)."""
+    if isinstance(when, (int, float)):
+        return float(when)
+    if isinstance(when, str):
+        when = datetime.datetime.fromisoformat(when.replace("Z", "+00:00"))
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return when.timestamp()
+
+
+def _host_ref_name(host: str) -> str:
+    """Ref log file name; any other byte is escaped as _xx, so distinct hosts never share a log."""
+    return "".join(c if c.isascii() and (c.isalnum() or c in ".-:") else
+                   "".join(f"_{b:02x}" for b in c.encode()) for c in host) + ".jsonl"
+
+
+class RulesetStore:
+    """
+    Object store + per-host version history.
+        store = RulesetStore()
+        v = store.record("10.10.0.20", ruleset_text, source="apply")
+        store.at("10.10.0.20", "2025-01-01T12:00:00")   → version dict or None
+        store.checkout(v["id"])                         → iptables-restore text
+    """
+
+    def __init__(self, root: Union[str, Path] = STORE_DIR):
+        self.root = Path(root)
+        self._objects = self.root / "objects"
+        self._refs = self.root / "refs"
+        self._lock = threading.Lock()
+        self._host_locks: Dict[str, threading.Lock] = {}           # host → serializes record()
+        self._known: set = set()                                   # oids known to exist on disk
+        self._cache: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._history: Dict[str, List[Tuple[float, str]]] = {}     # host → [(ts, version id)] sorted
+
+    # ---------- Objects ----------
+    def _path(self, oid: str) -> Path:
+        return self._objects / oid[:2] / oid[2:]
+
+    def put_object(self, kind: str, data: bytes) -> str:
+        """Store `data` under the sha256 of its header + content; existing objects are not rewritten."""
+        if kind not in KINDS:
+            raise ValueError(f"unknown object kind {kind!r}")
+        raw = f"{kind} {len(data)}\0".encode() + data
+        oid = hashlib.sha256(raw).hexdigest()
+        if oid in self._known:
+            return oid
+        path = self._path(oid)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(path, zlib.compress(raw, ZLIB_LEVEL), fsync=OBJECT_FSYNC)
+        with self._lock:
+            self._known.add(oid)
+        return oid
+
+    def get_object(self, oid: str) -> Tuple[str, bytes]:
+        """(kind, content) of an object; KeyError if it does not exist."""
+        with self._lock:
+            hit = self._cache.get(oid)
+            if hit is not None:
+                self._cache.move_to_end(oid)
+                return hit
+        try:
+            raw = zlib.decompress(self._path(oid).read_bytes())
+        except (OSError, ValueError):
+            raise KeyError(oid) from None
+        header, _, data = raw.partition(b"\0")
+        kind = header.split(b" ", 1)[0].decode()
+        with self._lock:
+            self._cache[oid] = (kind, data)
+            self._known.add(oid)
+            if len(self._cache) > OBJECT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return kind, data
+
+    def _get(self, oid: str, kind: str) -> bytes:
+        got_kind, data = self.get_object(oid)
+        if got_kind != kind:
+            raise KeyError(f"{oid} is a {got_kind}, not a {kind}")
+        return data
+
+    # ---------- Rulesets ----------
+    def write_ruleset(self, ruleset: Ruleset) -> str:
+        """Store a ruleset (counters dropped) and return its tree oid."""
+        tree = []
+        for table in ruleset.tables.values():
+            entries = []
+            for chain in table.chains.values():
+                body = [chain.header(counters=False)] + [r.to_line(counters=False) for r in chain.rules]
+                entries.append(f"{self.put_object('chain', chr(10).join(body).encode())} {chain.name}")
+            tree.append(f"{self.put_object('table', chr(10).join(entries).encode())} {table.name}")
+        return self.put_object("tree", "\n".join(tree).encode())
+
+    def read_ruleset(self, tree_oid: str) -> Ruleset:
+        lines: List[str] = []
+        for entry in self._get(tree_oid, "tree").decode().splitlines():
+            table_oid, name = entry.split(" ", 1)
+            lines.append(f"*{name}")
+            chains = [e.split(" ", 1)[0] for e in self._get(table_oid, "table").decode().splitlines()]
+            bodies = [self._get(oid, "chain").decode().splitlines() for oid in chains]
+            lines.extend(body[0] for body in bodies)                 # declarations first
+            lines.extend(line for body in bodies for line in body[1:])
+            lines.append("COMMIT")
+        return parse_iptables_save("\n".join(lines))
+
+    def chain_oids(self, tree_oid: str) -> Dict[Tuple[str, str], str]:
+        """{(table, chain): chain oid} of a stored ruleset, without reading the chains."""
+        out = {}
+        for entry in self._get(tree_oid, "tree").decode().splitlines():
+            table_oid, table = entry.split(" ", 1)
+            for e in self._get(table_oid, "table").decode().splitlines():
+                oid, chain = e.split(" ", 1)
+                out[(table, chain)] = oid
+        return out
+
+    # ---------- Versions ----------
+    def record(self, host: str, ruleset: Union[Ruleset, str], source: str = "apply",
+               message: str = "", timestamp: Optional[float] = None) -> Dict[str, object]:
+        """Record what is now on `host`; returns the new version (with "changed" vs. the previous one)."""
+        if isinstance(ruleset, str):
+            ruleset = parse_iptables_save(ruleset)
+        tree = self.write_ruleset(ruleset)
+        with self._lock:
+            host_lock = self._host_locks.setdefault(host, threading.Lock())
+        with host_lock:
+            return self._record(host, ruleset, tree, timestamp, source, message)
+
+    def _record(self, host: str, ruleset: Ruleset, tree: str, timestamp: Optional[float], source: str,
+                message: str) -> Dict[str, object]:
+        # Under the host lock: a concurrent record() must not read the same parent
+        ts = time.time() if timestamp is None else float(timestamp)
+        parent = self.head(host)
+        version = {
+            "host": host,
+            "timestamp": ts,
+            "tree": tree,
+            "parent": parent["id"] if parent else None,
+            "source": source,
+            "message": message,
+            "rules": ruleset.rule_count(),
+        }
+        vid = self.put_object("version", json.dumps(version, sort_keys=True).encode())
+
+        history = self._load_history(host)
+        self._refs.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            with open(self._refs / _host_ref_name(host), "a") as f:
+                f.write(json.dumps({"ts": ts, "id": vid}) + "\n")
+            bisect.insort(history, (ts, vid))
+        return {"id": vid, **version, "changed": parent is None or parent["tree"] != tree}
+
+    def version(self, version_id: str) -> Dict[str, object]:
+        return {"id": version_id, **json.loads(self._get(version_id, "version"))}
+
+    def _load_history(self, host: str) -> List[Tuple[float, str]]:
+        history = self._history.get(host)
+        if history is None:
+            entries = []
+            path = self._refs / _host_ref_name(host)
+            if path.exists():
+                with open(path) as f:
+                    for line in f:
+                        if line.strip():
+                            e = json.loads(line)
+                            entries.append((e["ts"], e["id"]))
+            entries.sort()
+            with self._lock:
+                history = self._history.setdefault(host, entries)
+        return history
+
+    def head(self, host: str) -> Optional[Dict[str, object]]:
+        history = self._load_history(host)
+        return self.version(history[-1][1]) if history else None
+
+    def at(self, host: str, when: Union[float, str, datetime.datetime]) -> Optional[Dict[str, object]]:
+        """The version that was current on `host` at `when` (None if recorded later)."""
+        history = self._load_history(host)
+        i = bisect.bisect_right(history, _timestamp(when), key=lambda e: e[0])
+        return self.version(history[i - 1][1]) if i else None
+
+    def history(self, host: str, limit: int = 50) -> List[Dict[str, object]]:
+        """Newest first."""
+        return [self.version(vid) for _, vid in reversed(self._load_history(host)[-limit:])]
+
+    def hosts(self) -> List[str]:
+        if not self._refs.exists():
+            return []
+        hosts = set(self._history)
+        for path in self._refs.glob("*.jsonl"):
+            with open(path) as f:
+                first = f.readline()
+            if first.strip():
+                hosts.add(self.version(json.loads(first)["id"])["host"])
+        return sorted(hosts)
+
+    def checkout(self, version_id: str) -> str:
+        """iptables-restore text of a version."""
+        return serialize_ruleset(self.read_ruleset(self.version(version_id)["tree"]), counters=False)
+
+    def stats(self) -> Dict[str, int]:
+        counts = {k: 0 for k in KINDS}
+        size = 0
+        if self._objects.exists():
+            for path in self._objects.glob("??/*"):
+                size += path.stat().st_size
+                counts[self.get_object(path.parent.name + path.name)[0]] += 1
+        return {**counts, "bytes": size}
+
+
+_DEFAULT: Optional[RulesetStore] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_store() -> RulesetStore:
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None or _DEFAULT.root != Path(STORE_DIR):
+            _DEFAULT = RulesetStore(STORE_DIR)
+        return _DEFAULT
+
+
+def rollback_host(
+    host: str,
+    version_id: str,
+    user: str,
+    key_path: str,
+    remote_rules_path: str = "/tmp/iptables.rules",
+    mgr=None,
+    store: Optional[RulesetStore] = None,
+    confirm_mgr=None,
+) -> Dict[str, object]:
+    """
+    Push and apply a stored version to `host`; the apply is recorded as a new
+    version. `confirm_mgr` is passed on to apply_iptables_rules.
+    """
+    from app.core.iptables_apply import apply_iptables_rules
+    from app.core.iptables_push import push_iptables_ruleset
+
+    store = store or default_store()
+    try:
+        text = store.checkout(version_id)
+    except KeyError:
+        return {"status": "failure", "message": f"Unknown version {version_id}"}
+
+    fd, local = tempfile.mkstemp(prefix="rollback-", suffix=".rules")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        pushed = push_iptables_ruleset(host, user, key_path, local, remote_rules_path, mgr=mgr)
+        if pushed["status"] != "success":
+            return {"status": "failure", "message": f"Rollback upload failed: {pushed['message']}"}
+        return apply_iptables_rules(host, user, key_path, remote_rules_path, mgr=mgr,
+                                    source=f"rollback:{version_id[:12]}", store=store, confirm_mgr=confirm_mgr)
+    finally:
+        os.unlink(local)
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import shutil
+    import sys
+
+    sys.path.append(str(Path(__file__).resolve().parents[2] / "tests" / "benchmarks"))
+    from fleet_generator import generate_ruleset, mutate_ruleset
+
+    root = tempfile.mkdtemp(prefix="ruleset-store-")
+    store = RulesetStore(root)
+    base = generate_ruleset(2000, seed=1)
+    t0 = time.perf_counter()
+    for i in range(200):
+        text = mutate_ruleset(base, 3) if i % 10 == 0 else base
+        store.record(f"10.10.{i // 250}.{i % 250}", text, timestamp=1_700_000_000 + i)
+    print(f"📦 200 hosts recorded in {time.perf_counter() - t0:.2f}s: {store.stats()}")
+    v = store.at("10.10.0.5", 1_700_000_010)
+    print(f"🕒 10.10.0.5 at T: {v['id'][:12]} ({v['rules']} rules)")
+    assert store.checkout(v["id"]) == serialize_ruleset(parse_iptables_save(base), counters=False)
+    print("✅ checkout round-trips")
+    shutil.rmtree(root)
@@ -10,24 +10,49 @@ Purpose:
 
 from __future__ import annotations
 import os
+import time
 from typing import Dict
-import paramiko
+from app.core import metrics, tracing
+from app.core.command_scheduler import Backpressure, admitted
 from app.core.ssh_session_manager import SSHSessionManager, _err
 
+SSH_TRANSFER_SECONDS = metrics.histogram("ssh_transfer_seconds", "SFTP transfer time", ("host", "direction"))
+SSH_TRANSFER_BYTES = metrics.counter("ssh_transfer_bytes_total", "Bytes moved over SFTP", ("host", "direction"))
+
 
 class SSHFileTransfer:
-    """Wrapper that performs upload/download through an SSHSessionManager."""
+    """
+    Wrapper that performs upload/download through an SSHSessionManager.
+    Given a scheduler Lane, each transfer holds one of its slots.
+    """
 
     def __init__(self, manager: SSHSessionManager):
         self.manager = manager
 
     def upload(self, host: str, user: str, key_path: str, local_path: str, remote_path: str) -> Dict[str, str]:
         """Upload a file to remote host."""
+        with tracing.span("sftp.upload", host=host, remote_path=remote_path) as sp:
+            try:
+                with admitted(self.manager, host):
+                    result = self._upload(host, user, key_path, local_path, remote_path)
+            except Backpressure as e:
+                result = e.result
+            tracing.mark_result(sp, result)
+            return result
+
+    def _upload(self, host: str, user: str, key_path: str, local_path: str, remote_path: str) -> Dict[str, str]:
         try:
             client = self.manager.get_session(host, user, key_path)
-            sftp = client.open_sftp()
-            sftp.put(local_path, remote_path)
+            t0 = time.perf_counter()
+            with tracing.span("sftp.open"):
+                sftp = client.open_sftp()
+            with tracing.span("sftp.put") as sp:
+                attrs = sftp.put(local_path, remote_path)
+                if sp is not None:
+                    sp.set(bytes=attrs.st_size)
             sftp.close()
+            SSH_TRANSFER_SECONDS.observe(time.perf_counter() - t0, host, "upload")
+            SSH_TRANSFER_BYTES.inc(host, "upload", amount=attrs.st_size or 0)
             return {
                 "status": "success",
                 "message": f"Uploaded {os.path.basename(local_path)} → {host}:{remote_path}",
@@ -37,11 +62,26 @@ class SSHFileTransfer:
 
     def download(self, host: str, user: str, key_path: str, remote_path: str, local_path: str) -> Dict[str, str]:
         """Download a file from remote host."""
+        with tracing.span("sftp.download", host=host, remote_path=remote_path) as sp:
+            try:
+                with admitted(self.manager, host):
+                    result = self._download(host, user, key_path, remote_path, local_path)
+            except Backpressure as e:
+                result = e.result
+            tracing.mark_result(sp, result)
+            return result
+
+    def _download(self, host: str, user: str, key_path: str, remote_path: str, local_path: str) -> Dict[str, str]:
         try:
             client = self.manager.get_session(host, user, key_path)
-            sftp = client.open_sftp()
-            sftp.get(remote_path, local_path)
+            t0 = time.perf_counter()
+            with tracing.span("sftp.open"):
+                sftp = client.open_sftp()
+            with tracing.span("sftp.get"):
+                sftp.get(remote_path, local_path)
             sftp.close()
+            SSH_TRANSFER_SECONDS.observe(time.perf_counter() - t0, host, "download")
+            SSH_TRANSFER_BYTES.inc(host, "download", amount=os.path.getsize(local_path))
             return {
                 "status": "success",
                 "message": f"Downloaded {host}:{remote_path} → {local_path}",
@@ -7,24 +7,44 @@ Purpose:
     Persistent SSH session manager with resilience:
       - Session cache per (host,user,port)
       - Auto-retry with exponential backoff on transient failures
-      - Idle TTL sweeper thread
+      - Idle TTL sweeper: heap of expiry deadlines, woken by an Event
+        (started on first connect, stops instantly)
+      - Process-wide shared managers (shared_manager) for one-shot callers
       - Per-host metrics (successes, failures, retries, last_latency, last_error)
       - Optional TCP keepalive to avoid idle drops
+      - Prometheus histograms/counters (see app.core.metrics) for /metrics
+      - Per-host circuit breaker (fail fast on dead hosts, half-open probes)
+        and adaptive connect timeouts from observed latency
+      - preflight(): warm sessions for a host list in parallel before a
+        rollout, checking iptables/privileges and pinned host keys
 """
 
 from __future__ import annotations
+import atexit
+import base64
+import hashlib
+import heapq
+import os
+import select
+import socket
+import statistics
 import time
 import threading
-from typing import Dict, Tuple, Optional
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Tuple, Optional
 
-import paramiko
-import socket
+from app.core import metrics, tracing
+from app.core.circuit_breaker import CLOSED, CircuitBreaker, LatencyTracker
+from app.utils.lazy_import import lazy_import
+
+paramiko = lazy_import("paramiko")     # loaded on the first connect, not at import
 
 
 # ---------- Tunables ----------
 DEFAULT_TIMEOUT_S      = 5          # connect/read timeout
 IDLE_TTL_S             = 300        # close sessions idle > 5 minutes
-HOUSEKEEP_FREQ_S       = 30         # sweep cache every 30s
+TCP_NODELAY            = True       # small exec request/reply packets must not wait for delayed ACKs
 RETRY_ATTEMPTS         = 2          # number of *additional* attempts after the first try
 RETRY_INITIAL_DELAY_S  = 0.5        # backoff base
 RETRY_BACKOFF_FACTOR   = 2.0        # exponential backoff
@@ -32,16 +52,44 @@ TCP_KEEPALIVE          = True       # enables TCP keepalive on the transport
 TCP_KEEPALIVE_IDLE_S   = 30
 TCP_KEEPALIVE_INTL_S   = 15
 TCP_KEEPALIVE_CNT      = 4
+SSH_COMPRESS           = False      # offer zlib transport compression (pays off on WAN links)
+STREAM_CHUNK           = 65536      # bytes per read from a channel (stdout and stderr)
+CHANNEL_POLL_S         = 1.0        # re-check a quiet channel for close this often
+SSH_BACKEND            = os.environ.get("IPTABLES_SSH_BACKEND", "paramiko")   # paramiko | openssh
+PREFLIGHT_WORKERS      = 32         # hosts warmed in parallel
+PREFLIGHT_STRAGGLER_FACTOR = 3.0    # warm-up slower than factor x fleet median → straggler
+PREFLIGHT_STRAGGLER_MIN_S  = 1.0    # ...but never flag anything faster than this
+# One round trip per host: can this login run iptables?
+PREFLIGHT_SCRIPT = (
+    'echo "uid=$(id -u)"; '
+    'echo "iptables=$(command -v iptables-restore)"; '
+    'echo "version=$(iptables --version 2>/dev/null)"; '
+    'if sudo -n true 2>/dev/null; then echo sudo=1; else echo sudo=0; fi'
+)
+
+# ---------- Instrumentation ----------
+_MANAGERS: "weakref.WeakSet[SSHSessionManager]" = weakref.WeakSet()
+
+SSH_CONNECT_SECONDS = metrics.histogram("ssh_connect_seconds", "SSH connect + auth time", ("host",))
+SSH_EXEC_SECONDS = metrics.histogram("ssh_exec_seconds", "Remote command time on an open session", ("host",))
+SSH_EXEC_TOTAL = metrics.counter("ssh_exec_total", "Commands executed by outcome", ("host", "status"))
+SSH_RETRIES_TOTAL = metrics.counter("ssh_retries_total", "Exec attempts retried after a transient error", ("host", "error_type"))
+metrics.gauge("ssh_sessions_open", "Cached SSH sessions across all managers",
+              fn=lambda: {(): sum(len(m._cache) for m in list(_MANAGERS))})
+metrics.gauge("ssh_circuits_open", "Hosts whose circuit breaker is open or half-open",
+              fn=lambda: {(): sum(m.open_circuits() for m in list(_MANAGERS))})
+metrics.gauge("ssh_sessions_active", "Cached SSH sessions with a live transport",
+              fn=lambda: {(): sum(m.active_sessions() for m in list(_MANAGERS))})
 
 
 class _ManagedSession:
-    """Holds a live Paramiko SSHClient plus last-used timestamp."""
+    """Holds a live Paramiko SSHClient plus last-used timestamp (monotonic)."""
     def __init__(self, client: paramiko.SSHClient):
         self.client = client
-        self.last_used = time.time()
+        self.last_used = time.monotonic()
 
     def touch(self):
-        self.last_used = time.time()
+        self.last_used = time.monotonic()
 
 
 class SSHSessionManager:
@@ -50,14 +98,23 @@ class SSHSessionManager:
     - get_session(): connect/reuse session
     - exec(): run command with auto-retry/backoff
     - metrics(): per-host counters & last error/latency
+    With compress=True every session offers zlib transport compression; what
+    each session actually negotiated is reported by compression().
     """
-    def __init__(self, idle_ttl_s: int = IDLE_TTL_S):
+    def __init__(self, idle_ttl_s: int = IDLE_TTL_S, compress: bool = SSH_COMPRESS):
+        self._compress = compress
         self._cache: Dict[Tuple[str, str, int], _ManagedSession] = {}
         self._lock = threading.RLock()
+        # Connects run outside the cache lock; one lock per key stops duplicate dials
+        self._connect_locks: Dict[Tuple[str, str, int], threading.Lock] = {}
         self._idle_ttl_s = idle_ttl_s
         self._metrics: Dict[Tuple[str, str, int], Dict[str, float | int | str | None]] = {}
-        self._sweeper = _Sweeper(self, HOUSEKEEP_FREQ_S)
-        self._sweeper.start()
+        # Reachability is per (host, port), whatever the user
+        self._breakers: Dict[Tuple[str, int], CircuitBreaker] = {}
+        self._latency: Dict[Tuple[str, int], LatencyTracker] = {}
+        self._health_lock = threading.Lock()
+        self._sweeper = _Sweeper(self)
+        _MANAGERS.add(self)
 
     # ---------- Connection ----------
     def _connect(
@@ -67,16 +124,35 @@ class SSHSessionManager:
         key_path: str,
         port: int = 22,
         timeout: int = DEFAULT_TIMEOUT_S,
-    ) -> paramiko.SSHClient:
-        key = paramiko.RSAKey.from_private_key_file(key_path)
+    ):
+        t0 = time.perf_counter()
+        try:
+            with tracing.span("ssh.connect", host=host, port=port):
+                client = self._dial(host, user, key_path, port, timeout)
+        except Exception as e:
+            if isinstance(e, socket.timeout) or time.perf_counter() - t0 >= timeout:
+                self._latency_for(host, port).timed_out()
+            raise
+        SSH_CONNECT_SECONDS.observe(time.perf_counter() - t0, host)
+        self._latency_for(host, port).add(time.perf_counter() - t0)
+        return client
+
+    def _dial(self, host: str, user: str, key_path: str, port: int, timeout: int) -> paramiko.SSHClient:
+        """Open one authenticated connection; transport backends override this."""
+        with tracing.span("ssh.load_key"):
+            key = paramiko.RSAKey.from_private_key_file(key_path)
         client = paramiko.SSHClient()
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(hostname=host, username=user, pkey=key, port=port, timeout=timeout)
+        with tracing.span("ssh.handshake"):
+            client.connect(hostname=host, username=user, pkey=key, port=port, timeout=timeout,
+                           compress=self._compress)
 
         # Optional TCP keepalive tweaks to reduce idle disconnects
         try:
+            transport = client.get_transport()
+            if TCP_NODELAY and transport is not None:
+                transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             if TCP_KEEPALIVE:
-                transport = client.get_transport()
                 if transport is not None:
                     sock = transport.sock
                     sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
@@ -107,13 +183,146 @@ class SSHSessionManager:
             if ms and self._is_alive(ms.client):
                 ms.touch()
                 return ms.client
-
-            # (re)connect
+            connect_lock = self._connect_locks.setdefault(k, threading.Lock())
+
+        # Dial without holding the cache lock, so slow hosts don't serialize the fleet
+        with connect_lock:
+            with self._lock:
+                ms = self._cache.get(k)
+                if ms and self._is_alive(ms.client):
+                    ms.touch()
+                    return ms.client
+
+            # (re)connect, bounded by what this host usually needs; a half-open
+            # probe gets the full timeout, or a host that slowed down never recovers
+            if self._breaker_for(host, port).state == CLOSED:
+                timeout = self._latency_for(host, port).timeout(timeout)
             client = self._connect(host, user, key_path, port, timeout)
-            self._cache[k] = _ManagedSession(client)
-            self._ensure_metrics(k)
+            with self._lock:
+                old = self._cache.get(k)
+                self._cache[k] = ms = _ManagedSession(client)
+                self._ensure_metrics(k)
+            if old is not None:
+                old.client.close()
+            self._sweeper.schedule(k, ms.last_used + self._idle_ttl_s)
             return client
 
+    # ---------- Preflight ----------
+    def preflight(
+        self,
+        hosts: Iterable[str],
+        user: str,
+        key_path: str,
+        port: int = 22,
+        timeout: int = DEFAULT_TIMEOUT_S,
+        fingerprints: Optional[Dict[str, str]] = None,
+        deadline_s: Optional[float] = None,
+        workers: int = PREFLIGHT_WORKERS,
+    ) -> Dict[str, object]:
+        """
+        Warm sessions for `hosts` in parallel, so key loading, connect,
+        handshake and auth are done before a rollout's first step. The same
+        round trip checks that the login can run iptables as the pipeline
+        does (as root, without sudo; iptables-restore installed); `fingerprints` pins
+        host keys ({host: "SHA256:..."}) and a mismatching session is dropped.
+        Hosts much slower than the fleet median are reported as stragglers, as
+        are hosts still connecting at `deadline_s` (they keep warming).
+        Returns dict(status, message, hosts{host: result}, ready, failed, stragglers, elapsed_ms)
+        """
+        hosts = list(dict.fromkeys(hosts))
+        fingerprints = fingerprints or {}
+        t0 = time.perf_counter()
+        results: Dict[str, Dict[str, object]] = {}
+        with tracing.span("ssh.preflight", hosts=len(hosts)):
+            pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(hosts))))
+            futures = {pool.submit(tracing.wrap(self._preflight_host), h, user, key_path, port, timeout,
+                                   fingerprints.get(h)): h for h in hosts}
+            done, pending = wait(futures, timeout=deadline_s)
+            pool.shutdown(wait=False)
+        for f in done:
+            results[futures[f]] = f.result()
+        stragglers = [futures[f] for f in pending]
+        for h in stragglers:
+            results[h] = {"status": "failure", "message": f"{h}: still connecting after {deadline_s:g}s",
+                          "error_type": "Straggler", "warm_ms": None}
+
+        warm = [r["warm_ms"] for r in results.values() if r["status"] == "success" and not r["cached"]]
+        if warm:
+            slow_ms = max(PREFLIGHT_STRAGGLER_MIN_S * 1000, PREFLIGHT_STRAGGLER_FACTOR * statistics.median(warm))
+            stragglers += [h for h, r in results.items() if r["status"] == "success" and r["warm_ms"] > slow_ms]
+        ready = [h for h in hosts if results[h]["status"] == "success"]
+        failed = [h for h in hosts if results[h]["status"] != "success"]
+        return {
+            "status": "success" if not failed else ("failure" if not ready else "partial"),
+            "message": f"{len(ready)}/{len(hosts)} hosts ready, {len(stragglers)} stragglers",
+            "hosts": {h: results[h] for h in hosts},
+            "ready": ready,
+            "failed": failed,
+            "stragglers": stragglers,
+            "elapsed_ms": int((time.perf_counter() - t0) * 1000),
+        }
+
+    def _preflight_host(self, host: str, user: str, key_path: str, port: int, timeout: int,
+                        expected: Optional[str]) -> Dict[str, object]:
+        with self._lock:
+            ms = self._cache.get((host, user, port))
+            cached = ms is not None and self._is_alive(ms.client)
+        t0 = time.perf_counter()
+        if expected:
+            # Check the pin on the bare connection, before the host is sent anything to run
+            try:
+                self.get_session(host, user, key_path, port, timeout)
+            except paramiko.AuthenticationException as e:
+                return {**_err("AuthenticationError", f"Auth failed for {user}@{host}", e),
+                        "warm_ms": int((time.perf_counter() - t0) * 1000), "cached": cached}
+            except Exception as e:
+                return {**_err("SSHError", f"SSH error on {host}", e),
+                        "warm_ms": int((time.perf_counter() - t0) * 1000), "cached": cached}
+            fingerprint = self.host_key_fingerprint(host, user, port)
+            if fingerprint != expected:
+                self.close_host(host, user, port)
+                return {"status": "failure", "error_type": "HostKeyMismatch",
+                        "message": f"{host}: host key {fingerprint} does not match pinned {expected}",
+                        "fingerprint": fingerprint, "warm_ms": int((time.perf_counter() - t0) * 1000),
+                        "cached": cached}
+        r = self.exec(host, user, key_path, PREFLIGHT_SCRIPT, port=port, timeout=timeout)
+        warm_ms = int((time.perf_counter() - t0) * 1000)
+        if r["status"] != "success":
+            return {"status": "failure", "message": r["message"], "error_type": r.get("error_type"),
+                    "warm_ms": warm_ms, "cached": cached}
+
+        facts = dict(line.split("=", 1) for line in r["stdout"].splitlines() if "=" in line)
+        privilege = "root" if facts.get("uid") == "0" else ("sudo" if facts.get("sudo") == "1" else "none")
+        out = {
+            "status": "success",
+            "warm_ms": warm_ms,
+            "cached": cached,
+            "fingerprint": self.host_key_fingerprint(host, user, port),
+            "privilege": privilege,
+            "iptables": facts.get("iptables") or None,
+            "version": facts.get("version") or None,
+        }
+        if out["iptables"] is None:
+            return {**out, "status": "failure", "error_type": "IptablesMissing",
+                    "message": f"{host}: iptables-restore not found"}
+        if privilege != "root":
+            # Pipeline commands (validate, apply, collect, ...) run iptables directly, never through sudo
+            hint = "; it has passwordless sudo, but commands are not run through sudo" if privilege == "sudo" else ""
+            return {**out, "status": "failure", "error_type": "NoPrivilege",
+                    "message": f"{user}@{host} is not root{hint}"}
+        out["message"] = f"{host}: ready in {warm_ms} ms ({privilege}, {out['version'] or out['iptables']})"
+        return out
+
+    def host_key_fingerprint(self, host: str, user: str, port: int = 22) -> Optional[str]:
+        """OpenSSH-style SHA256 fingerprint of the host key of a cached session, if any."""
+        with self._lock:
+            ms = self._cache.get((host, user, port))
+        transport = ms.client.get_transport() if ms is not None else None
+        if transport is None:
+            return None
+        digest = hashlib.sha256(transport.get_remote_server_key().asbytes()).digest()
+        return "SHA256:" + base64.b64encode(digest).decode().rstrip("=")
+
     # ---------- Exec with retry/backoff ----------
     def exec(
         self,
@@ -123,13 +332,40 @@ class SSHSessionManager:
         command: str,
         port: int = 22,
         timeout: int = DEFAULT_TIMEOUT_S,
+        sink=None,
+        fresh: bool = False,
     ) -> dict:
         """
         Returns dict(status, exit_code, stdout, stderr, message, retries, latency_ms, error_type?)
         Retries a failed attempt up to RETRY_ATTEMPTS with exponential backoff.
+        With a `sink` (anything with write(bytes)), stdout is streamed to it in
+        chunks instead of being collected: result["stdout"] is "" and
+        result["stdout_bytes"] the byte count. A sink with reset() is reset
+        before each retry. fresh=True drops the cached session first, so the
+        command proves that a *new* connection can still be made.
         """
+        if fresh:
+            self.close_host(host, user, port)
+        with tracing.span("ssh.exec", host=host, command=command[:120]) as sp:
+            result = self._exec_retrying(host, user, key_path, command, port, timeout, sink)
+            if sp is not None:
+                sp.set(retries=result.get("retries", 0), exit_code=result.get("exit_code"))
+                tracing.mark_result(sp, result)
+            return result
+
+    def _exec_retrying(
+        self,
+        host: str,
+        user: str,
+        key_path: str,
+        command: str,
+        port: int,
+        timeout: int,
+        sink=None,
+    ) -> dict:
         k = (host, user, port)
         self._ensure_metrics(k)
+        breaker = self._breaker_for(host, port)
 
         attempt = 0
         delay = RETRY_INITIAL_DELAY_S
@@ -139,16 +375,27 @@ class SSHSessionManager:
 
         while True:
             attempt += 1
+            if not breaker.allow():
+                SSH_EXEC_TOTAL.inc(host, "circuit_open")
+                self._bump_metric(k, "failures", 1)
+                return _circuit_open(host, port, breaker, retries=attempt - 1)
             t0 = time.perf_counter()
+            if sink is not None and attempt > 1 and hasattr(sink, "reset"):
+                sink.reset()
             try:
                 client = self.get_session(host, user, key_path, port, timeout)
-                result = self._exec_with_client(client, command)
+                t_exec = time.perf_counter()
+                with tracing.span("ssh.channel", attempt=attempt):
+                    result = self._exec_with_client(client, command, sink)
+                SSH_EXEC_SECONDS.observe(time.perf_counter() - t_exec, host)
                 latency_ms = int((time.perf_counter() - t0) * 1000)
 
                 # success path
                 if result["status"] == "success":
+                    breaker.success()
                     result["retries"] = attempt - 1
                     result["latency_ms"] = latency_ms
+                    SSH_EXEC_TOTAL.inc(host, "success")
                     self._bump_metric(k, "successes", 1)
                     self._set_metric(k, "last_latency_ms", latency_ms)
                     self._set_metric(k, "last_error", None)
@@ -159,13 +406,21 @@ class SSHSessionManager:
                     last_error_type = result["error_type"]
                     last_exc = result["stderr"]
                     self.close_host(host, user, port)  # force reconnect next try
-                    if attempt <= (1 + RETRY_ATTEMPTS):
+                    breaker.failure()
+                    if attempt <= (1 + RETRY_ATTEMPTS) and breaker.state == CLOSED:
+                        SSH_RETRIES_TOTAL.inc(host, last_error_type)
+                        tracing.event("retry", attempt=attempt, error_type=last_error_type, delay_s=delay)
                         self._bump_metric(k, "retries", 1)
                         time.sleep(delay)
                         delay *= RETRY_BACKOFF_FACTOR
                         continue
 
-                # non-transient failure (exit_code != 0, or other)
+                # non-transient failure (exit_code != 0, or other): the host itself is fine
+                if result.get("exit_code") is not None:
+                    breaker.success()
+                else:
+                    breaker.release()
+                SSH_EXEC_TOTAL.inc(host, "failure")
                 self._bump_metric(k, "failures", 1)
                 self._set_metric(k, "last_latency_ms", latency_ms)
                 self._set_metric(k, "last_error", result.get("stderr") or result.get("message"))
@@ -176,6 +431,8 @@ class SSHSessionManager:
             except paramiko.AuthenticationException as e:
                 last_error_type = "AuthenticationError"
                 last_exc = str(e)
+                breaker.success()  # reachable; retrying will not help
+                SSH_EXEC_TOTAL.inc(host, "auth_error")
                 self._bump_metric(k, "failures", 1)
                 return _err("AuthenticationError", f"Auth failed for {user}@{host}", e, retries=attempt-1)
 
@@ -183,17 +440,23 @@ class SSHSessionManager:
                 last_error_type = "SSHError"
                 last_exc = str(e)
                 self.close_host(host, user, port)
-                if attempt <= (1 + RETRY_ATTEMPTS):
+                breaker.failure()
+                if attempt <= (1 + RETRY_ATTEMPTS) and breaker.state == CLOSED:
+                    SSH_RETRIES_TOTAL.inc(host, last_error_type)
+                    tracing.event("retry", attempt=attempt, error_type=last_error_type, delay_s=delay)
                     self._bump_metric(k, "retries", 1)
                     time.sleep(delay)
                     delay *= RETRY_BACKOFF_FACTOR
                     continue
+                SSH_EXEC_TOTAL.inc(host, "ssh_error")
                 self._bump_metric(k, "failures", 1)
                 return _err("SSHError", f"SSH error on {host}", e, retries=attempt-1)
 
             except Exception as e:
                 last_error_type = "GeneralError"
                 last_exc = str(e)
+                breaker.release()
+                SSH_EXEC_TOTAL.inc(host, "error")
                 self._bump_metric(k, "failures", 1)
                 return _err("GeneralError", f"Unexpected error for {host}", e, retries=attempt-1)
 
@@ -204,17 +467,26 @@ class SSHSessionManager:
                     self._set_metric(k, "last_error_type", last_error_type)
                     self._set_metric(k, "last_error", last_exc)
 
-    def _exec_with_client(self, client: paramiko.SSHClient, command: str) -> dict:
+    def _exec_with_client(self, client: paramiko.SSHClient, command: str, sink=None) -> dict:
         try:
             stdin, stdout, stderr = client.exec_command(command)
-            exit_code = stdout.channel.recv_exit_status()
-            return {
+            stdin.close()
+            chan = stdout.channel
+            chunks, err_chunks = [], []
+            n = _drain(chan, chunks.append if sink is None else sink.write, err_chunks.append)
+            out = b"".join(chunks).decode().strip()
+            err = b"".join(err_chunks).decode().strip()
+            exit_code = chan.recv_exit_status()
+            result = {
                 "status": "success" if exit_code == 0 else "failure",
                 "exit_code": exit_code,
-                "stdout": stdout.read().decode().strip(),
-                "stderr": stderr.read().decode().strip(),
+                "stdout": out,
+                "stderr": err,
                 "message": f"Executed '{command}' (exit {exit_code})",
             }
+            if sink is not None:
+                result["stdout_bytes"] = n
+            return result
         except socket.error as e:
             return _err("SocketError", "Socket error while executing command", e)
         except paramiko.SSHException as e:
@@ -228,6 +500,52 @@ class SSHSessionManager:
         except Exception:
             return False
 
+    # ---------- Circuit breakers ----------
+    def _breaker_for(self, host: str, port: int) -> CircuitBreaker:
+        with self._health_lock:
+            cb = self._breakers.get((host, port))
+            if cb is None:
+                cb = self._breakers[(host, port)] = CircuitBreaker()
+            return cb
+
+    def _latency_for(self, host: str, port: int) -> LatencyTracker:
+        with self._health_lock:
+            lt = self._latency.get((host, port))
+            if lt is None:
+                lt = self._latency[(host, port)] = LatencyTracker()
+            return lt
+
+    def circuit(self, host: str, port: int = 22) -> Dict[str, object]:
+        """Breaker state plus the adaptive connect timeout currently in use."""
+        snap = self._breaker_for(host, port).snapshot()
+        lt = self._latency_for(host, port)
+        snap["connect_timeout_s"] = round(lt.timeout(DEFAULT_TIMEOUT_S), 2)
+        p95 = lt.percentile(0.95)
+        snap["connect_p95_ms"] = round(p95 * 1000, 1) if p95 is not None else None
+        return snap
+
+    def reset_circuit(self, host: str, port: int = 22):
+        """Forget a host's failure history (e.g. after it was repaired)."""
+        with self._health_lock:
+            self._breakers.pop((host, port), None)
+
+    def open_circuits(self) -> int:
+        with self._health_lock:
+            return sum(1 for cb in self._breakers.values() if cb.state != CLOSED)
+
+    def compression(self, host: str, user: str, port: int = 22) -> Optional[Dict[str, str]]:
+        """Negotiated transport compression of a cached session ({"in": .., "out": ..}), if any."""
+        with self._lock:
+            ms = self._cache.get((host, user, port))
+        if ms is None or not self._is_alive(ms.client):
+            return None
+        t = ms.client.get_transport()
+        return {"in": t.remote_compression, "out": t.local_compression}
+
+    def active_sessions(self) -> int:
+        with self._lock:
+            return sum(1 for ms in self._cache.values() if self._is_alive(ms.client))
+
     # ---------- Metrics ----------
     def _ensure_metrics(self, key: Tuple[str, str, int]):
         if key not in self._metrics:
@@ -252,7 +570,10 @@ class SSHSessionManager:
     def metrics(self) -> Dict[Tuple[str, str, int], Dict[str, int | float | str | None]]:
         """Return a snapshot of per-host metrics."""
         # return a shallow copy for safety
-        return {k: dict(v) for k, v in self._metrics.items()}
+        out = {k: dict(v) for k, v in self._metrics.items()}
+        for (host, user, port), m in out.items():
+            m["circuit"] = self._breaker_for(host, port).state
+        return out
 
     # ---------- Cleanup ----------
     def close_host(self, host: str, user: str, port: int = 22):
@@ -265,8 +586,24 @@ class SSHSessionManager:
                 except Exception:
                     pass
 
+    def _expire(self, key: Tuple[str, str, int], now: float) -> Optional[float]:
+        """Sweeper callback: close `key` if idle past its TTL, else return its new deadline."""
+        with self._lock:
+            ms = self._cache.get(key)
+            if ms is None:
+                return None
+            deadline = ms.last_used + self._idle_ttl_s
+            if deadline > now:
+                return deadline
+            self._cache.pop(key, None)
+        try:
+            ms.client.close()
+        except Exception:
+            pass
+        return None
+
     def close_idle(self):
-        now = time.time()
+        now = time.monotonic()
         with self._lock:
             to_close = [k for k, ms in self._cache.items() if now - ms.last_used > self._idle_ttl_s]
             for k in to_close:
@@ -287,28 +624,103 @@ class SSHSessionManager:
 
     def stop(self):
         self._sweeper.stop()
-        self._sweeper.join()
         self.close_all()
 
 
-class _Sweeper(threading.Thread):
-    """Background thread to close idle sessions periodically."""
-    def __init__(self, mgr: SSHSessionManager, freq_s: int):
-        super().__init__(daemon=True)
+class _Sweeper:
+    """
+    Closes idle sessions at their expiry deadlines.
+    Deadlines sit in a heap (one entry per key); the thread sleeps until the
+    earliest one or until schedule()/stop() sets the wake Event. A popped key
+    that was used since is re-armed with its new deadline, so touch() on the
+    hot path costs nothing here. The thread is started on first schedule().
+    """
+    def __init__(self, mgr: SSHSessionManager):
         self._mgr = mgr
-        self._freq = freq_s
-        self._run = True
+        self._heap: list = []
+        self._keys: set = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, key: Tuple[str, str, int], deadline: float):
+        with self._lock:
+            if self._stopped:
+                return
+            if key not in self._keys:
+                self._keys.add(key)
+                heapq.heappush(self._heap, (deadline, key))
+                if self._heap[0][1] == key:
+                    self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ssh-sweeper", daemon=True)
+                self._thread.start()
 
     def stop(self):
-        self._run = False
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+        self._wake.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            now = time.monotonic()
+            due = []
+            with self._lock:
+                if self._stopped:
+                    return
+                while self._heap and self._heap[0][0] <= now:
+                    _, key = heapq.heappop(self._heap)
+                    self._keys.discard(key)
+                    due.append(key)
+                timeout = self._heap[0][0] - now if self._heap else None
+            for key in due:
+                try:
+                    deadline = self._mgr._expire(key, now)
+                except Exception:
+                    deadline = None
+                if deadline is not None:
+                    self.schedule(key, deadline)
+            if not due:
+                self._wake.wait(timeout)
+
+
+# ---------- Shared managers ----------
+_SHARED: Dict[str, SSHSessionManager] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_manager(name: str = "default", **options) -> SSHSessionManager:
+    """
+    Process-wide manager for callers that don't bring their own, so one-shot
+    push/validate/apply/discovery calls reuse sessions instead of building
+    (and tearing down) a manager each time. SSH_BACKEND picks the transport;
+    `options` (e.g. compress=True) only apply when the manager is created.
+    """
+    with _SHARED_LOCK:
+        mgr = _SHARED.get(name)
+        if mgr is None:
+            if SSH_BACKEND == "openssh":
+                from app.core.openssh_session_manager import OpenSSHSessionManager
+                mgr = _SHARED[name] = OpenSSHSessionManager(**options)
+            else:
+                mgr = _SHARED[name] = SSHSessionManager(**options)
+        return mgr
+
+
+def stop_shared_managers():
+    with _SHARED_LOCK:
+        managers = list(_SHARED.values())
+        _SHARED.clear()
+    for mgr in managers:
+        mgr.stop()
 
-    def run(self):
-        while self._run:
-            time.sleep(self._freq)
-            try:
-                self._mgr.close_idle()
-            except Exception:
-                pass
+
+atexit.register(stop_shared_managers)
 
 
 # ---------- Minimal self-test ----------
@@ -319,6 +731,11 @@ if __name__ == "__main__":
 
     mgr = SSHSessionManager(idle_ttl_s=120)
     try:
+        report = mgr.preflight(HOSTS, USER, KEY)
+        print("🚦", report["message"], f"in {report['elapsed_ms']} ms")
+        for h, r in report["hosts"].items():
+            print("  ", h, "→", r["message"])
+
         for h in HOSTS:
             r1 = mgr.exec(h, USER, KEY, "hostname")
             print(h, "→", r1["status"], "-", r1["message"], f"(retries={r1.get('retries', 0)}, latency={r1.get('latency_ms')}ms)")
@@ -331,6 +748,18 @@ if __name__ == "__main__":
         mgr.stop()
 
 
+def _circuit_open(host: str, port: int, breaker: CircuitBreaker, retries: int = 0) -> dict:
+    return {
+        "status": "failure",
+        "exit_code": None,
+        "stdout": "",
+        "stderr": "circuit open",
+        "message": f"{host}:{port} is failing; skipped (retry in {breaker.retry_in():.0f}s)",
+        "error_type": "CircuitOpen",
+        "retries": retries,
+    }
+
+
 def _err(error_type: str, msg: str, exc: Exception, retries: int = 0) -> dict:
     return {
         "status": "failure",
@@ -341,3 +770,25 @@ def _err(error_type: str, msg: str, exc: Exception, retries: int = 0) -> dict:
         "error_type": error_type,
         "retries": retries,
     }
+
+
+def _drain(chan, on_stdout, on_stderr) -> int:
+    """
+    Read stdout and stderr together until the command's EOF; returns the stdout
+    byte count. Both streams share one channel window, so leaving either
+    unread (e.g. stderr until stdout ends) stalls a chatty command forever.
+    """
+    n = 0
+    while True:
+        if chan.recv_ready():
+            chunk = chan.recv(STREAM_CHUNK)
+            on_stdout(chunk)
+            n += len(chunk)
+        elif chan.recv_stderr_ready():
+            on_stderr(chan.recv_stderr(STREAM_CHUNK))
+        elif chan.eof_received or chan.closed:
+            # EOF arrives after all data: once seen, whatever is buffered is the rest
+            if not (chan.recv_ready() or chan.recv_stderr_ready()):
+                return n
+        else:
+            select.select([chan], [], [], CHANNEL_POLL_S)
@@ -0,0 +1,332 @@
+"""
+Module: tracing
+Phase: 6
+Milestone: 3
+Step: 2
+Purpose:
+    Lightweight tracing for rollouts (push → validate → apply).
+      - Nested spans with wall-clock timings, carried in a contextvar
+      - Library spans (ssh.*, sftp.*) only record inside an active trace,
+        so untraced callers pay one contextvar lookup
+      - Finished traces are kept in memory and exported to a local file as
+        JSON lines or OTLP/JSON (the collector "file" exporter layout)
+      - Flame-style per-host breakdown (self/total time and folded stacks)
+"""
+
+from __future__ import annotations
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+
+# ---------- Tunables ----------
+TRACE_EXPORT  = os.environ.get("IPTABLES_TRACE_EXPORT", "json")   # json | otlp | off
+TRACE_DIR     = os.environ.get("IPTABLES_TRACE_DIR",
+                               str(Path(__file__).resolve().parents[2] / "logs" / "traces"))
+TRACE_KEEP    = 100               # finished traces kept for /api/traces
+TRACE_MAX_BYTES = 50 * 1024 * 1024  # export file is rotated to <name>.1 past this size
+SERVICE_NAME  = "iptables_gui"
+
+
+class Span:
+    """One timed operation. `attrs` are exported as span attributes."""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start_ns", "end_ns",
+                 "_t0", "status", "error", "events")
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attrs: Dict[str, object]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attrs = attrs
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._t0 = time.perf_counter_ns()
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, object]] = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else self.start_ns + (time.perf_counter_ns() - self._t0)
+        return (end - self.start_ns) / 1e6
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def event(self, name: str, **attrs):
+        self.events.append({"name": name, "time_ns": time.time_ns(), **attrs})
+
+    def fail(self, message: str):
+        self.status = "error"
+        self.error = message
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attrs": self.attrs,
+            "events": self.events,
+        }
+
+
+class Trace:
+    """All spans sharing one root. Spans append themselves when they end."""
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.spans: List[Span] = []      # list.append is atomic; worker threads add to it
+
+    @property
+    def root(self) -> Optional[Span]:
+        return next((s for s in self.spans if s.parent_id is None), None)
+
+    def to_dict(self) -> Dict[str, object]:
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "duration_ms": round(root.duration_ms, 3) if root else None,
+            "spans": [s.to_dict() for s in sorted(self.spans, key=lambda s: s.start_ns)],
+        }
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("iptables_span", default=None)
+_finished: Deque[Trace] = deque(maxlen=TRACE_KEEP)
+_export_lock = threading.Lock()
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    s = _current.get()
+    return s.trace.trace_id if s else None
+
+
+@contextmanager
+def span(name: str, root: bool = False, **attrs) -> Iterator[Optional[Span]]:
+    """
+    Time a block as a child of the current span.
+    With root=True a new trace is started when none is active (pipeline entry
+    points); otherwise the block is not recorded outside a trace and yields None.
+    """
+    parent = _current.get()
+    if parent is None and not root:
+        yield None
+        return
+    trace = parent.trace if parent else Trace(name)
+    s = Span(trace, name, parent, attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        s.end_ns = s.start_ns + (time.perf_counter_ns() - s._t0)
+        trace.spans.append(s)
+        if parent is None:
+            _finished.append(trace)
+            export(trace)
+
+
+def event(name: str, **attrs):
+    """Attach an event to the current span, if any."""
+    s = _current.get()
+    if s is not None:
+        s.event(name, **attrs)
+
+
+def mark_result(s: Optional[Span], result: Dict[str, object]):
+    """Copy a repo-style result dict's status onto a span."""
+    if s is not None and result.get("status") != "success":
+        s.fail(str(result.get("stderr") or result.get("message")))
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorator for per-host pipeline steps `fn(host, ...) -> result dict`:
+    runs the call in a root-capable span tagged with the host.
+    """
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(host: str, *args, **kwargs):
+            with span(name, root=True, host=host) as s:
+                result = fn(host, *args, **kwargs)
+                mark_result(s, result)
+                return result
+        return wrapper
+    return deco
+
+
+def wrap(fn: Callable) -> Callable:
+    """Bind `fn` to the caller's context so spans in worker threads nest correctly."""
+    ctx = contextvars.copy_context()
+    # A Context can only be entered by one thread at a time: run each call in a copy
+    return lambda *a, **kw: ctx.copy().run(fn, *a, **kw)
+
+
+# ---------- Export ----------
+def _otlp_value(v: object) -> Dict[str, object]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def to_otlp(trace: Trace) -> Dict[str, object]:
+    """OTLP/JSON ExportTraceServiceRequest for one trace."""
+    spans = []
+    for s in trace.spans:
+        end = s.end_ns or s.start_ns
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent_id or "",
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(end),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attrs.items()],
+            "events": [{"name": e["name"], "timeUnixNano": str(e["time_ns"]),
+                        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in e.items()
+                                       if k not in ("name", "time_ns")]} for e in s.events],
+            "status": {"code": 2, "message": s.error or ""} if s.status == "error" else {"code": 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": spans}],
+    }]}
+
+
+def export(trace: Trace, mode: Optional[str] = None, directory: Optional[str] = None) -> Optional[str]:
+    """
+    Append a finished trace to TRACE_DIR/traces.jsonl (or traces.otlp.jsonl);
+    returns the path. A file past TRACE_MAX_BYTES is first rotated to .1,
+    replacing the previous one, so exports never grow without bound.
+    """
+    mode = mode or TRACE_EXPORT
+    if mode == "off":
+        return None
+    directory = directory or TRACE_DIR
+    path = os.path.join(directory, "traces.otlp.jsonl" if mode == "otlp" else "traces.jsonl")
+    record = to_otlp(trace) if mode == "otlp" else trace.to_dict()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with _export_lock:
+            if os.path.exists(path) and os.path.getsize(path) >= TRACE_MAX_BYTES:
+                os.replace(path, path + ".1")
+            with open(path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"⚠️ Trace export failed: {e}")
+        return None
+    return path
+
+
+def recent(limit: int = TRACE_KEEP) -> List[Trace]:
+    return list(_finished)[-limit:][::-1]
+
+
+def find(trace_id: str) -> Optional[Trace]:
+    return next((t for t in _finished if t.trace_id == trace_id), None)
+
+
+# ---------- Flame breakdown ----------
+def flame(trace: Trace) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Per-host folded stacks:
+        {host: {"apply;validate;ssh.exec": {"total_ms": .., "self_ms": .., "count": n}}}
+    A span's host is its own `host` attribute or the nearest ancestor's;
+    self time is total minus time spent in direct children.
+    """
+    by_id = {s.span_id: s for s in trace.spans}
+    children_ms: Dict[str, float] = {}
+    for s in trace.spans:
+        if s.parent_id:
+            children_ms[s.parent_id] = children_ms.get(s.parent_id, 0.0) + s.duration_ms
+
+    out: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for s in trace.spans:
+        path, host, cur = [], None, s
+        while cur is not None:
+            path.append(cur.name)
+            if host is None and "host" in cur.attrs:
+                host = str(cur.attrs["host"])
+            cur = by_id.get(cur.parent_id) if cur.parent_id else None
+        stack = ";".join(reversed(path))
+        entry = out.setdefault(host or "-", {}).setdefault(stack, {"total_ms": 0.0, "self_ms": 0.0, "count": 0})
+        entry["total_ms"] += s.duration_ms
+        entry["self_ms"] += max(0.0, s.duration_ms - children_ms.get(s.span_id, 0.0))
+        entry["count"] += 1
+    return out
+
+
+def format_flame(trace: Trace) -> str:
+    """Text report: per host, stacks sorted by total time with self time bars."""
+    lines = [f"trace {trace.trace_id} ({trace.name})"]
+    for host, stacks in sorted(flame(trace).items()):
+        lines.append(f"  {host}")
+        width = max((v["total_ms"] for v in stacks.values()), default=1.0) or 1.0
+        for stack, v in sorted(stacks.items(), key=lambda kv: kv[0]):
+            depth = stack.count(";")
+            bar = "█" * max(1, int(24 * v["self_ms"] / width)) if v["self_ms"] else ""
+            lines.append(f"    {'  ' * depth}{stack.rsplit(';', 1)[-1]:<24} {v['total_ms']:9.1f} ms "
+                         f"(self {v['self_ms']:8.1f}) {bar}")
+    return "\n".join(lines)
+
+
+def folded(trace: Trace) -> str:
+    """Folded-stack lines (host;span;span self_us) for flamegraph.pl / speedscope."""
+    return "\n".join(f"{host};{stack} {int(v['self_ms'] * 1000)}"
+                     for host, stacks in sorted(flame(trace).items())
+                     for stack, v in sorted(stacks.items())) + "\n"
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    def rollout(host):
+        with span("push", host=host):
+            with span("ssh.connect"):
+                time.sleep(0.02)
+            with span("sftp.put"):
+                time.sleep(0.01)
+        with span("apply", host=host):
+            with span("validate"):
+                with span("ssh.exec", command="iptables-restore --test"):
+                    time.sleep(0.005)
+            with span("ssh.exec", command="iptables-restore"):
+                time.sleep(0.008)
+
+    with span("rollout", root=True) as root:
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(wrap(rollout), ["10.10.0.20", "10.10.0.30"]))
+
+    t = find(root.trace.trace_id)
+    print(format_flame(t))
+    print(folded(t))
+    print(f"✅ exported to {export(t, mode='otlp', directory='/tmp')}")
@@ -0,0 +1,257 @@
+"""
+Module: traffic_tester
+Phase: 6
+Milestone: 6
+Step: 6
+Purpose:
+    Post-apply verification with real traffic instead of manual curl/ping.
+      - Flow expectations are declared as (src agent, dst, proto/port,
+        allow|deny), in db/flows.json or per request
+      - All flows of one source host run as a single exec over its pooled SSH
+        session; the probes inside it are launched concurrently
+      - Source hosts are probed in parallel, so a whole fleet matrix comes
+        back in about one probe timeout
+    Probes use nc when present, else bash /dev/tcp (TCP) and ping (ICMP).
+    A probe that connects is "allow", one that is refused or times out is
+    "deny". UDP can only be seen as denied when the target answers with an
+    ICMP unreachable (nc -zu), so UDP "allow" means "not rejected".
+"""
+
+from __future__ import annotations
+import json
+import re
+import shlex
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+from app.core import metrics
+from app.core.metrics import record_stage
+from app.core.ssh_session_manager import SSHSessionManager, shared_manager
+from app.core.tracing import traced
+
+
+# ---------- Tunables ----------
+FLOWS_PATH       = Path(__file__).resolve().parents[2] / "db" / "flows.json"
+PROBE_TIMEOUT_S  = 2            # per probe; a dropped packet costs this much
+PROBE_PARALLEL   = 32           # probes in flight at once on one source host
+SOURCE_WORKERS   = 32           # source hosts probed in parallel
+
+PROTOCOLS = ("tcp", "udp", "icmp")
+EXPECT = ("allow", "deny")
+NO_TOOL_RC = 127                # probe tool missing on the source host
+
+TRAFFIC_PROBES_TOTAL = metrics.counter("traffic_probes_total", "Traffic test probes by outcome", ("result",))
+
+_PROBE_LINE = re.compile(r"^probe (\d+) (\d+)$", re.M)
+
+
+class Flow:
+    """One declared expectation: traffic from `src` to `dst` should be allowed or denied."""
+
+    __slots__ = ("src", "dst", "proto", "port", "expect", "name")
+
+    def __init__(self, src: str, dst: str, proto: str = "tcp", port: Optional[int] = None,
+                 expect: str = "allow", name: Optional[str] = None):
+        proto = proto.lower()
+        if proto not in PROTOCOLS:
+            raise ValueError(f"unsupported protocol {proto!r} (use one of {', '.join(PROTOCOLS)})")
+        if expect not in EXPECT:
+            raise ValueError(f"'expect' must be 'allow' or 'deny', not {expect!r}")
+        if proto == "icmp":
+            port = None
+        elif port is None or not 0 < int(port) < 65536:
+            raise ValueError(f"{proto} flow to {dst} needs a port in 1-65535")
+        self.src = str(src)
+        self.dst = str(dst)
+        self.proto = proto
+        self.port = None if port is None else int(port)
+        self.expect = expect
+        self.name = name or self.label
+
+    @property
+    def label(self) -> str:
+        return f"{self.proto}/{self.dst}" + (f":{self.port}" if self.port is not None else "")
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, object]) -> "Flow":
+        try:
+            return cls(d["src"], d["dst"], d.get("proto", "tcp"), d.get("port"), d.get("expect", "allow"),
+                       d.get("name"))
+        except KeyError as e:
+            raise ValueError(f"flow is missing {e}") from None
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"name": self.name, "src": self.src, "dst": self.dst, "proto": self.proto, "port": self.port,
+                "expect": self.expect}
+
+    def __repr__(self):
+        return f"Flow({self.src} -> {self.label} {self.expect})"
+
+
+def parse_flows(items: Iterable[Union[Flow, Dict[str, object]]]) -> List[Flow]:
+    return [f if isinstance(f, Flow) else Flow.from_dict(f) for f in items]
+
+
+def load_flows(path: Union[str, Path, None] = None) -> List[Flow]:
+    """Declared flows from db/flows.json (a list of flow dicts); [] if none are declared."""
+    path = Path(path or FLOWS_PATH)
+    if not path.exists():
+        return []
+    return parse_flows(json.loads(path.read_text()))
+
+
+def flows_for_hosts(flows: Iterable[Flow], hosts: Iterable[str]) -> List[Flow]:
+    """Flows that start or end on one of `hosts` (what an apply wave can have changed)."""
+    hosts = set(hosts)
+    return [f for f in flows if f.src in hosts or f.dst in hosts]
+
+
+# ---------- Probing ----------
+def probe_script(flows: List[Flow], timeout_s: int = PROBE_TIMEOUT_S, parallel: int = PROBE_PARALLEL) -> str:
+    """
+    POSIX shell script probing every flow concurrently (at most `parallel` at
+    a time) and printing "probe <i> <exit code>" per flow, in completion order.
+    """
+    lines = [
+        f"T={int(timeout_s)}",
+        "have() { command -v \"$1\" >/dev/null 2>&1; }",
+        "tcp() { if have nc; then nc -z -w \"$T\" \"$1\" \"$2\"; "
+        "elif have bash && have timeout; then timeout \"$T\" bash -c 'exec 3<>\"/dev/tcp/$0/$1\"' \"$1\" \"$2\"; "
+        f"else return {NO_TOOL_RC}; fi; }}",
+        f"udp() {{ have nc || return {NO_TOOL_RC}; nc -zu -w \"$T\" \"$1\" \"$2\"; }}",
+        f"icmp() {{ have ping || return {NO_TOOL_RC}; ping -c 1 -W \"$T\" \"$1\"; }}",
+        "p() { i=$1; shift; \"$@\" </dev/null >/dev/null 2>&1; echo \"probe $i $?\"; }",
+    ]
+    for i, f in enumerate(flows):
+        port = "" if f.port is None else f" {f.port}"
+        lines.append(f"p {i} {f.proto} {shlex.quote(f.dst)}{port} &")
+        if (i + 1) % parallel == 0:
+            lines.append("wait")
+    lines.append("wait")
+    return "\n".join(lines) + "\n"
+
+
+def parse_probe_output(output: str) -> Dict[int, int]:
+    return {int(m.group(1)): int(m.group(2)) for m in _PROBE_LINE.finditer(output)}
+
+
+def _outcome(flow: Flow, rc: Optional[int]) -> Dict[str, object]:
+    if rc is None or rc == NO_TOOL_RC:
+        observed, result = "error", "error"
+    else:
+        observed = "allow" if rc == 0 else "deny"
+        result = "pass" if observed == flow.expect else "fail"
+    TRAFFIC_PROBES_TOTAL.inc(result)
+    return {**flow.to_dict(), "observed": observed, "result": result, "exit_code": rc}
+
+
+@traced("traffic")
+def probe_host(
+    src: str,
+    flows: List[Flow],
+    user: str,
+    key_path: str,
+    mgr: Optional[SSHSessionManager] = None,
+    port: int = 22,
+    timeout_s: int = PROBE_TIMEOUT_S,
+) -> Dict[str, object]:
+    """
+    Run every flow of source host `src` in one exec. Returns dict(status,
+    message, results=[flow + observed/result], row={flow label: result});
+    status is "failure" if any flow failed or could not be probed.
+    """
+    started = time.perf_counter()
+    mgr = mgr or shared_manager()
+    # exec's timeout only bounds the connect; the run is bounded by the script,
+    # which gives every probe timeout_s (about timeout_s per wave of PROBE_PARALLEL)
+    r = mgr.exec(src, user, key_path, probe_script(flows, timeout_s), port=port)
+    if r["status"] != "success" and not r.get("stdout"):
+        final = {"status": "failure", "message": f"Traffic test could not run on {src}: "
+                                                 f"{r.get('stderr') or r.get('message')}",
+                 "results": [_outcome(f, None) for f in flows]}
+        final["row"] = {o["name"]: o["result"] for o in final["results"]}
+        record_stage(src, "traffic", started, final)
+        return final
+
+    codes = parse_probe_output(r.get("stdout", ""))
+    results = [_outcome(f, codes.get(i)) for i, f in enumerate(flows)]
+    failed = sum(o["result"] == "fail" for o in results)
+    errors = sum(o["result"] == "error" for o in results)
+    final = {
+        "status": "success" if not (failed or errors) else "failure",
+        "message": f"{src}: {len(flows) - failed - errors}/{len(flows)} flows as expected"
+                   + (f", {failed} failed" if failed else "") + (f", {errors} not probed" if errors else ""),
+        "results": results,
+        "row": {o["name"]: o["result"] for o in results},
+    }
+    record_stage(src, "traffic", started, final)
+    return final
+
+
+def run_flows(
+    flows: Iterable[Union[Flow, Dict[str, object]]],
+    user: str,
+    key_path: str,
+    mgr: Optional[SSHSessionManager] = None,
+    workers: int = SOURCE_WORKERS,
+    port: int = 22,
+    timeout_s: int = PROBE_TIMEOUT_S,
+) -> Dict[str, object]:
+    """
+    Probe all flows, one batch per source host, source hosts in parallel.
+    Returns dict(status, message, passed, failed, errors, matrix={src: {flow: result}},
+    results=[...]); status is "success" only if every flow behaved as expected.
+    """
+    by_src: Dict[str, List[Flow]] = {}
+    for f in parse_flows(flows):
+        by_src.setdefault(f.src, []).append(f)
+    if not by_src:
+        return {"status": "success", "message": "No flows to test", "passed": 0, "failed": 0, "errors": 0,
+                "matrix": {}, "results": []}
+
+    def one(src: str) -> Dict[str, object]:
+        return probe_host(src, by_src[src], user, key_path, mgr=mgr, port=port, timeout_s=timeout_s)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(by_src)))) as pool:
+        per_src = dict(zip(by_src, pool.map(one, by_src)))
+    results = [o for r in per_src.values() for o in r["results"]]
+    counts = {k: sum(o["result"] == k for o in results) for k in ("pass", "fail", "error")}
+    return {
+        "status": "success" if counts["pass"] == len(results) else "failure",
+        "message": f"{counts['pass']}/{len(results)} flows as expected, {counts['fail']} failed, "
+                   f"{counts['error']} not probed ({len(by_src)} source hosts)",
+        "passed": counts["pass"],
+        "failed": counts["fail"],
+        "errors": counts["error"],
+        "matrix": {src: r["row"] for src, r in per_src.items()},
+        "results": results,
+    }
+
+
+def format_matrix(report: Dict[str, object]) -> str:
+    """Plain-text pass/fail matrix: one line per source host."""
+    lines = []
+    for src, row in report["matrix"].items():
+        marks = {"pass": "✅", "fail": "❌", "error": "⚠️"}
+        lines.append(f"{src:<16} " + "  ".join(f"{marks[v]} {k}" for k, v in row.items()))
+    return "\n".join(lines)
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    USER = "root"
+    KEY = "/home/glitch/.ssh/id_rsa"
+    FLOWS = [
+        {"src": "10.10.0.50", "dst": "10.10.0.40", "proto": "tcp", "port": 80, "expect": "allow"},
+        {"src": "10.10.0.50", "dst": "10.10.0.40", "proto": "tcp", "port": 22, "expect": "deny"},
+        {"src": "10.10.0.50", "dst": "10.10.0.30", "proto": "icmp", "expect": "allow"},
+        {"src": "10.10.0.30", "dst": "10.10.0.20", "proto": "tcp", "port": 22, "expect": "allow"},
+    ]
+
+    print(probe_script(parse_flows(FLOWS[:2])))
+    t0 = time.perf_counter()
+    report = run_flows(load_flows() or FLOWS, USER, KEY)
+    print(f"🚦 {report['message']} in {time.perf_counter() - t0:.1f}s")
+    print(format_matrix(report))
@@ -0,0 +1,124 @@
+"""
+Module: validator
+Phase: 6
+Milestone: 1
+Step: 3
+Purpose:
+    Local (offline) structural validation of an iptables-restore payload,
+    complementing the remote `iptables-restore --test` in iptables_validate.
+      - Parse errors, unknown tables, built-in chain declarations and policies
+      - Targets that are invalid for the table or built-in chain
+      - Jumps to undeclared chains, unreferenced user chains (warning)
+"""
+
+from __future__ import annotations
+from typing import Dict, List, Union
+
+from app.utils.parser import BUILTIN_CHAINS, ParseError, Ruleset, parse_iptables_save
+
+
+# Terminal/extension targets accepted per table (the kernel refuses DROP in
+# nat, and CT/NOTRACK only register on raw). objective_engine derives the
+# tables and hooks it offers from these two tables.
+TABLE_TARGETS = {
+    "filter": {"ACCEPT", "DROP", "REJECT", "RETURN", "LOG", "NFLOG", "QUEUE", "NFQUEUE",
+               "CONNMARK", "MARK", "AUDIT", "TCPMSS"},
+    "nat":    {"ACCEPT", "RETURN", "LOG", "NFLOG", "DNAT", "SNAT", "MASQUERADE",
+               "REDIRECT", "NETMAP", "MARK", "CONNMARK"},
+    "mangle": {"ACCEPT", "DROP", "RETURN", "LOG", "NFLOG", "MARK", "CONNMARK", "TOS", "DSCP",
+               "TTL", "TCPMSS", "CLASSIFY", "TPROXY", "CHECKSUM", "HMARK", "TEE", "QUEUE", "NFQUEUE"},
+    "raw":    {"ACCEPT", "DROP", "RETURN", "LOG", "NFLOG", "NOTRACK", "CT", "TRACE", "MARK"},
+}
+
+# Built-in chains a target is restricted to (user chains are not checked)
+CHAIN_RESTRICTED_TARGETS = {
+    "DNAT":       {"PREROUTING", "OUTPUT"},
+    "REDIRECT":   {"PREROUTING", "OUTPUT"},
+    "SNAT":       {"POSTROUTING", "INPUT"},
+    "MASQUERADE": {"POSTROUTING"},
+    "TPROXY":     {"PREROUTING"},
+    "REJECT":     {"INPUT", "FORWARD", "OUTPUT"},
+    "TCPMSS":     {"FORWARD", "OUTPUT", "POSTROUTING"},
+}
+
+POLICIES = {"ACCEPT", "DROP"}
+
+
+def validate_ruleset(ruleset: Union[str, Ruleset]) -> Dict[str, object]:
+    """
+    Validate a ruleset locally, without root or a remote host.
+
+    Returns:
+        dict: {"status": "success"|"failure", "message": str,
+               "errors": [str, ...], "warnings": [str, ...]}
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+
+    if isinstance(ruleset, str):
+        try:
+            ruleset = parse_iptables_save(ruleset)
+        except ParseError as e:
+            return _result([f"parse error: {e}"], warnings)
+
+    for tname, table in ruleset.tables.items():
+        valid_targets = TABLE_TARGETS.get(tname)
+        if valid_targets is None:
+            errors.append(f"unknown table {tname!r}")
+            continue
+
+        builtins = BUILTIN_CHAINS[tname]
+        referenced = set()
+        for cname, chain in table.chains.items():
+            if chain.builtin:
+                if cname not in builtins:
+                    errors.append(f"{tname}/{cname}: policy set on a non built-in chain")
+                elif chain.policy not in POLICIES:
+                    errors.append(f"{tname}/{cname}: invalid policy {chain.policy!r}")
+            elif cname in builtins:
+                errors.append(f"{tname}/{cname}: built-in chain declared without a policy")
+
+            for pos, rule in enumerate(chain.rules, 1):
+                target = rule.target
+                if target is None:
+                    continue
+                where = f"{tname}/{cname} rule {pos}"
+                if target in table.chains and target not in builtins:
+                    referenced.add(target)
+                    continue
+                if target not in valid_targets:
+                    if target.isupper() and target not in table.chains:
+                        errors.append(f"{where}: target {target!r} is not valid in table {tname!r}")
+                    else:
+                        errors.append(f"{where}: jump to undeclared chain {target!r}")
+                    continue
+                allowed = CHAIN_RESTRICTED_TARGETS.get(target)
+                if allowed and cname in builtins and cname not in allowed:
+                    errors.append(f"{where}: {target} is only valid in {', '.join(sorted(allowed))}")
+
+        for cname, chain in table.chains.items():
+            if not chain.builtin and cname not in referenced:
+                warnings.append(f"{tname}/{cname}: user chain is never referenced")
+
+    return _result(errors, warnings)
+
+
+def _result(errors: List[str], warnings: List[str]) -> Dict[str, object]:
+    if errors:
+        message = f"{len(errors)} error(s) in ruleset: {errors[0]}"
+    else:
+        message = f"Ruleset OK ({len(warnings)} warning(s))"
+    return {
+        "status": "failure" if errors else "success",
+        "message": message,
+        "errors": errors,
+        "warnings": warnings,
+    }
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    GOOD = "*filter\n:INPUT DROP [0:0]\n:FORWARD DROP [0:0]\n:OUTPUT ACCEPT [0:0]\n-A INPUT -p tcp --dport 22 -j ACCEPT\nCOMMIT\n"
+    BAD = "*filter\n:INPUT DROP [0:0]\n:ORPHAN - [0:0]\n-A INPUT -j DNAT --to-destination 1.2.3.4\n-A INPUT -j missing\nCOMMIT\n"
+    print(validate_ruleset(GOOD))
+    print(validate_ruleset(BAD))
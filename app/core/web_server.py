@@ -0,0 +1,271 @@
+"""
+Module: web_server
+Phase: 6
+Milestone: 2
+Step: 2
+Purpose:
+    Production serving support for the Flask backend (main_process).
+      - Response compression (brotli when installed, gzip otherwise)
+      - ETag / If-None-Match handling that survives compression
+      - Multi-threaded / multi-worker server entry point
+        (gunicorn → waitress → werkzeug, whichever is installed)
+      - Graceful shutdown hooks run once on SIGTERM/SIGINT or, once serving
+        has started, at interpreter exit
+"""
+
+from __future__ import annotations
+import atexit
+import gzip
+import hashlib
+import os
+import signal
+import sys
+import threading
+from typing import Callable, Dict, List, Optional
+
+from flask import Flask, Response, request
+
+try:  # optional: better ratio than gzip for JSON and iptables-save text
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+
+# ---------- Tunables ----------
+COMPRESS_MIN_BYTES   = 1024                 # below this the headers cost more than they save
+COMPRESS_MAX_BYTES   = 64 * 1024 * 1024     # never buffer more than this to compress it
+GZIP_LEVEL           = 6
+BROTLI_QUALITY       = 5                    # 4-6 is the usual speed/ratio sweet spot for dynamic content
+STATIC_MAX_AGE_S     = 86400                # cacheable static assets
+SERVER_THREADS       = 16                   # request threads per worker
+SERVER_WORKERS       = 1                    # processes; jobs/sessions live in-process, see serve()
+COMPRESSIBLE_TYPES   = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+_ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+# ---------- Compression ----------
+def _accepted_codings(accept: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}; a malformed q-value counts as q=0."""
+    out: Dict[str, float] = {}
+    for item in accept.lower().split(","):
+        coding, *params = (p.strip() for p in item.split(";"))
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    q = 0.0
+        out[coding] = q
+    return out
+
+
+def _pick_encoding(accept: str) -> Optional[str]:
+    """The client's most preferred coding we can produce (brotli on ties); "q=0" means refused."""
+    codings = _accepted_codings(accept)
+    wildcard = codings.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in ("br", "gzip") if brotli is not None else ("gzip",):
+        q = codings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _strip_suffix(tag: str) -> str:
+    for suffix in _ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[: -len(suffix) - 1] + '"'
+    return tag
+
+
+def install_compression(app: Flask):
+    """
+    Compress eligible responses after the view has run.
+    Streaming responses (SSE, large files) are left untouched, and ETags get an
+    encoding suffix so caches never mix encodings; the suffix is stripped from
+    If-None-Match before views see it, so revalidation still returns 304.
+    """
+
+    @app.before_request
+    def _normalize_if_none_match():
+        inm = request.environ.get("HTTP_IF_NONE_MATCH")
+        if inm:
+            request.environ["HTTP_IF_NONE_MATCH"] = ", ".join(_strip_suffix(t.strip()) for t in inm.split(","))
+
+    @app.after_request
+    def _compress(response: Response) -> Response:
+        response.vary.add("Accept-Encoding")
+        encoding = _pick_encoding(request.headers.get("Accept-Encoding", ""))
+        if (
+            encoding is None
+            or response.status_code != 200
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)
+            or response.mimetype == "text/event-stream"
+        ):
+            return response
+        length = response.content_length
+        if length is None or not COMPRESS_MIN_BYTES <= length <= COMPRESS_MAX_BYTES:
+            return response
+
+        response.direct_passthrough = False  # send_file responses: read the (bounded) file
+        data = response.get_data()
+        if encoding == "br":
+            body = brotli.compress(data, quality=BROTLI_QUALITY)
+        else:
+            body = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+        if len(body) >= len(data):
+            return response
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+        return response
+
+
+# ---------- Conditional responses ----------
+def content_etag(body: bytes) -> str:
+    """Strong validator for a response body."""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def conditional(body_fn: Callable[[], bytes], mimetype: str, etag: Optional[str] = None,
+                weak: bool = False, max_age: int = 0) -> Response:
+    """
+    Build a cacheable response, answering 304 when the client already has it.
+    If `etag` is given (e.g. from file size + mtime) the body is only produced
+    on a miss; otherwise it is hashed to derive the validator.
+    """
+    body = None
+    if etag is None:
+        body = body_fn()
+        etag = content_etag(body)
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(body if body is not None else body_fn(), mimetype=mimetype)
+    resp.set_etag(etag, weak=weak)
+    resp.cache_control.max_age = max_age
+    resp.cache_control.no_cache = max_age == 0 or None
+    return resp
+
+
+# ---------- Graceful shutdown ----------
+_shutdown_hooks: List[Callable[[], None]] = []
+_shutdown_lock = threading.Lock()
+_shutdown_done = False
+
+
+def on_shutdown(fn: Callable[[], None]) -> Callable[[], None]:
+    """Register `fn` to run once when the server stops (usable as a decorator)."""
+    _shutdown_hooks.append(fn)
+    return fn
+
+
+def run_shutdown_hooks():
+    global _shutdown_done
+    with _shutdown_lock:
+        if _shutdown_done:
+            return
+        _shutdown_done = True
+    for fn in reversed(_shutdown_hooks):
+        try:
+            fn()
+        except Exception as e:
+            print(f"⚠️ Shutdown hook {getattr(fn, '__name__', fn)} failed: {e}")
+
+
+def _install_signal_handlers():
+    def handler(signum, frame):
+        print(f"🛑 Received signal {signum}, draining...")
+        run_shutdown_hooks()
+        sys.exit(0)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, handler)
+
+
+# ---------- Server entry point ----------
+def _serve_gunicorn(app: Flask, host: str, port: int, workers: int, threads: int):
+    from gunicorn.app.base import BaseApplication  # type: ignore
+
+    class _App(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", threads)
+            self.cfg.set("timeout", 0)             # SSE streams and long jobs hold connections
+            self.cfg.set("graceful_timeout", 30)
+            self.cfg.set("worker_exit", lambda server, worker: run_shutdown_hooks())
+
+        def load(self):
+            return app
+
+    _App().run()
+
+
+def _serve_waitress(app: Flask, host: str, port: int, threads: int):
+    from waitress import serve as waitress_serve  # type: ignore
+
+    _install_signal_handlers()
+    waitress_serve(app, host=host, port=port, threads=threads, channel_timeout=3600)
+
+
+def _serve_werkzeug(app: Flask, host: str, port: int):
+    from werkzeug.serving import run_simple
+
+    _install_signal_handlers()
+    run_simple(host, port, app, threaded=True, use_reloader=False, use_debugger=False)
+
+
+def serve(app: Flask, host: str = "0.0.0.0", port: int = 5000, server: str = "auto",
+          workers: int = SERVER_WORKERS, threads: int = SERVER_THREADS) -> dict:
+    """
+    Run `app` with a production server.
+        server="auto"     → gunicorn (POSIX) if installed, else waitress, else werkzeug
+    Background jobs and SSH sessions are per process, so keep workers=1 unless a
+    load balancer pins each client to one worker; threads scale the request side.
+    """
+    # Only a serving process owns the hooks; merely importing this module (tests, CLI) must not
+    atexit.register(run_shutdown_hooks)
+    order = {"auto": ["gunicorn", "waitress", "werkzeug"]}.get(server, [server])
+    if os.name != "posix" and "gunicorn" in order and server == "auto":
+        order.remove("gunicorn")
+    for name in order:
+        try:
+            print(f"🚀 Serving on {host}:{port} with {name} ({workers} worker(s) × {threads} threads)")
+            if name == "gunicorn":
+                _serve_gunicorn(app, host, port, workers, threads)
+            elif name == "waitress":
+                _serve_waitress(app, host, port, threads)
+            elif name == "werkzeug":
+                _serve_werkzeug(app, host, port)
+            else:
+                return {"status": "failure", "message": f"Unknown server '{name}'"}
+            return {"status": "success", "message": f"{name} stopped"}
+        except ImportError:
+            print(f"⚠️ {name} is not installed")
+    return {"status": "failure", "message": f"None of {order} is available"}
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    demo = Flask(__name__)
+    install_compression(demo)
+
+    @demo.route("/big")
+    def big():
+        return conditional(lambda: b"-A INPUT -p tcp --dport 22 -j ACCEPT\n" * 500, "text/plain")
+
+    client = demo.test_client()
+    r1 = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    r2 = client.get("/big", headers={"Accept-Encoding": "gzip", "If-None-Match": r1.headers["ETag"]})
+    print(f"✅ {r1.status_code} {r1.headers.get('Content-Encoding')} {len(r1.data)} bytes, ETag {r1.headers['ETag']}")
+    print(f"✅ revalidation → {r2.status_code}")
@@ -0,0 +1,274 @@
+"""
+Module: file_manager
+Phase: 6
+Milestone: 6
+Step: 4
+Purpose:
+    Large ruleset/snapshot/log files without reading them into memory.
+      - MappedFile: read-only mmap with zero-copy line iteration, a line
+        offset index for paging, tail and substring search, so multi-hundred-MB
+        archives can be browsed while only the touched pages are resident
+      - atomic_write(): temp file + fsync + rename (+ directory fsync)
+      - file_digest()/fingerprint(): content hash and cheap change validator
+      - parse_ruleset_file(): iptables-save file → Ruleset, streamed into the parser
+"""
+
+from __future__ import annotations
+import bisect
+import codecs
+import hashlib
+import mmap
+import os
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+from app.utils.parser import Ruleset, RulesetParser
+
+
+# ---------- Tunables ----------
+HASH_CHUNK   = 1 << 20       # bytes hashed per update() (a memoryview slice, no copy)
+DECODE_CHUNK = 1 << 20       # bytes decoded at a time by text_lines()
+
+PathLike = Union[str, os.PathLike]
+
+
+class MappedFile:
+    """
+    Read-only memory map of a file.
+        with MappedFile("snapshots.rules") as mf:
+            for line in mf.lines(): ...            # memoryview per line, no copy
+            mf.read_lines(1_000_000, 50)           # one page, via the line index
+            mf.tail(100)                           # last lines, without an index
+    Memoryviews handed out must be released before close(); if some are still
+    alive the map is left for the garbage collector instead.
+    """
+
+    __slots__ = ("path", "size", "_f", "_mm", "_index")
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        self._f = open(self.path, "rb")
+        self.size = os.fstat(self._f.fileno()).st_size
+        # mmap cannot map an empty file
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._index: Optional[array] = None
+
+    def __enter__(self) -> "MappedFile":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass
+            self._mm = None
+        self._f.close()
+
+    @property
+    def buffer(self) -> Union[mmap.mmap, bytes]:
+        return self._mm if self._mm is not None else b""
+
+    # ---------- Lines ----------
+    def lines(self, start: int = 0, end: Optional[int] = None) -> Iterator[memoryview]:
+        """Lines in byte range [start, end) as memoryviews into the map (newline stripped)."""
+        if self._mm is None:
+            return
+        mm, view = self._mm, memoryview(self._mm)
+        end = self.size if end is None else min(end, self.size)
+        pos = start
+        try:
+            while pos < end:
+                nl = mm.find(b"\n", pos, end)
+                if nl < 0:
+                    yield view[pos:end]
+                    return
+                yield view[pos:nl]
+                pos = nl + 1
+        finally:
+            view.release()
+
+    def text_lines(self, encoding: str = "utf-8", start: int = 0) -> Iterator[str]:
+        """Decoded lines, DECODE_CHUNK bytes at a time (memory stays bounded whatever the file size)."""
+        if self._mm is None:
+            return
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        tail = ""
+        for pos in range(start, self.size, DECODE_CHUNK):
+            text = tail + decoder.decode(self._mm[pos:pos + DECODE_CHUNK])
+            lines = text.split("\n")
+            tail = lines.pop()
+            yield from lines
+        tail += decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    # ---------- Paging ----------
+    def line_offsets(self) -> array:
+        """Start offset of every line (built once, 8 bytes per line)."""
+        if self._index is None:
+            index = array("Q")
+            if self._mm is not None:
+                mm, find, append = self._mm, self._mm.find, index.append
+                pos = 0
+                while pos < self.size:
+                    append(pos)
+                    nl = find(b"\n", pos)
+                    if nl < 0:
+                        break
+                    pos = nl + 1
+            self._index = index
+        return self._index
+
+    def line_count(self) -> int:
+        return len(self.line_offsets())
+
+    def line_number(self, offset: int) -> int:
+        """0-based number of the line containing byte `offset`."""
+        return bisect.bisect_right(self.line_offsets(), offset) - 1
+
+    def read_lines(self, first: int, count: int, encoding: str = "utf-8") -> List[str]:
+        """Lines [first, first+count) — only their pages are touched."""
+        index = self.line_offsets()
+        if first >= len(index) or count <= 0:
+            return []
+        last = first + count
+        end = index[last] if last < len(index) else self.size
+        return self._mm[index[first]:end].decode(encoding, errors="replace").splitlines()
+
+    def tail(self, n: int, encoding: str = "utf-8") -> List[str]:
+        """Last `n` lines, found by scanning backwards from the end (no index needed)."""
+        if self._mm is None or n <= 0:
+            return []
+        mm = self._mm
+        end = self.size - 1 if mm[self.size - 1:self.size] == b"\n" else self.size
+        pos = end
+        for _ in range(n):
+            nl = mm.rfind(b"\n", 0, pos)
+            if nl < 0:
+                pos = -1
+                break
+            pos = nl
+            if pos == 0:
+                break
+        return mm[pos + 1:end].decode(encoding, errors="replace").split("\n") if end > pos + 1 else []
+
+    def find_lines(self, needle: Union[bytes, str], limit: int = 100, start: int = 0,
+                   encoding: str = "utf-8") -> List[Tuple[int, str]]:
+        """(line number, line) of up to `limit` lines containing `needle`, from byte `start` on."""
+        if self._mm is None:
+            return []
+        if isinstance(needle, str):
+            needle = needle.encode(encoding)
+        mm, out, pos = self._mm, [], start
+        while len(out) < limit:
+            hit = mm.find(needle, pos)
+            if hit < 0:
+                break
+            line_start = mm.rfind(b"\n", 0, hit) + 1
+            line_end = mm.find(b"\n", hit)
+            line_end = self.size if line_end < 0 else line_end
+            out.append((self.line_number(line_start), mm[line_start:line_end].decode(encoding, errors="replace")))
+            pos = line_end + 1
+        return out
+
+    # ---------- Hashing ----------
+    def digest(self, algorithm: str = "sha256") -> str:
+        h = hashlib.new(algorithm)
+        if self._mm is not None:
+            with memoryview(self._mm) as view:
+                for pos in range(0, self.size, HASH_CHUNK):
+                    h.update(view[pos:pos + HASH_CHUNK])
+        return h.hexdigest()
+
+
+def file_digest(path: PathLike, algorithm: str = "sha256") -> str:
+    with MappedFile(path) as mf:
+        return mf.digest(algorithm)
+
+
+def fingerprint(path: PathLike) -> str:
+    """Cheap validator: size + mtime in ns (changes on every write, no read needed)."""
+    st = os.stat(path)
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def iter_lines(path: PathLike, encoding: str = "utf-8") -> Iterator[str]:
+    """Decoded lines of a file, streamed from a memory map."""
+    with MappedFile(path) as mf:
+        yield from mf.text_lines(encoding)
+
+
+def parse_ruleset_file(path: PathLike) -> Ruleset:
+    """Parse an iptables-save file without holding its text in memory."""
+    parser = RulesetParser()
+    parser.feed(iter_lines(path))
+    return parser.close()
+
+
+def atomic_write(path: PathLike, data: Union[bytes, str], fsync: bool = True,
+                 mode: Optional[int] = None) -> None:
+    """
+    Replace `path` with `data` so readers see the old or the new content,
+    never a torn file. With fsync=True the data and the rename are flushed
+    to disk before returning (crash-safe, not just atomic).
+    """
+    path = os.fspath(path)
+    directory = os.path.dirname(path) or "."
+    if isinstance(data, str):
+        data = data.encode()
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        dfd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import sys
+    import time
+
+    sys.path.append(str(Path(__file__).resolve().parents[2] / "tests" / "benchmarks"))
+    from fleet_generator import generate_ruleset
+
+    d = tempfile.mkdtemp(prefix="file-manager-")
+    path = os.path.join(d, "archive.rules")
+    with open(path, "w") as f:
+        chunk = generate_ruleset(20_000, seed=5)
+        for _ in range(20):
+            f.write(chunk)
+    t0 = time.perf_counter()
+    with MappedFile(path) as mf:
+        n = mf.line_count()
+        page = mf.read_lines(n // 2, 3)
+        hits = mf.find_lines("--dport 443", limit=3)
+        print(f"📄 {mf.size / 1e6:.0f} MB, {n} lines, indexed + paged in {time.perf_counter() - t0:.2f}s")
+        print(f"   middle: {page[0][:60]}...  tail: {mf.tail(1)}  hits: {[h[0] for h in hits]}")
+    t0 = time.perf_counter()
+    print(f"🔑 sha256 {file_digest(path)[:16]}... in {time.perf_counter() - t0:.2f}s")
+    t0 = time.perf_counter()
+    atomic_write(os.path.join(d, "config.json"), "{}")
+    print(f"💾 atomic_write in {(time.perf_counter() - t0) * 1000:.1f} ms")
@@ -0,0 +1,50 @@
+"""
+Module: lazy_import
+Phase: 6
+Milestone: 6
+Step: 8
+Purpose:
+    Defer heavy third-party imports (paramiko + cryptography, numpy) until a
+    module attribute is first used, so importing app.core for --help,
+    log-only CLI commands or the web process start-up does not pay for them.
+        paramiko = lazy_import("paramiko")     # nothing loaded yet
+        paramiko.SSHClient()                   # loads paramiko here
+    Annotation-only uses are free under `from __future__ import annotations`.
+"""
+
+from __future__ import annotations
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    `name` as a module object whose body runs on first attribute access.
+    Returns the real module if it is already imported; raises ImportError
+    straight away if it is not installed.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import time
+
+    t0 = time.perf_counter()
+    paramiko = lazy_import("paramiko")
+    print(f"💤 lazy_import('paramiko') in {(time.perf_counter() - t0) * 1000:.2f} ms")
+    t0 = time.perf_counter()
+    paramiko.SSHClient
+    print(f"📦 first attribute access (real import) in {(time.perf_counter() - t0) * 1000:.0f} ms")
@@ -0,0 +1,388 @@
+"""
+Module: parser
+Phase: 6
+Milestone: 1
+Step: 1
+Purpose:
+    Parse `iptables-save` output into a structured ruleset and back.
+      - Tables → chains (policy + counters) → rules (tokens + common match fields)
+      - Lossless serialization back to iptables-restore text
+      - Chain-level diff between two rulesets
+      - Works on any iterable of lines, so callers can stream large dumps
+"""
+
+from __future__ import annotations
+import re
+import shlex
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+BUILTIN_CHAINS = {
+    "filter": ["INPUT", "FORWARD", "OUTPUT"],
+    "nat":    ["PREROUTING", "INPUT", "OUTPUT", "POSTROUTING"],
+    "mangle": ["PREROUTING", "INPUT", "FORWARD", "OUTPUT", "POSTROUTING"],
+    "raw":    ["PREROUTING", "OUTPUT"],
+}
+
+_COUNTERS_RE = re.compile(r"^\[(\d+):(\d+)\]$")
+_JUMP_OPTS = frozenset(("-j", "--jump", "-g", "--goto"))
+_MATCH_OPTS = frozenset(("-m", "--match"))
+
+# Options whose value is copied onto a Rule attribute
+_FIELD_OPTS = {
+    "-p": "protocol", "--protocol": "protocol",
+    "-s": "source", "--source": "source",
+    "-d": "destination", "--destination": "destination",
+    "--sport": "sport", "--source-port": "sport",
+    "--dport": "dport", "--destination-port": "dport",
+    "--sports": "sport", "--dports": "dport",
+    "-i": "in_iface", "--in-interface": "in_iface",
+    "-o": "out_iface", "--out-interface": "out_iface",
+    "--comment": "comment",
+}
+
+
+class ParseError(ValueError):
+    """Raised when iptables-save text cannot be parsed."""
+
+
+def _scan(args: List[str]) -> Tuple[List[Tuple[str, int]], Optional[int], List[int], List[str]]:
+    """
+    Where a rule's fields sit in its tokens: ([(attr, index)], target index,
+    [-m module indexes], [negated attrs]). Positions depend only on the rule's
+    shape, so they can be stored once and reused (see app/utils/snapshot).
+    """
+    fields: List[Tuple[str, int]] = []
+    matches: List[int] = []
+    negated: List[str] = []
+    n = len(args)
+    i = 0
+    negate = False
+    while i < n:
+        tok = args[i]
+        if tok == "!":
+            negate = True
+            i += 1
+            continue
+        if tok in _JUMP_OPTS:
+            return fields, (i + 1 if i + 1 < n else None), matches, negated
+        if tok in _MATCH_OPTS and i + 1 < n:
+            matches.append(i + 1)
+            i += 2
+            negate = False
+            continue
+        attr = _FIELD_OPTS.get(tok)
+        if attr and i + 1 < n:
+            fields.append((attr, i + 1))
+            if negate:
+                negated.append(attr)
+            i += 2
+            negate = False
+            continue
+        negate = False
+        i += 1
+    return fields, None, matches, negated
+
+
+class Rule:
+    """A single `-A CHAIN ...` line, tokenized, with common matches extracted."""
+
+    __slots__ = (
+        "chain", "args", "target", "target_args", "protocol", "source", "destination",
+        "sport", "dport", "in_iface", "out_iface", "comment", "matches",
+        "packets", "bytes", "negated",
+    )
+
+    def __init__(self, chain: str, args: List[str], packets: Optional[int] = None, bytes_: Optional[int] = None):
+        self.chain = chain
+        self.args = args
+        self.packets = packets
+        self.bytes = bytes_
+        self.target: Optional[str] = None
+        self.target_args: List[str] = []
+        self.protocol: Optional[str] = None
+        self.source: Optional[str] = None
+        self.destination: Optional[str] = None
+        self.sport: Optional[str] = None
+        self.dport: Optional[str] = None
+        self.in_iface: Optional[str] = None
+        self.out_iface: Optional[str] = None
+        self.comment: Optional[str] = None
+        self.matches: List[str] = []        # -m modules in use
+        self.negated: set = set()           # option names preceded by "!"
+        self._extract()
+
+    def _extract(self):
+        args = self.args
+        fields, target, matches, negated = _scan(args)
+        for attr, i in fields:
+            setattr(self, attr, args[i])
+        if target is not None:
+            self.target = args[target]
+            self.target_args = args[target + 1:]
+        self.matches = [args[i] for i in matches]
+        self.negated = set(negated)
+
+    def spec(self) -> str:
+        """Rule specification without the `-A CHAIN` prefix (iptables-save quoting)."""
+        return " ".join(_quote(a) for a in self.args)
+
+    def to_line(self, counters: bool = True) -> str:
+        prefix = ""
+        if counters and self.packets is not None:
+            prefix = f"[{self.packets}:{self.bytes}] "
+        body = self.spec()
+        return f"{prefix}-A {self.chain} {body}" if body else f"{prefix}-A {self.chain}"
+
+    def __repr__(self):
+        return f"Rule({self.chain}: {self.spec()})"
+
+
+class Chain:
+    """A chain declaration (`:NAME POLICY [pkts:bytes]`) and its ordered rules."""
+
+    __slots__ = ("name", "policy", "packets", "bytes", "rules")
+
+    def __init__(self, name: str, policy: str = "-", packets: int = 0, bytes_: int = 0):
+        self.name = name
+        self.policy = policy
+        self.packets = packets
+        self.bytes = bytes_
+        self.rules: List[Rule] = []
+
+    @property
+    def builtin(self) -> bool:
+        return self.policy != "-"
+
+    def header(self, counters: bool = True) -> str:
+        if counters:
+            return f":{self.name} {self.policy} [{self.packets}:{self.bytes}]"
+        return f":{self.name} {self.policy}"
+
+    def __repr__(self):
+        return f"Chain({self.name}, policy={self.policy}, rules={len(self.rules)})"
+
+
+class Table:
+    """One `*table ... COMMIT` block."""
+
+    __slots__ = ("name", "chains")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.chains: Dict[str, Chain] = {}
+
+    def rules(self) -> List[Rule]:
+        return [r for c in self.chains.values() for r in c.rules]
+
+    def __repr__(self):
+        return f"Table({self.name}, chains={list(self.chains)})"
+
+
+class Ruleset:
+    """Parsed iptables-save output: ordered tables keyed by name."""
+
+    __slots__ = ("tables",)
+
+    def __init__(self):
+        self.tables: Dict[str, Table] = {}
+
+    def table(self, name: str) -> Table:
+        t = self.tables.get(name)
+        if t is None:
+            t = self.tables[name] = Table(name)
+        return t
+
+    def rule_count(self) -> int:
+        return sum(len(c.rules) for t in self.tables.values() for c in t.chains.values())
+
+    def __repr__(self):
+        return f"Ruleset(tables={list(self.tables)}, rules={self.rule_count()})"
+
+
+# ---------- Parsing ----------
+def _quote(tok: str) -> str:
+    if tok == "" or any(ch in tok for ch in " \t\"'"):
+        return '"' + tok.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return tok
+
+
+def _split(line: str) -> List[str]:
+    # Fast path: most rules carry no quoting at all
+    if '"' not in line and "'" not in line:
+        return line.split()
+    return shlex.split(line)
+
+
+class RulesetParser:
+    """
+    Incremental iptables-save parser: `feed()` batches of lines as they arrive
+    (e.g. decompressed chunks of a remote dump), then `close()` for the Ruleset.
+    """
+
+    __slots__ = ("ruleset", "_table", "_lineno")
+
+    def __init__(self):
+        self.ruleset = Ruleset()
+        self._table: Optional[Table] = None
+        self._lineno = 0
+
+    def feed(self, lines: Iterable[str]):
+        rs = self.ruleset
+        table = self._table
+        lineno = self._lineno
+        try:
+            for raw in lines:
+                lineno += 1
+                line = raw.strip()
+                if not line or line[0] == "#":
+                    continue
+
+                head = line[0]
+                if head == "*":
+                    table = rs.table(line[1:])
+                    continue
+                if line == "COMMIT":
+                    table = None
+                    continue
+                if table is None:
+                    raise ParseError(f"line {lineno}: content outside of a *table block: {line!r}")
+
+                if head == ":":
+                    parts = line[1:].split()
+                    if len(parts) < 2:
+                        raise ParseError(f"line {lineno}: malformed chain declaration: {line!r}")
+                    pkts, byts = 0, 0
+                    if len(parts) > 2:
+                        m = _COUNTERS_RE.match(parts[2])
+                        if m:
+                            pkts, byts = int(m.group(1)), int(m.group(2))
+                    table.chains[parts[0]] = Chain(parts[0], parts[1], pkts, byts)
+                    continue
+
+                packets = bytes_ = None
+                if head == "[":
+                    end = line.find("]")
+                    m = _COUNTERS_RE.match(line[:end + 1])
+                    if not m:
+                        raise ParseError(f"line {lineno}: malformed counters: {line!r}")
+                    packets, bytes_ = int(m.group(1)), int(m.group(2))
+                    line = line[end + 1:].lstrip()
+
+                tokens = _split(line)
+                if len(tokens) < 2 or tokens[0] not in ("-A", "--append"):
+                    raise ParseError(f"line {lineno}: unsupported statement: {line!r}")
+                chain_name = tokens[1]
+                chain = table.chains.get(chain_name)
+                if chain is None:
+                    raise ParseError(f"line {lineno}: rule for undeclared chain {chain_name!r}")
+                chain.rules.append(Rule(chain_name, tokens[2:], packets, bytes_))
+        finally:
+            self._table = table
+            self._lineno = lineno
+
+    def close(self) -> Ruleset:
+        if self._table is not None:
+            raise ParseError(f"table {self._table.name!r} is missing COMMIT")
+        return self.ruleset
+
+
+def parse_iptables_save_lines(lines: Iterable[str]) -> Ruleset:
+    """
+    Parse iptables-save output from any iterable of lines (file, generator, list).
+    Comments (`# Generated by ...`) and blank lines are ignored.
+    """
+    p = RulesetParser()
+    p.feed(lines)
+    return p.close()
+
+
+def parse_iptables_save(text: str) -> Ruleset:
+    """Parse a complete iptables-save dump held in a string."""
+    return parse_iptables_save_lines(text.splitlines())
+
+
+def parse_config_json(data: Dict[str, str]) -> Ruleset:
+    """Parse the `{table: iptables-save text}` layout used by db/config.json."""
+    lines: List[str] = []
+    for text in data.values():
+        if text:
+            lines.extend(text.splitlines())
+    return parse_iptables_save_lines(lines)
+
+
+# ---------- Serialization ----------
+def serialize_table(table: Table, counters: bool = True) -> str:
+    out = [f"*{table.name}"]
+    out.extend(c.header(counters) for c in table.chains.values())
+    for c in table.chains.values():
+        out.extend(r.to_line(counters) for r in c.rules)
+    out.append("COMMIT")
+    return "\n".join(out) + "\n"
+
+
+def serialize_ruleset(ruleset: Ruleset, counters: bool = True) -> str:
+    """Render a Ruleset as iptables-restore input."""
+    return "".join(serialize_table(t, counters) for t in ruleset.tables.values())
+
+
+# ---------- Diff ----------
+def diff_rulesets(old: Ruleset, new: Ruleset) -> Dict[str, Dict[str, Dict[str, object]]]:
+    """
+    Compare two rulesets chain by chain. Only changed chains are reported:
+        {table: {chain: {"status": "added"|"removed"|"changed",
+                         "policy": (old, new) | None,
+                         "added": [spec, ...], "removed": [spec, ...],
+                         "reordered": bool}}}
+    Rules are compared by specification (counters ignored), as multisets.
+    """
+    out: Dict[str, Dict[str, Dict[str, object]]] = {}
+    for tname in list(old.tables) + [t for t in new.tables if t not in old.tables]:
+        ot = old.tables.get(tname)
+        nt = new.tables.get(tname)
+        ochains = ot.chains if ot else {}
+        nchains = nt.chains if nt else {}
+        changes: Dict[str, Dict[str, object]] = {}
+
+        for cname in list(ochains) + [c for c in nchains if c not in ochains]:
+            oc, nc = ochains.get(cname), nchains.get(cname)
+            ospecs = [r.spec() for r in oc.rules] if oc else []
+            nspecs = [r.spec() for r in nc.rules] if nc else []
+            opol = oc.policy if oc else None
+            npol = nc.policy if nc else None
+            if ospecs == nspecs and opol == npol:
+                continue
+
+            ocount, ncount = Counter(ospecs), Counter(nspecs)
+            changes[cname] = {
+                "status": "added" if oc is None else "removed" if nc is None else "changed",
+                "policy": (opol, npol) if opol != npol else None,
+                "added": list((ncount - ocount).elements()),
+                "removed": list((ocount - ncount).elements()),
+                "reordered": ocount == ncount and ospecs != nspecs,
+            }
+        if changes:
+            out[tname] = changes
+    return out
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    SAMPLE = (
+        "*filter\n"
+        ":INPUT DROP [0:0]\n"
+        ":FORWARD ACCEPT [0:0]\n"
+        ":OUTPUT ACCEPT [0:0]\n"
+        ":SSH - [0:0]\n"
+        "-A INPUT -p tcp -m tcp --dport 22 -j SSH\n"
+        "-A INPUT -s 10.10.0.0/24 -p icmp -m comment --comment \"lab ping\" -j ACCEPT\n"
+        "-A SSH -s 10.10.0.30/32 -j ACCEPT\n"
+        "COMMIT\n"
+    )
+    rs = parse_iptables_save(SAMPLE)
+    print(rs)
+    for r in rs.tables["filter"].rules():
+        print(" ", r, "→", r.target, r.protocol, r.source, r.dport, r.comment)
+    print("Round-trip OK:", serialize_ruleset(rs) == SAMPLE)
+    print("Diff:", diff_rulesets(rs, parse_iptables_save(SAMPLE.replace("10.10.0.30", "10.10.0.31"))))
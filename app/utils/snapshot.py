@@ -0,0 +1,407 @@
+"""
+Module: snapshot
+Phase: 6
+Milestone: 6
+Step: 5
+Purpose:
+    Compact binary ruleset snapshots (db/config.snap), replacing JSON-wrapped
+    iptables-save text for large multi-table states.
+      - String table: every distinct token (matches, targets, addresses...)
+        stored once, rules are arrays of token ids
+      - Rule templates: where target/fields/matches sit in a rule's tokens is
+        stored once per rule shape, so loading skips re-tokenizing and
+        re-extracting every rule
+      - Varint-encoded counters and chain index with byte offsets, so one
+        chain can be read without decoding the rest
+      - Round-trips exactly: serialize_ruleset(load(save(rs))) == serialize_ruleset(rs)
+
+    Layout (little-endian):
+        magic "IPTSNAP1" | u8 token width (2|4) | u32 x4 section lengths
+        strings   utf-8, "\\0"-separated
+        templates varint-encoded shapes
+        index     per table: name, chains: name, policy, packets, bytes, rules, offset, length
+        blocks    per chain: template ids (varint), token ids (u16/u32 array), counters (varint)
+"""
+
+from __future__ import annotations
+import gc
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from app.utils.file_manager import MappedFile, PathLike, atomic_write
+from app.utils.parser import Chain, Rule, Ruleset, _scan
+
+
+MAGIC = b"IPTSNAP1"
+_HEADER = struct.Struct("<8sBIIII")
+
+# Template field codes (order is part of the format)
+FIELDS = ("protocol", "source", "destination", "sport", "dport", "in_iface", "out_iface", "comment")
+_FIELD_CODE = {name: i for i, name in enumerate(FIELDS)}
+
+NO_COUNTERS, ALL_COUNTERS, SOME_COUNTERS = 0, 1, 2
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot is truncated, corrupt or of an unknown version."""
+
+
+# ---------- Varints ----------
+def _put(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get(buf, pos: int) -> Tuple[int, int]:
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    value, shift = b & 0x7F, 7
+    while True:
+        pos += 1
+        b = buf[pos]
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, pos + 1
+        shift += 7
+
+
+# ---------- Encoding ----------
+def encode_ruleset(ruleset: Ruleset) -> bytes:
+    strings: Dict[str, int] = {}
+    templates: Dict[tuple, int] = {}
+    tmpl_out = bytearray()
+
+    def sid(s: str) -> int:
+        i = strings.get(s)
+        if i is None:
+            if "\0" in s:
+                raise SnapshotError(f"token contains NUL: {s!r}")
+            i = strings[s] = len(strings)
+        return i
+
+    def template(args: List[str]) -> int:
+        fields, target, matches, negated = _scan(args)
+        key = (len(args), tuple(fields), target, tuple(matches), tuple(negated))
+        t = templates.get(key)
+        if t is None:
+            t = templates[key] = len(templates)
+            _put(tmpl_out, len(args))
+            _put(tmpl_out, len(fields))
+            for attr, i in fields:
+                _put(tmpl_out, _FIELD_CODE[attr])
+                _put(tmpl_out, i)
+            _put(tmpl_out, 0 if target is None else target + 1)
+            _put(tmpl_out, len(matches))
+            for i in matches:
+                _put(tmpl_out, i)
+            _put(tmpl_out, sum(1 << _FIELD_CODE[a] for a in set(negated)))
+        return t
+
+    chain_blocks: List[Tuple[Chain, bytearray, array]] = []
+    for table in ruleset.tables.values():
+        sid(table.name)
+        for chain in table.chains.values():
+            sid(chain.name)
+            sid(chain.policy)
+            head = bytearray()
+            tokens = array("I")
+            for r in chain.rules:
+                _put(head, template(r.args))
+                tokens.extend(sid(a) for a in r.args)
+            chain_blocks.append((chain, head, tokens))
+
+    width = 2 if len(strings) <= 0xFFFF else 4
+    index = bytearray()
+    blocks = bytearray()
+    it = iter(chain_blocks)
+    _put(index, len(ruleset.tables))
+    for table in ruleset.tables.values():
+        _put(index, strings[table.name])
+        _put(index, len(table.chains))
+        for chain in table.chains.values():
+            _, head, tokens = next(it)
+            start = len(blocks)
+            blocks += head
+            ids = tokens if width == 4 else array("H", tokens)
+            if sys.byteorder != "little":
+                ids.byteswap()
+            blocks += ids.tobytes()
+            have = [r.packets is not None for r in chain.rules]
+            mode = ALL_COUNTERS if have and all(have) else SOME_COUNTERS if any(have) else NO_COUNTERS
+            blocks.append(mode)
+            for r in chain.rules:
+                if mode == ALL_COUNTERS:
+                    _put(blocks, r.packets)
+                    _put(blocks, r.bytes)
+                elif mode == SOME_COUNTERS:
+                    _put(blocks, 0 if r.packets is None else r.packets + 1)
+                    if r.packets is not None:
+                        _put(blocks, r.bytes)
+            for v in (strings[chain.name], strings[chain.policy], chain.packets, chain.bytes,
+                      len(chain.rules), len(tokens), start, len(blocks) - start):
+                _put(index, v)
+
+    blob = "\0".join(strings).encode()
+    return b"".join((_HEADER.pack(MAGIC, width, len(blob), len(tmpl_out), len(index), len(blocks)),
+                     blob, bytes(tmpl_out), bytes(index), bytes(blocks)))
+
+
+# ---------- Decoding ----------
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """
+    Decoding allocates tens of thousands of Rules, lists and sets that all
+    stay alive; without this the cyclic collector repeatedly rescans them
+    and costs about twice the decode itself.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+@contextmanager
+def _corrupt(what: str) -> Iterator[None]:
+    """
+    Lengths and ids are read from the file unchecked; when they are wrong the
+    decoder fails with whatever indexing or decoding hit them first. Callers
+    only need to handle SnapshotError.
+    """
+    try:
+        yield
+    except SnapshotError:
+        raise
+    except (IndexError, KeyError, ValueError, TypeError, OverflowError, MemoryError, struct.error) as e:
+        raise SnapshotError(f"corrupt {what}: {type(e).__name__}: {e}") from e
+
+
+class _Snapshot:
+    """Parsed header, string table, templates and chain index of an encoded snapshot."""
+
+    __slots__ = ("buf", "width", "strings", "templates", "chains", "_blocks")
+
+    def __init__(self, buf):
+        if len(buf) < _HEADER.size:
+            raise SnapshotError("truncated snapshot header")
+        magic, width, n_str, n_tmpl, n_idx, n_blk = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or width not in (2, 4):
+            raise SnapshotError("not a ruleset snapshot (or an unsupported version)")
+        pos = _HEADER.size
+        if len(buf) < pos + n_str + n_tmpl + n_idx + n_blk:
+            raise SnapshotError("truncated snapshot")
+        self.buf = buf
+        self.width = width
+        with _corrupt("string table"):
+            self.strings = bytes(buf[pos:pos + n_str]).decode().split("\0")
+        pos += n_str
+        with _corrupt("templates"):
+            self.templates = self._templates(buf, pos, pos + n_tmpl)
+        pos += n_tmpl
+        with _corrupt("chain index"):
+            self.chains = self._index(buf, pos, pos + n_idx)
+        self._blocks = pos + n_idx
+
+    @staticmethod
+    def _templates(buf, pos: int, end: int) -> list:
+        out = []
+        while pos < end:
+            n, pos = _get(buf, pos)
+            nf, pos = _get(buf, pos)
+            fields = []
+            for _ in range(nf):
+                code, pos = _get(buf, pos)
+                i, pos = _get(buf, pos)
+                fields.append((FIELDS[code], i))
+            target, pos = _get(buf, pos)
+            nm, pos = _get(buf, pos)
+            matches = []
+            for _ in range(nm):
+                i, pos = _get(buf, pos)
+                matches.append(i)
+            mask, pos = _get(buf, pos)
+            negated = tuple(FIELDS[b] for b in range(len(FIELDS)) if mask >> b & 1)
+            out.append((n, tuple(fields), target - 1, tuple(matches), negated))
+        if pos != end:
+            raise SnapshotError("corrupt templates")
+        return out
+
+    def _index(self, buf, pos: int, end: int) -> List[Tuple[str, List[tuple]]]:
+        s = self.strings
+        tables = []
+        n_tables, pos = _get(buf, pos)
+        for _ in range(n_tables):
+            name, pos = _get(buf, pos)
+            n_chains, pos = _get(buf, pos)
+            chains = []
+            for _ in range(n_chains):
+                vals = []
+                for _ in range(8):
+                    v, pos = _get(buf, pos)
+                    vals.append(v)
+                cname, policy, pkts, byts, n_rules, n_tokens, offset, length = vals
+                chains.append((s[cname], s[policy], pkts, byts, n_rules, n_tokens, offset, length))
+            tables.append((s[name], chains))
+        if pos != end:
+            raise SnapshotError("corrupt chain index")
+        return tables
+
+    def chain(self, entry: tuple) -> Chain:
+        name, policy, pkts, byts, n_rules, n_tokens, offset, length = entry
+        pos = self._blocks + offset
+        end = pos + length
+        # Every rule takes at least one byte (its template id), every token `width`
+        if end > len(self.buf) or n_rules > length or n_tokens * self.width > length:
+            raise SnapshotError(f"truncated block for chain {name}")
+        with _corrupt(f"block for chain {name}"):
+            return self._chain(name, policy, pkts, byts, n_rules, n_tokens, pos, end)
+
+    def _chain(self, name, policy, pkts, byts, n_rules, n_tokens, pos, end) -> Chain:
+        buf, strings, templates = self.buf, self.strings, self.templates
+
+        tids = []
+        for _ in range(n_rules):
+            t, pos = _get(buf, pos)
+            tids.append(t)
+        ids = array("H" if self.width == 2 else "I")
+        ids.frombytes(buf[pos:pos + n_tokens * self.width])
+        if sys.byteorder != "little":
+            ids.byteswap()
+        pos += n_tokens * self.width
+        tokens = [strings[i] for i in ids]
+
+        mode = buf[pos]
+        pos += 1
+        if mode not in (NO_COUNTERS, ALL_COUNTERS, SOME_COUNTERS):
+            raise SnapshotError(f"corrupt block for chain {name}")
+        counters: List[Tuple[Optional[int], Optional[int]]]
+        if mode == NO_COUNTERS:
+            counters = [(None, None)] * n_rules
+        else:
+            counters = []
+            for _ in range(n_rules):
+                p, pos = _get(buf, pos)
+                if mode == SOME_COUNTERS:
+                    if p == 0:
+                        counters.append((None, None))
+                        continue
+                    p -= 1
+                b, pos = _get(buf, pos)
+                counters.append((p, b))
+        if pos != end:
+            raise SnapshotError(f"corrupt block for chain {name}")
+
+        chain = Chain(name, policy, pkts, byts)
+        new = Rule.__new__
+        rules = chain.rules
+        start = 0
+        for tid, (p, b) in zip(tids, counters):
+            n, fields, target, matches, negated = templates[tid]
+            args = tokens[start:start + n]
+            start += n
+            r = new(Rule)
+            r.chain = name
+            r.args = args
+            r.packets = p
+            r.bytes = b
+            r.protocol = r.source = r.destination = r.sport = r.dport = None
+            r.in_iface = r.out_iface = r.comment = None
+            for attr, i in fields:
+                setattr(r, attr, args[i])
+            if target >= 0:
+                r.target = args[target]
+                r.target_args = args[target + 1:]
+            else:
+                r.target = None
+                r.target_args = []
+            r.matches = [args[i] for i in matches]
+            r.negated = set(negated)
+            rules.append(r)
+        if start != n_tokens:
+            raise SnapshotError(f"corrupt block for chain {name}")
+        return chain
+
+
+def decode_ruleset(buf: Union[bytes, memoryview]) -> Ruleset:
+    snap = _Snapshot(buf)
+    ruleset = Ruleset()
+    with _gc_paused():
+        for tname, chains in snap.chains:
+            table = ruleset.table(tname)
+            for entry in chains:
+                table.chains[entry[0]] = snap.chain(entry)
+    return ruleset
+
+
+# ---------- Files ----------
+def write_snapshot(path: PathLike, ruleset: Ruleset, fsync: bool = True) -> int:
+    """Atomically write `ruleset` to `path`; returns the snapshot size in bytes."""
+    data = encode_ruleset(ruleset)
+    atomic_write(path, data, fsync=fsync)
+    return len(data)
+
+
+def read_snapshot(path: PathLike) -> Ruleset:
+    with MappedFile(path) as mf:
+        return decode_ruleset(mf.buffer)
+
+
+def read_chain(path: PathLike, table: str, chain: str) -> Chain:
+    """One chain, decoding only the index and that chain's block (KeyError if absent)."""
+    with MappedFile(path) as mf:
+        snap = _Snapshot(mf.buffer)
+        for tname, chains in snap.chains:
+            if tname == table:
+                for entry in chains:
+                    if entry[0] == chain:
+                        with _gc_paused():
+                            return snap.chain(entry)
+    raise KeyError(f"{table}/{chain}")
+
+
+def snapshot_index(path: PathLike) -> List[Dict[str, object]]:
+    """[{table, chain, policy, rules}] without decoding any rules."""
+    with MappedFile(path) as mf:
+        snap = _Snapshot(mf.buffer)
+        return [{"table": t, "chain": e[0], "policy": e[1], "rules": e[4]} for t, chains in snap.chains for e in chains]
+
+
+# ---------- Self-test ----------
+if __name__ == "__main__":
+    import json
+    import os
+    import tempfile
+    import time
+    from pathlib import Path
+
+    sys.path.append(str(Path(__file__).resolve().parents[2] / "tests" / "benchmarks"))
+    from fleet_generator import generate_ruleset
+    from app.utils.parser import parse_config_json, parse_iptables_save, serialize_ruleset
+
+    text = generate_ruleset(20_000, seed=1)
+    ruleset = parse_iptables_save(text)
+    d = tempfile.mkdtemp(prefix="snapshot-")
+    js, snap = os.path.join(d, "config.json"), os.path.join(d, "config.snap")
+    with open(js, "w") as f:
+        json.dump({"filter": text}, f, indent=2)
+    size = write_snapshot(snap, ruleset)
+
+    t0 = time.perf_counter()
+    with open(js) as f:
+        parse_config_json(json.load(f))
+    t_json = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    loaded = read_snapshot(snap)
+    t_snap = time.perf_counter() - t0
+    print(f"📦 {os.path.getsize(js)} bytes JSON → {size} bytes snapshot")
+    print(f"⏱️ JSON {t_json * 1000:.0f} ms, snapshot {t_snap * 1000:.0f} ms ({t_json / t_snap:.1f}x)")
+    assert serialize_ruleset(loaded) == serialize_ruleset(ruleset)
+    print("✅ round-trips exactly")
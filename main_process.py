@@ -2,17 +2,66 @@
 """
 Main Flask entrypoint for the iptables GUI project.
 Serves the web interface and exposes backend API routes.
+
+Fleet operations (discover, push, validate, apply, snapshot, rollback,
+policy, drift, traffic, counters, preflight) run as background jobs: the POST returns a job ID immediately and
+progress is streamed from /api/jobs/<id>/events (Server-Sent Events).
+Push, validate, apply and policy jobs accept "preflight": true to warm and
+check every host's session first; hosts that fail it are left untouched.
+
+    python main_process.py            → development server (debugger, reloader)
+    python main_process.py --prod     → production server (see app/core/web_server)
 """
 
-from flask import Flask, jsonify, send_from_directory
-import os, requests
+from flask import Flask, Response, jsonify, request, send_from_directory, stream_with_context
+import argparse, atexit, json, os, re
+
+from app.core.command_scheduler import BACKGROUND, INTERACTIVE, ROLLOUT, shared_scheduler
+from app.core.job_queue import FINISHED, Job, JobManager, run_per_host
+from app.core.rule_index import DEFAULT_LIMIT, FILTER_KEYS, RuleIndexCache, page as rule_page
+from app.core.ssh_session_manager import shared_manager
+from app.core import metrics, tracing, web_server
 
 app = Flask(__name__, static_folder="app/web")
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = web_server.STATIC_MAX_AGE_S
+web_server.install_compression(app)
+
+# --- Shared state for background jobs ---
+DEFAULT_USER = os.environ.get("IPTABLES_GUI_SSH_USER", "root")
+DEFAULT_KEY = os.environ.get("IPTABLES_GUI_SSH_KEY", os.path.expanduser("~/.ssh/id_rsa"))
+# Local rulesets a job may push: files under this directory only
+RULES_DIR = os.path.realpath(os.environ.get("IPTABLES_GUI_RULES_DIR", "."))
+DEFAULT_REMOTE_RULES = "/tmp/iptables.rules"
+REMOTE_PATH_RE = re.compile(r"/[A-Za-z0-9._-]+(/[A-Za-z0-9._-]+)*")
+SSE_HEARTBEAT_S = 15
+
+JOBS = JobManager()
+SESSIONS = shared_manager()     # same pool as one-shot push/validate/apply calls
+# Every fleet command is admitted by priority, so rollouts never crowd out the GUI
+SCHEDULER = shared_scheduler()
+ROLLOUTS = SCHEDULER.lane(ROLLOUT)
+POLLING = SCHEDULER.lane(BACKGROUND)
+# Dead-man confirmations must beat the rollback timer, so they skip the rollout rate limit
+CONFIRMS = SCHEDULER.lane(INTERACTIVE)
+
+
+@web_server.on_shutdown
+def _drain_sessions():
+    print("🔌 Closing SSH sessions...")
+    SESSIONS.stop()
+
+
+@web_server.on_shutdown
+def _stop_jobs():
+    # Registered last so it runs first: cancel jobs before their sessions go away
+    print("⏹️ Cancelling background jobs...")
+    JOBS.shutdown(wait=False)
 
 # --- Base route: serve the frontend page ---
 @app.route("/")
 def serve_frontend():
-    return send_from_directory(app.static_folder, "index.html")
+    # Always revalidated (cheap 304 via ETag) so a redeploy is picked up immediately
+    return send_from_directory(app.static_folder, "index.html", max_age=0)
 
 # --- Test route: backend status check ---
 @app.route("/api/status")
@@ -25,18 +74,669 @@ def api_status():
         "step": "1"
     })
 
+# --- Interactive fleet reads (ahead of any queued rollout or polling work) ---
+@app.route("/api/hosts/exec", methods=["POST"])
+def api_hosts_exec():
+    """
+    Run an allow-listed read command (see remote_command_executor.validate_command)
+    on a few hosts, synchronously. Only hosts and the command come from the
+    request; the SSH user and key are the server's.
+    """
+    from app.core.multi_host_executor import execute_on_multiple_hosts
+
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        hosts = _job_params(data)["hosts"]
+        command = str(data["command"])
+    except (KeyError, ValueError) as e:
+        return jsonify({"status": "failure", "message": f"Invalid request: {e}"}), 400
+    results = execute_on_multiple_hosts(hosts, DEFAULT_USER, DEFAULT_KEY, command,
+                                        max_workers=min(len(hosts), 16), priority=INTERACTIVE)
+    if results.get("status") == "rejected":
+        return jsonify(results), 403
+    return jsonify({"status": "success", "results": results})
+
+
+@app.route("/api/scheduler")
+def api_scheduler():
+    return jsonify({"status": "success", **SCHEDULER.stats()})
+
+# --- Objective wizard (lookup tables precomputed in app/core/objective_engine) ---
+@app.route("/api/objective", methods=["GET"])
+def api_objective_options():
+    """Valid table/chain/target combinations; ?objective= and/or ?position= narrow the answer."""
+    from app.core.objective_engine import lookup
+
+    answer = lookup(request.args.get("objective"), request.args.get("position"), request.args.get("target"))
+    if answer is None:
+        return jsonify({"status": "failure", "message": "Unknown objective or position"}), 404
+    return web_server.conditional(lambda: answer.body, "application/json", etag=answer.etag,
+                                  max_age=web_server.STATIC_MAX_AGE_S)
+
+
 @app.route("/api/objective", methods=["POST"])
 def api_objective():
     """
-    Temporary route to test Objective Selection from frontend.
+    With a position (or chain): build the rule, {objective, position, target?, match?, params?}.
+    Without one (the GUI's {objective, action}): the positions where the objective is possible.
     """
-    data = requests.get_json(force=True, silent=False)
-    return jsonify({
-        "status": "received",
-        "objective": data.get("objective"),
-        "action": data.get("action")
-    })
+    from app.core.objective_engine import build_rule, lookup
+
+    data = request.get_json(force=True, silent=False)
+    objective, target = data.get("objective"), data.get("target") or data.get("action")
+    position = data.get("position") or data.get("chain")
+    if position:
+        result = build_rule(objective, position, target, data.get("match"), data.get("params"))
+        return jsonify(result), 200 if result["status"] == "success" else 422
+    answer = lookup(objective, None, target)
+    if answer is None:
+        return jsonify({"status": "failure", "message": f"Unknown objective {objective!r}"}), 404
+    return jsonify({**answer.data, "action": data.get("action")})
+
+# --- Prometheus scrape endpoint ---
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# --- Rollout traces ---
+@app.route("/api/traces")
+def api_traces():
+    limit = request.args.get("limit", 20, type=int)
+    return jsonify([{"trace_id": t.trace_id, "name": t.name,
+                     "duration_ms": t.to_dict()["duration_ms"], "spans": len(t.spans)}
+                    for t in tracing.recent(limit)])
+
+
+@app.route("/api/traces/<trace_id>")
+def api_trace(trace_id):
+    """?format=json (default) | otlp | flame (per-host breakdown) | folded (flamegraph.pl input)."""
+    trace = tracing.find(trace_id)
+    if trace is None:
+        return jsonify({"status": "failure", "message": f"No trace {trace_id}"}), 404
+    fmt = request.args.get("format", "json")
+    if fmt == "otlp":
+        return jsonify(tracing.to_otlp(trace))
+    if fmt == "flame":
+        return jsonify({"trace_id": trace_id, "hosts": tracing.flame(trace), "text": tracing.format_flame(trace)})
+    if fmt == "folded":
+        return Response(tracing.folded(trace), mimetype="text/plain")
+    return jsonify(trace.to_dict())
+
+# --- Ruleset and log views (conditional: unchanged data answers 304) ---
+LOG_TAIL_DEFAULT = 500
+
+
+@app.route("/api/ruleset")
+def api_ruleset():
+    """Current iptables-save output (optionally one table), without the timestamp comments."""
+    from app.core.iptables_controller import get_backend
+
+    table = request.args.get("table")
+    cmd = ["iptables-save"] + (["-t", table] if table else [])
+
+    result = get_backend().run(cmd)
+    if result.returncode != 0:
+        return jsonify({"status": "failure", "message": result.stderr.strip()}), 502
+    # The "# Generated ... on <date>" lines change on every call and would defeat the ETag
+    text = "".join(line for line in result.stdout.splitlines(keepends=True) if not line.startswith("#"))
+    return web_server.conditional(lambda: text.encode(), "text/plain")
+
+
+@app.route("/api/logs")
+def api_logs():
+    """Last `limit` KB log entries as JSON; the validator is the log file's size and mtime."""
+    from app.core.iptables_logger import LOG_FILE
+    from app.utils.file_manager import MappedFile, fingerprint
+
+    limit = max(1, min(request.args.get("limit", LOG_TAIL_DEFAULT, type=int), 10_000))
+    try:
+        etag = f"{fingerprint(LOG_FILE)}-{limit}"
+    except FileNotFoundError:
+        return jsonify([])
+
+    def body():
+        # Scan backwards from the end of the mapped file: cost follows `limit`, not the log size
+        with MappedFile(LOG_FILE) as mf:
+            lines = mf.tail(limit)
+        return ("[" + ",".join(l for l in lines if l.strip()) + "]").encode()
+
+    return web_server.conditional(body, "application/json", etag=etag, weak=True)
+
+# --- Paged rule listing (virtualized tables in the GUI) ---
+def _fetch_table(table: str, counters: bool) -> str:
+    from app.core.iptables_controller import get_backend
+
+    result = get_backend().run(["iptables-save", "-t", table] + (["-c"] if counters else []))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return "".join(line for line in result.stdout.splitlines(keepends=True) if not line.startswith("#"))
+
+
+RULES = RuleIndexCache(_fetch_table)
+
+
+def _rule_index(table: str):
+    try:
+        return RULES.get(table, counters=request.args.get("counters") == "1"), None
+    except RuntimeError as e:
+        return None, (jsonify({"status": "failure", "message": str(e)}), 502)
+
+
+@app.route("/api/rules/<table>")
+def api_rule_chains(table):
+    index, err = _rule_index(table)
+    if err:
+        return err
+    return jsonify({"status": "success", "table": table, "digest": index.digest, "chains": index.summary()})
+
+
+@app.route("/api/rules/<table>/<chain>")
+def api_rule_page(table, chain):
+    """
+    One window of a chain: ?offset=&limit= plus optional address, port,
+    target, comment and q filters. Unchanged rules + same query → 304.
+    """
+    index, err = _rule_index(table)
+    if err:
+        return err
+    args = request.args
+    filters = {k: args.get(k) for k in FILTER_KEYS if args.get(k)}
+    offset = args.get("offset", 0, type=int)
+    limit = args.get("limit", DEFAULT_LIMIT, type=int)
+    result = rule_page(index, chain, offset, limit, **filters)
+    if result["status"] != "success":
+        return jsonify(result), 404 if "No chain" in result["message"] else 400
+    query = "&".join(f"{k}={v}" for k, v in sorted(args.items()))
+    etag = f"{index.digest}-{web_server.content_etag(query.encode())[:12]}"
+    return web_server.conditional(lambda: json.dumps(result).encode(), "application/json", etag=etag)
+
+
+@app.route("/api/rules/<table>/<chain>/<rule_id>")
+def api_rule(table, chain, rule_id):
+    """A single rule by stable ID, with its current position."""
+    index, err = _rule_index(table)
+    if err:
+        return err
+    row = index.locate(rule_id)
+    if row is None or row.rule.chain != chain:
+        return jsonify({"status": "failure", "message": f"No rule {rule_id} in {table}/{chain}"}), 404
+    return jsonify({"status": "success", "rule": row.to_dict()})
+
+# --- Ruleset history (content-addressed store) ---
+@app.route("/api/history/<host>")
+def api_history(host):
+    """Versions recorded for a host, newest first; ?at=<epoch|ISO time> returns the one current then."""
+    from app.core.ruleset_store import default_store
+
+    store = default_store()
+    at = request.args.get("at")
+    if at is not None:
+        try:
+            when = float(at) if at.replace(".", "", 1).isdigit() else at
+            version = store.at(host, when)
+        except ValueError as e:
+            return jsonify({"status": "failure", "message": f"Invalid time: {e}"}), 400
+        if version is None:
+            return jsonify({"status": "failure", "message": f"No version of {host} at {at}"}), 404
+        return jsonify({"status": "success", "version": version})
+    limit = max(1, min(request.args.get("limit", 50, type=int), 1000))
+    return jsonify({"status": "success", "host": host, "versions": store.history(host, limit)})
+
+
+@app.route("/api/versions/<version_id>")
+def api_version(version_id):
+    """One version (JSON), or its ruleset with ?format=text; versions never change, so cache freely."""
+    from app.core.ruleset_store import default_store
+
+    store = default_store()
+    try:
+        version = store.version(version_id)
+    except KeyError:
+        return jsonify({"status": "failure", "message": f"No such version {version_id}"}), 404
+    if request.args.get("format") == "text":
+        return web_server.conditional(lambda: store.checkout(version_id).encode(), "text/plain",
+                                      etag=version_id, max_age=web_server.STATIC_MAX_AGE_S)
+    return jsonify({"status": "success", "version": version})
+
+# --- Rule hit counters over time (db/counters) ---
+def _when(arg):
+    value = request.args.get(arg)
+    if value is None:
+        return None
+    return float(value) if value.replace(".", "", 1).isdigit() else value
+
+
+@app.route("/api/counters/top")
+def api_counters_top():
+    """Busiest rules over ?start=&end= (epoch or ISO time), ?by=packets|bytes, ?host= (repeatable)."""
+    from app.core.counter_store import default_counter_store
+
+    n = max(1, min(request.args.get("n", 10, type=int), 1000))
+    try:
+        rows = default_counter_store().top(n, by=request.args.get("by", "packets"), start=_when("start"),
+                                           end=_when("end"), hosts=request.args.getlist("host") or None)
+    except ValueError as e:
+        return jsonify({"status": "failure", "message": f"Invalid request: {e}"}), 400
+    return jsonify({"status": "success", "rules": rows})
+
+
+@app.route("/api/counters/anomalies")
+def api_counters_anomalies():
+    """Rules that spiked or went dead in the last ?recent= seconds compared with the ?baseline= before it."""
+    from app.core.counter_store import default_counter_store
+
+    try:
+        found = default_counter_store().anomalies(
+            recent_s=request.args.get("recent", 3600, type=float),
+            baseline_s=request.args.get("baseline", 7 * 86400, type=float),
+            now=_when("now"), hosts=request.args.getlist("host") or None)
+    except ValueError as e:
+        return jsonify({"status": "failure", "message": f"Invalid request: {e}"}), 400
+    return jsonify({"status": "success", "anomalies": found})
+
+# --- Policy templates (db/policies.json) ---
+_POLICIES = {"mtime": None, "compiler": None}
+
+
+def _policies():
+    """Compiler for db/policies.json, rebuilt when the file changes (its chain cache survives otherwise)."""
+    from app.core.policy_templates import POLICY_PATH, load_policies
+
+    mtime = os.stat(POLICY_PATH).st_mtime_ns
+    if _POLICIES["mtime"] != mtime:
+        _POLICIES["compiler"], _POLICIES["mtime"] = load_policies(POLICY_PATH), mtime
+    return _POLICIES["compiler"]
+
+
+@app.route("/api/policies/<host>")
+def api_policy(host):
+    """Compiled iptables-restore payload for one host."""
+    from app.core.policy_templates import PolicyError
+
+    try:
+        payload = _policies().compile_host(host)
+    except FileNotFoundError:
+        return jsonify({"status": "failure", "message": "No policies defined (db/policies.json)"}), 404
+    except PolicyError as e:
+        return jsonify({"status": "failure", "message": str(e)}), 422
+    return web_server.conditional(lambda: payload.encode(), "text/plain")
+
+# --- Observer: on-host rule watchers + local file watcher ---
+_OBSERVER = {"observer": None}
+
+
+def _observer():
+    """Created on first use, so a GUI that never watches anything opens no channels."""
+    from app.core.observer import Observer
+
+    if _OBSERVER["observer"] is None:
+        obs = Observer()
+        obs.watch_local()
+        _OBSERVER["observer"] = obs
+    return _OBSERVER["observer"]
+
+
+@web_server.on_shutdown
+def _stop_observer():
+    if _OBSERVER["observer"] is not None:
+        print("👀 Stopping observer...")
+        _OBSERVER["observer"].stop()
+
+
+@app.route("/api/observer")
+def api_observer():
+    return jsonify({"status": "success", "hosts": _observer().hosts()})
+
+
+@app.route("/api/observer/hosts", methods=["POST"])
+def api_observer_watch():
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        p = _job_params(data)
+        port = int(data.get("port", 22))
+        if not 0 < port < 65536:
+            raise ValueError("'port' must be between 1 and 65535")
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "failure", "message": f"Invalid request: {e}"}), 400
+    obs = _observer()
+    started = [h for h in p["hosts"] if obs.watch(h, p["user"], p["key_path"], port)]
+    return jsonify({"status": "success", "started": started, "hosts": obs.hosts()})
+
+
+@app.route("/api/observer/hosts/<host>", methods=["DELETE"])
+def api_observer_unwatch(host):
+    if not _observer().unwatch(host, request.args.get("port", 22, type=int)):
+        return jsonify({"status": "failure", "message": f"{host} is not watched"}), 404
+    return jsonify({"status": "success", "message": f"Stopped watching {host}"})
+
+
+def _last_event_id():
+    """Sequence number to resume an SSE stream after (Last-Event-ID or ?after=); None if malformed."""
+    value = (request.headers.get("Last-Event-ID") or request.args.get("after") or "0").strip()
+    return int(value) if value.isascii() and value.isdigit() else None
+
+
+@app.route("/api/observer/events")
+def api_observer_events():
+    """Server-Sent Events stream of rule changes and local file changes; resumes from Last-Event-ID."""
+    obs = _observer()
+    last = _last_event_id()
+    if last is None:
+        return jsonify({"status": "failure", "message": "Last-Event-ID / after must be a non-negative integer"}), 400
+
+    def stream():
+        seq = last
+        while True:
+            events = obs.events_after(seq, timeout=SSE_HEARTBEAT_S)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for e in events:
+                seq = e["seq"]
+                yield f"id: {seq}\nevent: {e['type']}\ndata: {json.dumps(e)}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Background fleet jobs ---
+def _remote_path(path: str) -> str:
+    """An absolute host path made of plain name characters only (no '..', no shell syntax)."""
+    if not REMOTE_PATH_RE.fullmatch(path) or ".." in path.split("/"):
+        raise ValueError(f"'remote_rules_path' must be a plain absolute path, got {path!r}")
+    return path
+
+
+def _local_rules(name: str) -> str:
+    """A ruleset file inside RULES_DIR; anything resolving outside it is refused."""
+    path = os.path.realpath(os.path.join(RULES_DIR, name))
+    if os.path.commonpath([path, RULES_DIR]) != RULES_DIR:
+        raise ValueError(f"'local_rules_path' must be a file under the rules directory, got {name!r}")
+    return path
+
+
+def _job_params(data: dict, require_hosts: bool = True) -> dict:
+    """
+    Common job parameters. The SSH identity is the server's (DEFAULT_USER /
+    DEFAULT_KEY), never the request's; paths from the request are checked.
+    """
+    params = {
+        "user": DEFAULT_USER,
+        "key_path": DEFAULT_KEY,
+        "remote_rules_path": _remote_path(str(data.get("remote_rules_path", DEFAULT_REMOTE_RULES))),
+    }
+    if require_hosts:
+        hosts = data.get("hosts")
+        if not isinstance(hosts, list) or not hosts:
+            raise ValueError("'hosts' must be a non-empty list")
+        params["hosts"] = [str(h) for h in hosts]
+    return params
+
+
+def _discover_job(job: Job):
+    from app.core.host_discovery import discover_hosts
+    import ipaddress
+
+    p = job.params
+    job.set_total(ipaddress.IPv4Network(p["subnet"]).num_addresses)
+    found = discover_hosts(
+        p["subnet"], p["user"], p["key_path"], mgr=POLLING, stop_event=job.cancel_event,
+        on_probe=lambda r: job.record(r["ip"], {
+            "status": "success",
+            "message": "reachable" if (r["ping"] or r["ssh"]) else "unreachable",
+            **r,
+        }),
+    )
+    return {"reachable": [r["ip"] for r in found]}
+
+
+def _preflight_report(job: Job):
+    p = job.params
+    report = SESSIONS.preflight(p["hosts"], p["user"], p["key_path"], fingerprints=p.get("fingerprints"),
+                                deadline_s=p.get("preflight_deadline_s"))
+    job.emit("preflight", **{k: report[k] for k in ("status", "message", "ready", "failed", "stragglers",
+                                                   "elapsed_ms")})
+    return report
+
+
+def _gated(job: Job, fn):
+    """With params["preflight"], warm every session before the wave; hosts that fail it get that result instead."""
+    if not job.params.get("preflight"):
+        return fn
+    report = _preflight_report(job)
+    blocked = {h: report["hosts"][h] for h in report["failed"]}
+    return lambda h: blocked[h] if h in blocked else fn(h)
+
+
+def _preflight_job(job: Job):
+    report = _preflight_report(job)
+    for host, r in report["hosts"].items():
+        job.record(host, r)
+    return {k: report[k] for k in ("ready", "failed", "stragglers", "elapsed_ms")}
+
+
+def _push_job(job: Job):
+    from app.core.iptables_push import push_iptables_ruleset
+
+    p = job.params
+    return run_per_host(job, p["hosts"], _gated(job, lambda h: push_iptables_ruleset(
+        h, p["user"], p["key_path"], p["local_rules_path"], p["remote_rules_path"], mgr=ROLLOUTS)))
+
+
+def _validate_job(job: Job):
+    from app.core.iptables_validate import validate_iptables_rules
+
+    p = job.params
+    return run_per_host(job, p["hosts"], _gated(job, lambda h: validate_iptables_rules(
+        h, p["user"], p["key_path"], p["remote_rules_path"], mgr=ROLLOUTS)))
+
+
+def _apply_job(job: Job):
+    from app.core.iptables_apply import apply_iptables_rules
+    from app.core.traffic_tester import flows_for_hosts, load_flows, run_flows
+
+    p = job.params
+    summary = run_per_host(job, p["hosts"], _gated(job, lambda h: apply_iptables_rules(
+        h, p["user"], p["key_path"], p["remote_rules_path"], mgr=ROLLOUTS, confirm_mgr=CONFIRMS,
+        rollback_timeout_s=p.get("rollback_timeout_s"))))
+    if p.get("verify") and not job.cancelled:
+        # Probe the declared flows touching this wave as soon as it is applied
+        applied = [h for h in p["hosts"] if job.results.get(h, {}).get("status") == "success"]
+        report = run_flows(flows_for_hosts(load_flows(), applied), p["user"], p["key_path"], mgr=ROLLOUTS)
+        summary["traffic"] = {k: report[k] for k in ("status", "message", "passed", "failed", "errors", "matrix")}
+        job.emit("traffic", **summary["traffic"])
+    return summary
+
+
+def _snapshot_job(job: Job):
+    from app.core.ruleset_collector import collect_ruleset
+    from app.utils.parser import serialize_ruleset
+    p = job.params
+
+    def snapshot(host):
+        r = collect_ruleset(host, p["user"], p["key_path"], compress=p.get("compress", True), mgr=POLLING)
+        if r["status"] == "success":
+            r["ruleset"] = serialize_ruleset(r["ruleset"])
+        return r
+
+    return run_per_host(job, p["hosts"], snapshot)
+
+
+def _policy_job(job: Job):
+    from app.core.iptables_apply import apply_iptables_rules
+    from app.core.policy_templates import push_host_policy
+    p = job.params
+    compiler = _policies()
+
+    def deploy(host):
+        r = push_host_policy(compiler, host, p["user"], p["key_path"], p["remote_rules_path"], mgr=ROLLOUTS)
+        if r["status"] == "success" and p["apply"]:
+            r = apply_iptables_rules(host, p["user"], p["key_path"], p["remote_rules_path"], mgr=ROLLOUTS,
+                                     source="policy", confirm_mgr=CONFIRMS)
+        return r
+
+    return run_per_host(job, p["hosts"], _gated(job, deploy))
+
+
+def _rollback_job(job: Job):
+    from app.core.ruleset_store import rollback_host
+    p = job.params
+    return run_per_host(job, p["hosts"], lambda h: rollback_host(
+        h, p["version"], p["user"], p["key_path"], p["remote_rules_path"], mgr=ROLLOUTS, confirm_mgr=CONFIRMS))
+
+
+def _drift_job(job: Job):
+    from app.core.drift_report import check_host, intended_from_policies, intended_from_store
+    p = job.params
+    intended = intended_from_store() if p["against"] == "store" else intended_from_policies(_policies())
+    return run_per_host(job, p["hosts"], lambda h: check_host(h, p["user"], p["key_path"], intended,
+                                                              mgr=POLLING))
+
+
+def _traffic_job(job: Job):
+    from app.core.traffic_tester import parse_flows, probe_host
+    p = job.params
+    by_src = {}
+    for f in parse_flows(p["flows"]):
+        by_src.setdefault(f.src, []).append(f)
+    run_per_host(job, by_src, lambda src: probe_host(src, by_src[src], p["user"], p["key_path"], mgr=ROLLOUTS))
+    return {"matrix": {src: r.get("row", {}) for src, r in job.results.items() if src in by_src}}
+
+
+def _counters_job(job: Job):
+    from app.core.counter_store import sample_host
+    p = job.params
+    return run_per_host(job, p["hosts"], lambda h: sample_host(h, p["user"], p["key_path"], mgr=POLLING))
+
+
+JOB_KINDS = {
+    "discover": _discover_job,
+    "push": _push_job,
+    "validate": _validate_job,
+    "apply": _apply_job,
+    "snapshot": _snapshot_job,
+    "rollback": _rollback_job,
+    "policy": _policy_job,
+    "drift": _drift_job,
+    "traffic": _traffic_job,
+    "counters": _counters_job,
+    "preflight": _preflight_job,
+}
+
+
+@app.route("/api/jobs/<kind>", methods=["POST"])
+def api_job_submit(kind):
+    """Queue a fleet job and return 202 with its ID; the work runs in the background."""
+    fn = JOB_KINDS.get(kind)
+    if fn is None:
+        return jsonify({"status": "failure", "message": f"Unknown job type '{kind}'"}), 404
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        params = _job_params(data, require_hosts=(kind not in ("discover", "traffic")))
+        if kind == "discover":
+            params["subnet"] = data["subnet"]
+        if kind == "push":
+            params["local_rules_path"] = _local_rules(str(data.get("local_rules_path", "iptables.rules")))
+        if kind == "apply" and "rollback_timeout_s" in data:
+            params["rollback_timeout_s"] = int(data["rollback_timeout_s"])
+        if kind == "apply":
+            params["verify"] = bool(data.get("verify", False))
+        if kind == "policy":
+            params["apply"] = bool(data.get("apply", False))
+        if kind == "rollback":
+            params["version"] = str(data["version"])
+        if kind == "snapshot":
+            params["compress"] = bool(data.get("compress", True))
+        if kind == "drift":
+            params["against"] = data.get("against", "policy")
+            if params["against"] not in ("policy", "store"):
+                raise ValueError("'against' must be 'policy' or 'store'")
+        if kind in ("push", "validate", "apply", "policy"):
+            params["preflight"] = bool(data.get("preflight", False))
+        if kind in ("push", "validate", "apply", "policy", "preflight"):
+            if "preflight_deadline_s" in data:
+                params["preflight_deadline_s"] = float(data["preflight_deadline_s"])
+            fingerprints = data.get("fingerprints") or {}
+            if not isinstance(fingerprints, dict):
+                raise ValueError("'fingerprints' must map hosts to SHA256:... host key fingerprints")
+            params["fingerprints"] = {str(h): str(f) for h, f in fingerprints.items()}
+        if kind == "traffic":
+            from app.core.traffic_tester import load_flows, parse_flows
+            flows = parse_flows(data["flows"]) if "flows" in data else load_flows()
+            params["flows"] = [f.to_dict() for f in flows]
+            if not flows:
+                raise ValueError("no 'flows' given and none declared in db/flows.json")
+    except (KeyError, ValueError) as e:
+        return jsonify({"status": "failure", "message": f"Invalid request: {e}"}), 400
+
+    job = JOBS.submit(kind, fn, params, total=len(params.get("hosts", [])))
+    resp = jsonify(job.to_dict(include_results=False))
+    resp.status_code = 202
+    resp.headers["Location"] = f"/api/jobs/{job.id}"
+    return resp
+
+
+@app.route("/api/jobs", methods=["GET"])
+def api_jobs():
+    return jsonify([j.to_dict(include_results=False) for j in JOBS.list()])
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def api_job(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"status": "failure", "message": f"No such job {job_id}"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/api/jobs/<job_id>", methods=["DELETE"])
+def api_job_cancel(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"status": "failure", "message": f"No such job {job_id}"}), 404
+    return jsonify({"status": "success" if job.cancel() else "unchanged", "job": job.to_dict(include_results=False)})
+
+
+@app.route("/api/jobs/<job_id>/events")
+def api_job_events(job_id):
+    """Server-Sent Events stream of a job's progress; resumes from Last-Event-ID."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"status": "failure", "message": f"No such job {job_id}"}), 404
+    last = _last_event_id()
+    if last is None:
+        return jsonify({"status": "failure", "message": "Last-Event-ID / after must be a non-negative integer"}), 400
+
+    def stream():
+        seq = last
+        while True:
+            events = job.events_after(seq, timeout=SSE_HEARTBEAT_S)
+            if not events:
+                if job.status in FINISHED:
+                    return
+                yield ": keepalive\n\n"
+                continue
+            for e in events:
+                seq = e["seq"]
+                yield f"id: {seq}\nevent: {e['type']}\ndata: {json.dumps(e)}\n\n"
+                if e["type"] == "finished":
+                    return
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="iptables GUI backend")
+    ap.add_argument("--prod", action="store_true", help="run a production server instead of the dev server")
+    ap.add_argument("--host", default=os.environ.get("IPTABLES_GUI_HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.environ.get("IPTABLES_GUI_PORT", 5000)))
+    ap.add_argument("--server", default="auto", choices=["auto", "gunicorn", "waitress", "werkzeug"])
+    ap.add_argument("--workers", type=int, default=web_server.SERVER_WORKERS)
+    ap.add_argument("--threads", type=int, default=web_server.SERVER_THREADS)
+    args = ap.parse_args()
+
     print("🚀 Starting iptables GUI backend...")
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    if args.prod:
+        web_server.serve(app, args.host, args.port, args.server, args.workers, args.threads)
+    else:
+        atexit.register(web_server.run_shutdown_hooks)
+        app.run(host=args.host, port=args.port, debug=True, threaded=True)
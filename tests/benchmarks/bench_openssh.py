@@ -0,0 +1,64 @@
+"""
+Paramiko vs OpenSSH ControlMaster backend: warm exec, cold connect+exec and
+bulk output (iptables-save), against the in-process stub and, when
+IPTABLES_LAB_HOST / IPTABLES_LAB_KEY are set, a real sshd from the Docker lab
+(e.g. the firewall container at 10.10.0.20).
+"""
+
+import os
+import shutil
+
+import pytest
+
+from app.core.ssh_session_manager import SSHSessionManager
+
+if shutil.which("ssh") is None:
+    pytest.skip("OpenSSH client not installed", allow_module_level=True)
+
+from app.core.openssh_session_manager import OpenSSHSessionManager  # noqa: E402
+
+LAB_HOST = os.environ.get("IPTABLES_LAB_HOST")
+LAB_USER = os.environ.get("IPTABLES_LAB_USER", "root")
+LAB_KEY = os.environ.get("IPTABLES_LAB_KEY")
+LAB_PORT = int(os.environ.get("IPTABLES_LAB_PORT", "22"))
+
+
+@pytest.fixture(scope="module", params=["paramiko", "openssh"])
+def mgr(request):
+    m = SSHSessionManager() if request.param == "paramiko" else OpenSSHSessionManager()
+    yield m
+    m.stop()
+
+
+@pytest.fixture(scope="module", params=["stub", "lab"])
+def target(request, stub_fleet, ssh_key_file):
+    """(host, user, key, port) of the SSH endpoint under test."""
+    if request.param == "stub":
+        return stub_fleet[0].address, "root", ssh_key_file, stub_fleet[0].port
+    if not (LAB_HOST and LAB_KEY):
+        pytest.skip("set IPTABLES_LAB_HOST and IPTABLES_LAB_KEY to benchmark a lab sshd")
+    return LAB_HOST, LAB_USER, LAB_KEY, LAB_PORT
+
+
+def test_exec_warm(benchmark, mgr, target):
+    host, user, key, port = target
+    mgr.exec(host, user, key, "hostname", port=port)
+    r = benchmark(mgr.exec, host, user, key, "hostname", port=port)
+    assert r["status"] == "success"
+
+
+def test_connect_cold(benchmark, mgr, target):
+    host, user, key, port = target
+
+    def cold():
+        mgr.close_host(host, user, port)
+        return mgr.exec(host, user, key, "hostname", port=port)
+
+    r = benchmark.pedantic(cold, rounds=10, iterations=1)
+    assert r["status"] == "success"
+
+
+def test_exec_iptables_save(benchmark, mgr, target):
+    host, user, key, port = target
+    r = benchmark(mgr.exec, host, user, key, "iptables-save", port=port)
+    assert r["stdout"].startswith("# Generated by iptables-save")
@@ -0,0 +1,41 @@
+"""
+Ruleset hot paths: parse, diff, validate, serialize and KB log writes.
+"""
+
+import pytest
+
+from app.core import iptables_logger
+from app.core.validator import validate_ruleset
+from app.utils.parser import diff_rulesets, parse_iptables_save, serialize_ruleset
+
+
+def test_parse(benchmark, ruleset_pair):
+    text, _ = ruleset_pair
+    rs = benchmark(parse_iptables_save, text)
+    assert rs.rule_count() > 0
+
+
+def test_serialize(benchmark, ruleset_pair):
+    rs = parse_iptables_save(ruleset_pair[0])
+    out = benchmark(serialize_ruleset, rs)
+    assert out.count("COMMIT") == len(rs.tables)
+
+
+def test_diff(benchmark, ruleset_pair):
+    old, new = (parse_iptables_save(t) for t in ruleset_pair)
+    changes = benchmark(diff_rulesets, old, new)
+    assert changes
+
+
+def test_validate(benchmark, ruleset_pair):
+    rs = parse_iptables_save(ruleset_pair[0])
+    result = benchmark(validate_ruleset, rs)
+    assert result["status"] == "success", result["message"]
+
+
+def test_log_write(benchmark, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(iptables_logger, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(iptables_logger, "LOG_FILE", str(tmp_path / "iptables_kb.jsonl"))
+    result = {"status": "success", "message": "iptables rules applied successfully on 10.10.0.20"}
+    benchmark(iptables_logger.log_kb_entry, "apply", "10.10.0.20", result)
+    assert (tmp_path / "iptables_kb.jsonl").stat().st_size > 0
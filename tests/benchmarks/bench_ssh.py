@@ -0,0 +1,52 @@
+"""
+SSHSessionManager latency against in-process stub servers:
+warm exec, cold connect+exec, bulk output and parallel fan-out.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.ssh_session_manager import SSHSessionManager
+
+
+@pytest.fixture(scope="module")
+def mgr():
+    m = SSHSessionManager()
+    yield m
+    m.stop()
+
+
+def test_exec_warm(benchmark, mgr, stub_fleet, ssh_key_file):
+    srv = stub_fleet[0]
+    mgr.exec(srv.address, "root", ssh_key_file, "hostname", port=srv.port)
+    r = benchmark(mgr.exec, srv.address, "root", ssh_key_file, "hostname", port=srv.port)
+    assert r["status"] == "success" and r["stdout"] == "stub-host"
+
+
+def test_connect_cold(benchmark, mgr, stub_fleet, ssh_key_file):
+    srv = stub_fleet[0]
+
+    def cold():
+        mgr.close_host(srv.address, "root", srv.port)
+        return mgr.exec(srv.address, "root", ssh_key_file, "hostname", port=srv.port)
+
+    r = benchmark.pedantic(cold, rounds=10, iterations=1)
+    assert r["status"] == "success"
+
+
+def test_exec_iptables_save(benchmark, mgr, stub_fleet, ssh_key_file):
+    srv = stub_fleet[0]
+    r = benchmark(mgr.exec, srv.address, "root", ssh_key_file, "iptables-save", port=srv.port)
+    assert r["stdout"].startswith("# Generated by iptables-save")
+
+
+def test_fanout(benchmark, mgr, stub_fleet, ssh_key_file):
+    def fanout():
+        with ThreadPoolExecutor(max_workers=len(stub_fleet)) as pool:
+            futures = [pool.submit(mgr.exec, s.address, "root", ssh_key_file, "hostname", port=s.port)
+                       for s in stub_fleet]
+            return [f.result() for f in futures]
+
+    results = benchmark(fanout)
+    assert all(r["status"] == "success" for r in results)
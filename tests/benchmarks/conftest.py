@@ -0,0 +1,66 @@
+"""
+Shared fixtures for the ruleset/SSH regression benchmarks (pytest-benchmark).
+
+Benchmark modules are named bench_*.py so the regular `pytest tests` run does
+not pick them up; use run_benchmarks.py to execute, store and compare them.
+"""
+
+import logging
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Project root for `app.*`, this directory for the helper modules
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+pytest.importorskip("pytest_benchmark")
+
+from fleet_generator import generate_ruleset, mutate_ruleset  # noqa: E402
+
+# Ruleset sizes to benchmark; add 200000 for the full-scale run
+SIZES = [int(s) for s in os.environ.get("IPTABLES_BENCH_SIZES", "1000,20000").split(",")]
+
+# Cold-connect rounds drop connections on purpose; keep transport noise out of the report
+logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+_cache = {}
+
+
+def ruleset_text(size: int) -> str:
+    if size not in _cache:
+        _cache[size] = generate_ruleset(size, seed=size)
+    return _cache[size]
+
+
+@pytest.fixture(params=SIZES, ids=lambda n: f"{n}rules")
+def ruleset_pair(request):
+    """(original, edited) iptables-save texts of the requested size."""
+    text = ruleset_text(request.param)
+    return text, mutate_ruleset(text, max(1, request.param // 100))
+
+
+@pytest.fixture(scope="session")
+def ssh_key_file(tmp_path_factory):
+    import paramiko
+
+    path = tmp_path_factory.mktemp("keys") / "id_rsa"
+    paramiko.RSAKey.generate(2048).write_private_key_file(str(path))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def stub_fleet():
+    """Sixteen in-process SSH servers on 127.0.0.1 … 127.0.0.16, sharing one port each."""
+    import paramiko
+    from ssh_stub_server import StubSSHServer
+
+    host_key = paramiko.RSAKey.generate(2048)
+    responses = {"hostname": "stub-host", "iptables-save": ruleset_text(1000)}
+    servers = [StubSSHServer(f"127.0.0.{i}", responses=responses, host_key=host_key).start()
+               for i in range(1, 17)]
+    yield servers
+    for s in servers:
+        s.stop()
@@ -0,0 +1,132 @@
+"""
+fleet_generator.py
+------------------
+Deterministic generator of realistic iptables-save rulesets for benchmarks.
+
+    generate_ruleset(20_000)            → one host's iptables-save text
+    generate_fleet(500, 2_000)          → {host_ip: text}, mostly shared chains
+
+Rulesets mix filter/nat/mangle tables, per-service user chains reached from
+INPUT/FORWARD, conntrack shortcuts, multiport and comment matches, LOG rules,
+DNAT port forwards, SNAT/MASQUERADE egress and mangle MARK/TOS rules.
+"""
+
+import random
+from typing import Dict, List
+
+HEADER = "# Generated by iptables-save v1.8.7 on Wed Oct 22 00:39:56 2025"
+FOOTER = "# Completed on Wed Oct 22 00:39:56 2025"
+
+SERVICES = [("tcp", "22"), ("tcp", "80"), ("tcp", "443"), ("udp", "53"), ("tcp", "3306"),
+            ("tcp", "5432"), ("tcp", "8080:8089"), ("udp", "123"), ("tcp", "6379"), ("udp", "514")]
+
+
+def _ip(rng: random.Random) -> str:
+    return f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+
+def _net(rng: random.Random) -> str:
+    return f"10.{rng.randrange(256)}.{rng.randrange(256)}.0/24"
+
+
+def _filter_rule(rng: random.Random, chain: str) -> str:
+    proto, port = rng.choice(SERVICES)
+    kind = rng.random()
+    src = f" -s {_net(rng) if rng.random() < 0.6 else _ip(rng) + '/32'}" if rng.random() < 0.8 else ""
+    dst = f" -d {_ip(rng)}/32" if rng.random() < 0.3 else ""
+    if kind < 0.15:
+        ports = ",".join(p for _, p in rng.sample(SERVICES, 3) if ":" not in p) or "443"
+        return f"-A {chain}{src} -p tcp -m multiport --dports {ports} -j ACCEPT"
+    if kind < 0.22:
+        return (f"-A {chain}{src}{dst} -p {proto} -m {proto} --dport {port} "
+                f"-m limit --limit 5/min -j LOG --log-prefix \"drop-{chain.lower()}: \"")
+    if kind < 0.35:
+        return f"-A {chain}{src}{dst} -p {proto} -m {proto} --dport {port} -j DROP"
+    if kind < 0.42:
+        return f"-A {chain}{src}{dst} -p {proto} -m {proto} --dport {port} -j REJECT --reject-with icmp-port-unreachable"
+    comment = f" -m comment --comment \"ticket {rng.randrange(1000, 9999)}\"" if rng.random() < 0.3 else ""
+    return f"-A {chain}{src}{dst} -p {proto} -m {proto} --dport {port}{comment} -j ACCEPT"
+
+
+def generate_ruleset(
+    n_rules: int,
+    seed: int = 0,
+    nat_ratio: float = 0.15,
+    mangle_ratio: float = 0.05,
+    user_chains: int = 0,
+) -> str:
+    """
+    Build an iptables-save dump with roughly `n_rules` rules.
+    `user_chains` defaults to one chain per ~250 filter rules.
+    """
+    rng = random.Random(seed)
+    n_nat = int(n_rules * nat_ratio)
+    n_mangle = int(n_rules * mangle_ratio)
+    n_filter = max(1, n_rules - n_nat - n_mangle)
+    user_chains = user_chains or max(1, n_filter // 250)
+    chains = [f"SVC_{i:04d}" for i in range(user_chains)]
+
+    out: List[str] = [HEADER, "*filter", ":INPUT DROP [0:0]", ":FORWARD DROP [0:0]", ":OUTPUT ACCEPT [0:0]"]
+    out += [f":{c} - [0:0]" for c in chains]
+    out.append("-A INPUT -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT")
+    out.append("-A INPUT -i lo -j ACCEPT")
+    out.append("-A FORWARD -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT")
+    jumps = [f"-A {'INPUT' if i % 2 else 'FORWARD'} -d {_net(rng)} -j {c}" for i, c in enumerate(chains)]
+    out += jumps
+    remaining = n_filter - len(jumps) - 3
+    for i in range(max(0, remaining)):
+        chain = chains[i % len(chains)] if rng.random() < 0.85 else rng.choice(["INPUT", "FORWARD"])
+        out.append(_filter_rule(rng, chain))
+    out += ["COMMIT", FOOTER]
+
+    if n_nat:
+        out += [HEADER, "*nat", ":PREROUTING ACCEPT [0:0]", ":INPUT ACCEPT [0:0]",
+                ":OUTPUT ACCEPT [0:0]", ":POSTROUTING ACCEPT [0:0]", ":PORTFWD - [0:0]",
+                "-A PREROUTING -m addrtype --dst-type LOCAL -j PORTFWD"]
+        for i in range(n_nat - 1):
+            r = rng.random()
+            if r < 0.6:
+                out.append(f"-A PORTFWD -p tcp -m tcp --dport {10000 + i % 50000} "
+                           f"-j DNAT --to-destination {_ip(rng)}:{rng.choice(['80', '443', '22'])}")
+            elif r < 0.9:
+                out.append(f"-A POSTROUTING -s {_net(rng)} -o eth{rng.randrange(4)} -j SNAT --to-source {_ip(rng)}")
+            else:
+                out.append(f"-A POSTROUTING -s {_net(rng)} -o eth0 -j MASQUERADE")
+        out += ["COMMIT", FOOTER]
+
+    if n_mangle:
+        out += [HEADER, "*mangle", ":PREROUTING ACCEPT [0:0]", ":INPUT ACCEPT [0:0]", ":FORWARD ACCEPT [0:0]",
+                ":OUTPUT ACCEPT [0:0]", ":POSTROUTING ACCEPT [0:0]"]
+        for _ in range(n_mangle):
+            if rng.random() < 0.7:
+                out.append(f"-A PREROUTING -s {_net(rng)} -j MARK --set-xmark 0x{rng.randrange(1, 255):x}/0xffffffff")
+            else:
+                out.append(f"-A POSTROUTING -p tcp -m tcp --dport {rng.choice(['22', '443'])} -j TOS --set-tos 0x10/0x3f")
+        out += ["COMMIT", FOOTER]
+
+    return "\n".join(out) + "\n"
+
+
+def mutate_ruleset(text: str, changes: int, seed: int = 1) -> str:
+    """Return a copy of `text` with `changes` rules replaced, as a policy edit would."""
+    rng = random.Random(seed)
+    lines = text.splitlines()
+    rule_idx = [i for i, line in enumerate(lines) if line.startswith("-A SVC_")]
+    for i in rng.sample(rule_idx, min(changes, len(rule_idx))):
+        chain = lines[i].split()[1]
+        lines[i] = _filter_rule(rng, chain)
+    return "\n".join(lines) + "\n"
+
+
+def generate_fleet(n_hosts: int, n_rules: int, seed: int = 0, variants: int = 8) -> Dict[str, str]:
+    """
+    Rulesets for `n_hosts` hosts drawn from a handful of policy variants,
+    each host carrying a few host-specific edits.
+    """
+    base = [generate_ruleset(n_rules, seed=seed + v) for v in range(variants)]
+    fleet = {}
+    for h in range(n_hosts):
+        host = f"10.{100 + h // 65536}.{(h // 256) % 256}.{h % 256}"
+        text = base[h % variants]
+        fleet[host] = mutate_ruleset(text, 2, seed=h) if h % 5 == 0 else text
+    return fleet
@@ -0,0 +1,41 @@
+"""
+run_benchmarks.py
+-----------------
+Run the regression benchmarks, store results and compare with the last run.
+
+    python tests/benchmarks/run_benchmarks.py                  # default sizes
+    IPTABLES_BENCH_SIZES=1000,20000,200000 python tests/benchmarks/run_benchmarks.py
+
+Results are saved under tests/benchmarks/results/ (one JSON per run, tagged
+with the git commit by pytest-benchmark). When a previous run exists the new
+one is compared against it and the run fails if any mean regresses by more
+than REGRESSION_THRESHOLD.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+HERE = Path(__file__).resolve().parent
+STORAGE = HERE / "results"
+REGRESSION_THRESHOLD = "mean:15%"
+
+
+def main(extra_args):
+    args = [
+        str(HERE / "bench_ruleset.py"),
+        str(HERE / "bench_ssh.py"),
+        str(HERE / "bench_openssh.py"),
+        "-q",
+        f"--benchmark-storage=file://{STORAGE}",
+        "--benchmark-autosave",
+        "--benchmark-columns=min,mean,median,ops,rounds",
+    ]
+    if any(STORAGE.rglob("*.json")):
+        args += ["--benchmark-compare", f"--benchmark-compare-fail={REGRESSION_THRESHOLD}"]
+    return pytest.main(args + list(extra_args))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,121 @@
+"""
+ssh_stub_server.py
+------------------
+In-process Paramiko SSH server used as a stand-in for lab hosts, so that
+SSHSessionManager connect/exec/fan-out latency can be measured without
+containers or root.
+
+    srv = StubSSHServer("127.0.0.2", responses={"hostname": "stub"})
+    srv.start()  ...  srv.stop()
+
+Any public key is accepted. `exec` requests are answered from `responses`
+(exact command match, then longest prefix; str or bytes) and exit 0; unknown
+commands exit 127. A callable response is handed the channel and the command
+and streams whatever it likes; it returns the exit status. compress=True lets clients negotiate zlib transport
+compression.
+"""
+
+import socket
+import threading
+from typing import Dict, Optional, Union
+
+import paramiko
+
+
+class _StubInterface(paramiko.ServerInterface):
+    def __init__(self, server: "StubSSHServer"):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server._answer, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+
+class StubSSHServer:
+    """Minimal SSH server listening on (address, port) in background threads."""
+
+    def __init__(self, address: str = "127.0.0.1", port: int = 0,
+                 responses: Optional[Dict[str, Union[str, bytes]]] = None,
+                 host_key: Optional[paramiko.PKey] = None, compress: bool = False):
+        self.responses = responses or {"hostname": "stub-host"}
+        self.compress = compress
+        self.host_key = host_key or paramiko.RSAKey.generate(2048)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((address, port))
+        self._sock.listen(64)
+        self.address, self.port = self._sock.getsockname()
+        self._transports = []
+        self._running = False
+        self.commands_served = 0
+
+    def start(self) -> "StubSSHServer":
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        try:
+            self._sock.close()
+        except Exception:
+            pass
+        for t in self._transports:
+            try:
+                t.close()
+            except Exception:
+                pass
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            t = paramiko.Transport(conn)
+            t.add_server_key(self.host_key)
+            t.use_compression(self.compress)
+            self._transports.append(t)
+            try:
+                t.start_server(server=_StubInterface(self))
+            except Exception:
+                t.close()
+
+    def _answer(self, channel: paramiko.Channel, command: str):
+        out = self.responses.get(command)
+        if out is None:
+            for prefix in sorted(self.responses, key=len, reverse=True):
+                if command.startswith(prefix):
+                    out = self.responses[prefix]
+                    break
+        try:
+            if out is None:
+                channel.sendall_stderr(f"stub: {command}: command not found\n".encode())
+                channel.send_exit_status(127)
+            elif callable(out):
+                channel.send_exit_status(out(channel, command) or 0)
+            else:
+                channel.sendall(out if isinstance(out, bytes) else out.encode())
+                channel.send_exit_status(0)
+            channel.shutdown_write()
+            self.commands_served += 1
+            # Closing before the client has seen the exec reply makes it fail
+            # with "Channel closed."; wait for the client to hang up first.
+            channel.settimeout(10)
+            channel.recv(1)
+        except Exception:
+            pass
+        finally:
+            channel.close()
@@ -0,0 +1,34 @@
+"""
+conftest.py
+-----------
+Fixtures shared by the SSH tests: one client key for the whole session (RSA
+generation is the slowest part of most of them) and a session manager with
+a short retry backoff, stopped after each test.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(scope="session")
+def key(tmp_path_factory):
+    import paramiko
+
+    path = tmp_path_factory.mktemp("ssh") / "id_rsa"
+    paramiko.RSAKey.generate(2048).write_private_key_file(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def mgr(monkeypatch):
+    from app.core import ssh_session_manager as ssm
+
+    monkeypatch.setattr(ssm, "RETRY_INITIAL_DELAY_S", 0.01)
+    m = ssm.SSHSessionManager()
+    yield m
+    m.stop()
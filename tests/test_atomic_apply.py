@@ -0,0 +1,202 @@
+"""
+test_atomic_apply.py
+--------------------
+Atomic apply with the on-host dead-man timer: the generated shell runs
+against fake iptables binaries, and the full apply flow against the SSH stub.
+"""
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core import iptables_logger
+from app.core import ssh_session_manager as ssm
+from app.core.iptables_apply import (EXIT_ALREADY_ARMED, EXIT_EXPIRED, EXIT_RESTORE_FAILED, apply_iptables_rules,
+                                     arm_command, confirm_command)
+from app.core.ruleset_store import RulesetStore
+from ssh_stub_server import StubSSHServer
+
+OLD = "*filter\n:INPUT ACCEPT [0:0]\nCOMMIT\n"
+NEW = "*filter\n:INPUT DROP [0:0]\n-A INPUT -p tcp --dport 22 -j ACCEPT\nCOMMIT\n"
+
+
+@pytest.fixture
+def host(tmp_path):
+    """A fake host: iptables-save/-restore read and write a 'kernel' file."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    kernel = tmp_path / "kernel"
+    kernel.write_text(OLD)
+    (bin_dir / "iptables-save").write_text(f"#!/bin/sh\ncat {kernel}\n")
+    (bin_dir / "iptables-restore").write_text(
+        f"#!/bin/sh\ncat > {kernel}.in\ngrep -q BAD {kernel}.in && exit 1\nmv {kernel}.in {kernel}\n")
+    for f in bin_dir.iterdir():
+        f.chmod(0o755)
+    (tmp_path / "new.rules").write_text(NEW)
+
+    def run(cmd):
+        return subprocess.run(["sh", "-c", cmd], capture_output=True, text=True, timeout=10,
+                              env={"PATH": f"{bin_dir}:/usr/bin:/bin"})
+
+    return run, kernel, tmp_path
+
+
+def test_confirm_cancels_the_timer(host):
+    run, kernel, tmp = host
+    state = str(tmp / "apply-1")
+    armed = run(arm_command(state, str(tmp / "new.rules"), 1))
+    assert armed.returncode == 0 and armed.stdout == OLD and kernel.read_text() == NEW
+
+    confirmed = run(confirm_command(state))
+    assert confirmed.returncode == 0 and confirmed.stdout.strip() == "confirmed"
+    time.sleep(1.5)
+    assert kernel.read_text() == NEW
+    assert [p.name for p in tmp.glob("apply-1.*")] == ["apply-1.confirmed"]
+    again = run(confirm_command(state))                         # a retried confirmation
+    assert again.returncode == 0 and again.stdout.strip() == "already confirmed"
+
+
+def test_timer_rolls_back_without_confirmation(host):
+    run, kernel, tmp = host
+    state = str(tmp / "apply-2")
+    assert run(arm_command(state, str(tmp / "new.rules"), 1)).returncode == 0
+    time.sleep(1.5)
+    assert kernel.read_text() == OLD
+    assert run(confirm_command(state)).returncode == EXIT_EXPIRED
+
+
+def test_failed_restore_restores_snapshot(host):
+    run, kernel, tmp = host
+    (tmp / "bad.rules").write_text("BAD\n")
+    armed = run(arm_command(str(tmp / "apply-3"), str(tmp / "bad.rules"), 1))
+    assert armed.returncode == EXIT_RESTORE_FAILED and kernel.read_text() == OLD
+    assert (tmp / "apply-3.failed").exists()
+
+
+def test_rerun_never_overwrites_the_snapshot(host):
+    run, kernel, tmp = host
+    state = str(tmp / "apply-4")
+    assert run(arm_command(state, str(tmp / "new.rules"), 1)).returncode == 0
+    again = run(arm_command(state, str(tmp / "new.rules"), 1))
+    assert again.returncode == EXIT_ALREADY_ARMED and (tmp / "apply-4.bak").read_text() == OLD
+    time.sleep(1.5)
+    assert kernel.read_text() == OLD                            # the one timer restores the real backup
+
+
+def test_channel_drop_after_restore_is_not_retried_blind(host, key, mgr, tmp_path, monkeypatch):
+    """The arm step succeeds on the host but the channel dies before the reply; the manager retries it."""
+    run, kernel, tmp = host
+    monkeypatch.setattr(iptables_logger, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(iptables_logger, "LOG_FILE", str(tmp_path / "kb.jsonl"))
+    attempts = []
+
+    def arm(channel, command):
+        r = run(command.replace("/tmp/iptables.rules", str(tmp / "new.rules")))
+        attempts.append(r.returncode)
+        channel.sendall(r.stdout.encode())
+        return r.returncode
+
+    srv = StubSSHServer("127.0.0.1", responses={"iptables-restore": "", "umask 077": arm,
+                                                "B=": "confirmed"}).start()
+    real = mgr.exec
+    monkeypatch.setattr(mgr, "exec", lambda host, user, key, cmd, port=22, **kw: real(host, user, key, cmd, port=srv.port, **kw))
+    monkeypatch.setattr("app.core.iptables_apply.REMOTE_STATE_DIR", str(tmp))
+    channel = mgr._exec_with_client
+
+    def lossy(client, command, sink=None):
+        result = channel(client, command, sink)
+        if command.startswith("umask 077") and len(attempts) == 1:
+            # Ran on the host, but the reply was lost with the channel
+            return ssm._err("SSHChannelError", "SSH channel error while executing command", EOFError("channel closed"))
+        return result
+
+    monkeypatch.setattr(mgr, "_exec_with_client", lossy)
+    try:
+        r = apply_iptables_rules(srv.address, "root", key, mgr=mgr, store=RulesetStore(tmp_path / "store"),
+                                 rollback_timeout_s=1)
+        assert attempts == [0, EXIT_ALREADY_ARMED]
+        assert r["status"] == "failure" and "state unknown" in r["message"]
+        assert kernel.read_text() == NEW
+        time.sleep(1.5)
+        assert kernel.read_text() == OLD                        # not confirmed: the timer rolled back
+    finally:
+        srv.stop()
+
+
+def test_apply_confirms_over_a_fresh_connection(key, mgr, tmp_path, monkeypatch):
+    monkeypatch.setattr(iptables_logger, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(iptables_logger, "LOG_FILE", str(tmp_path / "kb.jsonl"))
+    store = RulesetStore(tmp_path / "store")
+    srv = StubSSHServer("127.0.0.1", responses={
+        "iptables-restore": "", "umask 077": OLD, "B=": "confirmed", "{ iptables-save": NEW}).start()
+    real = mgr.exec
+    monkeypatch.setattr(mgr, "exec", lambda host, user, key, cmd, port=22, **kw: real(host, user, key, cmd, port=srv.port, **kw))
+    try:
+        r = apply_iptables_rules(srv.address, "root", key, mgr=mgr, store=store)
+        assert r["status"] == "success" and "confirmed" in r["message"]
+        assert len(srv._transports) == 2                       # confirmation used a new connection
+        assert store.version(r["previous_version"])["source"] == "pre-apply"
+        assert store.checkout(r["version"]).startswith("*filter\n:INPUT DROP")
+
+        # The confirmation can go through its own (unthrottled) lane
+        confirms = []
+
+        class Confirms:
+            def exec(self, host, user, key_path, cmd, **kw):
+                confirms.append(cmd)
+                return mgr.exec(host, user, key_path, cmd, **kw)
+
+        r = apply_iptables_rules(srv.address, "root", key, mgr=mgr, store=store, confirm_mgr=Confirms())
+        assert r["status"] == "success" and len(confirms) == 1 and confirms[0].startswith("B=")
+
+        srv.responses.pop("B=")
+        r = apply_iptables_rules(srv.address, "root", key, mgr=mgr, store=store)
+        assert r["status"] == "failure" and "rolls back" in r["message"]
+    finally:
+        srv.stop()
+
+
+def test_lost_confirmation_reply_is_not_reported_as_rollback(host, key, mgr, tmp_path, monkeypatch):
+    """The confirmation runs on the host but its reply is lost; the manager retries it."""
+    run, kernel, tmp = host
+    monkeypatch.setattr(iptables_logger, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(iptables_logger, "LOG_FILE", str(tmp_path / "kb.jsonl"))
+    confirms = []
+
+    def on_host(channel, command):
+        r = run(command.replace("/tmp/iptables.rules", str(tmp / "new.rules")))
+        if command.startswith("B="):
+            confirms.append(r.stdout.strip())
+        channel.sendall(r.stdout.encode())
+        return r.returncode
+
+    srv = StubSSHServer("127.0.0.1", responses={"iptables-restore": "", "umask 077": on_host,
+                                                "B=": on_host, "{ iptables-save": NEW}).start()
+    real = mgr.exec
+    monkeypatch.setattr(mgr, "exec", lambda host, user, key, cmd, port=22, **kw: real(host, user, key, cmd, port=srv.port, **kw))
+    monkeypatch.setattr("app.core.iptables_apply.REMOTE_STATE_DIR", str(tmp))
+    channel = mgr._exec_with_client
+
+    def lossy(client, command, sink=None):
+        result = channel(client, command, sink)
+        if command.startswith("B=") and len(confirms) == 1:
+            return ssm._err("SSHChannelError", "SSH channel error while executing command", EOFError("channel closed"))
+        return result
+
+    monkeypatch.setattr(mgr, "_exec_with_client", lossy)
+    try:
+        r = apply_iptables_rules(srv.address, "root", key, mgr=mgr, store=RulesetStore(tmp_path / "store"),
+                                 rollback_timeout_s=1)
+        assert confirms == ["confirmed", "already confirmed"]
+        assert r["status"] == "success", r["message"]
+        time.sleep(1.5)
+        assert kernel.read_text() == NEW                        # the timer was cancelled
+    finally:
+        srv.stop()
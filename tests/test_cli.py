@@ -0,0 +1,109 @@
+"""
+test_cli.py
+-----------
+CLI start-up budget and behaviour: `python -X importtime` shows that the CLI
+and the pipeline step modules load no heavy dependency (paramiko,
+cryptography, numpy, flask) until a command needs it, and that import time
+stays within budget; `logs` filters the KB log without touching SSH.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from app import cli
+
+HEAVY = ("paramiko", "cryptography", "numpy", "flask", "werkzeug")
+CLI_IMPORT_BUDGET_MS = 60           # ~15 ms measured; headroom for slow runners
+CORE_IMPORT_BUDGET_MS = 150         # paramiko alone used to cost ~185 ms
+
+
+def _importtime(*args, cwd=ROOT):
+    """Run python -X importtime; returns ({module: cumulative µs}, stdout, exit code)."""
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    r = subprocess.run([sys.executable, "-X", "importtime", *args], capture_output=True, text=True,
+                       cwd=cwd, env=env)
+    modules = {}
+    for line in r.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules, r.stdout, r.returncode
+
+
+def _heavy(modules):
+    return sorted(m for m in modules if m.split(".")[0] in HEAVY)
+
+
+def test_cli_starts_without_heavy_imports(tmp_path):
+    modules, out, code = _importtime("-m", "app.cli", "--help")
+    assert code == 0 and "snapshot" in out
+    assert _heavy(modules) == []
+
+    best = min(_importtime("-c", "import app.cli")[0]["app.cli"] for _ in range(3))
+    assert best / 1000 < CLI_IMPORT_BUDGET_MS
+
+
+@pytest.mark.parametrize("module", ["app.core.iptables_apply", "app.core.iptables_push",
+                                    "app.core.host_discovery", "app.core.ruleset_collector",
+                                    "app.core.multi_host_executor"])
+def test_pipeline_modules_defer_paramiko(module):
+    modules, _, code = _importtime("-c", f"import {module}")
+    assert code == 0
+    assert _heavy(modules) == []
+    assert modules[module] / 1000 < CORE_IMPORT_BUDGET_MS
+
+
+def test_logs_command(tmp_path, monkeypatch, capsys):
+    log = tmp_path / "logs" / "kb" / "iptables_kb.jsonl"
+    log.parent.mkdir(parents=True)
+    with open(log, "w") as f:
+        for i in range(200):
+            f.write(json.dumps({"timestamp": f"2025-01-01T00:00:{i % 60:02d}", "action": ["push", "apply"][i % 2],
+                                "host": f"10.10.0.{i % 5}", "status": "success", "message": f"entry {i}"}) + "\n")
+        f.write("not json\n")
+
+    # A log-only invocation never loads SSH support
+    modules, out, code = _importtime("-m", "app.cli", "logs", "-n", "2", cwd=tmp_path)
+    assert code == 0 and out.count("\n") == 2 and _heavy(modules) == []
+
+    monkeypatch.chdir(tmp_path)
+    assert cli.main(["logs", "-n", "3", "--host", "10.10.0.3", "--action", "apply", "--json"]) == 0
+    entries = [json.loads(l) for l in capsys.readouterr().out.splitlines()]
+    assert [e["message"] for e in entries] == ["entry 173", "entry 183", "entry 193"]
+
+    with pytest.raises(SystemExit):
+        cli.main(["apply"])                                     # hosts are required
+    with pytest.raises(SystemExit):
+        cli.main(["preflight", "10.10.0.3", "--pin", "SHA256:no-host"])
+
+
+def test_json_fan_out_keeps_worker_prints_off_stdout(capsys):
+    import argparse
+    import threading
+    import time
+
+    started = threading.Barrier(4)
+
+    def chatty(host):
+        started.wait(5)
+        for i in range(50):
+            print(f"🔧 {host} step {i}")                       # progress, as push/apply print it
+            time.sleep(0.0005)
+        return {"status": "success", "message": host}
+
+    args = argparse.Namespace(json=True, workers=4, hosts=[f"10.10.0.{i}" for i in range(8)])
+    assert cli._fan_out(args, lambda h: chatty(h) if h < "10.10.0.4" else {"status": "success"}) == 0
+    out, err = capsys.readouterr()
+    assert sorted(json.loads(line)["host"] for line in out.splitlines()) == sorted(args.hosts)
+    assert err.count("step") == 4 * 50
+    assert sys.stdout is not sys.stderr                        # restored for the caller
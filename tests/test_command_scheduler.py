@@ -0,0 +1,165 @@
+"""
+test_command_scheduler.py
+-------------------------
+Priority-aware command scheduling: admission order by class, slots held back
+for interactive reads during a rollout, per-host limits, token-bucket rate
+limiting, backpressure refusals and lanes as drop-in session managers.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.core import command_scheduler
+from app.core.command_scheduler import (BACKGROUND, INTERACTIVE, ROLLOUT, SCHED_THROTTLED_TOTAL, Backpressure,
+                                        CommandScheduler, admitted)
+
+
+class GatedManager:
+    """Records commands as they start; each one blocks until the gate opens."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = []
+        self.closed = []
+
+    def exec(self, host, user, key_path, command, **kw):
+        self.started.append(command)
+        self.gate.wait(10)
+        return {"status": "success", "stdout": command}
+
+    def close_host(self, host, user, port=22):
+        self.closed.append(host)
+
+
+def _submit(sched, host, command, priority):
+    t = threading.Thread(target=sched.exec, args=(host, "root", "-", command), kwargs={"priority": priority})
+    t.start()
+    return t
+
+
+def _until(fn, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if fn():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def test_admits_highest_class_first():
+    mgr = GatedManager()
+    sched = CommandScheduler(mgr, max_inflight=1)
+    threads = [_submit(sched, "h1", "first", ROLLOUT)]
+    assert _until(lambda: mgr.started == ["first"])
+    for cmd, prio in (("poll", BACKGROUND), ("push", ROLLOUT), ("read", INTERACTIVE)):
+        threads.append(_submit(sched, "h2", cmd, prio))
+    assert _until(lambda: sum(sched.stats()["queued"].values()) == 3)
+    mgr.gate.set()
+    for t in threads:
+        t.join(5)
+    assert mgr.started == ["first", "read", "push", "poll"]
+    assert sched.stats()["inflight"] == {INTERACTIVE: 0, ROLLOUT: 0, BACKGROUND: 0}
+
+
+def test_rollout_leaves_room_for_interactive_reads():
+    mgr = GatedManager()
+    sched = CommandScheduler(mgr, max_inflight=10, max_per_host=2)
+    threads = [_submit(sched, f"10.10.0.{i}", "restore", ROLLOUT) for i in range(6)]
+    threads += [_submit(sched, "10.10.0.0", "restore", ROLLOUT)]      # same host as the first
+    # 10 slots - 8 held back = 2 rollout commands at a time, one per host
+    assert _until(lambda: sched.stats()["queued"][ROLLOUT] == 5)
+    assert sched.stats()["inflight"][ROLLOUT] == 2
+
+    done = threading.Event()
+    read = threading.Thread(target=lambda: (sched.exec("10.10.0.0", "root", "-", "iptables -S",
+                                                       priority=INTERACTIVE), done.set()))
+    read.start()
+    assert _until(lambda: "iptables -S" in mgr.started, 2)
+    mgr.gate.set()
+    for t in threads + [read]:
+        t.join(5)
+    assert done.is_set() and len(mgr.started) == 8
+
+
+def test_token_bucket_throttles_class():
+    class Instant:
+        def exec(self, host, user, key_path, command, **kw):
+            return {"status": "success"}
+
+    sched = CommandScheduler(Instant(), rates={ROLLOUT: (20.0, 2)})
+    before = SCHED_THROTTLED_TOTAL.value(ROLLOUT)
+    t0 = time.perf_counter()
+    for _ in range(4):
+        assert sched.exec("h", "root", "-", "true", priority=ROLLOUT)["status"] == "success"
+    # burst of 2, then 20/s: the last two wait ~50 ms each
+    assert time.perf_counter() - t0 >= 0.09
+    assert SCHED_THROTTLED_TOTAL.value(ROLLOUT) - before == 2
+    t0 = time.perf_counter()
+    for _ in range(50):
+        sched.exec("h", "root", "-", "true", priority=INTERACTIVE)
+    assert time.perf_counter() - t0 < 0.5                                  # not rate limited
+
+
+def test_backpressure(monkeypatch):
+    mgr = GatedManager()
+    sched = CommandScheduler(mgr, max_inflight=1)
+    t = _submit(sched, "h", "busy", ROLLOUT)
+    assert _until(lambda: mgr.started == ["busy"])
+
+    r = sched.exec("h", "root", "-", "late", priority=BACKGROUND, max_wait_s=0.05)
+    assert r["status"] == "failure" and r["error_type"] == "QueueTimeout"
+    monkeypatch.setitem(command_scheduler.MAX_QUEUED, BACKGROUND, 0)
+    r = sched.exec("h", "root", "-", "more", priority=BACKGROUND)
+    assert r["error_type"] == "Overloaded"
+    with pytest.raises(Backpressure):
+        with sched.slot("h", BACKGROUND):
+            pass
+    assert sched.stats()["queued"][BACKGROUND] == 0
+    mgr.gate.set()
+    t.join(5)
+
+
+def test_lane_is_a_drop_in_manager():
+    mgr = GatedManager()
+    mgr.gate.set()
+    sched = CommandScheduler(mgr)
+    lane = sched.lane(INTERACTIVE)
+    assert lane.exec("h", "root", "-", "hostname")["stdout"] == "hostname"
+    lane.close_host("h", "root")                                          # not scheduled, passed through
+    assert mgr.closed == ["h"]
+
+    with admitted(lane, "h"):
+        assert sched.stats()["inflight"][INTERACTIVE] == 1
+    with admitted(mgr, "h"):
+        assert sched.stats()["inflight"][INTERACTIVE] == 0
+    with pytest.raises(ValueError):
+        sched.lane("urgent")
+
+
+def test_exec_route_only_runs_allow_listed_reads(monkeypatch):
+    pytest.importorskip("flask")
+    import main_process
+    from app.core import multi_host_executor
+    from app.core.remote_command_executor import validate_command
+
+    assert validate_command("hostname") and validate_command("iptables -t nat -L -n -v")
+    for cmd in ("hostname; iptables -F; reboot", "hostname && reboot", "iptables -L $(reboot)", "uptime\nreboot",
+                "iptables -L -F", "iptables-save > /etc/passwd", "hostnamectl set-hostname x", ""):
+        assert not validate_command(cmd), cmd
+
+    client = main_process.app.test_client()
+    r = client.post("/api/hosts/exec", json={"hosts": ["10.10.0.20"], "command": "hostname; iptables -F"})
+    assert r.status_code == 403
+
+    seen = []
+    monkeypatch.setattr(multi_host_executor, "execute_on_multiple_hosts",
+                        lambda hosts, user, key_path, command, **kw: seen.append((user, key_path)) or {})
+    client.post("/api/hosts/exec", json={"hosts": ["h"], "command": "hostname", "user": "x", "key_path": "/etc/shadow"})
+    assert seen == [(main_process.DEFAULT_USER, main_process.DEFAULT_KEY)]
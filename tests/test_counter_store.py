@@ -0,0 +1,131 @@
+"""
+test_counter_store.py
+---------------------
+Per-rule counter history: rates across counter resets and segment
+boundaries, recording parsed rulesets, torn-append recovery, and top-N /
+anomaly queries over four weeks of fleet samples within the time budget.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.core import counter_store
+from app.core.counter_store import CounterStore
+from app.utils.parser import parse_iptables_save
+
+QUERY_BUDGET_S = 1.0
+DAY = 86400
+NOW = 1_700_000_000
+
+
+def _save(ssh_hits, web_hits, extra=False):
+    lines = ["*filter", ":INPUT ACCEPT [0:0]",
+             f"[{ssh_hits}:{ssh_hits * 60}] -A INPUT -p tcp --dport 22 -j ACCEPT",
+             f"[{web_hits}:{web_hits * 1000}] -A INPUT -p tcp --dport 443 -j ACCEPT"]
+    if extra:
+        lines.append("[0:0] -A INPUT -p udp --dport 53 -j ACCEPT")
+    return parse_iptables_save("\n".join(lines + ["COMMIT", ""]))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CounterStore(tmp_path / "counters")
+
+
+def test_rates_across_resets_and_segments(store, tmp_path):
+    samples = [(0, 0), (100, 1000), (250, 1500), (50, 1600), (150, 2000)]   # ssh counter reset at the 4th
+    for i, (ssh, web) in enumerate(samples):
+        store.record("fw1", _save(ssh, web), when=NOW + i * 60)
+    # A rule is added: new segment, existing rules carry their last values across
+    store.record("fw1", _save(400, 2000, extra=True), when=NOW + 300)
+    assert store.stats()["segments"] == 2
+
+    top = {r["rule"]: r for r in store.top(5)}
+    ssh = top["-A INPUT -p tcp --dport 22 -j ACCEPT"]
+    assert ssh["packets"] == 100 + 150 + 50 + 100 + 250 and ssh["packets_per_s"] == pytest.approx(650 / 300, abs=1e-3)
+    assert ssh["bytes"] == 650 * 60
+    assert top["-A INPUT -p tcp --dport 443 -j ACCEPT"]["packets"] == 2000
+    assert "-A INPUT -p udp --dport 53 -j ACCEPT" not in top               # a single sample has no rate
+
+    window = store.top(5, start=NOW + 60, end=NOW + 120)
+    assert [(r["rule"].split()[5], r["packets"]) for r in window] == [("443", 500), ("22", 150)]
+    assert store.top(5, by="bytes", hosts=["fw2"]) == []
+    with pytest.raises(ValueError):
+        store.top(5, by="hits")
+
+    # Reopening (new process) sees the same history
+    assert CounterStore(tmp_path / "counters").top(5) == store.top(5)
+
+
+def test_torn_append_is_cut_back(store, tmp_path):
+    for i in range(3):
+        store.record("fw1", _save(10 * i, 20 * i), when=NOW + i)
+    seg = next((store.root / "fw1").iterdir())
+    with open(seg / "packets.i64", "ab") as f:
+        f.write(b"\x01\x02\x03")                                       # crash mid-append
+    with open(seg / "bytes.i64", "ab") as f:
+        f.write(np.int64(7).tobytes() * 2)                              # a full row, but no timestamp
+
+    reopened = CounterStore(tmp_path / "counters")
+    reopened.record("fw1", _save(30, 60), when=NOW + 3)
+    assert reopened.stats()["samples"] == 4 and reopened.stats()["segments"] == 1
+    assert {r["packets"] for r in reopened.top(2)} == {30, 60}
+
+
+def _fleet(store, hosts=20, rules=100, days=28, step_s=600, seed=3):
+    """Poisson traffic per rule; fw0 rule 0 spikes and fw1 rule 1 goes silent in the last hour."""
+    rng = np.random.default_rng(seed)
+    ts = NOW - days * DAY + np.arange(days * DAY // step_s + 1) * step_s
+    recent = ts > NOW - 3600
+    for h in range(hosts):
+        keys = [(f"fw{h}", "filter", "INPUT", f"-A INPUT -p tcp --dport {1000 + i} -j ACCEPT")
+                for i in range(rules)]
+        hits = rng.poisson(rng.uniform(0.5, 2.0, rules) * step_s, (len(ts), rules))
+        if h == 0:
+            hits[recent, 0] *= 20
+        if h == 1:
+            hits[recent, 1] = 0
+        store.record_batch(f"fw{h}", keys, ts, np.cumsum(hits, axis=0), np.cumsum(hits * 100, axis=0))
+
+
+def test_fleet_queries_within_budget(store, monkeypatch):
+    monkeypatch.setattr(counter_store, "SEGMENT_ROWS", 1008)                # a week per segment
+    _fleet(store)
+    assert store.stats()["segments"] == 20 * 5 and store.stats()["samples"] == 20 * 4033
+
+    t0 = time.perf_counter()
+    top = store.top(3, by="bytes", start=NOW - 28 * DAY, end=NOW)
+    found = store.anomalies(recent_s=3600, baseline_s=7 * DAY, now=NOW)
+    elapsed = time.perf_counter() - t0
+    assert elapsed < QUERY_BUDGET_S, f"queries took {elapsed:.2f}s"
+
+    assert len(top) == 3 and top[0]["bytes"] >= top[1]["bytes"] >= top[2]["bytes"]
+    assert [(a["kind"], a["host"], a["rule"]) for a in found] == [
+        ("dead", "fw1", "-A INPUT -p tcp --dport 1001 -j ACCEPT"),
+        ("spike", "fw0", "-A INPUT -p tcp --dport 1000 -j ACCEPT"),
+    ]
+    assert found[1]["recent_pps"] > 10 * found[1]["baseline_pps"]
+
+
+def test_counter_endpoints(tmp_path, monkeypatch):
+    pytest.importorskip("flask")
+    import main_process
+
+    monkeypatch.setattr(counter_store, "COUNTER_DIR", tmp_path / "counters")
+    store = counter_store.default_counter_store()
+    for i, hits in enumerate((0, 10, 20, 900)):
+        store.record("fw1", _save(hits, 5 * i), when=NOW - 3 * 3600 + i * 3600)
+    client = main_process.app.test_client()
+
+    body = client.get(f"/api/counters/top?n=1&by=bytes&end={NOW}").get_json()
+    assert body["rules"][0]["rule"].endswith("--dport 22 -j ACCEPT") and body["rules"][0]["bytes"] == 900 * 60
+    assert client.get("/api/counters/top?by=hits").status_code == 400
+    found = client.get(f"/api/counters/anomalies?recent=3600&baseline=7200&now={NOW}").get_json()["anomalies"]
+    assert [a["kind"] for a in found] == ["spike"]
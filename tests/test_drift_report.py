@@ -0,0 +1,119 @@
+"""
+test_drift_report.py
+--------------------
+Fleet drift report: on-host chain digests agree with the local ones (also for
+non-canonical intended rules), only differing chains are fetched, and the
+parallel report sorts hosts into in sync / drifted / unchecked.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core.drift_report import (canonical, check_drift, digest_command, drift_report, fetch_command,
+                                   intended_from_store, local_digests, parse_digests)
+from app.core.ruleset_store import RulesetStore
+from app.utils.parser import parse_iptables_save
+from fleet_generator import generate_ruleset
+from ssh_stub_server import StubSSHServer
+
+# How an operator writes it...
+INTENDED = """*filter
+:INPUT DROP [0:0]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [0:0]
+:MGMT - [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -p tcp --dport 22 -j MGMT
+-A MGMT --source 10.10.0.5 -j ACCEPT
+-A MGMT -j DROP
+COMMIT
+"""
+# ...and how iptables-save prints the same thing, with counters
+LIVE = """# Generated by iptables-save v1.8.7
+*filter
+:INPUT DROP [120:9000]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [80:7000]
+:MGMT - [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 22 -j MGMT
+-A MGMT -s 10.10.0.5/32 -j ACCEPT
+-A MGMT -j DROP
+COMMIT
+"""
+
+
+def _host_digests(tmp_path, text: str, tables=None) -> str:
+    """Run the real digest command against a fake iptables-save printing `text`."""
+    (tmp_path / "rules").write_text(text)
+    fake = tmp_path / "iptables-save"
+    fake.write_text(f"#!/bin/sh\ncat {tmp_path / 'rules'}\n")
+    fake.chmod(0o755)
+    env = {**os.environ, "PATH": f"{tmp_path}:{os.environ['PATH']}"}
+    r = subprocess.run(["sh", "-c", digest_command(tables)], capture_output=True, text=True, env=env)
+    assert r.returncode == 0, r.stderr
+    return r.stdout
+
+
+def _fetched(text: str, chains) -> str:
+    ruleset = parse_iptables_save(text)
+    out = []
+    for t, c in chains:
+        chain = ruleset.tables[t].chains[c]
+        out.append(f"*{t} {c}")
+        out.append(f"-P {c} {chain.policy}" if chain.builtin else f"-N {c}")
+        out.extend(r.to_line(counters=False) for r in chain.rules)
+    return "\n".join(out) + "\n"
+
+
+def test_host_and_local_digests_agree(tmp_path):
+    assert parse_digests(_host_digests(tmp_path, LIVE)) == local_digests(canonical(parse_iptables_save(INTENDED)))
+
+    big = generate_ruleset(3000, seed=11)
+    host = parse_digests(_host_digests(tmp_path, big))
+    assert len(host) > 10 and host == local_digests(canonical(parse_iptables_save(big)))
+
+
+def test_check_drift_fetches_only_differing_chains(key, mgr, tmp_path):
+    live = LIVE.replace("-A MGMT -j DROP", "-A MGMT -s 10.10.0.6/32 -j ACCEPT\n-A MGMT -j DROP") \
+               .replace(":OUTPUT ACCEPT [80:7000]", ":OUTPUT DROP [0:0]\n:DOCKER - [0:0]")
+    srv = StubSSHServer(responses={
+        "D=$(mktemp -d)": _host_digests(tmp_path, live, ["filter"]),
+        # exact key: any other chain selection is answered with exit 127
+        fetch_command([("filter", "OUTPUT"), ("filter", "MGMT")]):
+            _fetched(live, [("filter", "OUTPUT"), ("filter", "MGMT")]),
+    }).start()
+    try:
+        r = check_drift(srv.address, "root", key, INTENDED, mgr=mgr, port=srv.port)
+        assert r["status"] == "success" and not r["in_sync"], r["message"]
+        assert r["chains"] == 4 and r["matching"] == 2
+        assert r["drifted"] == {
+            "filter/OUTPUT": {"policy": ("ACCEPT", "DROP"), "missing": [], "unexpected": [], "reordered": False},
+            "filter/MGMT": {"policy": None, "missing": [], "unexpected": ["-s 10.10.0.6/32 -j ACCEPT"],
+                            "reordered": False},
+        }
+        assert r["missing"] == [] and r["extra"] == ["filter/DOCKER"]
+    finally:
+        srv.stop()
+
+
+def test_drift_report_in_parallel(key, mgr, tmp_path):
+    srv = StubSSHServer(responses={"D=$(mktemp -d)": _host_digests(tmp_path, LIVE, ["filter"])}).start()
+    store = RulesetStore(tmp_path / "store")
+    store.record(srv.address, INTENDED)
+    try:
+        report = drift_report([srv.address, "10.99.0.1"], "root", key, intended=intended_from_store(store),
+                              mgr=mgr, port=srv.port)
+        assert report["status"] == "partial"
+        assert report["hosts"][srv.address]["in_sync"] and report["drifted"] == []
+        assert report["failed"] == ["10.99.0.1"]
+        assert "no recorded version" in report["hosts"]["10.99.0.1"]["message"]
+    finally:
+        srv.stop()
+
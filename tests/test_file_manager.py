@@ -0,0 +1,97 @@
+"""
+test_file_manager.py
+--------------------
+Memory-mapped file handling: zero-copy lines, paging through a large archive
+without reading it, tail/search, hashing, streamed parsing and atomic writes.
+"""
+
+import hashlib
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the fleet generator) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.utils import file_manager
+from app.utils.file_manager import MappedFile, atomic_write, file_digest, fingerprint, parse_ruleset_file
+from app.utils.parser import parse_iptables_save, serialize_ruleset
+from fleet_generator import generate_ruleset
+
+DUMP = generate_ruleset(2000, seed=9)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """~15 MB of concatenated dumps, like a snapshot archive."""
+    path = tmp_path / "archive.rules"
+    with open(path, "w") as f:
+        for _ in range(60):
+            f.write(DUMP)
+    return path
+
+
+def test_lines_match_splitlines(tmp_path):
+    path = tmp_path / "x"
+    for content in (b"", b"a", b"a\n", b"a\n\nb", "é\nü\n".encode()):
+        path.write_bytes(content)
+        with MappedFile(path) as mf:
+            assert [bytes(l) for l in mf.lines()] == content.split(b"\n")[:len(content.splitlines())]
+            assert list(mf.text_lines()) == content.decode().splitlines()
+            assert mf.line_count() == len(content.splitlines())
+
+
+def test_text_lines_across_chunk_boundaries(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_manager, "DECODE_CHUNK", 7)      # splits lines and multi-byte characters
+    path = tmp_path / "x"
+    text = "ünïcödé line\n" * 20 + "last"
+    path.write_text(text)
+    with MappedFile(path) as mf:
+        assert list(mf.text_lines()) == text.splitlines()
+
+
+def test_browse_archive_without_reading_it(archive):
+    expected = archive.read_text().splitlines()
+    tracemalloc.start()
+    with MappedFile(archive) as mf:
+        assert mf.tail(3) == expected[-3:]
+        tail_peak = tracemalloc.get_traced_memory()[1]
+        hits = mf.find_lines("--dport 443", limit=5)
+        page = mf.read_lines(len(expected) // 2, 20)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert page == expected[len(expected) // 2: len(expected) // 2 + 20]
+    assert [expected[n] for n, _ in hits] == [line for _, line in hits]
+    assert tail_peak < 64 * 1024
+    # The line index is 8 bytes per line; the text itself is never copied in full
+    assert peak < archive.stat().st_size / 4
+
+
+def test_digest_and_parse(archive, tmp_path):
+    assert file_digest(archive) == hashlib.sha256(archive.read_bytes()).hexdigest()
+    single = tmp_path / "one.rules"
+    single.write_text(DUMP)
+    assert serialize_ruleset(parse_ruleset_file(single)) == serialize_ruleset(parse_iptables_save(DUMP))
+
+
+def test_atomic_write(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    atomic_write(path, '{"a": 1}')
+    before = fingerprint(path)
+    atomic_write(path, b'{"a": 2}', mode=0o600)
+    assert path.read_text() == '{"a": 2}' and fingerprint(path) != before
+    assert path.stat().st_mode & 0o777 == 0o600
+
+    def crash(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", crash)
+    with pytest.raises(OSError):
+        atomic_write(path, '{"a": 3}')
+    assert path.read_text() == '{"a": 2}'
+    assert [p.name for p in tmp_path.iterdir()] == ["config.json"]      # no temp file left behind
@@ -0,0 +1,151 @@
+"""
+test_firewall_rules.py
+----------------------
+Offline policy checks: iptables-save parsing and packet simulation.
+Runs without root, containers, or SSH.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.utils.parser import ParseError, diff_rulesets, parse_iptables_save, serialize_ruleset
+from app.core.validator import validate_ruleset
+from app.core.packet_simulator import PacketSimulator, make_packets, random_packets, simulate
+
+
+POLICY = (
+    "*filter\n"
+    ":INPUT DROP [12:3400]\n"
+    ":FORWARD DROP [0:0]\n"
+    ":OUTPUT ACCEPT [0:0]\n"
+    ":SSH - [0:0]\n"
+    "-A INPUT -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT\n"
+    "-A INPUT -i lo -j ACCEPT\n"
+    "-A INPUT -p tcp -m tcp --dport 22 -j SSH\n"
+    "-A INPUT -p tcp -m multiport --dports 80,443,8000:8080 -j ACCEPT\n"
+    "-A INPUT ! -s 10.0.0.0/8 -p udp -m udp --dport 53 -j DROP\n"
+    "-A INPUT -p udp -m udp --dport 53 -j ACCEPT\n"
+    "-A INPUT -p icmp -m comment --comment \"lab ping\" -j ACCEPT\n"
+    "-A SSH -s 10.10.0.0/24 -j ACCEPT\n"
+    "-A SSH -s 10.20.0.0/24 -j RETURN\n"
+    "-A SSH -j REJECT --reject-with icmp-port-unreachable\n"
+    "COMMIT\n"
+    "*nat\n"
+    ":PREROUTING ACCEPT [0:0]\n"
+    ":INPUT ACCEPT [0:0]\n"
+    ":OUTPUT ACCEPT [0:0]\n"
+    ":POSTROUTING ACCEPT [0:0]\n"
+    "[5:300] -A PREROUTING -d 203.0.113.10/32 -p tcp -m tcp --dport 80 -j DNAT --to-destination 10.10.0.40:80\n"
+    "COMMIT\n"
+)
+
+
+def test_parse_round_trip():
+    rs = parse_iptables_save(POLICY)
+    assert list(rs.tables) == ["filter", "nat"]
+    assert rs.rule_count() == 11
+    assert serialize_ruleset(rs) == POLICY
+
+    inp = rs.tables["filter"].chains["INPUT"]
+    assert (inp.policy, inp.packets, inp.bytes) == ("DROP", 12, 3400)
+    icmp = inp.rules[-1]
+    assert icmp.comment == "lab ping" and icmp.protocol == "icmp" and icmp.target == "ACCEPT"
+    dnat = rs.tables["nat"].chains["PREROUTING"].rules[0]
+    assert (dnat.packets, dnat.bytes, dnat.target_args) == (5, 300, ["--to-destination", "10.10.0.40:80"])
+
+
+def test_parse_errors():
+    with pytest.raises(ParseError):
+        parse_iptables_save("*filter\n:INPUT ACCEPT [0:0]\n-A INPUT -j ACCEPT\n")
+    with pytest.raises(ParseError):
+        parse_iptables_save("*filter\n:INPUT ACCEPT [0:0]\n-A NOPE -j ACCEPT\nCOMMIT\n")
+
+
+def test_diff_reports_changed_chains_only():
+    edited = POLICY.replace(":INPUT DROP [12:3400]", ":INPUT ACCEPT [0:0]").replace("10.20.0.0/24", "10.30.0.0/24")
+    changes = diff_rulesets(parse_iptables_save(POLICY), parse_iptables_save(edited))
+    assert list(changes) == ["filter"]
+    assert changes["filter"]["INPUT"]["policy"] == ("DROP", "ACCEPT")
+    assert changes["filter"]["SSH"]["added"] == ["-s 10.30.0.0/24 -j RETURN"]
+    assert changes["filter"]["SSH"]["removed"] == ["-s 10.20.0.0/24 -j RETURN"]
+
+
+def test_local_validation():
+    assert validate_ruleset(POLICY)["status"] == "success"
+    bad = POLICY.replace("-j SSH", "-j MISSING").replace("-j DNAT", "-j MASQUERADE")
+    result = validate_ruleset(bad)
+    assert result["status"] == "failure"
+    assert any("MISSING" in e for e in result["errors"])
+    assert any("MASQUERADE is only valid in POSTROUTING" in e for e in result["errors"])
+    assert result["warnings"] == ["filter/SSH: user chain is never referenced"]
+
+
+def test_targets_outside_their_table_are_rejected():
+    for table, chain, target in (("nat", "PREROUTING", "DROP"), ("filter", "INPUT", "CT"),
+                                 ("filter", "INPUT", "CHECKSUM"), ("mangle", "PREROUTING", "REJECT")):
+        result = validate_ruleset(f"*{table}\n:{chain} ACCEPT [0:0]\n-A {chain} -j {target}\nCOMMIT\n")
+        assert result["status"] == "failure", (table, target)
+    assert validate_ruleset("*nat\n:PREROUTING ACCEPT [0:0]\n-A PREROUTING -j ACCEPT\nCOMMIT\n")["status"] == "success"
+    assert validate_ruleset("*raw\n:PREROUTING ACCEPT [0:0]\n-A PREROUTING -j CT --notrack\nCOMMIT\n")["status"] == "success"
+    clamp = "-p tcp --tcp-flags SYN,RST SYN -j TCPMSS --clamp-mss-to-pmtu"
+    assert validate_ruleset(f"*filter\n:FORWARD ACCEPT [0:0]\n-A FORWARD {clamp}\nCOMMIT\n")["status"] == "success"
+    assert validate_ruleset(f"*filter\n:INPUT ACCEPT [0:0]\n-A INPUT {clamp}\nCOMMIT\n")["status"] == "failure"
+
+
+def test_simulated_verdicts():
+    flows = [
+        ("10.10.0.30", "10.10.0.20", "tcp", 40000, 22),     # SSH from lab subnet
+        ("10.20.0.5", "10.10.0.20", "tcp", 40000, 22),      # RETURN → falls to policy
+        ("192.168.1.5", "10.10.0.20", "tcp", 40000, 22),    # rejected in SSH chain
+        ("192.168.1.5", "10.10.0.20", "tcp", 40000, 8080),  # multiport range
+        ("192.168.1.5", "10.10.0.20", "udp", 5353, 53),     # negated source
+        ("10.1.1.1", "10.10.0.20", "udp", 5353, 53),
+        ("192.168.1.5", "10.10.0.20", "icmp", 0, 0),
+    ]
+    got = [(r["verdict"], r["rule"]) for r in simulate(POLICY, flows)]
+    assert got == [
+        ("ACCEPT", "SSH: -s 10.10.0.0/24 -j ACCEPT"),
+        ("DROP", "policy"),
+        ("REJECT", "SSH: -j REJECT --reject-with icmp-port-unreachable"),
+        ("ACCEPT", "INPUT: -p tcp -m multiport --dports 80,443,8000:8080 -j ACCEPT"),
+        ("DROP", "INPUT: ! -s 10.0.0.0/8 -p udp -m udp --dport 53 -j DROP"),
+        ("ACCEPT", "INPUT: -p udp -m udp --dport 53 -j ACCEPT"),
+        ("ACCEPT", 'INPUT: -p icmp -m comment --comment "lab ping" -j ACCEPT'),
+    ]
+
+
+def test_interfaces_and_nat_table():
+    sim = PacketSimulator(parse_iptables_save(POLICY))
+    pk = make_packets(["192.168.1.5"] * 2, ["127.0.0.1"] * 2, ["udp"] * 2, [1, 1], [9999, 9999], in_iface=["lo", "eth0"])
+    assert sim.classify(pk).verdict_names() == ["ACCEPT", "DROP"]
+
+    nat = PacketSimulator(parse_iptables_save(POLICY), table="nat")
+    res = nat.classify(make_packets(["198.51.100.1"], ["203.0.113.10"], ["tcp"], [5555], [80]), "PREROUTING")
+    assert res.explain(0)["verdict"] == "DNAT"
+
+
+def test_unsupported_options_never_match():
+    text = (
+        "*filter\n:INPUT ACCEPT [0:0]\n:FORWARD ACCEPT [0:0]\n:OUTPUT ACCEPT [0:0]\n"
+        "-A INPUT -p tcp -m limit --limit 5/min -j DROP\nCOMMIT\n"
+    )
+    sim = PacketSimulator(parse_iptables_save(text))
+    assert sim.unsupported == {0: ["--limit"]}
+    assert sim.classify(make_packets(["1.2.3.4"], ["5.6.7.8"], ["tcp"], [1], [2])).verdict_names() == ["ACCEPT"]
+    with pytest.raises(ValueError):
+        PacketSimulator(parse_iptables_save(text), strict=True)
+
+
+def test_vectorized_matches_scalar():
+    sim = PacketSimulator(parse_iptables_save(POLICY))
+    batch = random_packets(5000, seed=7)
+    whole = sim.classify(batch)
+    for i in range(0, 5000, 250):
+        one = {k: v[i:i + 1] for k, v in batch.items()}
+        single = sim.classify(one)
+        assert (single.verdict[0], single.rule[0]) == (whole.verdict[i], whole.rule[i])
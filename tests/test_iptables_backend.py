@@ -0,0 +1,112 @@
+"""
+test_iptables_backend.py
+------------------------
+The backend sequence from test_backend.py (add → save → flush → restore →
+delete), run against the in-memory iptables backend instead of the kernel,
+plus plan (dry-run) mode.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.core import iptables_controller as ctl
+from app.core import ruleset_store
+from app.core.iptables_backend import InMemoryBackend
+
+
+@pytest.fixture
+def mem(tmp_path, monkeypatch):
+    monkeypatch.setattr(ctl, "CONFIG_PATH", tmp_path / "config.json")
+    monkeypatch.setattr(ruleset_store, "STORE_DIR", tmp_path / "store")
+    backend = InMemoryBackend()
+    previous = ctl.set_backend(backend)
+    yield backend
+    ctl.set_backend(previous)
+
+
+def test_controller_lifecycle(mem, capsys):
+    ctl.add_rule("INPUT", ["-p", "icmp", "-j", "ACCEPT"])
+    ctl.add_rule("PREROUTING", ["-d", "203.0.113.10", "-p", "tcp", "--dport", "80",
+                                "-j", "DNAT", "--to-destination", "10.10.0.40:80"], table="nat")
+    assert "ACCEPT     icmp" in ctl.list_rules()
+
+    ctl.save_rules_to_json()
+    assert ruleset_store.default_store().head("localhost")["source"] == "save"
+    ctl.run_cmd(["iptables", "-F"])
+    assert "icmp" not in ctl.list_rules()
+
+    ctl.load_rules_from_json()
+    assert "ACCEPT     icmp" in ctl.list_rules()
+    assert "restored from config.snap" in capsys.readouterr().out     # the snapshot, not the JSON
+    assert "-A PREROUTING -d 203.0.113.10/32 -p tcp -m tcp --dport 80 -j DNAT" in ctl.run_cmd(["iptables-save", "-t", "nat"])
+
+    ctl.delete_rule("INPUT", ["-p", "icmp", "-j", "ACCEPT"])
+    assert "icmp" not in ctl.list_rules()
+    assert ctl.run_cmd(["iptables", "-D", "INPUT", "-p", "icmp", "-j", "ACCEPT"]).startswith("[ERROR] iptables: Bad rule")
+
+
+def test_chain_semantics(mem):
+    assert mem.run(["iptables", "-N", "SSH"]).returncode == 0
+    assert mem.run(["iptables", "-N", "SSH"]).stderr == "iptables: Chain already exists."
+    assert mem.run(["iptables", "-A", "INPUT", "-j", "nosuch"]).returncode == 1
+    mem.run(["iptables", "-A", "INPUT", "-p", "tcp", "--dport", "22", "-j", "SSH"])
+    mem.run(["iptables", "-I", "SSH", "-s", "10.10.0.0/24", "-j", "ACCEPT"])
+    mem.run(["iptables", "-I", "SSH", "1", "-s", "10.10.0.30", "-j", "DROP"])
+    assert mem.run(["iptables", "-X", "SSH"]).returncode == 1      # still referenced
+    assert mem.run(["iptables", "-C", "SSH", "-s", "10.10.0.30/32", "-j", "DROP"]).returncode == 0
+    assert mem.run(["iptables", "-S", "SSH"]).stdout.splitlines() == [
+        "-N SSH",
+        "-A SSH -s 10.10.0.30/32 -j DROP",
+        "-A SSH -s 10.10.0.0/24 -j ACCEPT",
+    ]
+
+
+def test_restore_is_atomic(mem):
+    mem.run(["iptables", "-A", "INPUT", "-j", "ACCEPT"])
+    bad = "*filter\n:INPUT DROP [0:0]\n-A INPUT -j MISSING_chain\nCOMMIT\n"
+    failed = mem.run(["iptables-restore"], input=bad)
+    assert failed.returncode == 1 and failed.stderr.startswith("iptables-restore: filter/INPUT rule 1:")
+    assert mem.run(["iptables-restore", "--test"], input="*filter\n:INPUT DROP [0:0]\nCOMMIT\n").returncode == 0
+    assert "-A INPUT -j ACCEPT" in mem.run(["iptables-save"]).stdout
+    assert ":INPUT ACCEPT" in mem.run(["iptables-save"]).stdout
+
+
+def test_targets_the_kernel_would_refuse(mem):
+    assert mem.run(["iptables", "-A", "INPUT", "-j", "SSH"]).returncode == 1              # undeclared chain
+    assert mem.run(["iptables", "-t", "nat", "-A", "PREROUTING", "-j", "DROP"]).returncode == 1
+    assert mem.run(["iptables", "-A", "INPUT", "-j", "NOPE"]).returncode == 1
+    assert mem.run(["iptables", "-t", "nat", "-A", "PREROUTING", "-j", "MASQUERADE"]).returncode == 1
+    assert mem.run(["iptables", "-A", "INPUT", "-j", "FORWARD"]).returncode == 1          # built-in chain
+    for bad in ("*filter\n:INPUT ACCEPT [0:0]\n-A INPUT -j SSH\nCOMMIT\n",
+                "*nat\n:PREROUTING ACCEPT [0:0]\n-A PREROUTING -j DROP\nCOMMIT\n",
+                "*filter\n:INPUT ACCEPT [0:0]\n-A INPUT -j NOPE\nCOMMIT\n"):
+        assert mem.run(["iptables-restore", "--test"], input=bad).returncode == 1, bad
+    plan = ctl.plan_rules([["iptables", "-t", "nat", "-A", "PREROUTING", "-j", "DROP"]])
+    assert plan["status"] == "failure"
+
+    assert mem.run(["iptables", "-t", "nat", "-A", "POSTROUTING", "-o", "eth0", "-j", "MASQUERADE"]).returncode == 0
+    ok = "*filter\n:INPUT ACCEPT [0:0]\n:SSH - [0:0]\n-A INPUT -j SSH\n-A SSH -j LOG\nCOMMIT\n"
+    assert mem.run(["iptables-restore", "--test"], input=ok).returncode == 0
+
+
+def test_plan_mode_does_not_apply(mem):
+    ctl.add_rule("INPUT", ["-p", "icmp", "-j", "ACCEPT"])
+    plan = ctl.plan_rules([
+        ["iptables", "-P", "INPUT", "DROP"],
+        ["iptables", "-A", "INPUT", "-p", "tcp", "--dport", "22", "-j", "ACCEPT"],
+        ["iptables", "-D", "INPUT", "-p", "udp", "-j", "ACCEPT"],
+    ])
+    assert plan["status"] == "failure" and len(plan["errors"]) == 1
+    change = plan["diff"]["filter"]["INPUT"]
+    assert change["policy"] == ("ACCEPT", "DROP")
+    assert change["added"] == ["-p tcp -m tcp --dport 22 -j ACCEPT"]
+    assert ":INPUT ACCEPT" in ctl.run_cmd(["iptables-save", "-t", "filter"])
+
+    preview = ctl.add_rule("INPUT", ["-s", "10.0.0.1", "-j", "DROP"], plan=True)
+    assert "-A INPUT -s 10.0.0.1/32 -j DROP" in preview
+    assert "10.0.0.1" not in ctl.list_rules()
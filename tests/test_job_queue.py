@@ -0,0 +1,115 @@
+"""
+test_job_queue.py
+-----------------
+Background job subsystem and the non-blocking /api/jobs routes.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.core.job_queue import CANCELLED, FINISHED, SUCCEEDED, JobManager, run_per_host
+
+
+def _wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.status not in FINISHED and time.time() < deadline:
+        job.events_after(0, timeout=0.05)
+    return job.status
+
+
+def test_progress_and_results():
+    jm = JobManager()
+    job = jm.submit("apply", lambda j: run_per_host(j, ["a", "b", "c"], lambda h: {"status": "success", "message": h}), {})
+    assert _wait(job) == SUCCEEDED
+    assert (job.done, job.total, job.failed) == (3, 3, 0)
+    assert job.results["_summary"] == {"hosts": 3, "failed": 0}
+    types = [e["type"] for e in job.events_after(0, 0)]
+    assert types[:3] == ["queued", "started", "progress"] and types[-1] == "finished"
+    jm.shutdown()
+
+
+def test_cancel_skips_remaining_hosts():
+    jm = JobManager()
+    gate = threading.Event()
+
+    def slow(host):
+        gate.wait(2)
+        return {"status": "success", "message": host}
+
+    job = jm.submit("push", lambda j: run_per_host(j, [str(i) for i in range(20)], slow, max_workers=2), {})
+    while job.status != "running":
+        time.sleep(0.01)
+    assert jm.cancel(job.id)
+    gate.set()
+    assert _wait(job) == CANCELLED
+    assert sum(r.get("status") == "cancelled" for r in job.results.values()) >= 16
+    jm.shutdown()
+
+
+def test_failed_hosts_fail_the_job():
+    jm = JobManager()
+    job = jm.submit("validate", lambda j: run_per_host(j, ["ok", "bad"], lambda h: {"status": "success" if h == "ok" else "failure"}), {})
+    assert _wait(job) == "failed" and job.failed == 1
+    jm.shutdown()
+
+
+def test_routes_return_immediately_and_stream(monkeypatch):
+    flask = pytest.importorskip("flask")
+    import main_process
+
+    release = threading.Event()
+
+    def fake_snapshot(job):
+        return run_per_host(job, job.params["hosts"], lambda h: release.wait(5) and {"status": "success", "message": h})
+
+    monkeypatch.setitem(main_process.JOB_KINDS, "snapshot", fake_snapshot)
+    client = main_process.app.test_client()
+
+    t0 = time.perf_counter()
+    resp = client.post("/api/jobs/snapshot", json={"hosts": ["10.10.0.20", "10.10.0.30"]})
+    assert resp.status_code == 202 and time.perf_counter() - t0 < 1
+    job_id = resp.get_json()["id"]
+    assert client.get(f"/api/jobs/{job_id}").get_json()["status"] in ("queued", "running")
+
+    release.set()
+    body = client.get(f"/api/jobs/{job_id}/events").get_data(as_text=True)
+    assert "event: host" in body and body.rstrip().endswith("}")
+    assert "event: finished" in body
+    assert client.get(f"/api/jobs/{job_id}").get_json()["progress"]["done"] == 2
+    assert client.get(f"/api/jobs/{job_id}/events", headers={"Last-Event-ID": "1; x"}).status_code == 400
+    resumed = client.get(f"/api/jobs/{job_id}/events?after=1").get_data(as_text=True)
+    assert "id: 1\n" not in resumed and "event: finished" in resumed
+
+    assert client.post("/api/jobs/apply", json={}).status_code == 400
+    assert client.post("/api/jobs/nope", json={}).status_code == 404
+
+
+def test_job_params_ignore_identity_and_confine_paths(monkeypatch, tmp_path):
+    pytest.importorskip("flask")
+    import main_process
+
+    monkeypatch.setattr(main_process, "RULES_DIR", str(tmp_path))
+    submitted = []
+    monkeypatch.setitem(main_process.JOB_KINDS, "push", lambda job: submitted.append(job.params) or {})
+    client = main_process.app.test_client()
+
+    for body in ({"local_rules_path": "/etc/shadow"}, {"local_rules_path": "../../etc/shadow"},
+                 {"remote_rules_path": "/tmp/x; reboot"}, {"remote_rules_path": "tmp/x"},
+                 {"remote_rules_path": "/tmp/../etc/passwd"}):
+        assert client.post("/api/jobs/push", json={"hosts": ["h"], **body}).status_code == 400, body
+
+    r = client.post("/api/jobs/push", json={"hosts": ["h"], "local_rules_path": "site/web.rules",
+                                            "remote_rules_path": "/var/tmp/web.rules",
+                                            "user": "mallory", "key_path": "/home/mallory/.ssh/id_rsa"})
+    assert r.status_code == 202
+    params = main_process.JOBS.get(r.get_json()["id"]).params
+    assert params["local_rules_path"] == str(tmp_path / "site" / "web.rules")
+    assert params["remote_rules_path"] == "/var/tmp/web.rules"
+    assert (params["user"], params["key_path"]) == (main_process.DEFAULT_USER, main_process.DEFAULT_KEY)
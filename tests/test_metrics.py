@@ -0,0 +1,71 @@
+"""
+test_metrics.py
+---------------
+Sharded Prometheus metrics, SSH instrumentation and the /metrics endpoint.
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core import metrics
+from ssh_stub_server import StubSSHServer
+
+
+def test_sharded_updates_merge_across_threads():
+    c = metrics.Counter("t_total", "test", ("host",))
+    h = metrics.Histogram("t_seconds", "test", ("host",), buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(1000):
+            c.inc("a")
+            h.observe(0.5, "a")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    c.inc("a")  # live shard on this thread + retired shards of the workers
+
+    assert c.value("a") == 8001
+    assert h.snapshot("a") == {"count": 8000, "sum": 4000.0}
+    assert not c._shards[1:]  # dead worker shards were folded into the retired total
+    lines = h.render()
+    assert 't_seconds_bucket{host="a",le="0.1"} 0' in lines
+    assert 't_seconds_bucket{host="a",le="+Inf"} 8000' in lines
+    with pytest.raises(ValueError):
+        c.inc("a", "extra")
+
+
+def test_ssh_exec_is_instrumented(key, mgr):
+    srv = StubSSHServer("127.0.0.1", responses={"hostname": "stub"}).start()
+    try:
+        host = srv.address
+        before = metrics.REGISTRY.get("ssh_exec_seconds").snapshot(host)["count"]
+        for _ in range(3):
+            assert mgr.exec(host, "root", key, "hostname", port=srv.port)["status"] == "success"
+        assert mgr.exec(host, "root", key, "nope", port=srv.port)["status"] == "failure"
+
+        assert metrics.REGISTRY.get("ssh_exec_seconds").snapshot(host)["count"] == before + 4
+        assert metrics.REGISTRY.get("ssh_exec_total").value(host, "failure") >= 1
+        text = metrics.render()
+        assert "# TYPE ssh_connect_seconds histogram" in text
+        assert "ssh_sessions_open " in text
+    finally:
+        srv.stop()
+
+
+def test_metrics_endpoint():
+    pytest.importorskip("flask")
+    import main_process
+
+    resp = main_process.app.test_client().get("/metrics")
+    assert resp.status_code == 200 and resp.mimetype == "text/plain"
+    assert "# TYPE iptables_stage_duration_seconds histogram" in resp.get_data(as_text=True)
@@ -0,0 +1,102 @@
+"""
+test_network_flow.py
+--------------------
+Traffic tester: declared flows are probed from each source host in a single
+exec (probes run concurrently inside it), source hosts in parallel, and the
+outcome comes back as a pass/fail matrix. The stub agents run the probe
+script locally against real listening and closed ports.
+"""
+
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core.traffic_tester import (Flow, flows_for_hosts, load_flows, parse_probe_output, probe_script,
+                                     run_flows)
+from ssh_stub_server import StubSSHServer
+
+
+def _run_locally(channel, command):
+    r = subprocess.run(["sh", "-c", command], capture_output=True)
+    channel.sendall(r.stdout)
+    return r.returncode
+
+
+@pytest.fixture
+def ports():
+    """(open port, closed port) on 127.0.0.1."""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(64)
+    closed = socket.socket()
+    closed.bind(("127.0.0.1", 0))
+    closed_port = closed.getsockname()[1]
+    closed.close()
+    yield listener.getsockname()[1], closed_port
+    listener.close()
+
+
+def test_flow_validation_and_selection(tmp_path):
+    assert Flow("a", "b", "ICMP", port=80).port is None
+    for bad in ({"src": "a", "dst": "b", "proto": "tcp"},
+                {"src": "a", "dst": "b", "proto": "sctp", "port": 1},
+                {"src": "a", "dst": "b", "port": 22, "expect": "maybe"},
+                {"dst": "b", "port": 22}):
+        with pytest.raises(ValueError):
+            Flow.from_dict(bad)
+
+    (tmp_path / "flows.json").write_text('[{"src": "h1", "dst": "h2", "port": 22, "name": "ssh"},'
+                                         ' {"src": "h3", "dst": "h4", "proto": "icmp", "expect": "deny"}]')
+    flows = load_flows(tmp_path / "flows.json")
+    assert [f.name for f in flows] == ["ssh", "icmp/h4"]
+    assert flows_for_hosts(flows, ["h2"]) == flows[:1]
+    assert load_flows(tmp_path / "missing.json") == []
+
+
+def test_probe_script_runs_concurrently(ports):
+    open_port, closed_port = ports
+    flows = [Flow("x", "127.0.0.1", "tcp", open_port), Flow("x", "127.0.0.1", "tcp", closed_port),
+             Flow("x", "192.0.2.1", "tcp", 9)]                # TEST-NET: dropped or unreachable
+    t0 = time.perf_counter()
+    out = subprocess.run(["sh", "-c", probe_script(flows * 3, timeout_s=1, parallel=4)],
+                         capture_output=True, text=True).stdout
+    # 9 probes, 4 at a time: three waves bounded by the 1 s probe timeout
+    assert time.perf_counter() - t0 < 5
+    codes = parse_probe_output(out)
+    assert sorted(codes) == list(range(9))
+    assert [codes[i] == 0 for i in range(3)] == [True, False, False]
+
+
+def test_matrix_across_agents(key, mgr, ports):
+    open_port, closed_port = ports
+    a = StubSSHServer("127.0.0.2", responses={"T=": _run_locally}).start()
+    b = StubSSHServer("127.0.0.3", port=a.port, responses={"T=": _run_locally}).start()
+    flows = [
+        {"src": "127.0.0.2", "dst": "127.0.0.1", "port": open_port, "expect": "allow", "name": "web"},
+        {"src": "127.0.0.2", "dst": "127.0.0.1", "port": closed_port, "expect": "deny", "name": "blocked"},
+        {"src": "127.0.0.2", "dst": "127.0.0.1", "port": closed_port, "expect": "allow", "name": "broken"},
+        {"src": "127.0.0.3", "dst": "127.0.0.1", "port": open_port, "expect": "allow", "name": "web"},
+        {"src": "127.0.0.4", "dst": "127.0.0.1", "port": open_port, "expect": "allow", "name": "web"},
+    ]
+    try:
+        report = run_flows(flows, "root", key, mgr=mgr, port=a.port, timeout_s=1)
+    finally:
+        a.stop()
+        b.stop()
+
+    assert report["status"] == "failure"
+    assert (report["passed"], report["failed"], report["errors"]) == (3, 1, 1)
+    assert report["matrix"] == {
+        "127.0.0.2": {"web": "pass", "blocked": "pass", "broken": "fail"},
+        "127.0.0.3": {"web": "pass"},
+        "127.0.0.4": {"web": "error"},                        # agent unreachable
+    }
+    assert a.commands_served == 1 and b.commands_served == 1  # one exec per source host
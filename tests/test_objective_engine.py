@@ -0,0 +1,115 @@
+"""
+test_objective_engine.py
+------------------------
+Objective wizard: precomputed hook/chain lookup tables, rule building and
+validation, and the cacheable /api/objective routes.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.core.objective_engine import COMBOS, HOOKS_FOR, OBJECTIVES_AT, build_rule, lookup
+from app.core.validator import validate_ruleset
+from app.utils.parser import parse_iptables_save
+
+
+def test_lookup_tables_follow_netfilter_hooks():
+    assert HOOKS_FOR["dnat"] == ["PREROUTING", "OUTPUT"]
+    assert HOOKS_FOR["masquerade"] == ["POSTROUTING"]
+    assert "snat" not in OBJECTIVES_AT["PREROUTING"]
+    assert {c["table"] for c in COMBOS[("filter", "PREROUTING")]} == {"raw", "mangle"}
+    assert COMBOS[("filter", "PREROUTING")][0]["table"] == "raw"
+    assert COMBOS[("filter", "INPUT")][0] == {
+        "table": "filter", "chain": "INPUT", "target": "ACCEPT",
+        "required": [], "optional": [], "note": None,
+    }
+    # GUI names resolve: "translate" + "DNAT" is the dnat objective
+    assert lookup("translate", target="DNAT").data["objective"] == "dnat"
+    assert lookup("bogus") is None and lookup("filter", "nowhere") is None
+
+
+def test_every_offered_combo_passes_local_validation():
+    for combos in COMBOS.values():
+        for c in combos:
+            payload = f"*{c['table']}\n:{c['chain']} ACCEPT [0:0]\n-A {c['chain']} -j {c['target']}\nCOMMIT\n"
+            assert validate_ruleset(payload)["status"] == "success", c
+
+
+def test_lookup_is_instant():
+    n = 5000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        lookup("port_forward", "before_decision")
+    assert (time.perf_counter() - t0) / n < 0.005
+
+
+def test_build_rule_returns_restorable_fragment():
+    r = build_rule("port_forward", "PREROUTING",
+                   match={"protocol": "tcp", "dport": 8080, "in_iface": "eth0"},
+                   params={"to-destination": "10.10.0.40:80"})
+    assert r["status"] == "success" and r["table"] == "nat"
+    assert r["spec"] == "-i eth0 -p tcp -m tcp --dport 8080 -j DNAT --to-destination 10.10.0.40:80"
+    ruleset = parse_iptables_save(r["fragment"])
+    assert ruleset.tables["nat"].chains["PREROUTING"].rules[0].target == "DNAT"
+
+
+@pytest.mark.parametrize("args, error", [
+    (("snat", "PREROUTING"), "not possible at PREROUTING"),
+    (("snat", "POSTROUTING"), "needs --to-source"),
+    (("filter", "INPUT", "DROP", {"dport": 22}), "needs protocol"),
+    (("filter", "INPUT", "DROP", {"out_iface": "eth0"}), "output interface"),
+    (("filter", "INPUT", "DROP", {"source": "10.0.0.300"}), "invalid address"),
+    (("filter", "INPUT", "DROP", {"protocol": "tcp", "dport": 70000}), "invalid port"),
+    (("log", "INPUT", "LOG", None, {"to-source": "1.2.3.4"}), "does not take --to-source"),
+    # Nothing from the request may reach the fragment as extra lines, tables or options
+    (("filter", "INPUT", "ACCEPT", {"comment": "x\nCOMMIT\n*nat\n-A PREROUTING -j DROP"}), "control characters"),
+    (("dnat", "PREROUTING", None, {"protocol": "tcp"}, {"to-destination": "10.0.0.1:80\nCOMMIT"}),
+     "invalid to-destination"),
+    (("dnat", "PREROUTING", None, {"protocol": "tcp"}, {"to-destination": "web:80"}), "invalid to-destination"),
+    (("filter", "INPUT", "DROP", {"in_iface": "eth0 -j DROP"}), "invalid interface"),
+    (("filter", "INPUT", "DROP", {"state": "new;rm"}), "invalid state NEW;RM"),
+    (("filter", "INPUT", "DROP", {"protocol": "tcp -j ACCEPT"}), "invalid protocol"),
+    (("mangle", "INPUT", "MARK", None, {"set-mark": "1 -j DROP"}), "invalid set-mark"),
+])
+def test_build_rule_rejects_invalid_combinations(args, error):
+    r = build_rule(*args)
+    assert r["status"] == "failure" and error in r["message"]
+
+
+def test_build_rule_accepts_valid_free_form_values():
+    r = build_rule("filter", "INPUT", "ACCEPT", match={"protocol": "tcp", "dport": 443, "state": "new,established",
+                                                       "comment": "web; from anywhere"})
+    assert r["status"] == "success"
+    assert r["command"].endswith("--ctstate NEW,ESTABLISHED -m comment --comment 'web; from anywhere' -j ACCEPT")
+    for target, params in (("DNAT", {"to-destination": "[2001:db8::1]:8080"}),
+                           ("DNAT", {"to-destination": "10.0.0.1-10.0.0.4:80-81"})):
+        assert build_rule("dnat", "PREROUTING", target, {"protocol": "tcp"}, params)["status"] == "success"
+    assert build_rule("log", "INPUT", "LOG", params={"log-prefix": "fw drop: "})["status"] == "success"
+
+
+def test_objective_routes():
+    pytest.importorskip("flask")
+    import main_process
+
+    client = main_process.app.test_client()
+    first = client.get("/api/objective?objective=dnat&position=PREROUTING")
+    assert first.status_code == 200 and first.get_json()["combinations"][0]["target"] == "DNAT"
+    again = client.get("/api/objective?objective=dnat&position=PREROUTING",
+                       headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert client.get("/api/objective?objective=bogus").status_code == 404
+
+    # The GUI's payload still works and now lists where the objective is possible
+    gui = client.post("/api/objective", json={"objective": "translate", "action": "MASQUERADE"}).get_json()
+    assert gui["objective"] == "masquerade" and [p["hook"] for p in gui["positions"]] == ["POSTROUTING"]
+
+    built = client.post("/api/objective", json={"objective": "filter", "position": "INPUT", "target": "DROP",
+                                                "match": {"protocol": "tcp", "dport": 23}})
+    assert built.status_code == 200 and built.get_json()["command"].startswith("iptables -t filter -A INPUT")
+    assert client.post("/api/objective", json={"objective": "snat", "chain": "INPUT"}).status_code == 422
@@ -0,0 +1,138 @@
+"""
+test_observer.py
+----------------
+Observer: the on-host watcher script, change events over a long-lived stub
+channel (recorded in the ruleset store), unwatching, and local file watching
+with inotify and the polling fallback.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core.observer import FileWatcher, Observer, watch_command
+from app.core.ruleset_store import RulesetStore
+from ssh_stub_server import StubSSHServer
+
+RULES = "*filter\n:INPUT ACCEPT [0:0]\n-A INPUT -p tcp --dport 22 -j ACCEPT\nCOMMIT\n"
+
+
+def _wait(pred, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not pred():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_watch_script_ignores_counters_and_reports_changes(tmp_path):
+    rules = tmp_path / "rules"
+    fake = tmp_path / "iptables-save"
+    fake.write_text(f"#!/bin/sh\ncat {rules}\n")
+    fake.chmod(0o755)
+    rules.write_text("# Generated\n*filter\n:INPUT ACCEPT [1:2]\nCOMMIT\n")
+
+    env = {**os.environ, "PATH": f"{tmp_path}:/usr/bin:/bin"}
+    proc = subprocess.Popen(["sh", "-c", watch_command(1, 100)], stdout=subprocess.PIPE, text=True, env=env)
+    try:
+        first = proc.stdout.readline().split()
+        rules.write_text("# Generated later\n*filter\n:INPUT ACCEPT [9:99]\nCOMMIT\n")   # counters only
+        time.sleep(1.5)
+        rules.write_text("*filter\n:INPUT DROP [0:0]\nCOMMIT\n")
+        second = proc.stdout.readline().split()
+    finally:
+        proc.kill()
+    assert first[0] == "rules" and first[2] == "poll"
+    assert second[0] == "rules" and second[1] != first[1]
+
+
+def test_observer_records_changes_and_unwatches(key, mgr, tmp_path):
+    bump = threading.Event()
+    closed = threading.Event()
+
+    def watcher(channel, command):
+        channel.sendall(b"rules 111-10 poll\nalive\n")
+        bump.wait(5)
+        channel.sendall(b"rules 222-12 poll\n")
+        # stdin is at EOF straight away; a real watcher runs until the channel goes
+        if _wait(lambda: channel.closed or not channel.get_transport().is_active(), 10):
+            closed.set()
+        return 0
+
+    srv = StubSSHServer(responses={"h() {": watcher, "{ iptables-save": RULES}).start()
+    store = RulesetStore(tmp_path / "store")
+    changes = []
+    obs = Observer(mgr=mgr, store=store, collect_mgr=mgr, on_change=lambda h, e: changes.append(e))
+    try:
+        assert obs.watch(srv.address, "root", key, port=srv.port)
+        assert not obs.watch(srv.address, "root", key, port=srv.port)
+        assert _wait(lambda: obs.hosts()[0]["digest"] == "111-10")
+        assert store.head(srv.address) is None          # quiet host: nothing collected
+        bump.set()
+        assert _wait(lambda: changes)
+        assert changes[0]["previous"] == "111-10" and changes[0]["digest"] == "222-12"
+        head = store.head(srv.address)
+        assert head["source"] == "observer" and head["id"] == changes[0]["version"]
+        types = [e["type"] for e in obs.events_after(0, timeout=0)]
+        assert types == ["baseline", "changed", "recorded"]
+
+        assert obs.unwatch(srv.address, port=srv.port)
+        assert closed.wait(5) and obs.hosts() == []
+    finally:
+        obs.stop()
+        srv.stop()
+
+
+@pytest.mark.parametrize("backend", ["inotify", "poll"])
+def test_file_watcher(tmp_path, backend):
+    seen = []
+    target = tmp_path / "iptables.rules"
+    (tmp_path / "db").mkdir()
+    try:
+        fw = FileWatcher([target, tmp_path / "db"], lambda p, k: seen.append((Path(p).name, k)),
+                         backend=backend, poll_s=0.05).start()
+    except OSError:
+        pytest.skip("inotify not available")
+    try:
+        time.sleep(0.1)
+        target.write_text(RULES)
+        (tmp_path / "unrelated.txt").write_text("x")
+        (tmp_path / "db" / ".tmp-abc").write_text("x")
+        (tmp_path / "db" / "config.json").write_text("{}")
+        assert _wait(lambda: {("iptables.rules", "modified"), ("config.json", "modified")} <= set(seen))
+        (tmp_path / "db" / "config.json").unlink()
+        assert _wait(lambda: ("config.json", "deleted") in seen)
+    finally:
+        fw.stop()
+    names = {n for n, _ in seen}
+    assert names == {"iptables.rules", "config.json"}
+
+
+def test_observer_routes(mgr, monkeypatch):
+    pytest.importorskip("flask")
+    import main_process
+
+    obs = Observer(mgr=mgr)
+    monkeypatch.setitem(main_process._OBSERVER, "observer", obs)
+    client = main_process.app.test_client()
+    try:
+        assert client.get("/api/observer").get_json() == {"status": "success", "hosts": []}
+        assert client.post("/api/observer/hosts", json={"hosts": []}).status_code == 400
+        for port in ("x", None, 0, 70000):
+            assert client.post("/api/observer/hosts", json={"hosts": ["10.0.0.1"], "port": port}).status_code == 400
+        assert obs.hosts() == []
+        assert client.delete("/api/observer/hosts/10.0.0.1").status_code == 404
+        assert client.get("/api/observer/events", headers={"Last-Event-ID": "abc"}).status_code == 400
+        assert client.get("/api/observer/events?after=-1").status_code == 400
+    finally:
+        obs.stop()
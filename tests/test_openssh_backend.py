@@ -0,0 +1,113 @@
+"""
+test_openssh_backend.py
+-----------------------
+OpenSSHSessionManager (system ssh + ControlMaster) against the in-process SSH
+stub server: same exec/get_session contract as the paramiko backend.
+"""
+
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from ssh_stub_server import StubSSHServer
+
+if shutil.which("ssh") is None:
+    pytest.skip("OpenSSH client not installed", allow_module_level=True)
+
+from app.core.openssh_session_manager import OpenSSHSession, OpenSSHSessionManager  # noqa: E402
+
+
+@pytest.fixture
+def env(key):
+    srv = StubSSHServer("127.0.0.1", responses={"hostname": "stub"}).start()
+    mgr = OpenSSHSessionManager()
+    yield srv, mgr, key
+    mgr.stop()
+    srv.stop()
+
+
+def test_exec_reuses_one_master(env):
+    srv, mgr, key = env
+    for _ in range(3):
+        r = mgr.exec(srv.address, "root", key, "hostname", port=srv.port)
+        assert r["status"] == "success" and r["stdout"] == "stub"
+    r = mgr.exec(srv.address, "root", key, "nope", port=srv.port)
+    assert r["status"] == "failure" and r["exit_code"] == 127 and "not found" in r["stderr"]
+
+    assert len(srv._transports) == 1            # every command went over the master
+    session = mgr.get_session(srv.address, "root", key, port=srv.port)
+    assert isinstance(session, OpenSSHSession) and session.check()
+    assert mgr.metrics()[(srv.address, "root", srv.port)]["successes"] == 3
+
+
+def test_close_and_stop_tear_down_masters(env):
+    srv, mgr, key = env
+    session = mgr.get_session(srv.address, "root", key, port=srv.port)
+    mgr.close_host(srv.address, "root", srv.port)
+    assert not os.path.exists(session.control_path)
+
+    mgr.exec(srv.address, "root", key, "hostname", port=srv.port)
+    control_dir = os.path.dirname(session.control_path)
+    mgr.stop()
+    assert not os.path.exists(control_dir)
+
+
+def test_connect_failure_is_structured(env, tmp_path):
+    srv, mgr, key = env
+    r = mgr.exec(srv.address, "root", str(tmp_path / "missing_key"), "hostname", port=srv.port)
+    assert r["status"] == "failure" and r["error_type"] == "AuthenticationError"
+
+
+def test_shared_manager_backend_switch(monkeypatch):
+    from app.core import ssh_session_manager as ssm
+
+    monkeypatch.setattr(ssm, "SSH_BACKEND", "openssh")
+    try:
+        assert isinstance(ssm.shared_manager("openssh-test"), OpenSSHSessionManager)
+    finally:
+        with ssm._SHARED_LOCK:
+            ssm._SHARED.pop("openssh-test").stop()
+
+
+def test_stream_to_sink(env):
+    import io
+
+    srv, mgr, key = env
+    sink = io.BytesIO()
+    r = mgr.exec(srv.address, "root", key, "hostname", port=srv.port, sink=sink)
+    assert r["status"] == "success" and r["stdout"] == "" and r["stdout_bytes"] == 4
+    assert sink.getvalue() == b"stub"
+
+
+def test_stream_enforces_the_exec_deadline(env, monkeypatch):
+    import io
+    import time
+    from app.core import openssh_session_manager, ssh_session_manager
+
+    srv, mgr, key = env
+    srv.responses["hang"] = lambda channel, command: time.sleep(3)     # stdout stays open
+    monkeypatch.setattr(openssh_session_manager, "EXEC_TIMEOUT_S", 0.5)
+    monkeypatch.setattr(ssh_session_manager, "RETRY_ATTEMPTS", 0)
+    t0 = time.perf_counter()
+    r = mgr.exec(srv.address, "root", key, "hang", port=srv.port, sink=io.BytesIO())
+    assert time.perf_counter() - t0 < 2.5
+    assert r["status"] == "failure" and "timed out" in r["message"]
+
+
+def test_preflight_reports_host_key(env):
+    import base64
+    import hashlib
+    from app.core.ssh_session_manager import PREFLIGHT_SCRIPT
+
+    srv, mgr, key = env
+    srv.responses[PREFLIGHT_SCRIPT] = "uid=0\niptables=/usr/sbin/iptables-restore\nversion=\nsudo=0\n"
+    expected = "SHA256:" + base64.b64encode(hashlib.sha256(srv.host_key.asbytes()).digest()).decode().rstrip("=")
+    report = mgr.preflight([srv.address], "root", key, port=srv.port, fingerprints={srv.address: expected})
+    assert report["status"] == "success" and report["hosts"][srv.address]["fingerprint"] == expected
@@ -0,0 +1,117 @@
+"""
+test_policy_templates.py
+------------------------
+Policy templates for host groups: variable expansion, chain cache sharing,
+selective recompilation and the 1,000-host compile budget.
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.core.policy_templates import HostGroup, PolicyCompiler, PolicyError, load_policies
+from app.utils.parser import parse_iptables_save
+
+EDGE = """*filter
+:INPUT DROP [0:0]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [0:0]
+:MGMT - [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -i ${lan_if} -s ${lan_net} -j ACCEPT
+-A INPUT -p tcp --dport 22 -j MGMT
+-A MGMT -s ${admin_net} -j ACCEPT
+-A MGMT -j DROP
+-A FORWARD -i ${lan_if} -o ${wan_if} -j ACCEPT
+COMMIT
+*nat
+:PREROUTING ACCEPT [0:0]
+-A PREROUTING -d ${host}/32 -p tcp --dport 443 -j DNAT --to-destination ${backend}
+COMMIT
+"""
+
+
+def _fleet(sites: int = 10, per_site: int = 100) -> PolicyCompiler:
+    pc = PolicyCompiler()
+    pc.add_template("edge", EDGE)
+    for s in range(sites):
+        hosts = {f"10.{s}.0.{i}": {"backend": f"192.168.{s}.{i % 4 + 10}:443"} for i in range(per_site)}
+        pc.add_group(HostGroup(f"site{s}", "edge", {
+            "lan_if": "eth1", "wan_if": "eth0", "lan_net": f"192.168.{s}.0/24",
+            "admin_net": ["10.255.0.0/24", "10.255.1.0/24"]}, hosts))
+    return pc
+
+
+def test_payload_expands_variables_and_lists():
+    pc = _fleet(1, 2)
+    rs = parse_iptables_save(pc.compile_host("10.0.0.1"))
+    mgmt = [r.source for r in rs.tables["filter"].chains["MGMT"].rules]
+    assert mgmt == ["10.255.0.0/24", "10.255.1.0/24", None]
+    nat = rs.tables["nat"].chains["PREROUTING"].rules[0]
+    assert nat.destination == "10.0.0.1/32" and nat.target_args[-1] == "192.168.0.11:443"
+
+
+def test_variable_change_recompiles_only_affected_hosts():
+    pc = _fleet()
+    pc.compile_all()
+    misses = pc.stats["chain_misses"]
+
+    assert pc.set_var("site3", "wan_if", "eth0") == []                 # same value: nothing stale
+    stale = pc.set_var("site3", "lan_net", "192.168.33.0/24")
+    assert sorted(stale) == sorted(h for h in pc.hosts() if h.startswith("10.3."))
+    assert pc.stale_hosts() == stale
+    pc.compile_all()
+    assert pc.stats["chain_misses"] == misses + 1                      # one new INPUT rendering, shared
+    assert "192.168.33.0/24" in pc.compile_host("10.3.0.7")
+
+    assert pc.set_var("site3", "backend", "192.168.3.99:443", host="10.3.0.7") == ["10.3.0.7"]
+
+
+def test_thousand_hosts_compile_well_under_a_second():
+    pc = _fleet()
+    t0 = time.perf_counter()
+    payloads = pc.compile_all()
+    assert len(payloads) == 1000
+    assert time.perf_counter() - t0 < 0.5
+
+
+def test_values_cannot_inject_rule_lines():
+    pc = _fleet(1, 2)
+    injected = "10.0.0.0/8 -j ACCEPT\n-A INPUT -j ACCEPT"
+    with pytest.raises(PolicyError, match="control characters"):
+        pc.set_var("site0", "lan_net", injected)
+    with pytest.raises(PolicyError, match="control characters"):
+        pc.set_var("site0", "admin_net", ["10.255.0.0/24", injected])
+    assert "-A INPUT -j ACCEPT" not in pc.compile_host("10.0.0.1")     # nothing was stored
+
+    # Values that arrive with the group (e.g. from policies.json) are checked at compile time
+    pc.add_group(HostGroup("evil", "edge", {"lan_if": "eth1", "wan_if": "eth0", "lan_net": injected,
+                                            "admin_net": "10.255.0.0/24"}, {"10.9.0.1": {"backend": "x:1"}}))
+    with pytest.raises(PolicyError, match="control characters"):
+        pc.compile_host("10.9.0.1")
+
+
+def test_errors_and_json_loading(tmp_path):
+    pc = PolicyCompiler()
+    pc.add_template("edge", EDGE)
+    pc.add_group(HostGroup("g", "edge", {"lan_if": "eth1"}, {"h1": {}}))
+    with pytest.raises(PolicyError, match="lan_net"):
+        pc.compile_host("h1")
+    with pytest.raises(PolicyError, match="undeclared|expected"):
+        pc.add_template("bad", "*filter\n:INPUT ACCEPT\n-A NOPE -j DROP\nCOMMIT\n")
+    with pytest.raises(PolicyError, match="already in group"):
+        pc.add_group(HostGroup("g2", "edge", {}, {"h1": {}}))
+
+    doc = {"templates": {"edge": EDGE.splitlines()},
+           "groups": {"dmz": {"template": "edge", "hosts": ["10.9.0.1"],
+                              "vars": {"lan_if": "eth1", "wan_if": "eth0", "lan_net": "10.9.0.0/24",
+                                       "admin_net": "10.255.0.0/24", "backend": "10.9.0.50:443"}}}}
+    path = tmp_path / "policies.json"
+    path.write_text(json.dumps(doc))
+    assert "-A MGMT -s 10.255.0.0/24 -j ACCEPT" in load_policies(path).compile_host("10.9.0.1")
@@ -0,0 +1,150 @@
+"""
+test_preflight.py
+-----------------
+SSHSessionManager.preflight against in-process SSH stub servers: sessions are
+warmed in parallel and reused by the pipeline, iptables/privilege checks and
+pinned host keys are reported per host, and slow hosts show up as stragglers.
+"""
+
+import base64
+import hashlib
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core import ssh_session_manager as ssm
+from ssh_stub_server import StubSSHServer
+
+ROOT_OK = "uid=0\niptables=/usr/sbin/iptables-restore\nversion=iptables v1.8.9 (nf_tables)\nsudo=0\n"
+
+
+@pytest.fixture
+def servers():
+    """Stub servers on 127.0.0.x, all on one port like a real fleet on :22."""
+    started = []
+
+    def start(address, preflight=ROOT_OK, delay_s=0.0):
+        def answer(channel, command):
+            time.sleep(delay_s)
+            channel.sendall(preflight.encode())
+
+        port = started[0].port if started else 0
+        srv = StubSSHServer(address, port, responses={ssm.PREFLIGHT_SCRIPT: answer, "hostname": "stub"}).start()
+        started.append(srv)
+        return srv
+
+    yield start
+    for srv in started:
+        srv.stop()
+
+
+def _fingerprint(srv):
+    return "SHA256:" + base64.b64encode(hashlib.sha256(srv.host_key.asbytes()).digest()).decode().rstrip("=")
+
+
+def test_warms_sessions_in_parallel_for_the_pipeline(mgr, key, servers, monkeypatch):
+    fleet = [servers(f"127.0.0.{i}", delay_s=0.3) for i in range(2, 6)]
+    hosts = [s.address for s in fleet]
+    dials = []
+    dial = mgr._dial
+    monkeypatch.setattr(mgr, "_dial", lambda host, *a: dials.append(host) or dial(host, *a))
+
+    t0 = time.perf_counter()
+    report = mgr.preflight(hosts, "root", key, port=fleet[0].port, fingerprints={hosts[0]: _fingerprint(fleet[0])})
+    assert time.perf_counter() - t0 < len(hosts) * 0.3                   # not one after another
+    assert report["status"] == "success" and report["ready"] == hosts and report["stragglers"] == []
+    first = report["hosts"][hosts[0]]
+    assert first["privilege"] == "root" and first["version"].startswith("iptables v1.8")
+    assert first["fingerprint"] == _fingerprint(fleet[0]) and not first["cached"]
+
+    # The pipeline's first step runs on the warm sessions
+    for h in hosts:
+        assert mgr.exec(h, "root", key, "hostname", port=fleet[0].port)["stdout"] == "stub"
+    assert sorted(dials) == sorted(hosts)
+    again = mgr.preflight(hosts[:1], "root", key, port=fleet[0].port)
+    assert again["hosts"][hosts[0]]["cached"] and len(dials) == len(hosts)
+
+
+def test_reports_unusable_hosts(mgr, key, servers):
+    port = servers("127.0.0.2").port
+    servers("127.0.0.3", preflight="uid=1000\niptables=/usr/sbin/iptables-restore\nversion=\nsudo=0\n")
+    servers("127.0.0.4", preflight="uid=1000\niptables=\nversion=\nsudo=1\n")
+    servers("127.0.0.5")
+    servers("127.0.0.6", preflight="uid=1000\niptables=/sbin/iptables-restore\nversion=\nsudo=1\n")
+
+    report = mgr.preflight(["127.0.0.2", "127.0.0.3", "127.0.0.4", "127.0.0.5", "127.0.0.6", "127.0.0.9"],
+                           "deploy", key, port=port, timeout=1, fingerprints={"127.0.0.5": "SHA256:not-the-key"})
+    errors = {h: r.get("error_type") for h, r in report["hosts"].items()}
+    assert errors.pop("127.0.0.9") is not None                           # nothing listening
+    assert errors == {"127.0.0.2": None, "127.0.0.3": "NoPrivilege", "127.0.0.4": "IptablesMissing",
+                      "127.0.0.5": "HostKeyMismatch", "127.0.0.6": "NoPrivilege"}
+    assert report["status"] == "partial" and report["ready"] == ["127.0.0.2"]
+    # sudo alone is not enough: no pipeline command runs through sudo
+    sudo = report["hosts"]["127.0.0.6"]
+    assert sudo["privilege"] == "sudo" and "not run through sudo" in sudo["message"]
+    assert mgr.compression("127.0.0.5", "deploy", port) is None          # untrusted session dropped
+
+
+
+def test_pinned_host_key_is_checked_before_running_anything(mgr, key):
+    ran = []
+    srv = StubSSHServer("127.0.0.1", responses={
+        ssm.PREFLIGHT_SCRIPT: lambda channel, command: ran.append(command) or channel.sendall(ROOT_OK.encode())}).start()
+    try:
+        r = mgr.preflight([srv.address], "root", key, port=srv.port, fingerprints={srv.address: "SHA256:not-the-key"})
+        assert r["hosts"][srv.address]["error_type"] == "HostKeyMismatch" and ran == []
+        assert r["hosts"][srv.address]["fingerprint"] == _fingerprint(srv)
+        r = mgr.preflight([srv.address], "root", key, port=srv.port, fingerprints={srv.address: _fingerprint(srv)})
+        assert r["status"] == "success" and len(ran) == 1
+    finally:
+        srv.stop()
+
+def test_stragglers(mgr, key, servers, monkeypatch):
+    monkeypatch.setattr(ssm, "PREFLIGHT_STRAGGLER_MIN_S", 0.2)
+    port = servers("127.0.0.2").port
+    servers("127.0.0.3")
+    servers("127.0.0.4")
+    servers("127.0.0.5", delay_s=1.0)                                    # slow but finishes
+    servers("127.0.0.6", delay_s=5.0)                                    # still going at the deadline
+    hosts = [f"127.0.0.{i}" for i in range(2, 7)]
+
+    t0 = time.perf_counter()
+    report = mgr.preflight(hosts, "root", key, port=port, deadline_s=2.0)
+    assert time.perf_counter() - t0 < 3.0
+    assert sorted(report["stragglers"]) == ["127.0.0.5", "127.0.0.6"]
+    assert report["hosts"]["127.0.0.5"]["status"] == "success"
+    assert report["hosts"]["127.0.0.6"]["error_type"] == "Straggler" and report["failed"] == ["127.0.0.6"]
+
+
+def test_rollout_jobs_leave_hosts_failing_preflight_alone(monkeypatch):
+    pytest.importorskip("flask")
+    import main_process
+    from app.core import iptables_validate
+
+    class Sessions:
+        def preflight(self, hosts, user, key_path, fingerprints=None, deadline_s=None):
+            self.pins = fingerprints
+            bad = {"status": "failure", "message": "host key mismatch", "error_type": "HostKeyMismatch"}
+            return {"status": "partial", "message": "1/2 hosts ready", "ready": ["fw1"], "failed": ["fw2"],
+                    "hosts": {"fw1": {"status": "success"}, "fw2": bad}, "stragglers": [], "elapsed_ms": 3}
+
+    touched = []
+    monkeypatch.setattr(main_process, "SESSIONS", Sessions())
+    monkeypatch.setattr(iptables_validate, "validate_iptables_rules",
+                        lambda h, *a, **kw: touched.append(h) or {"status": "success", "message": "valid"})
+    client = main_process.app.test_client()
+
+    job_id = client.post("/api/jobs/validate", json={"hosts": ["fw1", "fw2"], "preflight": True,
+                                                      "fingerprints": {"fw2": "SHA256:pinned"}}).get_json()["id"]
+    body = client.get(f"/api/jobs/{job_id}/events").get_data(as_text=True)
+    assert "event: preflight" in body and "event: finished" in body
+    results = client.get(f"/api/jobs/{job_id}").get_json()["results"]
+    assert touched == ["fw1"] and results["fw2"]["error_type"] == "HostKeyMismatch"
+    assert main_process.SESSIONS.pins == {"fw2": "SHA256:pinned"}
+    assert client.post("/api/jobs/preflight", json={"hosts": ["fw1"], "fingerprints": ["x"]}).status_code == 400
@@ -0,0 +1,99 @@
+"""
+test_rule_index.py
+------------------
+Paged rule listing: stable IDs, server-side filters, /api/rules routes.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.core.rule_index import RuleIndex, RuleIndexCache, page
+
+RULES = """*filter
+:INPUT DROP [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -s 10.10.0.0/24 -p tcp -m tcp --dport 22 -m comment --comment "lab ssh" -j ACCEPT
+-A INPUT -p tcp -m multiport --dports 80,443,8080:8089 -j ACCEPT
+-A INPUT -s 192.0.2.7/32 -j DROP
+-A INPUT -s 192.0.2.7/32 -j DROP
+-A INPUT -p udp -m udp --dport 53 -j REJECT --reject-with icmp-port-unreachable
+COMMIT
+"""
+
+
+def test_ids_are_stable_across_inserts():
+    before = RuleIndex("filter", RULES)
+    after = RuleIndex("filter", RULES.replace("-A INPUT -i lo", "-A INPUT -p icmp -j ACCEPT\n-A INPUT -i lo"))
+    old = {r.id: r.position for r in before.chains["INPUT"]}
+    new = {r.id: r.position for r in after.chains["INPUT"]}
+    assert len(old) == 6  # duplicate rules still get distinct IDs
+    assert all(new[i] == pos + 1 for i, pos in old.items())
+    assert after.locate(next(iter(old))).position == 2
+
+
+def test_filters_and_paging():
+    idx = RuleIndex("filter", RULES)
+    assert page(idx, "INPUT", address="10.10.0.5")["total"] == 1
+    assert page(idx, "INPUT", address="192.0.2.0/24")["total"] == 2
+    assert [r["position"] for r in page(idx, "INPUT", port="8085")["rules"]] == [3]
+    assert page(idx, "INPUT", port="20:60")["total"] == 2
+    assert [r["position"] for r in page(idx, "INPUT", port="22,443")["rules"]] == [2, 3]    # any of the ports
+    assert [r["position"] for r in page(idx, "INPUT", port="1024:")["rules"]] == [3]         # open-ended range
+    assert page(idx, "INPUT", target="reject")["rules"][0]["dport"] == "53"
+    assert page(idx, "INPUT", comment="SSH")["rules"][0]["comment"] == "lab ssh"
+
+    p = page(idx, "INPUT", offset=2, limit=2)
+    assert (p["total"], [r["position"] for r in p["rules"]]) == (6, [3, 4])
+    assert page(idx, "NOPE")["status"] == "failure"
+    assert page(idx, "INPUT", port="x")["status"] == "failure"
+
+
+def test_cache_reuses_snapshot_and_index():
+    calls = []
+
+    def fetch(table, counters):
+        calls.append(table)
+        return RULES
+
+    cache = RuleIndexCache(fetch, ttl_s=60)
+    a = cache.get("filter")
+    assert cache.get("filter") is a and len(calls) == 1
+    cache._ttl_s = 0
+    assert cache.get("filter") is a and len(calls) == 2  # refetched, same digest → same index
+
+
+def test_routes(monkeypatch):
+    pytest.importorskip("flask")
+    import main_process
+    from app.core import iptables_controller as ctl
+    from app.core.iptables_backend import InMemoryBackend
+
+    backend = InMemoryBackend()
+    backend.run(["iptables-restore"], input=RULES)
+    previous = ctl.set_backend(backend)
+    main_process.RULES.invalidate()
+    try:
+        client = main_process.app.test_client()
+        chains = client.get("/api/rules/filter").get_json()["chains"]
+        assert {"chain": "INPUT", "policy": "DROP", "rules": 6} in chains
+
+        r = client.get("/api/rules/filter/INPUT?limit=2&target=DROP")
+        body = r.get_json()
+        assert body["total"] == 2 and len(body["rules"]) == 2
+        assert client.get("/api/rules/filter/INPUT?limit=2&target=DROP",
+                          headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+        rid = body["rules"][0]["id"]
+        assert client.get(f"/api/rules/filter/INPUT/{rid}").get_json()["rule"]["position"] == 4
+        assert client.get("/api/rules/filter/INPUT/deadbeef").status_code == 404
+        assert client.get("/api/rules/filter/NOPE").status_code == 404
+    finally:
+        ctl.set_backend(previous)
+        main_process.RULES.invalidate()
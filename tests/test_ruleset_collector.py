@@ -0,0 +1,123 @@
+"""
+test_ruleset_collector.py
+-------------------------
+Compressed iptables-save collection: codec sniffing, streaming decompression
+into the parser, SSH transport compression and large outputs over the stub.
+"""
+
+import gzip
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core.ruleset_collector import StreamingRulesetSink, collect_command, collect_ruleset
+from app.core.ssh_session_manager import SSHSessionManager
+from app.utils.parser import ParseError, parse_iptables_save, serialize_ruleset
+from fleet_generator import generate_ruleset
+from ssh_stub_server import StubSSHServer
+
+DUMP = generate_ruleset(2000, seed=7)
+
+
+def _feed(data: bytes, step: int) -> StreamingRulesetSink:
+    sink = StreamingRulesetSink()
+    for i in range(0, len(data), step):
+        sink.write(data[i:i + step])
+    return sink
+
+
+@pytest.mark.parametrize("step", [3, 4096])
+@pytest.mark.parametrize("encode", [gzip.compress, str.encode], ids=["gzip", "plain"])
+def test_sink_matches_parser(encode, step):
+    data = encode(DUMP.encode()) if encode is gzip.compress else DUMP.encode()
+    sink = _feed(data, step)
+    rs = sink.close()
+    assert serialize_ruleset(rs) == serialize_ruleset(parse_iptables_save(DUMP))
+    assert sink.codec == ("gzip" if encode is gzip.compress else "plain")
+    assert sink.raw_bytes == len(DUMP.encode()) and sink.wire_bytes == len(data)
+
+
+def test_sink_reset_and_truncated_stream():
+    sink = _feed(gzip.compress(DUMP.encode()), 1000)
+    sink.reset()
+    assert sink.close().tables == {}
+    with pytest.raises(ParseError):
+        _feed(DUMP.encode()[: len(DUMP) // 2], 1000).close()
+
+
+def test_collect_command_falls_back_to_cat():
+    cmd = collect_command(table="nat", codecs_=["gzip"])
+    assert cmd.startswith('{ iptables-save -c -t nat || echo "iptables-save exited $?" >&2; } | if command -v gzip')
+    assert cmd.endswith("else cat; fi")
+    assert collect_command(counters=False, codecs_=[]) == "iptables-save"
+
+
+def test_collect_over_compressed_transport(key):
+    srv = StubSSHServer("127.0.0.1", responses={"{ iptables-save": gzip.compress(DUMP.encode())},
+                        compress=True).start()
+    mgr = SSHSessionManager(compress=True)
+    try:
+        r = collect_ruleset(srv.address, "root", key, mgr=mgr, port=srv.port)
+        assert r["status"] == "success" and r["codec"] == "gzip"
+        assert r["ruleset"].rule_count() == parse_iptables_save(DUMP).rule_count()
+        assert r["wire_bytes"] * 3 < r["raw_bytes"]
+        assert mgr.compression(srv.address, "root", srv.port)["in"].startswith("zlib")
+    finally:
+        mgr.stop()
+        srv.stop()
+
+
+
+def test_failed_save_is_not_hidden_by_the_compressor(key, mgr):
+    # iptables-save dies after the first table; gzip still exits 0, so only stderr tells
+    def partial(channel, command):
+        channel.sendall(gzip.compress(DUMP.split("COMMIT\n")[0].encode() + b"COMMIT\n"))
+        channel.sendall_stderr(b"iptables-save: Failed to get table nat\niptables-save exited 1\n")
+        return 0
+
+    srv = StubSSHServer("127.0.0.1", responses={"{ iptables-save": partial}).start()
+    try:
+        r = collect_ruleset(srv.address, "root", key, mgr=mgr, port=srv.port)
+        assert r["status"] == "failure" and "iptables-save failed" in r["message"]
+    finally:
+        srv.stop()
+
+def test_large_output_does_not_stall(key, mgr):
+    # Larger than paramiko's 2 MiB channel window: stdout must be drained before the exit status
+    big = generate_ruleset(30000, seed=3)
+    assert len(big) > 2 * 1024 * 1024
+    srv = StubSSHServer("127.0.0.1", responses={"iptables-save": big}).start()
+    try:
+        r = mgr.exec(srv.address, "root", key, "iptables-save", port=srv.port, timeout=5)
+        assert r["status"] == "success" and len(r["stdout"]) == len(big.strip())
+        r = collect_ruleset(srv.address, "root", key, compress=False, mgr=mgr, port=srv.port)
+        assert r["status"] == "success" and r["codec"] == "plain"
+    finally:
+        srv.stop()
+
+
+def test_large_stderr_does_not_stall(key, mgr):
+    # stderr shares the channel window with stdout, so it cannot wait until stdout ends
+    noise = b"warning: something odd\n" * (3 * 1024 * 1024 // 23)
+
+    def chatty(channel, command):
+        channel.sendall_stderr(noise)
+        channel.sendall(b"done")
+
+    srv = StubSSHServer("127.0.0.1", responses={"chatty": chatty}).start()
+    results = []
+    try:
+        worker = threading.Thread(target=lambda: results.append(
+            mgr.exec(srv.address, "root", key, "chatty", port=srv.port)), daemon=True)
+        worker.start()
+        worker.join(20)
+        assert results, "exec stalled on a full stderr buffer"
+        assert results[0]["stdout"] == "done" and len(results[0]["stderr"]) == len(noise.strip())
+    finally:
+        srv.stop()
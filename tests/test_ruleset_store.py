@@ -0,0 +1,117 @@
+"""
+test_ruleset_store.py
+---------------------
+Content-addressed ruleset history: chain deduplication across hosts,
+point-in-time lookups, checkout and rollback through push/apply.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the benchmark helpers) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core import iptables_logger
+from app.core.iptables_apply import apply_iptables_rules
+from app.core.ruleset_store import RulesetStore
+from app.utils.parser import parse_iptables_save, serialize_ruleset
+from fleet_generator import generate_ruleset, mutate_ruleset
+from ssh_stub_server import StubSSHServer
+
+BASE = generate_ruleset(500, seed=11)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RulesetStore(tmp_path / "store")
+
+
+def test_identical_chains_are_stored_once(store):
+    edited = mutate_ruleset(BASE, 2)
+    for i in range(50):
+        store.record(f"10.0.0.{i}", BASE if i % 2 else edited)
+    stats = store.stats()
+    chains = len(store.chain_oids(store.head("10.0.0.1")["tree"]))
+    assert stats["version"] == 50 and stats["tree"] == 2
+    assert stats["chain"] <= 2 * chains                  # not 50 copies of every chain
+
+    v = store.head("10.0.0.3")
+    expected = serialize_ruleset(parse_iptables_save(BASE), counters=False)
+    assert store.checkout(v["id"]) == expected
+    assert RulesetStore(store.root).checkout(v["id"]) == expected     # survives a restart
+
+
+def test_point_in_time_lookup(store):
+    v1 = store.record("fw1", BASE, timestamp=1000)
+    v2 = store.record("fw1", mutate_ruleset(BASE, 1), timestamp=2000)
+    v3 = store.record("fw1", BASE, timestamp=3000, source="rollback")
+
+    assert store.at("fw1", 999) is None
+    assert store.at("fw1", 1000)["id"] == v1["id"]
+    assert store.at("fw1", 2500)["id"] == v2["id"]
+    assert store.at("fw1", "1970-01-01T00:50:00Z")["id"] == v3["id"]
+    assert v3["parent"] == v2["id"] and v3["tree"] == v1["tree"] and v3["changed"]
+    assert [v["id"] for v in store.history("fw1")] == [v3["id"], v2["id"], v1["id"]]
+    assert RulesetStore(store.root).at("fw1", 2500)["id"] == v2["id"]
+    assert store.hosts() == ["fw1"]
+
+
+
+def test_concurrent_records_keep_one_line_of_history(store, monkeypatch):
+    head = store.head
+    monkeypatch.setattr(store, "head", lambda host: time.sleep(0.05) or head(host))
+    threads = [threading.Thread(target=store.record, args=("fw1", mutate_ruleset(BASE, i + 1))) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    parents = [v["parent"] for v in store.history("fw1")]
+    assert len(set(parents)) == 5 and parents.count(None) == 1       # no two versions share a parent
+
+
+def test_hosts_never_share_a_ref_log(store):
+    store.record("a/b", BASE, timestamp=1000)
+    store.record("a_b", mutate_ruleset(BASE, 1), timestamp=2000)
+    fresh = RulesetStore(store.root)
+    assert fresh.head("a/b")["host"] == "a/b" and fresh.head("a_b")["host"] == "a_b"
+    assert fresh.head("a/b")["parent"] is None and fresh.hosts() == ["a/b", "a_b"]
+
+def test_apply_records_the_live_ruleset(store, key, mgr, tmp_path, monkeypatch):
+    monkeypatch.setattr(iptables_logger, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(iptables_logger, "LOG_FILE", str(tmp_path / "kb.jsonl"))
+    srv = StubSSHServer("127.0.0.1", responses={"iptables-restore": "", "{ iptables-save": BASE,
+                                                "umask 077": "", "B=": "confirmed"}).start()
+    real = mgr.exec
+    monkeypatch.setattr(mgr, "exec", lambda host, user, key, cmd, port=22, **kw: real(host, user, key, cmd, port=srv.port, **kw))
+    try:
+        r = apply_iptables_rules(srv.address, "root", key, mgr=mgr, store=store)
+        assert r["status"] == "success"
+        v = store.version(r["version"])
+        assert v["host"] == srv.address and v["source"] == "apply"
+        assert v["rules"] == parse_iptables_save(BASE).rule_count()
+    finally:
+        srv.stop()
+
+
+def test_history_endpoints(store, monkeypatch):
+    pytest.importorskip("flask")
+    import main_process
+    from app.core import ruleset_store
+
+    monkeypatch.setattr(ruleset_store, "STORE_DIR", store.root)
+    v = ruleset_store.default_store().record("fw9", BASE, timestamp=1000)
+    client = main_process.app.test_client()
+
+    assert client.get("/api/history/fw9").get_json()["versions"][0]["id"] == v["id"]
+    assert client.get("/api/history/fw9?at=1500").get_json()["version"]["id"] == v["id"]
+    assert client.get("/api/history/fw9?at=10").status_code == 404
+    text = client.get(f"/api/versions/{v['id']}?format=text")
+    assert text.status_code == 200 and text.get_data(as_text=True).startswith("*filter")
+    assert client.get(f"/api/versions/{v['id']}?format=text",
+                      headers={"If-None-Match": text.headers["ETag"]}).status_code == 304
+    assert client.get("/api/versions/deadbeef").status_code == 404
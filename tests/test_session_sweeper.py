@@ -0,0 +1,40 @@
+"""
+test_session_sweeper.py
+-----------------------
+SSHSessionManager session lifecycle: the event-driven idle sweeper and the
+process-wide shared managers, against the in-process SSH stub server.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core import ssh_session_manager as ssm
+from ssh_stub_server import StubSSHServer
+
+
+def test_sweeper_is_lazy_event_driven_and_stops_instantly(key):
+    m = ssm.SSHSessionManager(idle_ttl_s=0.2)
+    assert m._sweeper._thread is None            # no thread until the first session
+    srv = StubSSHServer("127.0.0.1").start()
+    try:
+        m.exec(srv.address, "root", key, "hostname", port=srv.port)
+        assert len(m._cache) == 1
+        time.sleep(0.5)
+        assert not m._cache                      # closed at its deadline, not on a 30 s tick
+        m.exec(srv.address, "root", key, "hostname", port=srv.port)
+        t0 = time.perf_counter()
+        m.stop()
+        assert time.perf_counter() - t0 < 0.5 and not m._cache
+    finally:
+        srv.stop()
+
+
+def test_shared_manager_registry():
+    a = ssm.shared_manager()
+    assert ssm.shared_manager() is a and ssm.shared_manager("other") is not a
+    ssm._SHARED.pop("other").stop()
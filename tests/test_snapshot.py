@@ -0,0 +1,131 @@
+"""
+test_snapshot.py
+----------------
+Binary ruleset snapshots: exact round trip to iptables-save text (counters,
+quoted comments, negations, several tables), single-chain reads via the index,
+corruption detection and load speed against the JSON config.
+"""
+
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the fleet generator) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.utils.parser import parse_config_json, parse_iptables_save, serialize_ruleset
+from app.utils.snapshot import (_HEADER, SnapshotError, decode_ruleset, encode_ruleset, read_chain, read_snapshot,
+                                snapshot_index, write_snapshot)
+from fleet_generator import generate_ruleset
+
+SAVE = """*filter
+:INPUT DROP [1200:96000]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [80:7000]
+:SSH - [0:0]
+[10:600] -A INPUT -i lo -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 22 -j SSH
+[3:180] -A INPUT ! -s 10.0.0.0/8 -p udp -m udp --dport 53 -m comment --comment "dns \\"from\\" outside" -j DROP
+-A SSH -s 10.10.0.0/24 -j ACCEPT
+-A SSH -j LOG --log-prefix "ssh drop: "
+COMMIT
+*nat
+:PREROUTING ACCEPT [0:0]
+:POSTROUTING ACCEPT [0:0]
+[18446744073709551615:1] -A PREROUTING -d 203.0.113.10/32 -p tcp -m tcp --dport 80 -j DNAT --to-destination 10.10.0.40:80
+-A POSTROUTING -o eth0 -j MASQUERADE
+COMMIT
+"""
+
+
+def _same(a, b):
+    assert serialize_ruleset(a) == serialize_ruleset(b)
+    for ta, tb in zip(a.tables.values(), b.tables.values()):
+        for ca, cb in zip(ta.chains.values(), tb.chains.values()):
+            for ra, rb in zip(ca.rules, cb.rules):
+                assert [getattr(ra, s) for s in ra.__slots__] == [getattr(rb, s) for s in rb.__slots__]
+
+
+def test_round_trip_exact():
+    for text in (SAVE, generate_ruleset(3000, seed=4), ""):
+        ruleset = parse_iptables_save(text)
+        _same(decode_ruleset(encode_ruleset(ruleset)), ruleset)
+
+
+def test_files_and_single_chain(tmp_path):
+    path = tmp_path / "config.snap"
+    ruleset = parse_iptables_save(SAVE)
+    assert write_snapshot(path, ruleset) == path.stat().st_size
+    _same(read_snapshot(path), ruleset)
+
+    ssh = read_chain(path, "filter", "SSH")
+    assert [r.to_line() for r in ssh.rules] == [r.to_line() for r in ruleset.tables["filter"].chains["SSH"].rules]
+    assert read_chain(path, "nat", "PREROUTING").rules[0].packets == 2 ** 64 - 1
+    with pytest.raises(KeyError):
+        read_chain(path, "nat", "SSH")
+    assert snapshot_index(path)[:2] == [{"table": "filter", "chain": "INPUT", "policy": "DROP", "rules": 3},
+                                        {"table": "filter", "chain": "FORWARD", "policy": "DROP", "rules": 0}]
+
+
+def test_rejects_corrupt_data():
+    data = encode_ruleset(parse_iptables_save(SAVE))
+    for bad in (b"", b"NOTASNAP" + data[8:], data[:-5]):
+        with pytest.raises(SnapshotError):
+            decode_ruleset(bad)
+
+
+def test_fuzzed_snapshots_only_raise_snapshot_error():
+    rng = random.Random(7)
+    data = encode_ruleset(parse_iptables_save(SAVE))
+    for _ in range(3000):
+        bad = bytearray(data)
+        for _ in range(rng.randint(1, 4)):
+            pos = rng.randrange(_HEADER.size, len(bad))                  # keep the header, break the body
+            bad[pos] = rng.randrange(256)
+        if rng.random() < 0.3:
+            del bad[rng.randrange(_HEADER.size, len(bad)):]
+        try:
+            decode_ruleset(bytes(bad))
+        except SnapshotError:
+            pass
+
+
+def test_corrupt_snapshot_falls_back_to_json(tmp_path, monkeypatch):
+    from app.core import iptables_controller
+
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"filter": SAVE.split("*nat")[0]}))
+    snap = config.with_suffix(".snap")
+    data = bytearray(encode_ruleset(parse_iptables_save(SAVE)))
+    data[_HEADER.size] = 0xFF                                           # invalid utf-8 in the string table
+    snap.write_bytes(bytes(data))
+    monkeypatch.setattr(iptables_controller, "CONFIG_PATH", config)
+
+    loaded = iptables_controller.load_saved_ruleset()
+    assert list(loaded.tables) == ["filter"]
+
+
+def test_loads_faster_than_json(tmp_path):
+    text = generate_ruleset(20_000, seed=1)
+    js, snap = tmp_path / "config.json", tmp_path / "config.snap"
+    js.write_text(json.dumps({"filter": text}, indent=2))
+    write_snapshot(snap, parse_iptables_save(text))
+
+    def best(fn):
+        times = []
+        for _ in range(3):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    t_json = best(lambda: parse_config_json(json.loads(js.read_text())))
+    t_snap = best(lambda: read_snapshot(snap))
+    assert snap.stat().st_size < js.stat().st_size / 1.5
+    # ~10x on an idle machine; the margin absorbs noisy CI runners
+    assert t_json / t_snap > 5, f"JSON {t_json:.3f}s vs snapshot {t_snap:.3f}s"
@@ -0,0 +1,125 @@
+"""
+test_ssh_resilience.py
+----------------------
+SSHSessionManager circuit breakers and adaptive connect timeouts, against
+the in-process SSH stub server.
+"""
+
+import socket
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core import ssh_session_manager as ssm
+from app.core.circuit_breaker import HALF_OPEN, TIMEOUT_FLOOR_S, CircuitBreaker
+from ssh_stub_server import StubSSHServer
+
+
+def test_breaker_state_machine():
+    now = [0.0]
+    cb = CircuitBreaker(failures=2, cooldown_s=10, clock=lambda: now[0])
+    cb.failure(); cb.failure()
+    assert cb.state == "open" and not cb.allow()
+    now[0] = 10
+    assert cb.allow() and not cb.allow()        # one probe at a time
+    cb.failure()
+    now[0] = 25
+    assert not cb.allow()                        # cooldown doubled after a failed probe
+    now[0] = 30
+    assert cb.allow()
+    cb.success()
+    assert cb.state == "closed" and cb.allow()
+
+
+def test_dead_host_fails_fast_then_recovers(mgr, key):
+    srv = StubSSHServer("127.0.0.1")
+    port = srv.port
+    srv.stop()                                   # nothing listens on the port now
+
+    first = mgr.exec("127.0.0.1", "root", key, "hostname", port=port)
+    assert first["status"] == "failure" and mgr.circuit("127.0.0.1", port)["state"] == "open"
+
+    t0 = time.perf_counter()
+    fast = mgr.exec("127.0.0.1", "root", key, "hostname", port=port)
+    assert fast["error_type"] == "CircuitOpen" and time.perf_counter() - t0 < 0.05
+
+    # Host comes back: after the cooldown a single probe closes the circuit
+    srv = StubSSHServer("127.0.0.1", port=port).start()
+    try:
+        mgr._breaker_for("127.0.0.1", port)._cooldown = 0.05
+        time.sleep(0.06)
+        assert mgr.exec("127.0.0.1", "root", key, "hostname", port=port)["stdout"] == "stub-host"
+        assert mgr.circuit("127.0.0.1", port)["state"] == "closed"
+        assert mgr.metrics()[("127.0.0.1", "root", port)]["circuit"] == "closed"
+    finally:
+        srv.stop()
+
+
+def test_command_failures_do_not_trip_the_breaker(mgr, key):
+    srv = StubSSHServer("127.0.0.1").start()
+    try:
+        for _ in range(5):
+            assert mgr.exec(srv.address, "root", key, "unknown", port=srv.port)["exit_code"] == 127
+        assert mgr.circuit(srv.address, srv.port)["state"] == "closed"
+    finally:
+        srv.stop()
+
+
+def test_connect_timeout_adapts_to_observed_latency(mgr, key):
+    srv = StubSSHServer("127.0.0.1").start()
+    try:
+        assert mgr.circuit(srv.address, srv.port)["connect_timeout_s"] == ssm.DEFAULT_TIMEOUT_S
+        for _ in range(6):
+            mgr.close_all()
+            mgr.exec(srv.address, "root", key, "hostname", port=srv.port)
+        c = mgr.circuit(srv.address, srv.port)
+        assert c["connect_p95_ms"] is not None
+        assert 1.0 <= c["connect_timeout_s"] < ssm.DEFAULT_TIMEOUT_S
+    finally:
+        srv.stop()
+
+
+def test_host_that_slows_down_is_not_locked_out(mgr, monkeypatch):
+    class Client:
+        def get_transport(self):
+            return None                          # never reused: every call dials
+
+        def close(self):
+            pass
+
+    latency, timeouts = [0.01], []
+
+    def dial(host, user, key_path, port, timeout):
+        timeouts.append(timeout)
+        if latency[0] > timeout:
+            time.sleep(timeout)
+            raise socket.timeout("timed out")
+        time.sleep(latency[0])
+        return Client()
+
+    monkeypatch.setattr(mgr, "_dial", dial)
+    for _ in range(6):
+        mgr.get_session("fw1", "root", "key", timeout=3)
+    assert timeouts[-1] == TIMEOUT_FLOOR_S                # learned: fast host, short timeout
+
+    latency[0] = 1.5                             # the host steps up past 4 x p95
+    with pytest.raises(socket.timeout):
+        mgr.get_session("fw1", "root", "key", timeout=3)
+    mgr.get_session("fw1", "root", "key", timeout=3)   # history dropped: full timeout
+    assert timeouts[-1] == 3
+
+    # A half-open probe is not held to the learned timeout either
+    for _ in range(6):
+        latency[0] = 0.01
+        mgr.get_session("fw1", "root", "key", timeout=3)
+    breaker = mgr._breaker_for("fw1", 22)
+    breaker.state = HALF_OPEN
+    latency[0] = 1.5
+    mgr.get_session("fw1", "root", "key", timeout=3)
+    assert timeouts[-1] == 3
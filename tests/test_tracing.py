@@ -0,0 +1,105 @@
+"""
+test_tracing.py
+---------------
+Rollout spans through iptables_apply → iptables_validate → SSHSessionManager,
+export formats and the per-host flame breakdown.
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root (and the SSH stub server) are importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent / "benchmarks"))
+
+from app.core import iptables_logger, ruleset_store, tracing
+from app.core.iptables_apply import apply_iptables_rules
+from app.core.job_queue import FINISHED, JobManager, run_per_host
+from ssh_stub_server import StubSSHServer
+
+
+@pytest.fixture
+def traced_env(key, mgr, tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_DIR", str(tmp_path / "traces"))
+    monkeypatch.setattr(iptables_logger, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(ruleset_store, "STORE_DIR", tmp_path / "store")
+    monkeypatch.setattr(iptables_logger, "LOG_FILE", str(tmp_path / "kb.jsonl"))
+    srv = StubSSHServer("127.0.0.1", responses={"iptables-restore": "", "umask 077": "", "B=": "confirmed"}).start()
+    yield srv, mgr, key, tmp_path
+    srv.stop()
+
+
+def _stub_exec(mgr, srv):
+    # The pipeline functions connect on port 22; route them to the stub's port
+    real = mgr.exec
+    return lambda host, user, key, cmd, port=22, **kw: real(host, user, key, cmd, port=srv.port, **kw)
+
+
+def test_apply_trace_nests_validate_and_ssh(traced_env, monkeypatch):
+    srv, mgr, key, tmp = traced_env
+    monkeypatch.setattr(mgr, "exec", _stub_exec(mgr, srv))
+
+    assert apply_iptables_rules(srv.address, "root", key, mgr=mgr)["status"] == "success"
+    trace = tracing.recent(1)[0]
+    assert trace.name == "apply" and trace.root.attrs["host"] == srv.address
+
+    stacks = tracing.flame(trace)[srv.address]
+    assert "apply;validate;ssh.exec;ssh.connect;ssh.handshake" in stacks
+    assert "apply;restore;ssh.exec;ssh.channel" in stacks
+    assert "apply;confirm;ssh.exec;ssh.connect" in stacks      # confirmation dials a fresh session
+    assert stacks["apply"]["total_ms"] >= stacks["apply;validate"]["total_ms"]
+    assert srv.address in tracing.format_flame(trace)
+
+    exported = json.loads((tmp / "traces" / "traces.jsonl").read_text().splitlines()[-1])
+    assert exported["trace_id"] == trace.trace_id and len(exported["spans"]) == len(trace.spans)
+
+    kb = [json.loads(l) for l in (tmp / "kb.jsonl").read_text().splitlines()]
+    assert {e["trace_id"] for e in kb} == {trace.trace_id}
+
+
+def test_failures_and_otlp_export(traced_env):
+    srv, mgr, key, tmp = traced_env
+    with tracing.span("rollout", root=True) as root:
+        r = mgr.exec(srv.address, "root", key, "false", port=srv.port)
+    assert r["status"] == "failure"
+    exec_span = next(s for s in root.trace.spans if s.name == "ssh.exec")
+    assert exec_span.status == "error" and exec_span.attrs["exit_code"] == 127
+
+    path = tracing.export(root.trace, mode="otlp", directory=str(tmp))
+    doc = json.loads(Path(path).read_text())
+    spans = doc["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert {s["name"] for s in spans} >= {"rollout", "ssh.exec", "ssh.connect"}
+    assert any(s["status"]["code"] == 2 for s in spans)
+
+
+
+def test_export_is_anchored_and_rotated(tmp_path, monkeypatch):
+    assert Path(tracing.TRACE_DIR).is_absolute() or "IPTABLES_TRACE_DIR" in os.environ
+    monkeypatch.setattr(tracing, "TRACE_MAX_BYTES", 1)
+    monkeypatch.setattr(tracing, "TRACE_EXPORT", "off")
+    with tracing.span("rollout", root=True) as root:
+        pass
+    paths = [tracing.export(root.trace, mode="json", directory=str(tmp_path)) for _ in range(3)]
+    assert paths[0] == str(tmp_path / "traces.jsonl")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["traces.jsonl", "traces.jsonl.1"]
+    assert len(Path(paths[0]).read_text().splitlines()) == 1          # each export started a new file
+
+def test_untraced_calls_record_nothing():
+    with tracing.span("ssh.exec") as s:
+        assert s is None
+    assert tracing.current_span() is None
+
+
+def test_job_hosts_share_one_trace(traced_env):
+    jm = JobManager()
+    job = jm.submit("snapshot", lambda j: run_per_host(j, ["a", "b"], lambda h: {"status": "success"}), {})
+    while job.status not in FINISHED:
+        job.events_after(0, 0.05)
+    trace = tracing.find(job.trace_id)
+    assert set(tracing.flame(trace)) >= {"a", "b"}
+    assert all(s.trace is trace for s in trace.spans)
+    jm.shutdown()
@@ -0,0 +1,106 @@
+"""
+test_web_server.py
+------------------
+Production serving features of main_process: compression, conditional
+(ETag/304) responses for the ruleset and log views, static caching.
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure the project root is importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+pytest.importorskip("flask")
+
+import main_process
+from app.core import iptables_controller as ctl
+from app.core import iptables_logger
+from app.core.iptables_backend import InMemoryBackend
+
+
+@pytest.fixture
+def client(monkeypatch):
+    backend = InMemoryBackend()
+    for port in range(1000, 1200):
+        backend.run(["iptables", "-A", "INPUT", "-p", "tcp", "--dport", str(port), "-j", "ACCEPT"])
+    previous = ctl.set_backend(backend)
+    yield main_process.app.test_client()
+    ctl.set_backend(previous)
+
+
+def test_accept_encoding_q_values(monkeypatch):
+    from app.core import web_server
+
+    monkeypatch.setattr(web_server, "brotli", object())               # pretend brotli is installed
+    pick = web_server._pick_encoding
+    assert pick("gzip, deflate, br") == "br"
+    assert pick("br;q=0, gzip") == "gzip"
+    assert pick("br;q=0.5, gzip;q=0.8") == "gzip"
+    assert pick("gzip;q=0, br;q=0") is None
+    assert pick("*;q=0.1, br;q=0") == "gzip"
+    assert pick("brotli, xgzip") is None
+    assert pick("br;q=oops, gzip") == "gzip"
+    monkeypatch.setattr(web_server, "brotli", None)
+    assert pick("br") is None and pick("br, gzip;q=0.1") == "gzip"
+
+
+def test_ruleset_is_compressed_and_revalidates(client):
+    plain = client.get("/api/ruleset?table=filter")
+    assert plain.status_code == 200 and "Content-Encoding" not in plain.headers
+    assert "--dport 1199" in plain.get_data(as_text=True)
+
+    gz = client.get("/api/ruleset?table=filter", headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert len(gz.data) < len(plain.data) / 4
+    assert gz.headers["ETag"].endswith('-gzip"') and "Accept-Encoding" in gz.headers["Vary"]
+
+    # Both the compressed and the identity validator revalidate to 304
+    for tag in (gz.headers["ETag"], plain.headers["ETag"]):
+        again = client.get("/api/ruleset?table=filter", headers={"Accept-Encoding": "gzip", "If-None-Match": tag})
+        assert again.status_code == 304 and not again.data
+
+    ctl.add_rule("INPUT", ["-p", "icmp", "-j", "ACCEPT"])
+    changed = client.get("/api/ruleset?table=filter", headers={"If-None-Match": plain.headers["ETag"]})
+    assert changed.status_code == 200
+
+
+def test_logs_tail_and_etag(client, tmp_path, monkeypatch):
+    log = tmp_path / "kb.jsonl"
+    log.write_text("".join(json.dumps({"host": f"10.10.0.{i}", "status": "success"}) + "\n" for i in range(50)))
+    monkeypatch.setattr(iptables_logger, "LOG_FILE", str(log))
+
+    r = client.get("/api/logs?limit=5")
+    assert [e["host"] for e in r.get_json()] == [f"10.10.0.{i}" for i in range(45, 50)]
+    assert client.get("/api/logs?limit=5", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+
+def test_sse_and_index_caching(client, monkeypatch):
+    index = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert index.headers["Content-Encoding"] == "gzip"
+    assert "no-cache" in index.headers["Cache-Control"] or "max-age=0" in index.headers["Cache-Control"]
+    assert client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": index.headers["ETag"]}).status_code == 304
+
+    # Event streams are never buffered for compression
+    monkeypatch.setitem(main_process.JOB_KINDS, "snapshot", lambda job: {"hosts": 0})
+    job_id = client.post("/api/jobs/snapshot", json={"hosts": ["10.10.0.20"]}).get_json()["id"]
+    events = client.get(f"/api/jobs/{job_id}/events", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in events.headers
+    assert "event: finished" in events.get_data(as_text=True)
+
+
+def test_shutdown_hooks_belong_to_the_serving_process():
+    # Importing the app (tests, CLI, tooling) must not run job/SSH teardown at exit; serving does
+    script = ("import atexit; calls = []; atexit.register = calls.append\n"
+              "import main_process\n"
+              "from app.core import web_server\n"
+              "assert web_server.run_shutdown_hooks not in calls, calls\n"
+              "assert web_server.serve(main_process.app, server='none')['status'] == 'failure'\n"
+              "assert web_server.run_shutdown_hooks in calls, calls\n")
+    root = Path(__file__).resolve().parents[1]
+    r = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True, timeout=60)
+    assert r.returncode == 0, r.stderr